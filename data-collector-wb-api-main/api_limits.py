@@ -0,0 +1,89 @@
+"""
+Ограничения параллелизма по внешним API, общие для всех потоков процесса.
+
+Выгрузки отчёта идут в потоках (asyncio.to_thread), а batch-режим строит
+несколько отчётов одновременно. Чтобы параллельные пары (период, юрлицо) не
+упирались в лимиты WB и не забивали Postgres / Google Sheets, каждый вызов
+выгрузки держит семафор своего API:
+
+  • WB API (statistics, analytics, advert, common) — лимиты на токен продавца,
+    поэтому семафор свой для каждого юрлица (key=seller_legal);
+  • postgres и sheets — один семафор на процесс.
+
+Значения по умолчанию равны числу одновременных вызовов одного API внутри
+одного отчёта: одиночный отчёт не замедляется, а параллельные отчёты одного
+юрлица делят лимит его токена. Переопределяются configure_limits(...)
+(в batch-режиме — из секции "api_limits" config.json).
+"""
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# API → число одновременных вызовов
+DEFAULT_LIMITS: Dict[str, int] = {
+    "wb_statistics": 3,
+    "wb_analytics": 3,
+    "wb_advert": 1,
+    "wb_common": 1,
+    "postgres": 4,
+    "sheets": 6,
+}
+# API, лимиты которых считаются отдельно для каждого токена (юрлица)
+PER_TOKEN_APIS = {"wb_statistics", "wb_analytics", "wb_advert", "wb_common"}
+
+
+class ApiLimits:
+    """Реестр семафоров: (api, ключ токена) → threading.BoundedSemaphore."""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, per_token: Iterable[str] = PER_TOKEN_APIS):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.per_token = set(per_token)
+        self._semaphores: Dict[Tuple[str, Optional[str]], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: Dict[str, int]) -> None:
+        """Новые значения лимитов; уже выданные семафоры сбрасываются (вызывать до запуска задач)."""
+        with self._lock:
+            self.limits.update({api: int(n) for api, n in limits.items()})
+            self._semaphores.clear()
+
+    def _semaphore(self, api: str, key: Optional[str]) -> Optional[threading.BoundedSemaphore]:
+        limit = self.limits.get(api)
+        if not limit:
+            return None
+        slot = (api, key if api in self.per_token else None)
+        with self._lock:
+            if slot not in self._semaphores:
+                self._semaphores[slot] = threading.BoundedSemaphore(limit)
+            return self._semaphores[slot]
+
+    @contextmanager
+    def hold(self, *apis: str, key: Optional[str] = None):
+        """
+        Держит семафоры всех apis на время блока. Захват в отсортированном
+        порядке — два вызова с пересекающимися наборами API не заблокируют друг друга.
+        """
+        with ExitStack() as stack:
+            for api in sorted(set(apis)):
+                semaphore = self._semaphore(api, key)
+                if semaphore is not None:
+                    stack.enter_context(semaphore)
+            yield
+
+
+API_LIMITS = ApiLimits()
+
+
+def configure_limits(limits: Dict[str, int]) -> None:
+    API_LIMITS.configure(limits)
+
+
+def api_limit(*apis: str, key: Optional[str] = None):
+    """Контекстный менеджер: with api_limit("wb_statistics", key=seller_legal): ..."""
+    return API_LIMITS.hold(*apis, key=key)
+
+
+def run_limited(apis: Tuple[str, ...], key: Optional[str], func: Callable, *args, **kwargs):
+    """func(*args, **kwargs) под лимитами apis; удобно для asyncio.to_thread(run_limited, ...)."""
+    with API_LIMITS.hold(*apis, key=key):
+        return func(*args, **kwargs)
@@ -14,6 +14,56 @@ from wildberries_orders_7days_before import fetch_orders_7_days
 from wildberries_funnel import fetch_sales_funnel
 from context import current_mode
 from wildberries_orders_cleared_by_funnel import funnel_and_orders_pipeline
+from api_limits import run_limited
+
+
+# --------------------------------------------------------------------------------------
+# Выгрузки отчёта: какие API держит каждая (лимиты — api_limits)
+# --------------------------------------------------------------------------------------
+def report_fetchers(date_from: str, date_to: str, seller_legal: str, spreadsheet_id: str):
+    """
+    Список (API, функция, аргументы) параллельных выгрузок одного отчёта.
+    """
+    return [
+        (("wb_analytics", "wb_statistics"), funnel_and_orders_pipeline, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("wb_analytics",), fetch_acceptance_report, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("wb_statistics",), fetch_supplies_report, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("wb_advert",), fetch_ad_campaigns, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("wb_common",), fetch_commission_data, (seller_legal, spreadsheet_id)),
+        (("wb_analytics",), fetch_paid_storage, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("postgres",), fetch_stocks, (date_from, date_to, seller_legal, spreadsheet_id)),
+        (("postgres",), transfer_selfcost_data, (date_from, date_to, spreadsheet_id)),
+        (("wb_statistics",), fetch_orders_7_days, (date_from, seller_legal, spreadsheet_id)),
+    ]
+
+
+async def run_report_fetchers(date_from: str, date_to: str, seller_legal: str, spreadsheet_id: str):
+    """
+    Все выгрузки отчёта параллельно, затем расчёт продаж из БД.
+    Каждая выгрузка держит лимиты своих API (общие для всех отчётов процесса).
+    """
+    await asyncio.gather(*(
+        asyncio.to_thread(run_limited, apis, seller_legal, func, *args)
+        for apis, func, args in report_fetchers(date_from, date_to, seller_legal, spreadsheet_id)
+    ))
+    await asyncio.to_thread(
+        run_limited, ("postgres",), seller_legal, process_wb_reports, date_from, date_to, seller_legal, spreadsheet_id
+    )
+
+
+async def build_report_spreadsheet(date_from: str, date_to: str, seller_legal: str) -> str:
+    """
+    Отчёт одного юрлица за период без переноса в сводную: копия шаблона,
+    системные данные, выгрузки. Возвращает spreadsheet_id (для batch-режима).
+    """
+    spreadsheet = await asyncio.to_thread(
+        create_spreadsheet_copy, f"WB report {seller_legal} from {date_from} to {date_to}"
+    )
+    await asyncio.to_thread(
+        prepare_and_insert_metadata, spreadsheet.id, "Config(ext)", seller_legal, date_from, date_to, "Wildberries"
+    )
+    await run_report_fetchers(date_from, date_to, seller_legal, spreadsheet.id)
+    return spreadsheet.id
 
 
 # --------------------------------------------------------------------------------------
@@ -35,19 +85,7 @@ async def generate_report_stream(date_from: str, date_to: str, legal_entity: str
         prepare_and_insert_metadata(spreadsheet_id, "Config(ext)", seller_legal, date_from, date_to, "Wildberries")
 
         yield f"data: Выполняем параллельные задачи для {seller_legal}\n\n"
-        await asyncio.gather(
-            asyncio.to_thread(funnel_and_orders_pipeline, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_acceptance_report, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_supplies_report, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_ad_campaigns, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_commission_data, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_paid_storage, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(fetch_stocks, date_from, date_to, seller_legal, spreadsheet_id),
-            asyncio.to_thread(transfer_selfcost_data, date_from, date_to, spreadsheet_id),
-            asyncio.to_thread(fetch_orders_7_days, date_from, seller_legal, spreadsheet_id),
-        )
-        await asyncio.to_thread(process_wb_reports, date_from, date_to, seller_legal, spreadsheet_id)
-
+        await run_report_fetchers(date_from, date_to, seller_legal, spreadsheet_id)
 
         # если делается отчет по дням
         mode = current_mode.get()
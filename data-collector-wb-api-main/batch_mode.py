@@ -1,15 +1,17 @@
 from datetime import datetime, timedelta
 import calendar
-from app import generate_report_stream
+from batch_scheduler import DEFAULT_WORKERS, run_report_batch
 from wildeberries_orders_7days_from_db import sync_wb_orders_7days_from_db
 from context import current_mode
 
 # -----------------------------------------------------------------------------
 # Batch-функция /generate-report/
 # -----------------------------------------------------------------------------
-async def run_generate_report(date_from: str, date_to: str, target_file_id: str, target_list: str):
+async def run_generate_report(date_from: str, date_to: str, target_file_id: str, target_list: str,
+                              workers: int = DEFAULT_WORKERS):
     """
     Batch-режим для произвольного диапазона, обрабатывающий все юридические лица.
+    Юрлица строятся параллельно (см. batch_scheduler).
     """
     print(f"\n=== Batch: generate-report ===")
     print(f"Параметры: date_from={date_from}, date_to={date_to}")
@@ -17,11 +19,7 @@ async def run_generate_report(date_from: str, date_to: str, target_file_id: str,
     legal_entities = ["ut", "inter", "kravchik"]
     # legal_entities = ["ut", "kravchik"]
     # legal_entities = ["inter"]
-    for le in legal_entities:
-        print(f"\n--- Начало обработки для {le} ---")
-        async for line in generate_report_stream(date_from, date_to, le, target_file_id, target_list):
-            print(line.strip())
-        print(f"--- Завершена обработка для {le} ---")
+    await run_report_batch("generate-report", [(date_from, date_to)], legal_entities, target_file_id, target_list, workers)
 
     print("=== Завершено. ===\n")
 
@@ -29,9 +27,10 @@ async def run_generate_report(date_from: str, date_to: str, target_file_id: str,
 # -----------------------------------------------------------------------------
 # Batch-функция /generate-report-by-days/
 # -----------------------------------------------------------------------------
-async def run_generate_report_by_days(date_from: str, date_to: str, target_file_id: str, target_list: str):
+async def run_generate_report_by_days(date_from: str, date_to: str, target_file_id: str, target_list: str,
+                                      workers: int = DEFAULT_WORKERS):
     """
-    Batch-режим для обработки по дням.
+    Batch-режим для обработки по дням. Пары (день, юрлицо) строятся параллельно.
     """
     # задаем контекст для смещения даты начала получения отчетов по заказам на 4 дня раньше
     current_mode.set("days")
@@ -49,14 +48,8 @@ async def run_generate_report_by_days(date_from: str, date_to: str, target_file_
     legal_entities = ["ut", "inter", "kravchik"]
     # legal_entities = ["inter"]
 
-
-    for single_date in all_dates:
-        formatted_date = single_date.strftime("%d.%m.%Y")
-        for le in legal_entities:
-            print(f"\n--- Начало обработки для {formatted_date} и {le} ---")
-            async for line in generate_report_stream(formatted_date, formatted_date, le, target_file_id, target_list):
-                print(line.strip())
-            print(f"--- Завершена обработка для {formatted_date} и {le} ---")
+    periods = [(d.strftime("%d.%m.%Y"), d.strftime("%d.%m.%Y")) for d in all_dates]
+    await run_report_batch("by-days", periods, legal_entities, target_file_id, target_list, workers)
 
     print("\nВсе отчеты обработаны.\n")
 
@@ -64,9 +57,10 @@ async def run_generate_report_by_days(date_from: str, date_to: str, target_file_
 # -----------------------------------------------------------------------------
 # Batch-функция /generate-report-by-months/
 # -----------------------------------------------------------------------------
-async def run_generate_report_by_months(date_from: str, date_to: str, target_file_id: str, target_list: str):
+async def run_generate_report_by_months(date_from: str, date_to: str, target_file_id: str, target_list: str,
+                                        workers: int = DEFAULT_WORKERS):
     """
-    Batch-режим для месячных интервалов.
+    Batch-режим для месячных интервалов. Пары (месяц, юрлицо) строятся параллельно.
     """
     print(f"\n=== Batch: generate-report-by-months ===")
     print(f"Параметры: date_from={date_from}, date_to={date_to}")
@@ -91,14 +85,8 @@ async def run_generate_report_by_months(date_from: str, date_to: str, target_fil
     #legal_entities = ["ut"]
     legal_entities = ["kravchik"]
     #legal_entities = ["inter"]
-    for start_date, end_date in month_ranges:
-        formatted_start_date = start_date.strftime("%d.%m.%Y")
-        formatted_end_date = end_date.strftime("%d.%m.%Y")
-        for le in legal_entities:
-            print(f"\n--- Начало обработки для {formatted_start_date} - {formatted_end_date} и {le} ---")
-            async for line in generate_report_stream(formatted_start_date, formatted_end_date, le, target_file_id, target_list):
-                print(line.strip())
-            print(f"--- Завершена обработка для {formatted_start_date} - {formatted_end_date} и {le} ---")
+    periods = [(start.strftime("%d.%m.%Y"), end.strftime("%d.%m.%Y")) for start, end in month_ranges]
+    await run_report_batch("by-months", periods, legal_entities, target_file_id, target_list, workers)
 
     print("\nВсе отчеты обработаны.\n")
 
@@ -106,9 +94,10 @@ async def run_generate_report_by_months(date_from: str, date_to: str, target_fil
 # -----------------------------------------------------------------------------
 # Batch-функция /generate-report-by-weeks/
 # -----------------------------------------------------------------------------
-async def run_generate_report_by_weeks(date_from: str, date_to: str, target_file_id: str, target_list: str):
+async def run_generate_report_by_weeks(date_from: str, date_to: str, target_file_id: str, target_list: str,
+                                       workers: int = DEFAULT_WORKERS):
     """
-    Batch-режим для недельных интервалов.
+    Batch-режим для недельных интервалов. Пары (неделя, юрлицо) строятся параллельно.
     """
     print(f"\n=== Batch: generate-report-by-weeks ===")
     print(f"Параметры: date_from={date_from}, date_to={date_to}")
@@ -134,14 +123,8 @@ async def run_generate_report_by_weeks(date_from: str, date_to: str, target_file
     week_ranges = get_week_ranges(date_from_obj, date_to_obj)
     legal_entities = ["ut", "inter", "kravchik"]
     #legal_entities = ["kravchik"]
-    for start_date, end_date in week_ranges:
-        formatted_start_date = start_date.strftime("%d.%m.%Y")
-        formatted_end_date = end_date.strftime("%d.%m.%Y")
-        for le in legal_entities:
-            print(f"\n--- Начало обработки для {formatted_start_date} - {formatted_end_date} и {le} ---")
-            async for line in generate_report_stream(formatted_start_date, formatted_end_date, le, target_file_id, target_list):
-                print(line.strip())
-            print(f"--- Завершена обработка для {formatted_start_date} - {formatted_end_date} и {le} ---")
+    periods = [(start.strftime("%d.%m.%Y"), end.strftime("%d.%m.%Y")) for start, end in week_ranges]
+    await run_report_batch("by-weeks", periods, legal_entities, target_file_id, target_list, workers)
 
     print("\nВсе отчеты обработаны.\n")
 
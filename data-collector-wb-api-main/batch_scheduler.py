@@ -0,0 +1,190 @@
+"""
+Планировщик batch-режимов: пары (период, юрлицо) строятся параллельно.
+
+Раньше batch_mode проходил даты × юрлица строго по очереди, и каждая пара
+сразу дописывала свои строки в сводную (append_data_between_spreadsheets).
+Здесь:
+
+  • ограниченный пул воркеров (workers) разбирает очередь пар ReportTask;
+    каждая пара — app.build_report_spreadsheet (копия шаблона + выгрузки);
+  • выгрузки держат лимиты своих API (api_limits): WB — на токен юрлица,
+    Postgres и Sheets — на процесс, так что воркеры делят их между собой;
+  • построенные пары записываются в файл контрольной точки (CHECKPOINT_DIR):
+    повторный запуск той же команды после сбоя пропускает их;
+  • в сводную всё переносится в конце одним append в порядке пар
+    (в режиме «по дням» перед этим одним batch_update удаляются старые строки
+    этих дней и юрлиц). После полного успеха файл контрольной точки удаляется.
+"""
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from api_limits import configure_limits
+from app import build_report_spreadsheet
+from config_loader import load_config
+from context import current_mode
+from google_sheets_utils import append_data_from_spreadsheets, remove_rows_by_condition_sets
+
+CONFIG = load_config()
+
+DEFAULT_WORKERS = 3
+# потоков на один строящийся отчёт: 9 выгрузок + расчёт продаж из БД
+THREADS_PER_REPORT = 10
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), "batch_checkpoints")
+
+SUMMARY_SOURCE_SHEET = "Данные для сводной"
+SUMMARY_SOURCE_RANGE = "A4:BG"
+MARKETPLACE = "Wildberries"
+
+
+@dataclass(frozen=True)
+class ReportTask:
+    date_from: str
+    date_to: str
+    legal_entity: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.date_from}|{self.date_to}|{self.legal_entity}"
+
+    def __str__(self) -> str:
+        period = self.date_from if self.date_from == self.date_to else f"{self.date_from} - {self.date_to}"
+        return f"{period} и {self.legal_entity}"
+
+
+def build_tasks(periods: Sequence[Tuple[str, str]], legal_entities: Sequence[str]) -> List[ReportTask]:
+    """Пары в порядке прежнего последовательного обхода: период, затем юрлицо."""
+    return [ReportTask(date_from, date_to, le) for date_from, date_to in periods for le in legal_entities]
+
+
+# ───────────────────────────── контрольная точка ─────────────────────────────
+
+class BatchCheckpoint:
+    """
+    JSON-файл {ключ пары: {"spreadsheet_id": ..., "appended": bool}}.
+    Пишется целиком через временный файл после каждой построенной пары.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pairs: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.pairs = json.load(file).get("pairs", {})
+
+    @classmethod
+    def for_batch(cls, mode: str, date_from: str, date_to: str, target_file_id: str, target_list: str):
+        name = re.sub(r"[^\w.-]+", "_", f"{mode}_{target_file_id}_{target_list}_{date_from}_{date_to}")
+        return cls(os.path.join(CHECKPOINT_DIR, f"{name}.json"))
+
+    def built(self, task: ReportTask) -> Optional[str]:
+        entry = self.pairs.get(task.key)
+        return entry["spreadsheet_id"] if entry else None
+
+    def appended(self, task: ReportTask) -> bool:
+        return bool(self.pairs.get(task.key, {}).get("appended"))
+
+    def mark_built(self, task: ReportTask, spreadsheet_id: str) -> None:
+        self.pairs[task.key] = {"spreadsheet_id": spreadsheet_id, "appended": False}
+        self._save()
+
+    def mark_appended(self, tasks: Sequence[ReportTask]) -> None:
+        for task in tasks:
+            self.pairs[task.key]["appended"] = True
+        self._save()
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"pairs": self.pairs}, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ───────────────────────────── запуск ─────────────────────────────
+
+async def _build_pairs(tasks: Sequence[ReportTask], checkpoint: BatchCheckpoint, workers: int):
+    """Пул воркеров над очередью пар; возвращает список (пара, ошибка) неудавшихся."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+    failed = []
+
+    async def worker():
+        while True:
+            try:
+                task = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            print(f"\n--- Начало обработки для {task} ---")
+            try:
+                spreadsheet_id = await build_report_spreadsheet(task.date_from, task.date_to, task.legal_entity)
+            except Exception as e:
+                print(f"\033[91m--- Ошибка обработки для {task}: {e} ---\033[0m")
+                failed.append((task, e))
+                continue
+            checkpoint.mark_built(task, spreadsheet_id)
+            print(f"--- Завершена обработка для {task}: "
+                  f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit ---")
+
+    await asyncio.gather(*(worker() for _ in range(min(workers, len(tasks)))))
+    return failed
+
+
+def _consolidate(tasks: Sequence[ReportTask], checkpoint: BatchCheckpoint, target_file_id: str, target_list: str):
+    """Один перенос в сводную для всех построенных, но ещё не перенесённых пар."""
+    ready = [t for t in tasks if checkpoint.built(t) and not checkpoint.appended(t)]
+    if not ready:
+        return
+    # если делается отчет по дням — сначала убираем старые строки этих дней и юрлиц
+    if current_mode.get() == "days":
+        remove_rows_by_condition_sets(
+            target_file_id, target_list, [(t.date_from, MARKETPLACE, t.legal_entity) for t in ready]
+        )
+    rows = append_data_from_spreadsheets(
+        [checkpoint.built(t) for t in ready], SUMMARY_SOURCE_SHEET, SUMMARY_SOURCE_RANGE, target_file_id, target_list
+    )
+    checkpoint.mark_appended(ready)
+    print(f"\nВ сводную перенесено {rows} строк из {len(ready)} отчётов.")
+
+
+async def run_report_batch(
+    mode: str,
+    periods: Sequence[Tuple[str, str]],
+    legal_entities: Sequence[str],
+    target_file_id: str,
+    target_list: str,
+    workers: int = DEFAULT_WORKERS,
+):
+    """
+    Строит отчёты по всем парам (период, юрлицо) пулом из workers воркеров и
+    переносит их в сводную одним append. current_mode задаётся до вызова:
+    задачи asyncio и потоки выгрузок наследуют контекст.
+    """
+    tasks = build_tasks(periods, legal_entities)
+    checkpoint = BatchCheckpoint.for_batch(mode, periods[0][0], periods[-1][1], target_file_id, target_list)
+    pending = [t for t in tasks if not checkpoint.built(t)]
+    if len(pending) < len(tasks):
+        print(f"Контрольная точка {checkpoint.path}: {len(tasks) - len(pending)} из {len(tasks)} пар уже построены.")
+
+    configure_limits(CONFIG.get("api_limits", {}))
+    # потоки выгрузок всех воркеров; ожидающие лимитов не должны занимать чужие места
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(workers, 1) * THREADS_PER_REPORT))
+
+    failed = await _build_pairs(pending, checkpoint, workers)
+    await asyncio.to_thread(_consolidate, tasks, checkpoint, target_file_id, target_list)
+
+    if failed:
+        print(f"\n\033[91mНе построено пар: {len(failed)} — "
+              f"{', '.join(str(t) for t, _ in failed)}. Повторный запуск обработает только их.\033[0m")
+        raise RuntimeError(f"batch {mode}: не построено {len(failed)} из {len(tasks)} пар")
+    checkpoint.remove()
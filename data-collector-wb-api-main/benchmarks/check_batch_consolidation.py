@@ -0,0 +1,186 @@
+"""
+Сводный перенос batch-режима (batch_scheduler) против прежнего поштучного
+на поддельном Google Sheets в памяти (FakeSheetsBackend).
+
+Пары (день, юрлицо) «строятся» подменённым build_report_spreadsheet: вместо
+копии шаблона и выгрузок он создаёт в бэкенде таблицу с листом «Данные для
+сводной» (строки пары с A4). Сводная заранее содержит строки этих и соседних
+дней, в том числе чужого маркетплейса.
+
+Сценарии run_report_batch в режиме «по дням» с возобновлением из
+контрольной точки (batch_checkpoints/, здесь — во временном каталоге):
+  • pair-failed   — одна пара не строится, остальные переносятся; повторный
+                    запуск строит только её и дописывает в сводную;
+  • append-failed — та же пара не строится, и перенос падает после удаления
+                    строк; повторный запуск строит её и переносит все пары.
+Итоговая сводная сравнивается с прежним путём: по каждой паре в порядке
+переноса remove_rows_by_conditions + append_data_between_spreadsheets.
+Проверяется также, что повторный запуск не перестраивает готовые пары, а
+файл контрольной точки после успеха удалён.
+
+Запуск (из data-collector-wb-api-main, нужен config.json — как для main.py):
+    PYTHONPATH=. python benchmarks/check_batch_consolidation.py --days 3 --rows 40
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import batch_scheduler  # noqa: E402
+import google_sheets_utils  # noqa: E402
+from context import current_mode  # noqa: E402
+from fake_sheets_backend import FakeSheetsBackend  # noqa: E402
+
+TARGET_ID = "target"
+TARGET_LIST = "Сводная"
+LEGAL_ENTITIES = ["ut", "inter", "kravchik"]
+HEADER = ["A", "B", "C", "D", "E", "F", "G", "H"]
+
+
+def summary_rows(task, rows: int):
+    """Строки «Данных для сводной» пары: E — маркетплейс, F — юрлицо, G — дата."""
+    rnd = random.Random(task.key)
+    label = google_sheets_utils.SELLER_LEGAL_LABELS.get(task.legal_entity, task.legal_entity)
+    return [
+        [f"{task.key}#{i}", i, rnd.randint(0, 99), "", batch_scheduler.MARKETPLACE, label, task.date_from,
+         round(rnd.uniform(0, 1e4), 2)]
+        for i in range(rnd.randint(rows // 2, rows))
+    ]
+
+
+def report_sheets(task, rows: int):
+    return {batch_scheduler.SUMMARY_SOURCE_SHEET: [["Сводная"], ["шапка"], HEADER] + summary_rows(task, rows)}
+
+
+def target_sheet(days, rows: int):
+    """Сводная до запуска: строки дней периода и соседних, WB и Ozon."""
+    first = datetime.strptime(days[0], "%d.%m.%Y") - timedelta(days=1)
+    around = [(first + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(len(days) + 2)]
+    values = [HEADER]
+    for day in around:
+        for marketplace in (batch_scheduler.MARKETPLACE, "Ozon"):
+            for le in LEGAL_ENTITIES:
+                label = google_sheets_utils.SELLER_LEGAL_LABELS.get(le, le)
+                values += [[f"old {day} {marketplace} {le} #{i}", i, 0, "", marketplace, label, day, 1.5]
+                           for i in range(rows // 10)]
+    return values
+
+
+class FakeBuilder:
+    """build_report_spreadsheet: таблица пары в бэкенде; пары из fail падают."""
+
+    def __init__(self, backend: FakeSheetsBackend, rows: int, fail=()):
+        self.backend = backend
+        self.rows = rows
+        self.fail = set(fail)
+        self.built = Counter()
+
+    async def __call__(self, date_from: str, date_to: str, legal_entity: str) -> str:
+        task = batch_scheduler.ReportTask(date_from, date_to, legal_entity)
+        self.built[task] += 1
+        await asyncio.sleep(0)
+        if task in self.fail:
+            raise RuntimeError(f"выгрузка для {task} не удалась")
+        spreadsheet_id = f"report {task.key}"
+        self.backend.add_spreadsheet(spreadsheet_id, report_sheets(task, self.rows))
+        return spreadsheet_id
+
+
+def run_batch(periods, builder, fail_append: bool = False) -> bool:
+    """Один запуск run_report_batch; True — успешно. fail_append — перенос падает после удаления строк."""
+    batch_scheduler.build_report_spreadsheet = builder
+    original_append = batch_scheduler.append_data_from_spreadsheets
+
+    def failing_append(*args, **kwargs):
+        raise RuntimeError("перенос в сводную прерван")
+
+    if fail_append:
+        batch_scheduler.append_data_from_spreadsheets = failing_append
+    current_mode.set("days")
+    try:
+        asyncio.run(batch_scheduler.run_report_batch(
+            "by-days", periods, LEGAL_ENTITIES, TARGET_ID, TARGET_LIST, workers=3,
+        ))
+        return True
+    except RuntimeError as e:
+        print(f"  запуск прерван: {e}")
+        return False
+    finally:
+        batch_scheduler.append_data_from_spreadsheets = original_append
+
+
+def serial_reference(days, tasks, rows: int):
+    """Прежний путь: по каждой паре удаление строк её дня и юрлица, затем append её строк."""
+    backend = FakeSheetsBackend({TARGET_ID: {TARGET_LIST: target_sheet(days, rows)}})
+    google_sheets_utils.set_sheets_backend(backend)
+    for task in tasks:
+        spreadsheet_id = f"report {task.key}"
+        backend.add_spreadsheet(spreadsheet_id, report_sheets(task, rows))
+        google_sheets_utils.remove_rows_by_conditions(
+            TARGET_ID, TARGET_LIST, task.date_from, batch_scheduler.MARKETPLACE, task.legal_entity
+        )
+        google_sheets_utils.append_data_between_spreadsheets(
+            spreadsheet_id, batch_scheduler.SUMMARY_SOURCE_SHEET, batch_scheduler.SUMMARY_SOURCE_RANGE,
+            TARGET_ID, TARGET_LIST,
+        )
+    return backend
+
+
+def scenario(name: str, days, args, fail_append: bool) -> None:
+    print(f"\n=== {name} ===")
+    periods = [(d, d) for d in days]
+    tasks = batch_scheduler.build_tasks(periods, LEGAL_ENTITIES)
+    broken = tasks[len(tasks) // 2]
+
+    backend = FakeSheetsBackend({TARGET_ID: {TARGET_LIST: target_sheet(days, args.rows)}})
+    google_sheets_utils.set_sheets_backend(backend)
+
+    first = FakeBuilder(backend, args.rows, fail=[broken])
+    assert not run_batch(periods, first, fail_append=fail_append)
+    checkpoint = batch_scheduler.BatchCheckpoint.for_batch("by-days", days[0], days[-1], TARGET_ID, TARGET_LIST)
+    assert os.path.exists(checkpoint.path), "после сбоя должна остаться контрольная точка"
+    appended_first = [t for t in tasks if checkpoint.appended(t)]
+    assert not checkpoint.built(broken)
+    assert len(appended_first) == (0 if fail_append else len(tasks) - 1), appended_first
+
+    second = FakeBuilder(backend, args.rows)
+    assert run_batch(periods, second)
+    assert set(second.built) == {broken}, f"повторный запуск перестроил готовые пары: {sorted(map(str, second.built))}"
+    assert not os.path.exists(checkpoint.path), "после успеха контрольная точка удаляется"
+
+    order = appended_first + [t for t in tasks if t not in appended_first]
+    reference = serial_reference(days, order, args.rows)
+    got = backend.snapshot(TARGET_ID)[TARGET_LIST]
+    expected = reference.snapshot(TARGET_ID)[TARGET_LIST]
+    assert got == expected, f"сводная отличается от поштучного пути: {len(got)} строк против {len(expected)}"
+
+    print(f"  пар {len(tasks)}, перестроена только {broken}; строк в сводной {len(got) - 1} — как у поштучного пути")
+    print(f"  вызовов Sheets API: batch {backend.totals()}, поштучно {reference.totals()}")
+
+
+def main(args) -> None:
+    start = datetime.strptime(args.date_from, "%d.%m.%Y")
+    days = [(start + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(args.days)]
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        batch_scheduler.CHECKPOINT_DIR = checkpoint_dir
+        try:
+            scenario("pair-failed: пара не построилась, остальные перенесены", days, args, fail_append=False)
+            scenario("append-failed: перенос прерван после удаления строк", days, args, fail_append=True)
+        finally:
+            google_sheets_utils.set_sheets_backend(None)
+    print("\nOK: возобновлённый batch даёт ту же сводную, что и поштучный перенос")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--date-from", default="02.06.2025")
+    p.add_argument("--days", type=int, default=3)
+    p.add_argument("--rows", type=int, default=40, help="максимум строк «Данных для сводной» на пару")
+    main(p.parse_args())
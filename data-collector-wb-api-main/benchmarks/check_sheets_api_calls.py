@@ -0,0 +1,179 @@
+"""
+Число вызовов Sheets API на один отчёт: прежние поштучные помощники
+google_sheets_utils (до SheetsWriter) против текущих пакетных — на
+поддельном Google Sheets в памяти (FakeSheetsBackend).
+
+Оба варианта строят одинаковый отчёт из синтетических данных: системные
+данные Config(ext), вкладки выгрузок (как add_data_to_sheet в fetch_*),
+остатки (очистка + запись), продажи без заголовков, себестоимость с
+заголовками, затем удаление строк дня и перенос «Данных для сводной» в
+сводную таблицу. Прежняя версия google_sheets_utils берётся из git (коммит
+перед появлением sheets_writer.py, --legacy-ref) и работает через gspread
+поверх того же бэкенда (fake_gspread_client).
+
+Проверяется, что итоговые листы обеих версий совпадают, а чтений и записей
+у пакетной версии меньше; печатаются счётчики по вызовам.
+
+Запуск (из data-collector-wb-api-main, нужен config.json — как для main.py):
+    PYTHONPATH=. python benchmarks/check_sheets_api_calls.py --rows 300
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import types
+from collections import Counter
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import google_sheets_utils  # noqa: E402
+from fake_sheets_backend import FakeSheetsBackend, fake_gspread_client  # noqa: E402
+
+REPORT_ID = "report"
+TARGET_ID = "target"
+TARGET_LIST = "Сводная"
+SUMMARY_SHEET = "Данные для сводной"
+EXPORT_TABS = (
+    "OrdersReport(ext)", "PaidReceiving(ext)", "Supplies(ext)",
+    "AdCampaign(ext)", "Commission(ext)", "PaidStorage(ext)",
+)
+
+
+# ─── данные ───
+
+def export_frame(rnd: random.Random, rows: int, date_str: str) -> pd.DataFrame:
+    return pd.DataFrame({
+        "date": [date_str] * rows,
+        "nm_id": [rnd.randint(10_000_000, 99_999_999) for _ in range(rows)],
+        "article": [f"ART-{rnd.randint(1, 500)}" for _ in range(rows)],
+        "quantity": [rnd.randint(0, 50) for _ in range(rows)],
+        "price": [round(rnd.uniform(100, 5000), 2) for _ in range(rows)],
+    })
+
+
+def spreadsheets(rnd: random.Random, rows: int, date_str: str, legal: str):
+    """Шаблон отчёта (как после create_spreadsheet_copy) и сводная с прошлыми днями."""
+    header = ["date", "nm_id", "article", "quantity", "price"]
+    report = {"Config(ext)": [["Маркетплейс", "Юрлицо", "С", "По", "Период"]]}
+    report.update({tab: [header] for tab in EXPORT_TABS})
+    report["StocksReport(ext)"] = [header] + [["stale", i] for i in range(rows // 2)]
+    report["SalesReport(ext)"] = [header]
+    report["SelfCost(ext)"] = [["Артикул"]]
+    # строки 1–3 — шапка листа, данные для сводной с A4 (E — маркетплейс, F — юрлицо, G — дата)
+    report[SUMMARY_SHEET] = [["Сводная"], ["шапка"], ["A", "B", "C", "D", "E", "F", "G", "H"]] + [
+        [f"s{i}", i, rnd.randint(0, 99), "", "Wildberries", legal, date_str, round(rnd.uniform(0, 1e4), 2)]
+        for i in range(rows // 3)
+    ]
+    target = [["A", "B", "C", "D", "E", "F", "G", "H"]]
+    for day in ("01.06.2025", date_str, "03.06.2025"):
+        for entity in (legal, "ИНТЕР"):
+            target += [[f"t{i}", i, 0, "", "Wildberries", entity, day, 1.5] for i in range(rows // 10)]
+    return {REPORT_ID: report, TARGET_ID: {TARGET_LIST: target}}
+
+
+# ─── отчёт ───
+
+def build_report(gsu, rnd: random.Random, rows: int, date_str: str, legal_key: str) -> None:
+    """Последовательность записей одного отчёта (app.generate_report_stream) на модуле gsu."""
+    gsu.prepare_and_insert_metadata(REPORT_ID, "Config(ext)", legal_key, date_str, date_str, "Wildberries")
+    for tab in EXPORT_TABS:
+        gsu.add_data_to_sheet(REPORT_ID, export_frame(rnd, rows, date_str), tab)
+
+    stocks = export_frame(rnd, rows, date_str)
+    if hasattr(gsu, "replace_sheet_data_without_headers_with_format"):
+        gsu.replace_sheet_data_without_headers_with_format(REPORT_ID, stocks, "StocksReport(ext)", "A2:V")
+    else:
+        gsu.clear_range(REPORT_ID, "StocksReport(ext)", "A2:V")
+        gsu.add_data_to_sheet_without_headers_with_format(REPORT_ID, stocks, "StocksReport(ext)")
+
+    gsu.add_data_to_sheet_without_headers_with_format(REPORT_ID, export_frame(rnd, rows, date_str), "SalesReport(ext)")
+
+    selfcost = pd.DataFrame({
+        "product_id": [f"ART-{i}" for i in range(rows // 5)],
+        date_str: [round(rnd.uniform(50, 900), 2) for _ in range(rows // 5)],
+    })
+    gsu.add_data_to_sheet_with_headers_and_format(REPORT_ID, selfcost, "SelfCost(ext)", clear_range="B1:Z", start_col=2)
+
+    gsu.remove_rows_by_conditions(TARGET_ID, TARGET_LIST, date_str, "Wildberries", legal_key)
+    gsu.append_data_between_spreadsheets(REPORT_ID, SUMMARY_SHEET, "A4:BG", TARGET_ID, TARGET_LIST)
+
+
+def load_legacy(ref: str):
+    """google_sheets_utils из git-ревизии ref как отдельный модуль."""
+    src = subprocess.run(
+        ["git", "show", f"{ref}:./google_sheets_utils.py"], cwd=HERE, check=True, capture_output=True, text=True,
+    ).stdout
+    module = types.ModuleType("google_sheets_utils_legacy")
+    module.__file__ = os.path.join(HERE, "google_sheets_utils.py")
+    exec(compile(src, f"{ref}:google_sheets_utils.py", "exec"), module.__dict__)
+    return module
+
+
+def default_legacy_ref() -> str:
+    added = subprocess.run(
+        ["git", "log", "--diff-filter=A", "--format=%h", "--", "sheets_writer.py"],
+        cwd=HERE, check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return f"{added[-1]}^"
+
+
+def normalized(snapshot):
+    def cell(v):
+        if v in ("", None):
+            return ""
+        try:
+            return repr(round(float(v), 6))
+        except (TypeError, ValueError):
+            return str(v)
+    return {title: [[cell(v) for v in row] for row in rows] for title, rows in snapshot.items()}
+
+
+def run(gsu, backend, args):
+    build_report(gsu, random.Random(args.seed), args.rows, args.date, args.legal)
+    kinds = Counter()
+    for (_, kind), n in backend.calls.items():
+        kinds[kind] += n
+    return kinds, backend.totals()
+
+
+def main(args) -> None:
+    legacy_ref = args.legacy_ref or default_legacy_ref()
+    label = {"kravchik": "КРАВЧИК", "inter": "ИНТЕР", "ut": "АТ"}[args.legal]
+
+    old_backend = FakeSheetsBackend(spreadsheets(random.Random(args.seed), args.rows, args.date, label))
+    legacy = load_legacy(legacy_ref)
+    legacy.connect_to_google_sheets = lambda: fake_gspread_client(old_backend)
+    old_kinds, old_totals = run(legacy, old_backend, args)
+
+    new_backend = FakeSheetsBackend(spreadsheets(random.Random(args.seed), args.rows, args.date, label))
+    google_sheets_utils.set_sheets_backend(new_backend)
+    try:
+        new_kinds, new_totals = run(google_sheets_utils, new_backend, args)
+    finally:
+        google_sheets_utils.set_sheets_backend(None)
+
+    print(f"прежние помощники ({legacy_ref}): чтений {old_totals['read']}, записей {old_totals['write']} — {dict(old_kinds)}")
+    print(f"SheetsWriter:                 чтений {new_totals['read']}, записей {new_totals['write']} — {dict(new_kinds)}")
+
+    for spreadsheet_id in (REPORT_ID, TARGET_ID):
+        old = normalized(old_backend.snapshot(spreadsheet_id))
+        new = normalized(new_backend.snapshot(spreadsheet_id))
+        for title in old:
+            assert old[title] == new[title], f"{spreadsheet_id}/{title}: листы версий различаются"
+    assert new_totals["read"] < old_totals["read"], (old_totals, new_totals)
+    assert new_totals["write"] < old_totals["write"], (old_totals, new_totals)
+    print("OK: листы совпадают, вызовов Sheets API меньше")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=300, help="строк в каждой выгрузке")
+    p.add_argument("--date", default="02.06.2025")
+    p.add_argument("--legal", default="kravchik", choices=["kravchik", "inter", "ut"])
+    p.add_argument("--legacy-ref", default=None, help="ревизия прежнего google_sheets_utils (по умолчанию — до sheets_writer.py)")
+    p.add_argument("--seed", type=int, default=3)
+    main(p.parse_args())
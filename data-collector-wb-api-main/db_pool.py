@@ -0,0 +1,182 @@
+"""
+Общий пул подключений к Postgres для выгрузок отчёта.
+
+Раньше каждая выгрузка открывала своё подключение на каждый запрос
+(asyncpg.connect в stocks / selfcost, psycopg2.connect в продажах), а потом
+собирала список словарей по строкам ради DataFrame. При девяти параллельных
+выгрузках это десяток рукопожатий на отчёт. Здесь:
+
+  • DbPool — один asyncpg-пул на процесс, живущий в собственном потоке с
+    event loop; синхронные выгрузки из потоков (asyncio.to_thread) просто
+    вызывают fetch_frame / copy_frame и ждут результат;
+  • fetch_frame — подготовленный запрос, DataFrame строится прямо из записей
+    asyncpg (без dict на строку), типы значений — как у asyncpg;
+  • copy_frame — COPY (запрос) TO STDOUT в CSV и pandas.read_csv (разбор на C);
+    типы столбцов берутся из описания подготовленного запроса. Для больших
+    выборок из чисел и дат; numeric остаётся Decimal, как у asyncpg. Пропуском
+    считается только пустое поле (NULL или ''), строки вида 'NA' / 'null' в
+    text-столбцах не трогаются.
+
+Параметры — как в asyncpg: $1, $2, ...
+"""
+import asyncio
+import atexit
+import functools
+import io
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+import pandas as pd
+
+from config_loader import load_config
+
+CONFIG = load_config()
+
+DEFAULT_POOL_MIN_SIZE = 1
+DEFAULT_POOL_MAX_SIZE = 5
+
+# тип Postgres → dtype pandas для copy_frame
+_INT_TYPES = {"int2", "int4", "int8", "oid"}
+_FLOAT_TYPES = {"float4", "float8"}
+# numeric без потери точности — Decimal, как в fetch_frame (money в CSV
+# приходит с символом валюты и остаётся строкой)
+_DECIMAL_TYPES = {"numeric"}
+_DATE_TYPES = {"date", "timestamp", "timestamptz"}
+
+
+def _to_decimal(value: str) -> Optional[Decimal]:
+    return Decimal(value) if value else None
+
+
+class DbPool:
+    """asyncpg-пул в отдельном потоке с event loop; методы синхронные и потокобезопасные."""
+
+    def __init__(self, min_size: int = DEFAULT_POOL_MIN_SIZE, max_size: int = DEFAULT_POOL_MAX_SIZE,
+                 **connect_kwargs: Any):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional["asyncio.Future[asyncpg.Pool]"] = None
+        self._lock = threading.Lock()
+
+    # ─── поток с event loop ───
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="db-pool-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro):
+        """Выполняет корутину в потоке пула и ждёт результат (нельзя вызывать из самого потока пула)."""
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("DbPool.run вызван из потока пула — используйте await")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        # вызывается только из потока пула; первые одновременные запросы ждут одно создание пула
+        if self._pool is None:
+            self._pool = asyncio.ensure_future(asyncpg.create_pool(
+                min_size=self.min_size, max_size=self.max_size, **self.connect_kwargs
+            ))
+        try:
+            return await asyncio.shield(self._pool)
+        except Exception:
+            self._pool = None
+            raise
+
+    # ─── запросы ───
+    async def _fetch(self, query: str, args: tuple):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            statement = await conn.prepare(query)
+            rows = await statement.fetch(*args)
+            return [a.name for a in statement.get_attributes()], rows
+
+    async def _copy(self, query: str, args: tuple):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            statement = await conn.prepare(query)
+            attributes = [(a.name, a.type.name) for a in statement.get_attributes()]
+            buffer = io.BytesIO()
+            await conn.copy_from_query(query, *args, output=buffer, format="csv", header=True)
+            return attributes, buffer
+
+    def fetch_frame(self, query: str, *args: Any) -> pd.DataFrame:
+        try:
+            columns, rows = self.run(self._fetch(query, args))
+        except asyncpg.PostgresError as e:
+            raise Exception(f"Ошибка при работе с базой данных: {e}")
+        return pd.DataFrame(rows, columns=columns)
+
+    def copy_frame(self, query: str, *args: Any) -> pd.DataFrame:
+        try:
+            attributes, buffer = self.run(self._copy(query, args))
+        except asyncpg.PostgresError as e:
+            raise Exception(f"Ошибка при работе с базой данных: {e}")
+
+        dtypes: Dict[str, Any] = {}
+        converters: Dict[str, Any] = {}
+        parse_dates: List[str] = []
+        for name, type_name in attributes:
+            if type_name in _DECIMAL_TYPES:
+                converters[name] = _to_decimal
+            elif type_name in _INT_TYPES:
+                dtypes[name] = "Int64"
+            elif type_name in _FLOAT_TYPES:
+                dtypes[name] = "float64"
+            elif type_name == "bool":
+                dtypes[name] = "boolean"
+            elif type_name in _DATE_TYPES:
+                parse_dates.append(name)
+            else:
+                dtypes[name] = str
+        buffer.seek(0)
+        return pd.read_csv(buffer, dtype=dtypes, converters=converters, parse_dates=parse_dates,
+                           true_values=["t"], false_values=["f"], keep_default_na=False, na_values=[""])
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._pool is not None and self._pool.done() and not self._pool.exception():
+            asyncio.run_coroutine_threadsafe(self._pool.result().close(), loop).result()
+        self._pool = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_db() -> DbPool:
+    """Пул процесса к хранилищу postgres_data_storage из config.json."""
+    storage = CONFIG["postgres_data_storage"]
+    db = DbPool(
+        min_size=storage.get("pool_min_size", DEFAULT_POOL_MIN_SIZE),
+        max_size=storage.get("pool_max_size", DEFAULT_POOL_MAX_SIZE),
+        database=storage["database_name"],
+        user=storage["user"],
+        password=storage["password"],
+        host=storage["host"],
+        port=storage["port"],
+    )
+    atexit.register(db.close)
+    return db
+
+
+def fetch_frame(query: str, *args: Any) -> pd.DataFrame:
+    """DataFrame по запросу через пул процесса (см. DbPool.fetch_frame)."""
+    return get_db().fetch_frame(query, *args)
+
+
+def copy_frame(query: str, *args: Any) -> pd.DataFrame:
+    """DataFrame по запросу через COPY ... CSV (см. DbPool.copy_frame)."""
+    return get_db().copy_frame(query, *args)
@@ -0,0 +1,336 @@
+"""
+Поддельный Google Sheets в памяти для проверок SheetsWriter / google_sheets_utils.
+
+FakeSheetsBackend повторяет методы низкого уровня gspread.HTTPClient, которыми
+пользуется SheetsWriter (fetch_sheet_metadata, values_get, batch_update,
+values_batch_update, values_append), а также values_update / values_clear /
+values_batch_clear высокоуровневых Worksheet-методов gspread — поверх него
+работают и прежние, поштучные помощники (fake_gspread_client). Листы хранятся
+как списки строк с размером сетки, вызовы API считаются по отчётам:
+calls[(отчёт, вызов)].
+
+Как и настоящий API, запись за пределы сетки — ошибка (400), а batchUpdate
+применяется целиком или не применяется вовсе.
+
+Подключение:
+    backend = FakeSheetsBackend({"sheet-id": {"OrdersReport(ext)": [["Дата", "Артикул"]]}})
+    google_sheets_utils.set_sheets_backend(backend)
+"""
+import copy
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import gspread
+
+from sheets_writer import a1_to_grid_range, cell_position, current_report
+
+DEFAULT_ROWS = 1000
+DEFAULT_COLUMNS = 26
+
+# вызовы, которые Sheets API относит к квоте чтения; остальные — запись
+READ_CALLS = {"metadata", "values.get"}
+
+
+class FakeSheetsError(Exception):
+    """Ошибка поддельного API (аналог APIError 400)."""
+
+
+class FakeSheet:
+    def __init__(self, sheet_id: int, title: str, values: List[List[Any]],
+                 rows: int = DEFAULT_ROWS, columns: int = DEFAULT_COLUMNS):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.rows = max(rows, len(values))
+        self.columns = max([columns] + [len(r) for r in values])
+        self.cells: List[List[Any]] = [list(r) for r in values]
+        self.formats: List[Dict[str, Any]] = []
+
+    # ─── сетка ───
+    def _ensure(self, row: int) -> None:
+        while len(self.cells) <= row:
+            self.cells.append([])
+
+    def set(self, row: int, col: int, value: Any) -> None:
+        if row >= self.rows or col >= self.columns:
+            raise FakeSheetsError(f"Range exceeds grid limits of '{self.title}': {self.rows}x{self.columns}")
+        self._ensure(row)
+        line = self.cells[row]
+        while len(line) <= col:
+            line.append("")
+        line[col] = value
+
+    def get(self, row: int, col: int) -> Any:
+        if row < len(self.cells) and col < len(self.cells[row]):
+            return self.cells[row][col]
+        return ""
+
+    def values(self) -> List[List[Any]]:
+        """Как values.get: без хвостовых пустых строк и ячеек."""
+        out = [list(r) for r in self.cells]
+        for r in out:
+            while r and r[-1] in ("", None):
+                r.pop()
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def bounds(self, grid: Dict[str, int]):
+        return (grid.get("startRowIndex", 0), grid.get("endRowIndex", self.rows),
+                grid.get("startColumnIndex", 0), grid.get("endColumnIndex", self.columns))
+
+
+class FakeSheetsBackend:
+    """Таблицы: {spreadsheet_id: {название листа: строки}}."""
+
+    def __init__(self, spreadsheets: Dict[str, Dict[str, List[List[Any]]]],
+                 rows: int = DEFAULT_ROWS, columns: int = DEFAULT_COLUMNS):
+        self.spreadsheets: Dict[str, Dict[str, FakeSheet]] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        for sid, sheets in spreadsheets.items():
+            self.add_spreadsheet(sid, sheets, rows, columns)
+
+    def add_spreadsheet(self, spreadsheet_id: str, sheets: Dict[str, List[List[Any]]],
+                        rows: int = DEFAULT_ROWS, columns: int = DEFAULT_COLUMNS) -> None:
+        """Новая таблица (как копия шаблона через Drive — вызовом Sheets API не считается)."""
+        with self._lock:
+            self.spreadsheets[spreadsheet_id] = {
+                title: FakeSheet(i, title, values, rows, columns) for i, (title, values) in enumerate(sheets.items())
+            }
+
+    # ─── служебное ───
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[(current_report.get(), kind)] += 1
+
+    def totals(self) -> Dict[str, int]:
+        """Всего вызовов: {"read": ..., "write": ...} по квотам Sheets API."""
+        out = {"read": 0, "write": 0}
+        for (_, kind), n in self.calls.items():
+            out["read" if kind in READ_CALLS else "write"] += n
+        return out
+
+    def snapshot(self, spreadsheet_id: str) -> Dict[str, List[List[Any]]]:
+        """Значения всех листов таблицы (как values.get без диапазона)."""
+        return {title: sheet.values() for title, sheet in self.spreadsheets[spreadsheet_id].items()}
+
+    def calls_by_report(self) -> Dict[str, Counter]:
+        out: Dict[str, Counter] = {}
+        for (report, kind), n in self.calls.items():
+            out.setdefault(report, Counter())[kind] += n
+        return out
+
+    def sheet(self, spreadsheet_id: str, title: str) -> FakeSheet:
+        try:
+            return self.spreadsheets[spreadsheet_id][title]
+        except KeyError:
+            raise FakeSheetsError(f"Unable to parse range: {title}") from None
+
+    def _sheet_by_id(self, spreadsheet_id: str, sheet_id: int) -> FakeSheet:
+        for sheet in self.spreadsheets[spreadsheet_id].values():
+            if sheet.sheet_id == sheet_id:
+                return sheet
+        raise FakeSheetsError(f"No grid with id: {sheet_id}")
+
+    def _split(self, spreadsheet_id: str, a1: str):
+        title, _, cell_range = a1.partition("!")
+        if title.startswith("'"):
+            title = title[1:-1].replace("''", "'")
+        return self.sheet(spreadsheet_id, title), cell_range
+
+    # ─── методы gspread.HTTPClient ───
+    def fetch_sheet_metadata(self, id: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._count("metadata")
+        return {"properties": {"title": id}, "sheets": [
+            {"properties": {"sheetId": s.sheet_id, "title": s.title,
+                            "gridProperties": {"rowCount": s.rows, "columnCount": s.columns}}}
+            for s in self.spreadsheets[id].values()
+        ]}
+
+    def values_get(self, id: str, range: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._count("values.get")
+        sheet, cell_range = self._split(id, range)
+        r0, r1, c0, c1 = sheet.bounds(a1_to_grid_range(cell_range, sheet.sheet_id))
+        rows = [row[c0:c1] for row in sheet.values()[r0:r1]]
+        while rows and not any(v not in ("", None) for v in rows[-1]):
+            rows.pop()
+        return {"range": range, "majorDimension": "ROWS", "values": rows}
+
+    def values_batch_update(self, id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("values.batchUpdate")
+        with self._lock:
+            snapshot = copy.deepcopy(self.spreadsheets[id])
+            try:
+                for item in body["data"]:
+                    sheet, cell = self._split(id, item["range"])
+                    row, col = cell_position(cell.split(":")[0])
+                    for dy, values in enumerate(item["values"]):
+                        for dx, value in enumerate(values):
+                            sheet.set(row - 1 + dy, col - 1 + dx, value)
+            except Exception:
+                self.spreadsheets[id] = snapshot
+                raise
+        return {"totalUpdatedRows": sum(len(i["values"]) for i in body["data"])}
+
+    def values_append(self, id: str, range: str, params: Dict[str, Any], body: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("values.append")
+        sheet, cell_range = self._split(id, range)
+        values = body["values"]
+        with self._lock:
+            cells = sheet.values()
+            start = a1_to_grid_range(cell_range, sheet.sheet_id).get("startRowIndex", 0)
+            # «таблица» — сплошной блок непустых строк от начала диапазона; запись — сразу под ней
+            while start < len(cells) and cells[start]:
+                start += 1
+            if (params or {}).get("insertDataOption") == "INSERT_ROWS" and start < len(cells):
+                sheet._ensure(start)
+                sheet.cells[start:start] = [[] for _ in values]
+                sheet.rows += len(values)
+            sheet.rows = max(sheet.rows, start + len(values))
+            for dy, row in enumerate(values):
+                for dx, value in enumerate(row):
+                    sheet.set(start + dy, dx, value)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def values_update(self, id: str, range: str, params: Optional[Dict[str, Any]] = None,
+                      body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._count("values.update")
+        sheet, cell_range = self._split(id, range)
+        row, col = cell_position(cell_range.split(":")[0] or "A1")
+        with self._lock:
+            snapshot = copy.deepcopy(self.spreadsheets[id])
+            try:
+                for dy, values in enumerate(body["values"]):
+                    for dx, value in enumerate(values):
+                        sheet.set(row - 1 + dy, col - 1 + dx, value)
+            except Exception:
+                self.spreadsheets[id] = snapshot
+                raise
+        return {"updatedRows": len(body["values"])}
+
+    def _clear(self, id: str, a1: str) -> None:
+        sheet, cell_range = self._split(id, a1)
+        r0, r1, c0, c1 = sheet.bounds(a1_to_grid_range(cell_range, sheet.sheet_id))
+        for r in range(r0, min(r1, len(sheet.cells))):
+            line = sheet.cells[r]
+            for c in range(c0, min(c1, len(line))):
+                line[c] = ""
+
+    def values_clear(self, id: str, range: str) -> Dict[str, Any]:
+        self._count("values.clear")
+        with self._lock:
+            self._clear(id, range)
+        return {"clearedRange": range}
+
+    def values_batch_clear(self, id: str, params: Optional[Dict[str, Any]] = None,
+                           body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._count("values.batchClear")
+        with self._lock:
+            for a1 in body["ranges"]:
+                self._clear(id, a1)
+        return {"clearedRanges": body["ranges"]}
+
+    def batch_update(self, id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._count("batchUpdate")
+        with self._lock:
+            snapshot = copy.deepcopy(self.spreadsheets[id])
+            try:
+                for request in body["requests"]:
+                    (kind, args), = request.items()
+                    getattr(self, f"_apply_{kind}")(id, args)
+            except Exception:
+                self.spreadsheets[id] = snapshot
+                raise
+        return {"replies": [{} for _ in body["requests"]]}
+
+    # ─── запросы batchUpdate ───
+    def _apply_updateCells(self, id: str, args: Dict[str, Any]) -> None:
+        if "rows" in args or args.get("fields") != "userEnteredValue":
+            raise FakeSheetsError("поддерживается только очистка значений updateCells")
+        sheet = self._sheet_by_id(id, args["range"]["sheetId"])
+        r0, r1, c0, c1 = sheet.bounds(args["range"])
+        for r in range(r0, min(r1, len(sheet.cells))):
+            line = sheet.cells[r]
+            for c in range(c0, min(c1, len(line))):
+                line[c] = ""
+
+    def _apply_insertDimension(self, id: str, args: Dict[str, Any]) -> None:
+        rng = args["range"]
+        sheet = self._sheet_by_id(id, rng["sheetId"])
+        if rng["dimension"] != "ROWS":
+            raise FakeSheetsError("поддерживается только вставка строк")
+        count = rng["endIndex"] - rng["startIndex"]
+        sheet._ensure(rng["startIndex"])
+        sheet.cells[rng["startIndex"]:rng["startIndex"]] = [[] for _ in range(count)]
+        sheet.rows += count
+
+    def _apply_insertRange(self, id: str, args: Dict[str, Any]) -> None:
+        rng = args["range"]
+        sheet = self._sheet_by_id(id, rng["sheetId"])
+        r0, r1, c0, c1 = sheet.bounds(rng)
+        count = r1 - r0
+        sheet.rows += count
+        # сдвиг вниз только в столбцах c0..c1, снизу вверх
+        for r in range(len(sheet.cells) - 1 + count, r0 - 1, -1):
+            for c in range(c0, c1):
+                value = sheet.get(r - count, c) if r - count >= r0 else ""
+                if value != "" or sheet.get(r, c) != "":
+                    sheet.set(r, c, value)
+
+    def _apply_deleteDimension(self, id: str, args: Dict[str, Any]) -> None:
+        rng = args["range"]
+        sheet = self._sheet_by_id(id, rng["sheetId"])
+        del sheet.cells[rng["startIndex"]:rng["endIndex"]]
+        sheet.rows -= rng["endIndex"] - rng["startIndex"]
+
+    def _apply_appendDimension(self, id: str, args: Dict[str, Any]) -> None:
+        sheet = self._sheet_by_id(id, args["sheetId"])
+        if args["dimension"] == "ROWS":
+            sheet.rows += args["length"]
+        else:
+            sheet.columns += args["length"]
+
+    def _apply_repeatCell(self, id: str, args: Dict[str, Any]) -> None:
+        self._sheet_by_id(id, args["range"]["sheetId"]).formats.append(args)
+
+    def _apply_updateSheetProperties(self, id: str, args: Dict[str, Any]) -> None:
+        props = args["properties"]
+        sheet = self._sheet_by_id(id, props["sheetId"])
+        grid = props.get("gridProperties", {})
+        if "rowCount" in grid:
+            del sheet.cells[grid["rowCount"]:]
+            sheet.rows = grid["rowCount"]
+        if "columnCount" in grid:
+            for line in sheet.cells:
+                del line[grid["columnCount"]:]
+            sheet.columns = grid["columnCount"]
+
+
+class _FakeHTTPClient(gspread.http_client.HTTPClient):
+    """HTTPClient gspread, чьи вызовы Sheets API уходят в FakeSheetsBackend."""
+
+    def __init__(self, backend: FakeSheetsBackend):
+        self.backend = backend
+
+    def __getattribute__(self, name):
+        if name in BACKEND_METHODS:
+            return getattr(object.__getattribute__(self, "backend"), name)
+        return object.__getattribute__(self, name)
+
+
+BACKEND_METHODS = {
+    "fetch_sheet_metadata", "values_get", "values_update", "values_append", "values_clear",
+    "values_batch_clear", "values_batch_update", "batch_update",
+}
+
+
+def fake_gspread_client(backend: FakeSheetsBackend) -> gspread.Client:
+    """
+    gspread.Client поверх FakeSheetsBackend: open_by_key / worksheet / update /
+    insert_rows и прочие методы Spreadsheet и Worksheet ходят в бэкенд, как в
+    HTTPClient, — для сравнения с помощниками до SheetsWriter.
+    """
+    client = gspread.Client.__new__(gspread.Client)
+    client.http_client = _FakeHTTPClient(backend)
+    return client
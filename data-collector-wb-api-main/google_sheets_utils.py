@@ -4,21 +4,34 @@ import pandas as pd
 import json
 from config_loader import load_config
 from datetime import datetime
-from gspread_dataframe import set_with_dataframe
 import time
 import functools
+import threading
 from gspread.exceptions import APIError
 from microsoft_sheets_utils import add_data_to_excel
+from sheets_writer import (
+    PacedHTTPClient, SheetsQuota, SheetsWriter, backoff_delay, column_letters, report_scope
+)
 
 CONFIG = load_config()
 
+# Квота Sheets API сервисного аккаунта (запросов в минуту), см. sheets_writer
+PacedHTTPClient.quota = SheetsQuota(
+    read_per_minute=CONFIG["google_sheets"].get("read_requests_per_minute", 60),
+    write_per_minute=CONFIG["google_sheets"].get("write_requests_per_minute", 60),
+)
 
-def retry_on_quota_error(max_retries=10, delay=10):
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def retry_on_quota_error(max_retries=3):
     """
     Декоратор для повторных попыток выполнения функции в случае ошибок API (429, 5xx).
+    Запросы к Sheets уже повторяет PacedHTTPClient; здесь — последний рубеж
+    для операций целиком (в т.ч. Drive), задержка экспоненциальная.
 
     :param max_retries: Максимальное количество повторных попыток.
-    :param delay: Задержка между попытками в секундах.
     """
 
     def decorator(func):
@@ -33,8 +46,9 @@ def retry_on_quota_error(max_retries=10, delay=10):
                 except APIError as e:
                     status_code = e.response.status_code
                     if status_code == 429 or (500 <= status_code < 600):  # Обрабатываем 429 и ошибки 5xx
+                        delay = backoff_delay(attempt, e.response)
                         print(
-                            f"{err_prefix}Ошибка {status_code}: {e.response.reason}. Ожидание {delay} секунд перед повторной попыткой... (Попытка {attempt} из {max_retries})")
+                            f"{err_prefix}Ошибка {status_code}: {e.response.reason}. Ожидание {delay:.1f} секунд перед повторной попыткой... (Попытка {attempt} из {max_retries})")
                         time.sleep(delay)
                     else:
                         print(f"{err_prefix}Ошибка {status_code}: {e.response.reason}. Прерываем выполнение.")
@@ -49,15 +63,53 @@ def retry_on_quota_error(max_retries=10, delay=10):
 
     return decorator
 
+@functools.lru_cache(maxsize=None)
 def connect_to_google_sheets():
+    """Авторизованный клиент gspread — один на процесс, запросы идут через квоту PacedHTTPClient."""
     scope = [
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive"
     ]
     creds = ServiceAccountCredentials.from_json_keyfile_name(CONFIG["google_sheets"]["credentials_file"], scope)
-    client = gspread.authorize(creds)
+    client = gspread.authorize(creds, http_client=PacedHTTPClient)
     return client
 
+
+def get_sheets_writer() -> SheetsWriter:
+    """SheetsWriter процесса; по умолчанию поверх HTTP-клиента gspread."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SheetsWriter(connect_to_google_sheets().http_client)
+        return _writer
+
+
+def set_sheets_backend(backend):
+    """Подменяет бэкенд записи (например, FakeSheetsBackend в проверках); None — вернуть gspread."""
+    global _writer
+    with _writer_lock:
+        _writer = SheetsWriter(backend) if backend is not None else None
+
+
+def _json_value(value):
+    """Значение ячейки для JSON тела запроса: NaN → '', numpy → python, прочее → str."""
+    if pd.isnull(value) is True:
+        return ""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _frame_values(data, include_header=False):
+    rows = [[_json_value(v) for v in row] for row in data.to_numpy("object")]
+    if include_header:
+        rows.insert(0, [_json_value(c) for c in data.columns])
+    return rows
+
 @retry_on_quota_error()
 def create_spreadsheet_copy(sheet_name):
     client = connect_to_google_sheets()
@@ -67,57 +119,28 @@ def create_spreadsheet_copy(sheet_name):
 
 @retry_on_quota_error()
 def add_data_to_sheet(spreadsheet_id, data, sheet_name):
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data_list = data.values.tolist()
-    sheet.insert_rows(data_list, row=2)
+    """Вставляет строки DataFrame под заголовком: вставка строк и запись — по одному запросу."""
+    data_list = _frame_values(data)
+    (get_sheets_writer().tab(spreadsheet_id, sheet_name)
+        .insert_rows(2, len(data_list))
+        .write("A2", data_list, value_input_option="RAW")
+        .commit())
 
 def add_data_to_sheet_by_dataframe_columns_count(spreadsheet_id, data, sheet_name):
-    from gspread.utils import rowcol_to_a1
-    client = connect_to_google_sheets()
-    spreadsheet = client.open_by_key(spreadsheet_id)
-    sheet = spreadsheet.worksheet(sheet_name)
-
     # Преобразуем DataFrame в список списков (строки)
     data_list = data.astype(str).values.tolist()
     rows_to_insert = len(data_list)
     # Количество столбцов в DataFrame
     columns_to_insert = data.shape[1]
 
-    sheet_id = sheet.id
-
-    # Формируем тело запроса с учётом нужного числа столбцов.
-    # Используем endColumnIndex = columns_to_insert, чтобы не трогать столбцы "правее".
-    body = {
-        "requests": [
-            {
-                "insertRange": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startRowIndex": 1,
-                        "endRowIndex": 1 + rows_to_insert,
-                        "startColumnIndex": 0,
-                        "endColumnIndex": columns_to_insert
-                    },
-                    "shiftDimension": "ROWS"
-                }
-            }
-        ]
-    }
-
-    # Вызываем batch_update именно у Spreadsheet-объекта
-    spreadsheet.batch_update(body)
+    # Сдвигаем вниз только столбцы данных (insertRange), чтобы не трогать столбцы "правее",
+    # и заполняем освободившиеся строки начиная с A2.
+    (get_sheets_writer().tab(spreadsheet_id, sheet_name)
+        .insert_rows(2, rows_to_insert, columns=columns_to_insert)
+        .write("A2", data_list, value_input_option="RAW")
+        .commit())
 
-    # Теперь заполним вставленные строки данными
-    # Сформируем A1-диапазон с помощью rowcol_to_a1
-    #  - Начальная ячейка: (row=2, col=1) => A2
-    #  - Конечная ячейка: (row=1+rows_to_insert, col=columns_to_insert)
-    #    например, если columns_to_insert=3, будет 'C(1+rows_to_insert)'
-    start_cell = rowcol_to_a1(2, 1)  # A2
-    end_cell = rowcol_to_a1(1 + rows_to_insert, columns_to_insert)
-    update_range = f"{start_cell}:{end_cell}"
-
-    sheet.update(update_range, data_list)
+    update_range = f"A2:{column_letters(columns_to_insert - 1)}{1 + rows_to_insert}"
 
     print(f"Добавлено {rows_to_insert} строк в диапазон {update_range}.\n"
           "Все столбцы за пределами этих данных остались нетронутыми.")
@@ -135,14 +158,6 @@ def add_data_to_sheet_with_headers_and_format(spreadsheet_id, data, sheet_name,
     - clear_range: Диапазон для очистки
     - start_col: Столбец, с которого начинать вставку
     """
-    client = connect_to_google_sheets()
-    sh = client.open_by_key(spreadsheet_id)
-    worksheet = sh.worksheet(sheet_name)
-
-    rows = len(worksheet.get_all_values())
-    clear_range_full = f"{clear_range}{rows}"
-    worksheet.batch_clear([clear_range_full])
-
     data = data.copy()
     data.columns = [
         col.strftime("%d.%m.%Y") if isinstance(col, datetime) else col for col in data.columns
@@ -162,14 +177,12 @@ def add_data_to_sheet_with_headers_and_format(spreadsheet_id, data, sheet_name,
             except ValueError:
                 pass
 
-    set_with_dataframe(
-        worksheet,
-        data,
-        include_index=False,
-        include_column_header=True,
-        row=1,
-        col=start_col
-    )
+    # Очистка открытого диапазона (например, 'B1:Z' — до конца листа) и запись
+    # с заголовками уходят в одной пачке: без чтения листа ради числа строк.
+    (get_sheets_writer().tab(spreadsheet_id, sheet_name)
+        .clear(clear_range)
+        .write(f"{column_letters(start_col - 1)}1", _frame_values(data, include_header=True))
+        .commit())
 
 
 @retry_on_quota_error()
@@ -181,21 +194,13 @@ def clear_range(spreadsheet_id, sheet_name, range_to_clear):
     :param sheet_name: Название вкладки для очистки.
     :param range_to_clear: Диапазон ячеек для очистки (например, 'A1:D10').
     """
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-
     # Очищаем указанный диапазон (без sheet_name в строке)
-    sheet.batch_clear([range_to_clear])
+    get_sheets_writer().tab(spreadsheet_id, sheet_name).clear(range_to_clear).commit()
 
     # print(f"Диапазон '{range_to_clear}' на листе '{sheet_name}' в Google Sheets '{spreadsheet_id}' успешно очищен.")
 
 
-@retry_on_quota_error()
-def add_data_to_sheet_without_headers_with_format(spreadsheet_id, data, sheet_name):
-    client = connect_to_google_sheets()
-    sh = client.open_by_key(spreadsheet_id)
-    worksheet = sh.worksheet(sheet_name)
-
+def _format_data_without_headers(data):
     data = data.copy()
     data.columns = [
         col.strftime("%d.%m.%Y") if isinstance(col, datetime) else col for col in data.columns
@@ -220,29 +225,41 @@ def add_data_to_sheet_without_headers_with_format(spreadsheet_id, data, sheet_na
             except ValueError:
                 pass
 
-    str_list = list(filter(None, worksheet.col_values(1)))
-    first_empty_row = len(str_list) + 1
+    return data.fillna("")
 
-    # Преобразуем DataFrame в JSON и выводим его в отформатированном виде
-    # json_data = data.to_json(orient='records', force_ascii=False)  # Формат JSON для строк
-    # parsed_json = json.loads(json_data)  # Десериализация для красивого вывода
-    # print("Данные в формате JSON:")
-    # print(json.dumps(parsed_json, indent=4, ensure_ascii=False))  # Красивый вывод
 
-    data = data.fillna("")
+@retry_on_quota_error()
+def add_data_to_sheet_without_headers_with_format(spreadsheet_id, data, sheet_name):
+    data = _format_data_without_headers(data)
+
+    writer = get_sheets_writer()
+    # Первая пустая строка — по заполненным ячейкам столбца A (читается только он)
+    str_list = list(filter(None, (row[0] if row else "" for row in writer.read(spreadsheet_id, sheet_name, "A:A"))))
+    first_empty_row = len(str_list) + 1
 
-    data_list = data.values.tolist()
     cell_range = f'A{first_empty_row}'
 
-    worksheet.update(cell_range, data_list, value_input_option='USER_ENTERED')
+    writer.tab(spreadsheet_id, sheet_name).write(cell_range, _frame_values(data)).commit()
+
+
+@retry_on_quota_error()
+def replace_sheet_data_without_headers_with_format(spreadsheet_id, data, sheet_name, range_to_clear, start_row=2):
+    """
+    Очищает range_to_clear и записывает данные без заголовков с start_row —
+    одной пачкой (batchUpdate + values.batchUpdate) вместо clear_range и
+    add_data_to_sheet_without_headers_with_format подряд.
+    """
+    data = _format_data_without_headers(data)
+    (get_sheets_writer().tab(spreadsheet_id, sheet_name)
+        .clear(range_to_clear)
+        .write(f"A{start_row}", _frame_values(data))
+        .commit())
 
     #print(f"Данные успешно добавлены в лист '{sheet_name}' начиная с строки {first_empty_row}.")
 
 @retry_on_quota_error()
 def insert_text_to_cell(spreadsheet_id, sheet_name, cell, text):
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    sheet.update_acell(cell, text)
+    get_sheets_writer().tab(spreadsheet_id, sheet_name).write(cell, [[text]]).commit()
 
 @retry_on_quota_error()
 def prepare_and_insert_metadata(spreadsheet_id, sheet_name, legal_entity, date_from, date_to, marketplace):
@@ -255,24 +272,25 @@ def prepare_and_insert_metadata(spreadsheet_id, sheet_name, legal_entity, date_f
     else:
         raise ValueError(f"Неизвестное юридическое лицо: {legal_entity}")
 
-    insert_text_to_cell(spreadsheet_id, sheet_name, "B2", entity_text)
-
     date_from_dt = datetime.strptime(date_from, "%d.%m.%Y")
     date_to_dt = datetime.strptime(date_to, "%d.%m.%Y")
     if date_from_dt == date_to_dt:
         date_text = date_from_dt.strftime("%d.%m.%Y")
     else:
         date_text = f"{date_from_dt.strftime('%d.%m.%Y')}-{date_to_dt.strftime('%d.%m.%Y')}"
-    insert_text_to_cell(spreadsheet_id, sheet_name, "E2", date_text)
-    insert_text_to_cell(spreadsheet_id, sheet_name, "A2", marketplace)
-    insert_text_to_cell(spreadsheet_id, sheet_name, "C2", f"{date_from_dt.strftime('%d.%m.%Y')}")
-    insert_text_to_cell(spreadsheet_id, sheet_name, "D2", f"{date_to_dt.strftime('%d.%m.%Y')}")
+
+    # пять ячеек — один values.batchUpdate
+    (get_sheets_writer().tab(spreadsheet_id, sheet_name)
+        .write("B2", [[entity_text]])
+        .write("E2", [[date_text]])
+        .write("A2", [[marketplace]])
+        .write("C2", [[f"{date_from_dt.strftime('%d.%m.%Y')}"]])
+        .write("D2", [[f"{date_to_dt.strftime('%d.%m.%Y')}"]])
+        .commit())
 
 @retry_on_quota_error()
 def get_sheet_data(spreadsheet_id, sheet_name):
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data = sheet.get_all_values()
+    data = get_sheets_writer().read(spreadsheet_id, sheet_name)
 
     if not data or len(data) < 2:
         raise Exception("Таблица пуста или данные отсутствуют.")
@@ -288,14 +306,12 @@ def clear_sheet(spreadsheet_id, sheet_name):
     :param spreadsheet_id: Идентификатор Google Sheets.
     :param sheet_name: Название вкладки для очистки.
     """
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    # Получаем количество строк и столбцов
-    rows = len(sheet.get_all_values())
-    cols = len(sheet.row_values(1))
-    if rows > 1:
-        range_to_clear = f'A2:{chr(64 + cols)}{rows}'
-        sheet.batch_clear([range_to_clear])
+    writer = get_sheets_writer()
+    # Ширина — по заголовку (читается только первая строка), высота — до конца листа
+    header = writer.read(spreadsheet_id, sheet_name, "1:1")
+    cols = len(header[0]) if header else 0
+    if cols:
+        writer.tab(spreadsheet_id, sheet_name).clear(f'A2:{column_letters(cols - 1)}').commit()
     #print(f"Лист '{sheet_name}' в Google Sheets '{spreadsheet_id}' был успешно очищен, кроме первой строки.")
 
 
@@ -310,9 +326,7 @@ def get_sheet_data_columns(spreadsheet_id, sheet_name, columns):
     :param columns: Список столбцов, которые нужно получить.
     :return: DataFrame с данными из указанных столбцов.
     """
-    client = connect_to_google_sheets()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data = sheet.get_all_values()
+    data = get_sheets_writer().read(spreadsheet_id, sheet_name)
 
     if not data or len(data) < 2:
         raise Exception("Таблица пуста или данные отсутствуют.")
@@ -328,24 +342,44 @@ def append_data_between_spreadsheets(
     target_spreadsheet_id,
     target_sheet_name
 ):
-    client = connect_to_google_sheets()
+    writer = get_sheets_writer()
 
-    source_spreadsheet = client.open_by_key(source_spreadsheet_id)
-    source_sheet = source_spreadsheet.worksheet(source_sheet_name)
-
-    data_to_copy = source_sheet.get(source_range)
+    data_to_copy = writer.read(source_spreadsheet_id, source_sheet_name, source_range)
 
     if not data_to_copy:
         #print("Нет данных для копирования.")
         return
 
-    target_spreadsheet = client.open_by_key(target_spreadsheet_id)
-    target_sheet = target_spreadsheet.worksheet(target_sheet_name)
-
-    target_sheet.append_rows(data_to_copy, value_input_option='USER_ENTERED')
+    writer.append(target_spreadsheet_id, target_sheet_name, data_to_copy, value_input_option='USER_ENTERED')
     #print("Данные успешно скопированы и добавлены в целевую таблицу.")
 
 
+@retry_on_quota_error()
+def append_data_from_spreadsheets(
+    source_spreadsheet_ids,
+    source_sheet_name,
+    source_range,
+    target_spreadsheet_id,
+    target_sheet_name
+):
+    """
+    Сводный перенос: читает source_range из каждой таблицы source_spreadsheet_ids
+    (в заданном порядке) и добавляет все строки в целевой лист одним append.
+    Возвращает число добавленных строк.
+    """
+    writer = get_sheets_writer()
+
+    data_to_copy = []
+    for source_spreadsheet_id in source_spreadsheet_ids:
+        data_to_copy.extend(writer.read(source_spreadsheet_id, source_sheet_name, source_range))
+
+    if not data_to_copy:
+        return 0
+
+    writer.append(target_spreadsheet_id, target_sheet_name, data_to_copy, value_input_option='USER_ENTERED')
+    return len(data_to_copy)
+
+
 @retry_on_quota_error()
 def append_data_from_google_to_microsoft_excel(
         source_spreadsheet_id,
@@ -357,12 +391,8 @@ def append_data_from_google_to_microsoft_excel(
     """
     Переносит данные из Google Sheets в Microsoft Excel.
     """
-    client = connect_to_google_sheets()
-
     # Читаем данные из Google Sheets
-    source_spreadsheet = client.open_by_key(source_spreadsheet_id)
-    source_sheet = source_spreadsheet.worksheet(source_sheet_name)
-    data_to_copy = source_sheet.get(source_range)
+    data_to_copy = get_sheets_writer().read(source_spreadsheet_id, source_sheet_name, source_range)
 
     if not data_to_copy:
         print("Нет данных для копирования.")
@@ -460,7 +490,10 @@ def append_data_from_google_to_microsoft_excel(
     except Exception as e:
         print(f"Ошибка при добавлении данных в Microsoft Excel: {e}")
 
-@retry_on_quota_error()
+# Подписи юрлиц в столбце F сводной
+SELLER_LEGAL_LABELS = {"ut": "АТ", "inter": "ИНТЕР", "kravchik": "КРАВЧИК"}
+
+
 def remove_rows_by_conditions(
     spreadsheet_id: str,
     sheet_name: str,
@@ -478,31 +511,27 @@ def remove_rows_by_conditions(
 
     Это физически удаляет строки, а не просто очищает их содержимое.
     """
+    remove_rows_by_condition_sets(spreadsheet_id, sheet_name, [(date_str, marketplace, seller_legal)])
 
-    if seller_legal == "ut":
-        seller_legal = "АТ"
-    if seller_legal == "inter":
-        seller_legal = "ИНТЕР"
-    if seller_legal == "kravchik":
-        seller_legal = "КРАВЧИК"
-
-    client = connect_to_google_sheets()
-    spreadsheet = client.open_by_key(spreadsheet_id)
 
-    # Найдём sheetId по названию листа
-    sheet_id = None
-    sheets_metadata = spreadsheet.fetch_sheet_metadata().get("sheets", [])
-    for s in sheets_metadata:
-        if s["properties"]["title"] == sheet_name:
-            sheet_id = s["properties"]["sheetId"]
-            break
+@retry_on_quota_error()
+def remove_rows_by_condition_sets(spreadsheet_id: str, sheet_name: str, conditions):
+    """
+    Как remove_rows_by_conditions, но сразу для набора условий
+    [(date_str, marketplace, seller_legal), ...]: одно чтение E:G и один batch_update
+    на все совпавшие строки (batch-режим удаляет так строки всех дней и юрлиц разом).
+    """
+    keys = {
+        (marketplace, SELLER_LEGAL_LABELS.get(seller_legal, seller_legal), date_str)
+        for date_str, marketplace, seller_legal in conditions
+    }
+    if not keys:
+        return
 
-    if sheet_id is None:
-        raise ValueError(f"Не найден лист с именем '{sheet_name}' в таблице {spreadsheet_id}")
+    writer = get_sheets_writer()
 
-    # Читаем все данные листа
-    sheet = spreadsheet.worksheet(sheet_name)
-    all_values = sheet.get_all_values()
+    # Читаем только столбцы условий E:G (sheetId листа — из кэша метаданных при удалении)
+    all_values = writer.read(spreadsheet_id, sheet_name, "E:G")
 
     # Если лист пуст или там только заголовок
     if len(all_values) <= 1:
@@ -516,72 +545,33 @@ def remove_rows_by_conditions(
     rows_to_delete = []
 
     for i, row in enumerate(data_rows, start=1):
-        # Проверяем, что есть хотя бы 7 столбцов (E=4, F=5, G=6)
-        if len(row) >= 7:
-            if row[4] == marketplace and row[5] == seller_legal and row[6] == date_str:
-                rows_to_delete.append(i)  # i уже совпадает с 0-based индексом в Sheets API
+        # Проверяем, что заполнены все три столбца (E=0, F=1, G=2 в прочитанном диапазоне)
+        if len(row) >= 3 and tuple(row[:3]) in keys:
+            rows_to_delete.append(i)  # i уже совпадает с 0-based индексом в Sheets API
 
     if not rows_to_delete:
         print("Нет строк, удовлетворяющих заданным условиям. Удалять нечего.")
         return
 
-    # Чтобы при удалении строк сверху не смещались индексы нижних строк, удаляем «снизу вверх».
-    # Для этого отсортируем индексы в убывающем порядке.
-    rows_to_delete.sort(reverse=True)
-
-    # Можно либо делать один запрос на каждую группу подряд идущих строк,
-    # либо вообще на каждую строку отдельно. Предпочтительнее группировать.
-    requests = []
+    # Группируем идущие подряд строки в интервалы [start, end) — один deleteDimension на интервал
+    intervals = []
+    for idx in sorted(rows_to_delete):
+        if intervals and intervals[-1][1] == idx:
+            intervals[-1][1] = idx + 1
+        else:
+            intervals.append([idx, idx + 1])
 
-    # Группируем идущие подряд строки в интервалы
-    start_idx = None
-    prev_idx = None
+    # Все удаления одним batch_update; TabBatch удаляет «снизу вверх», индексы не смещаются
+    writer.tab(spreadsheet_id, sheet_name).delete_rows(map(tuple, intervals)).commit()
 
-    for idx in rows_to_delete:
-        if start_idx is None:
-            # Начало нового диапазона
-            start_idx = idx
-            prev_idx = idx
-        else:
-            if idx == prev_idx - 1:
-                # Продолжаем диапазон подряд
-                prev_idx = idx
-            else:
-                # Закрываем предыдущий диапазон (prev_idx..start_idx)
-                requests.append({
-                    "deleteDimension": {
-                        "range": {
-                            "sheetId": sheet_id,
-                            "dimension": "ROWS",
-                            "startIndex": prev_idx,
-                            "endIndex": start_idx + 1  # endIndex не включительно
-                        }
-                    }
-                })
-                # Начинаем новый
-                start_idx = idx
-                prev_idx = idx
-
-    # Добавим последний (или единственный) диапазон
-    requests.append({
-        "deleteDimension": {
-            "range": {
-                "sheetId": sheet_id,
-                "dimension": "ROWS",
-                "startIndex": prev_idx,
-                "endIndex": start_idx + 1
-            }
-        }
-    })
-
-    # Отправляем все удаления одним batch_update
-    body = {"requests": requests}
-    spreadsheet.batch_update(body)
-
-    print(
-        f"Удалено {len(rows_to_delete)} строк, удовлетворяющих условиям: "
-        f"E='{marketplace}', F='{seller_legal}', G='{date_str}'."
-    )
+    if len(keys) == 1:
+        (marketplace, seller_legal, date_str), = keys
+        print(
+            f"Удалено {len(rows_to_delete)} строк, удовлетворяющих условиям: "
+            f"E='{marketplace}', F='{seller_legal}', G='{date_str}'."
+        )
+    else:
+        print(f"Удалено {len(rows_to_delete)} строк по {len(keys)} наборам условий (E, F, G).")
 
 if __name__ == "__main__":
     # # Обязательно надо копировать с заголовком таблицы! (указать в диапазоне)
@@ -10,6 +10,7 @@ from batch_mode import (
     run_generate_report_by_weeks,
     run_sync_wb_orders
 )
+from batch_scheduler import DEFAULT_WORKERS
 
 def main():
     """
@@ -28,6 +29,8 @@ def main():
     parser.add_argument("--target_list", type=str, default=None, help="Имя вкладки в файле с результатом")
     parser.add_argument("--clear_range", type=str, default=None, help="Интервал вставки данных в листе (напр. А1:N)")
     parser.add_argument("--start_col", type=int, default=None, help="Стартовый столбец вставки (напр. 1")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Сколько пар (период, юрлицо) строить параллельно в batch-режимах")
 
     args = parser.parse_args()
 
@@ -35,28 +38,28 @@ def main():
         if not args.date_from or not args.date_to:
             print("Ошибка: для --generate-report нужны --date-from и --date-to!")
             sys.exit(1)
-        asyncio.run(run_generate_report(args.date_from, args.date_to, args.target_file_id, args.target_list))
+        asyncio.run(run_generate_report(args.date_from, args.date_to, args.target_file_id, args.target_list, args.workers))
         return
 
     if args.generate_report_by_days:
         if not args.date_from or not args.date_to:
             print("Ошибка: для --generate-report-by-days нужны --date-from и --date-to!")
             sys.exit(1)
-        asyncio.run(run_generate_report_by_days(args.date_from, args.date_to, args.target_file_id, args.target_list))
+        asyncio.run(run_generate_report_by_days(args.date_from, args.date_to, args.target_file_id, args.target_list, args.workers))
         return
 
     if args.generate_report_by_weeks:
         if not args.date_from or not args.date_to:
             print("Ошибка: для --generate-report-by-weeks нужны --date-from и --date-to!")
             sys.exit(1)
-        asyncio.run(run_generate_report_by_weeks(args.date_from, args.date_to, args.target_file_id, args.target_list))
+        asyncio.run(run_generate_report_by_weeks(args.date_from, args.date_to, args.target_file_id, args.target_list, args.workers))
         return
 
     if args.generate_report_by_months:
         if not args.date_from or not args.date_to:
             print("Ошибка: для --generate-report-by-months нужны --date-from и --date-to!")
             sys.exit(1)
-        asyncio.run(run_generate_report_by_months(args.date_from, args.date_to, args.target_file_id, args.target_list))
+        asyncio.run(run_generate_report_by_months(args.date_from, args.date_to, args.target_file_id, args.target_list, args.workers))
         return
 
     if args.sync_wb_orders_7days:
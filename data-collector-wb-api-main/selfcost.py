@@ -1,28 +1,7 @@
 import pandas as pd
 from google_sheets_utils import get_sheet_data, add_data_to_sheet_with_headers_and_format
-from config_loader import load_config
 from datetime import datetime
-import asyncio
-import asyncpg
-
-CONFIG = load_config()
-
-async def fetch_data_from_db(query: str, params: tuple):
-    """Получение данных из PostgreSQL."""
-    db_config = {
-        "database": CONFIG["postgres_data_storage"]["database_name"],
-        "user": CONFIG["postgres_data_storage"]["user"],
-        "password": CONFIG["postgres_data_storage"]["password"],
-        "host": CONFIG["postgres_data_storage"]["host"],
-        "port": CONFIG["postgres_data_storage"]["port"]
-    }
-    try:
-        conn = await asyncpg.connect(**db_config)
-        rows = await conn.fetch(query, *params)
-        await conn.close()
-        return rows
-    except asyncpg.PostgresError as e:
-        raise Exception(f"Ошибка при работе с базой данных: {e}")
+from db_pool import copy_frame
 
 def transfer_selfcost_data(date_from: str, date_to: str, spreadsheet_id: str):
     """
@@ -46,23 +25,17 @@ def transfer_selfcost_data(date_from: str, date_to: str, spreadsheet_id: str):
         WHERE date >= $1 AND date <= $2 AND seller_id = 1
     """
 
-    async def process_data():
-        rows = await fetch_data_from_db(query, (start_date, end_date))
-        result = []
-        for row in rows:
-            result.append({
-                'product_id': row['sku'],
-                'date': row['date'].strftime('%d.%m.%Y'),
-                'cost': row['cost_in_kopecks'] / 100
-            })
-        return result
-
-    data = asyncio.run(process_data())
-    if not data:
+    # COPY → DataFrame, типы столбцов — из описания запроса (см. db_pool.copy_frame)
+    rows = copy_frame(query, start_date, end_date)
+    if rows.empty:
         print(f"Нет данных за период с {date_from} по {date_to}.")
         return
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({
+        'product_id': rows['sku'],
+        'date': rows['date'].dt.strftime('%d.%m.%Y'),
+        'cost': rows['cost_in_kopecks'] / 100,
+    })
 
     pivot_df = df.pivot(index='product_id', columns='date', values='cost').reset_index()
 
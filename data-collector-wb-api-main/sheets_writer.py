@@ -0,0 +1,385 @@
+"""
+Сервис записи в Google Sheets для отчётов.
+
+Раньше каждый хелпер google_sheets_utils заново авторизовывался, открывал
+таблицу и лист (2 запроса метаданных), читал лист целиком ради числа строк и
+после 429 спал фиксированные 10 секунд. Здесь:
+
+  • PacedHTTPClient — HTTP-клиент gspread: каждый запрос к Sheets API проходит
+    через token bucket (чтение и запись — отдельные квоты в минуту), 429/5xx
+    повторяются с экспоненциальной задержкой (Retry-After, если есть);
+  • SheetsWriter — поверх «бэкенда» с методами низкого уровня gspread.HTTPClient
+    (fetch_sheet_metadata, values_get, batch_update, values_batch_update,
+    values_append): метаданные таблицы (sheetId, размер сетки) кэшируются на
+    процесс, размеры берутся из них, а не из get_all_values();
+  • TabBatch — операции над одной вкладкой отчёта копятся и уходят при commit()
+    максимум двумя запросами: один spreadsheets.batchUpdate (очистки, вставки и
+    удаления строк, расширение сетки, форматы) и один values.batchUpdate (значения);
+  • report_scope — метка отчёта для счётчика вызовов API (calls[(отчёт, вызов)]).
+
+Для проверок вместо gspread.HTTPClient подставляется FakeSheetsBackend
+(fake_sheets_backend.py) с теми же методами.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+from api_limits import api_limit
+
+# Квоты Sheets API на пользователя (сервисный аккаунт) в минуту
+READ_REQUESTS_PER_MINUTE = 60
+WRITE_REQUESTS_PER_MINUTE = 60
+PACER_BURST = 10
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 64.0
+
+_VALUES_ACTION = re.compile(r":(append|clear|batchUpdate|batchGet|batchClear)$")
+
+NO_REPORT = "-"
+current_report: ContextVar[str] = ContextVar("current_report", default=NO_REPORT)
+
+
+@contextmanager
+def report_scope(name: str, override: bool = True):
+    """Помечает вызовы API внутри блока отчётом name (override=False — не перебивать внешнюю метку)."""
+    if not override and current_report.get() != NO_REPORT:
+        yield
+        return
+    token = current_report.set(name)
+    try:
+        yield
+    finally:
+        current_report.reset(token)
+
+
+# ───────────────────────────── квоты ─────────────────────────────
+
+class TokenBucketPacer:
+    """
+    Token bucket: per_minute токенов в минуту, не больше burst подряд.
+    acquire() блокирует поток до появления токена; потокобезопасен.
+    """
+
+    def __init__(self, per_minute: float, burst: int = PACER_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Забирает токен; возвращает суммарное время ожидания в секундах."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                wait = (1.0 - self.tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+class SheetsQuota:
+    """Пара token bucket'ов: чтение (GET) и запись (всё остальное) — у Sheets это разные квоты."""
+
+    def __init__(self, read_per_minute: float = READ_REQUESTS_PER_MINUTE,
+                 write_per_minute: float = WRITE_REQUESTS_PER_MINUTE, burst: int = PACER_BURST):
+        self.read = TokenBucketPacer(read_per_minute, burst)
+        self.write = TokenBucketPacer(write_per_minute, burst)
+
+    def acquire(self, method: str) -> float:
+        return (self.read if method.upper() == "GET" else self.write).acquire()
+
+
+def backoff_delay(attempt: int, response=None) -> float:
+    """Задержка перед повтором: Retry-After сервера или экспонента с джиттером."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE ** attempt) + random.uniform(0, 1)
+
+
+def call_kind(method: str, endpoint: str) -> str:
+    """Короткое имя вызова Sheets API для счётчиков: metadata, values.get, batchUpdate, …"""
+    path = endpoint.split("?", 1)[0]
+    if "/values" in path:
+        action = _VALUES_ACTION.search(path)
+        return f"values.{action.group(1) if action else method.lower()}"
+    if path.endswith(":batchUpdate"):
+        return "batchUpdate"
+    return "metadata" if method.upper() == "GET" else f"{method.lower()} {path.rsplit('/', 1)[-1]}"
+
+
+class PacedHTTPClient(HTTPClient):
+    """
+    HTTP-клиент gspread с квотами и повторами. Передаётся в gspread.authorize(..., http_client=...).
+    quota и calls общие на процесс: все клиенты делят одну квоту сервисного аккаунта.
+    Одновременных запросов к Google — не больше лимита "sheets" из api_limits.
+    """
+
+    quota = SheetsQuota()
+    calls: Counter = Counter()
+    _calls_lock = threading.Lock()
+
+    def request(self, method, endpoint, *args, **kwargs):
+        paced = "sheets.googleapis.com" in endpoint
+        for attempt in range(MAX_RETRIES + 1):
+            if paced:
+                self.quota.acquire(method)
+                with self._calls_lock:
+                    self.calls[(current_report.get(), call_kind(method, endpoint))] += 1
+            try:
+                with api_limit("sheets"):
+                    return super().request(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                status = e.response.status_code
+                if status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e.response)
+                print(f"\033[91mWARNING: Запись в google sheet. \033[0mОшибка {status}: {e.response.reason}. "
+                      f"Повтор через {delay:.1f} с (попытка {attempt + 1} из {MAX_RETRIES})")
+                time.sleep(delay)
+
+
+# ───────────────────────────── A1 → GridRange ─────────────────────────────
+
+_A1_PART = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def column_index(letters: str) -> int:
+    """'A' → 0, 'Z' → 25, 'AA' → 26."""
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    """0 → 'A', 26 → 'AA'."""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def quote_title(sheet_name: str) -> str:
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def a1_to_grid_range(cell_range: str, sheet_id: int) -> Dict[str, int]:
+    """
+    A1 без имени листа → GridRange (индексы с 0, конец не включается).
+    Открытые диапазоны ('A2:V', 'E:G', '1:1') не ограничиваются по недостающему измерению.
+    """
+    grid: Dict[str, int] = {"sheetId": sheet_id}
+    if not cell_range:
+        return grid
+    start, _, end = cell_range.partition(":")
+    end = end or start
+    (c1, r1), (c2, r2) = (_A1_PART.match(part).groups() for part in (start, end))
+    if c1:
+        grid["startColumnIndex"] = column_index(c1)
+    if r1:
+        grid["startRowIndex"] = int(r1) - 1
+    if c2:
+        grid["endColumnIndex"] = column_index(c2) + 1
+    if r2:
+        grid["endRowIndex"] = int(r2)
+    return grid
+
+
+def cell_position(cell: str) -> Tuple[int, int]:
+    """'B3' → (row=3, col=2), нумерация с 1."""
+    letters, digits = _A1_PART.match(cell).groups()
+    return int(digits or 1), column_index(letters or "A") + 1
+
+
+# ───────────────────────────── запись ─────────────────────────────
+
+class SheetsWriter:
+    """Операции над таблицами через бэкенд низкого уровня; метаданные листов кэшируются."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._sheets: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def sheet_properties(self, spreadsheet_id: str, sheet_name: str) -> Dict[str, Any]:
+        """properties листа (sheetId, gridProperties.rowCount/columnCount) — один запрос на таблицу за процесс."""
+        with self._lock:
+            sheets = self._sheets.get(spreadsheet_id)
+        if sheets is None or sheet_name not in sheets:
+            metadata = self.backend.fetch_sheet_metadata(
+                spreadsheet_id, params={"fields": "sheets.properties"}
+            )
+            sheets = {s["properties"]["title"]: s["properties"] for s in metadata.get("sheets", [])}
+            with self._lock:
+                self._sheets[spreadsheet_id] = sheets
+        if sheet_name not in sheets:
+            raise ValueError(f"Не найден лист с именем '{sheet_name}' в таблице {spreadsheet_id}")
+        return sheets[sheet_name]
+
+    def _grid_changed(self, spreadsheet_id: str, sheet_name: str, rows: int = 0, columns: int = 0) -> None:
+        with self._lock:
+            grid = self._sheets[spreadsheet_id][sheet_name]["gridProperties"]
+            grid["rowCount"] = grid.get("rowCount", 0) + rows
+            grid["columnCount"] = grid.get("columnCount", 0) + columns
+
+    def tab(self, spreadsheet_id: str, sheet_name: str) -> "TabBatch":
+        return TabBatch(self, spreadsheet_id, sheet_name)
+
+    def read(self, spreadsheet_id: str, sheet_name: str, cell_range: str = "") -> List[List[Any]]:
+        """Значения диапазона (весь лист, если cell_range пуст) одним values.get."""
+        a1 = quote_title(sheet_name) + (f"!{cell_range}" if cell_range else "")
+        with report_scope(sheet_name, override=False):
+            return self.backend.values_get(spreadsheet_id, a1).get("values", [])
+
+    def append(self, spreadsheet_id: str, sheet_name: str, values: List[List[Any]],
+               value_input_option: str = "USER_ENTERED") -> None:
+        """Дописывает строки после таблицы данных листа (values.append, без чтения)."""
+        with report_scope(sheet_name, override=False):
+            self.backend.values_append(
+                spreadsheet_id, quote_title(sheet_name),
+                params={"valueInputOption": value_input_option, "insertDataOption": "INSERT_ROWS"},
+                body={"majorDimension": "ROWS", "values": values},
+            )
+
+
+class TabBatch:
+    """
+    Накопитель операций над одной вкладкой. Структурные операции выполняются
+    в порядке добавления одним batchUpdate, затем значения — одним
+    values.batchUpdate; сетка при необходимости расширяется в том же batchUpdate.
+    """
+
+    def __init__(self, writer: SheetsWriter, spreadsheet_id: str, sheet_name: str):
+        self.writer = writer
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self._requests: List[Dict[str, Any]] = []
+        self._values: Dict[str, List[Dict[str, Any]]] = {}
+        self._row_delta = 0
+        self._need_rows = 0
+        self._need_columns = 0
+
+    @property
+    def sheet_id(self) -> int:
+        return self.writer.sheet_properties(self.spreadsheet_id, self.sheet_name)["sheetId"]
+
+    def clear(self, cell_range: str) -> "TabBatch":
+        """Очищает значения диапазона (форматирование остаётся), как values.batchClear."""
+        self._requests.append({"updateCells": {
+            "range": a1_to_grid_range(cell_range, self.sheet_id), "fields": "userEnteredValue",
+        }})
+        return self
+
+    def insert_rows(self, row: int, count: int, columns: Optional[int] = None) -> "TabBatch":
+        """Вставляет count пустых строк перед строкой row (с 1); columns — только в первых N столбцах."""
+        if count <= 0:
+            return self
+        if columns is None:
+            self._requests.append({"insertDimension": {
+                "range": {"sheetId": self.sheet_id, "dimension": "ROWS",
+                          "startIndex": row - 1, "endIndex": row - 1 + count},
+                "inheritFromBefore": False,
+            }})
+            self._row_delta += count
+        else:
+            self._requests.append({"insertRange": {
+                "range": {"sheetId": self.sheet_id, "startRowIndex": row - 1, "endRowIndex": row - 1 + count,
+                          "startColumnIndex": 0, "endColumnIndex": columns},
+                "shiftDimension": "ROWS",
+            }})
+            self._row_delta += count
+        return self
+
+    def delete_rows(self, ranges: Iterable[Tuple[int, int]]) -> "TabBatch":
+        """Удаляет строки по интервалам (start, end) индексов API (с 0, end не включается), снизу вверх."""
+        for start, end in sorted(ranges, reverse=True):
+            self._requests.append({"deleteDimension": {"range": {
+                "sheetId": self.sheet_id, "dimension": "ROWS", "startIndex": start, "endIndex": end,
+            }}})
+            self._row_delta -= end - start
+        return self
+
+    def format(self, cell_range: str, cell_format: Dict[str, Any], fields: str = "userEnteredFormat") -> "TabBatch":
+        """Формат ячеек диапазона (repeatCell), например {"numberFormat": {"type": "DATE", "pattern": "dd.mm.yyyy"}}."""
+        self._requests.append({"repeatCell": {
+            "range": a1_to_grid_range(cell_range, self.sheet_id),
+            "cell": {"userEnteredFormat": cell_format},
+            "fields": fields,
+        }})
+        return self
+
+    def write(self, cell: str, values: Sequence[Sequence[Any]], value_input_option: str = "USER_ENTERED") -> "TabBatch":
+        """Записывает прямоугольник values начиная с ячейки cell ('A2')."""
+        if not values:
+            return self
+        row, col = cell_position(cell)
+        width = max(len(r) for r in values)
+        self._need_rows = max(self._need_rows, row + len(values) - 1)
+        self._need_columns = max(self._need_columns, col + width - 1)
+        self._values.setdefault(value_input_option, []).append({
+            "range": f"{quote_title(self.sheet_name)}!{cell}",
+            "majorDimension": "ROWS",
+            "values": [list(r) for r in values],
+        })
+        return self
+
+    def _grow_requests(self) -> List[Dict[str, Any]]:
+        grid = self.writer.sheet_properties(self.spreadsheet_id, self.sheet_name)["gridProperties"]
+        grow = []
+        rows = self._need_rows - (grid.get("rowCount", 0) + self._row_delta)
+        columns = self._need_columns - grid.get("columnCount", 0)
+        for dimension, length in (("ROWS", rows), ("COLUMNS", columns)):
+            if length > 0:
+                grow.append({"appendDimension": {"sheetId": self.sheet_id, "dimension": dimension, "length": length}})
+        return grow
+
+    def commit(self) -> Dict[str, int]:
+        """Отправляет накопленное: ≤1 batchUpdate + по одному values.batchUpdate на valueInputOption."""
+        sent = {"batchUpdate": 0, "values.batchUpdate": 0}
+        with report_scope(self.sheet_name, override=False):
+            grow = self._grow_requests() if self._values else []
+            requests = self._requests + grow
+            if requests:
+                self.writer.backend.batch_update(self.spreadsheet_id, {"requests": requests})
+                sent["batchUpdate"] += 1
+                rows_added = self._row_delta + sum(
+                    r["appendDimension"]["length"] for r in grow if r["appendDimension"]["dimension"] == "ROWS")
+                cols_added = sum(
+                    r["appendDimension"]["length"] for r in grow if r["appendDimension"]["dimension"] == "COLUMNS")
+                self.writer._grid_changed(self.spreadsheet_id, self.sheet_name, rows_added, cols_added)
+            for value_input_option, data in self._values.items():
+                self.writer.backend.values_batch_update(
+                    self.spreadsheet_id, {"valueInputOption": value_input_option, "data": data}
+                )
+                sent["values.batchUpdate"] += 1
+        self._requests, self._values = [], {}
+        self._row_delta = self._need_rows = self._need_columns = 0
+        return sent
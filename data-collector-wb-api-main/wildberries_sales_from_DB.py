@@ -1,41 +1,10 @@
 import pandas as pd
 import decimal
-import psycopg2
 from datetime import datetime, timedelta
 from google_sheets_utils import add_data_to_sheet_without_headers_with_format
-from config_loader import load_config
 from context import current_mode
 from collections import defaultdict
-
-CONFIG = load_config()
-
-def fetch_data_from_db(query: str, params: tuple):
-    """Синхронное получение данных из PostgreSQL с использованием psycopg2."""
-    db_config = {
-        "dbname": CONFIG["postgres_data_storage"]["database_name"],
-        "user": CONFIG["postgres_data_storage"]["user"],
-        "password": CONFIG["postgres_data_storage"]["password"],
-        "host": CONFIG["postgres_data_storage"]["host"],
-        "port": CONFIG["postgres_data_storage"]["port"]
-    }
-
-    try:
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-
-        cursor.close()
-        conn.close()
-
-        data = [dict(zip(column_names, row)) for row in rows]
-        return data
-
-    except psycopg2.Error as e:
-        raise Exception(f"Ошибка при работе с базой данных: {e}")
-
+from db_pool import fetch_frame
 
 def process_wb_reports(date_from: str, date_to: str, seller_legal: str, spreadsheet_id: str):
     """
@@ -66,21 +35,17 @@ def process_wb_reports(date_from: str, date_to: str, seller_legal: str, spreadsh
 
     query = """
         SELECT * FROM wb_sale_report
-        WHERE date BETWEEN %s AND %s
-        AND legal_entity = %s
+        WHERE date BETWEEN $1::date AND $2::date
+        AND legal_entity = $3
     """
 
 
-    data = fetch_data_from_db(query, (date_from_dt, date_to_dt, seller_legal))
+    df = fetch_frame(query, date_from_dt, date_to_dt, seller_legal)
 
-    if not data:
+    if df.empty:
         print("⚠ Нет данных для записи в Google Sheets.")
         return
 
-    data = [dict(record) for record in data]
-
-    df = pd.DataFrame(data)
-
     # Маппинг колонок, которые есть в Google Sheets
     column_mapping = {
         "Номер поставки": "Номер поставки",
@@ -1,30 +1,8 @@
-import asyncio
 import datetime
 import json
-import asyncpg
 import pandas as pd
-from google_sheets_utils import add_data_to_sheet_without_headers_with_format, clear_range
-from config_loader import load_config
-
-
-CONFIG = load_config()
-
-
-async def fetch_data_from_db(query: str, params: tuple):
-    db_config = {
-        "database": CONFIG["postgres_data_storage"]["database_name"],
-        "user": CONFIG["postgres_data_storage"]["user"],
-        "password": CONFIG["postgres_data_storage"]["password"],
-        "host": CONFIG["postgres_data_storage"]["host"],
-        "port": CONFIG["postgres_data_storage"]["port"]
-    }
-    try:
-        conn = await asyncpg.connect(**db_config)
-        rows = await conn.fetch(query, *params)
-        await conn.close()
-        return rows
-    except asyncpg.PostgresError as e:
-        raise Exception(f"Ошибка при работе с базой данных: {e}")
+from google_sheets_utils import replace_sheet_data_without_headers_with_format
+from db_pool import fetch_frame
 
 
 def fetch_stocks(date_from: str, date_to: str, seller_legal: str, spreadsheet_id: str):
@@ -45,16 +23,13 @@ def fetch_stocks(date_from: str, date_to: str, seller_legal: str, spreadsheet_id
 
     query = "SELECT * FROM wb_data WHERE date >= $1 AND date <= $2 AND legal_entity = $3"
 
-    async def process_data():
-        rows = await fetch_data_from_db(query, (formatted_date_from, formatted_date_to, entity_text))
-        return [
-            {key: (value.strftime('%d.%m.%Y') if isinstance(value, datetime.date) else value)
-             for key, value in row.items()}
-            for row in rows
-        ]
+    df = fetch_frame(query, formatted_date_from, formatted_date_to, entity_text)
 
-    result = asyncio.run(process_data())
-    df = pd.DataFrame(result)
+    # даты → DD.MM.YYYY (столбцы с датами определяются по первому непустому значению)
+    for col in df.columns:
+        values = df[col].dropna()
+        if not values.empty and isinstance(values.iloc[0], datetime.date):
+            df[col] = pd.to_datetime(df[col]).dt.strftime('%d.%m.%Y')
 
 
     if df.empty:
@@ -160,9 +135,8 @@ def fetch_stocks(date_from: str, date_to: str, seller_legal: str, spreadsheet_id
             expanded_df[col] = ''
 
     expanded_df = expanded_df[column_order]
-    clear_range(spreadsheet_id, "StocksReport(ext)", "A2:V")
     try:
-        add_data_to_sheet_without_headers_with_format(spreadsheet_id, expanded_df, "StocksReport(ext)")
+        replace_sheet_data_without_headers_with_format(spreadsheet_id, expanded_df, "StocksReport(ext)", "A2:V")
         print("✅ Данные успешно добавлены на вкладку StocksReport(ext).")
     except Exception as e:
         raise Exception(f"Ошибка при добавлении данных в Google Sheets: {e}")
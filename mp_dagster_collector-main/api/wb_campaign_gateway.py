@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import aiohttp
+
+from dagster_conf.lib.rate_limit import HeaderRatePacer
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Пакетный шлюз к рекламным эндпоинтам WB для оптимизаторов (АКО, UCB-бандит)
+#
+#  • информация о кампаниях: одиночные запросы campaign_info() копятся
+#    coalesce_delay секунд и уходят одним POST /v1/promotion/adverts
+#    (до 50 id), ответы кэшируются на время жизни шлюза;
+#  • ставки: queue_bid() складывает nm-ставки по кампаниям, flush() шлёт их
+#    PATCH /v0/bids пачками до 20 кампаний; ответ «min: N» — ставка
+#    поднимается до минимума и пачка повторяется (как set_bids); другая
+#    ошибка 4xx — кампании из errors[].field отбрасываются, остальные
+#    повторяются (без field — каждая кампания отдельным запросом);
+#  • минус-фразы: у set-excluded одна кампания на запрос, поэтому повторные
+#    обновления кампании схлопываются (последнее побеждает), а запросы идут
+#    параллельно с общим темпом;
+#  • темп каждого эндпоинта — HeaderRatePacer по X-Ratelimit-*, 429 повторяет
+#    только свой запрос.
+# ─────────────────────────────────────────────────────────────────────────────
+
+BASE_URL = "https://advert-api.wildberries.ru/adv"
+
+INFO_BATCH = 50
+BIDS_BATCH = 20
+MAX_EXCLUDED_PHRASES = 1000
+
+# тип кампании → эндпоинт минус-фраз
+EXCLUDED_ENDPOINTS = {
+    8: "/v1/auto/set-excluded",
+    9: "/v1/search/set-excluded",
+}
+
+# паспортные лимиты эндпоинтов (запросов в секунду) → минимальный интервал;
+# set-excluded — 2 запроса в секунду на кампанию
+MIN_INTERVALS = {
+    "info": 0.2,
+    "bids": 0.2,
+    "excluded": 0.5,
+}
+
+# ошибки пачки ставок, после которых её кампании повторяются отдельно:
+# 401/403 (токен) и 429 (лимит) к конкретной кампании не относятся
+NOT_SPLITTABLE = {401, 403, 429}
+
+
+@dataclass
+class FlushReport:
+    """Итог flush(): id кампаний, по которым обновление прошло / не прошло."""
+    bids_ok: Set[int] = field(default_factory=set)
+    bids_failed: Set[int] = field(default_factory=set)
+    bids_corrected: Dict[int, Dict[int, int]] = field(default_factory=dict)
+    phrases_ok: Set[int] = field(default_factory=set)
+    phrases_failed: Set[int] = field(default_factory=set)
+
+
+class WBCampaignGateway:
+    """
+    Асинхронный пакетный клиент кампаний WB. Использование:
+
+        async with WBCampaignGateway(token) as gw:
+            infos = await gw.campaigns_info(ids)
+            gw.queue_bid(advert_id, nm, bid)
+            gw.queue_excluded_phrases(advert_id, phrases, campaign_type)
+            report = await gw.flush()
+
+    requests — счётчик отправленных HTTP-запросов по эндпоинтам.
+    """
+
+    def __init__(
+            self,
+            token: str,
+            *,
+            base_url: str = BASE_URL,
+            log: Optional[logging.Logger] = None,
+            coalesce_delay: float = 0.05,
+            concurrency: int = 4,
+            min_intervals: Optional[Mapping[str, float]] = None,
+            retries: int = 3,
+            timeout: float = 30.0,
+    ):
+        self.token = (token or "").strip()
+        self.base_url = base_url.rstrip("/")
+        self.log = log or logger
+        self.coalesce_delay = coalesce_delay
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        intervals = {**MIN_INTERVALS, **(min_intervals or {})}
+        self.pacers = {
+            name: HeaderRatePacer(fallback_delay=max(interval, 1.0), min_interval=interval)
+            for name, interval in intervals.items()
+        }
+        self.requests: Counter = Counter()
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._info_futures: Dict[int, asyncio.Future] = {}
+        self._info_queue: List[int] = []
+        self._info_timer: Optional[asyncio.Task] = None
+        self._info_tasks: Set[asyncio.Task] = set()
+        self._bids: Dict[int, Dict[int, int]] = {}
+        self._phrases: Dict[int, Tuple[int, List[str]]] = {}
+
+    async def __aenter__(self) -> "WBCampaignGateway":
+        self._session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+            timeout=self.timeout,
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._info_timer is not None:
+            self._info_timer.cancel()
+        if self._info_tasks:
+            await asyncio.gather(*self._info_tasks, return_exceptions=True)
+        if self._bids or self._phrases:
+            self.log.warning(
+                f"[wb-gateway] закрытие с неотправленными обновлениями: "
+                f"ставки {len(self._bids)}, минус-фразы {len(self._phrases)}"
+            )
+        await self._session.close()
+        self._session = None
+
+    # ------------------------------------------------------------------ HTTP
+
+    async def _request(self, kind: str, method: str, path: str, *,
+                       params: Optional[Dict[str, str]] = None, payload: Any = None) -> Tuple[int, Any]:
+        """Запрос с темпом эндпоинта и повтором 429. Возвращает (status, тело)."""
+        if self._session is None:
+            raise RuntimeError("WBCampaignGateway используется вне async with")
+        pacer = self.pacers[kind]
+        status, body = 0, None
+        for attempt in range(self.retries):
+            await pacer.acquire()
+            self.requests[path] += 1
+            try:
+                async with self._session.request(method, f"{self.base_url}{path}", params=params, json=payload) as resp:
+                    status = resp.status
+                    text = await resp.text()
+                    if status == 429:
+                        delay = pacer.penalize(resp.headers)
+                        self.log.warning(f"[wb-gateway] 429 {path}, повтор через {delay:.1f}s")
+                        continue
+                    pacer.observe(resp.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.log.warning(f"[wb-gateway] {method} {path}: {e} (попытка {attempt + 1}/{self.retries})")
+                status, body = 0, {"errors": str(e)}
+                continue
+            try:
+                body = json.loads(text) if text else None
+            except ValueError:
+                body = text
+            return status, body
+        return status, body
+
+    # ------------------------------------------------------------ info
+
+    async def campaign_info(self, advert_id: int) -> Optional[Dict[str, Any]]:
+        """Информация о кампании; запросы из разных корутин склеиваются в один список."""
+        advert_id = int(advert_id)
+        fut = self._info_futures.get(advert_id)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._info_futures[advert_id] = fut
+            self._info_queue.append(advert_id)
+            if len(self._info_queue) >= INFO_BATCH:
+                self._dispatch_info()
+            elif self._info_timer is None:
+                self._info_timer = asyncio.create_task(self._info_after_delay())
+        return await asyncio.shield(fut)
+
+    async def campaigns_info(self, advert_ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        ids = list(dict.fromkeys(int(a) for a in advert_ids))
+        infos = await asyncio.gather(*(self.campaign_info(a) for a in ids))
+        return dict(zip(ids, infos))
+
+    async def _info_after_delay(self) -> None:
+        await asyncio.sleep(self.coalesce_delay)
+        self._info_timer = None
+        self._dispatch_info()
+
+    def _dispatch_info(self) -> None:
+        if self._info_timer is not None:
+            self._info_timer.cancel()
+            self._info_timer = None
+        while self._info_queue:
+            batch, self._info_queue = self._info_queue[:INFO_BATCH], self._info_queue[INFO_BATCH:]
+            task = asyncio.create_task(self._fetch_info(batch))
+            self._info_tasks.add(task)
+            task.add_done_callback(self._info_tasks.discard)
+
+    async def _fetch_info(self, ids: List[int]) -> None:
+        try:
+            status, body = await self._request("info", "POST", "/v1/promotion/adverts", payload=ids)
+        except Exception as e:
+            status, body = 0, e
+        found = {}
+        if isinstance(body, list):
+            found = {int(item["advertId"]): item for item in body if isinstance(item, dict) and "advertId" in item}
+        elif status != 204:
+            self.log.warning(f"[wb-gateway] информация о кампаниях {ids}: HTTP {status} {str(body)[:300]}")
+        for advert_id in ids:
+            fut = self._info_futures[advert_id]
+            if not status or status >= 500:
+                # сбой сети / сервера — следующий вызов запросит кампанию заново
+                del self._info_futures[advert_id]
+            if not fut.done():
+                fut.set_result(found.get(advert_id))
+
+    # ----------------------------------------------------------- updates
+
+    def queue_bid(self, advert_id: int, nm: int, bid: int) -> None:
+        self._bids.setdefault(int(advert_id), {})[int(nm)] = int(bid)
+
+    def queue_excluded_phrases(self, advert_id: int, phrases: List[str], campaign_type: int) -> None:
+        if campaign_type not in EXCLUDED_ENDPOINTS:
+            raise ValueError(f"Кампания {advert_id} имеет неподдерживаемый тип: {campaign_type}")
+        if len(phrases) > MAX_EXCLUDED_PHRASES:
+            raise ValueError(f"Превышен лимит {MAX_EXCLUDED_PHRASES} минус-фраз для кампании {advert_id} ({len(phrases)})")
+        self._phrases[int(advert_id)] = (campaign_type, list(phrases))
+
+    async def flush(self) -> FlushReport:
+        """Отправляет накопленные ставки и минус-фразы."""
+        report = FlushReport()
+        bids, self._bids = self._bids, {}
+        phrases, self._phrases = self._phrases, {}
+
+        advert_ids = list(bids)
+        bid_chunks = [advert_ids[i:i + BIDS_BATCH] for i in range(0, len(advert_ids), BIDS_BATCH)]
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def bids_chunk(chunk: List[int]) -> None:
+            async with sem:
+                await self._send_bids({a: bids[a] for a in chunk}, report)
+
+        async def phrases_one(advert_id: int) -> None:
+            campaign_type, items = phrases[advert_id]
+            async with sem:
+                status, body = await self._request(
+                    "excluded", "POST", EXCLUDED_ENDPOINTS[campaign_type],
+                    params={"id": str(advert_id)}, payload={"excluded": items},
+                )
+            if 200 <= status < 300:
+                report.phrases_ok.add(advert_id)
+            else:
+                report.phrases_failed.add(advert_id)
+                self.log.error(f"[wb-gateway] минус-фразы кампании {advert_id}: HTTP {status} {str(body)[:300]}")
+
+        await asyncio.gather(
+            *(bids_chunk(c) for c in bid_chunks),
+            *(phrases_one(a) for a in phrases),
+        )
+        self.log.info(
+            f"[wb-gateway] flush: ставки ok={len(report.bids_ok)} failed={len(report.bids_failed)}, "
+            f"минус-фразы ok={len(report.phrases_ok)} failed={len(report.phrases_failed)}, "
+            f"запросов {dict(self.requests)}"
+        )
+        return report
+
+    async def _send_bids(self, chunk: Dict[int, Dict[int, int]], report: FlushReport,
+                         corrected: Optional[Dict[int, Dict[int, int]]] = None) -> None:
+        payload = [
+            {"advert_id": a, "nm_bids": [{"nm": nm, "bid": bid} for nm, bid in nm_bids.items()]}
+            for a, nm_bids in chunk.items()
+        ]
+        corrected = {a: dict(nm_bids) for a, nm_bids in (corrected or {}).items() if a in chunk}
+        for _ in range(2):  # исходная пачка + одна попытка с поднятыми до минимума ставками
+            status, body = await self._request("bids", "PATCH", "/v0/bids", payload={"bids": payload})
+            if 200 <= status < 300:
+                report.bids_ok.update(chunk)
+                for a, nm_bids in corrected.items():
+                    report.bids_corrected.setdefault(a, {}).update(nm_bids)
+                return
+            if not self._correct_min_bids(payload, body, corrected):
+                break
+
+        if len(chunk) > 1 and 400 <= status < 500 and status not in NOT_SPLITTABLE:
+            # одна кампания (архивная, чужая, с неверным nm) не должна валить
+            # ставки остальных 19 в пачке
+            current = {p["advert_id"]: {nb["nm"]: nb["bid"] for nb in p["nm_bids"]} for p in payload}
+            bad = {payload[i]["advert_id"] for i in self._failed_bid_indices(body, len(payload))}
+            if bad and len(bad) < len(payload):
+                report.bids_failed.update(bad)
+                self.log.error(f"[wb-gateway] ставки кампаний {sorted(bad)}: HTTP {status} {str(body)[:300]}")
+                await self._send_bids({a: b for a, b in current.items() if a not in bad}, report, corrected)
+            else:
+                self.log.warning(f"[wb-gateway] пачка ставок {list(chunk)}: HTTP {status}, повтор по одной кампании")
+                for a, nm_bids in current.items():
+                    await self._send_bids({a: nm_bids}, report, corrected)
+            return
+
+        report.bids_failed.update(chunk)
+        self.log.error(f"[wb-gateway] ставки кампаний {list(chunk)}: HTTP {status} {str(body)[:300]}")
+
+    @staticmethod
+    def _failed_bid_indices(body: Any, size: int) -> Set[int]:
+        """Индексы i кампаний из errors[].field вида «bids[i]...», кроме ошибок «min: N»."""
+        errors = body.get("errors") if isinstance(body, dict) else None
+        if not isinstance(errors, list):
+            return set()
+        indices = set()
+        for error in errors:
+            if not isinstance(error, dict) or re.search(r"min: \d+", str(error.get("detail", ""))):
+                continue
+            m = re.match(r"bids\[(\d+)\]", str(error.get("field", "")))
+            if m and int(m.group(1)) < size:
+                indices.add(int(m.group(1)))
+        return indices
+
+    @staticmethod
+    def _correct_min_bids(payload: List[Dict[str, Any]], body: Any, corrected: Dict[int, Dict[int, int]]) -> bool:
+        """
+        Ошибки вида «min: N» в bids[i].nm_bids[j] → ставка = N. Поправки
+        применяются все; False, если среди ошибок есть другие (или их нет).
+        """
+        errors = body.get("errors") if isinstance(body, dict) else None
+        if not isinstance(errors, list) or not errors:
+            return False
+        only_min = True
+        for error in errors:
+            min_bid = re.search(r"min: (\d+)", str(error.get("detail", ""))) if isinstance(error, dict) else None
+            indices = re.findall(r"\[(\d+)\]", str(error.get("field", ""))) if min_bid else []
+            if len(indices) != 2:
+                only_min = False
+                continue
+            i, j = map(int, indices)
+            try:
+                nm_bid = payload[i]["nm_bids"][j]
+            except (IndexError, KeyError):
+                only_min = False
+                continue
+            nm_bid["bid"] = int(min_bid.group(1))
+            corrected.setdefault(payload[i]["advert_id"], {})[nm_bid["nm"]] = nm_bid["bid"]
+        return only_min
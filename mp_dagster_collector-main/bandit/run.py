@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import time
@@ -6,9 +7,9 @@ from pathlib import Path
 from dotenv import dotenv_values
 import os
 import requests
-from ucb_bandit_cpm import UCBBanditCPM
+from ucb_batch import BanditCampaign, UCBBanditBatch, autobidder_rows
 from api.wb_api import WildberriesAPI
-from api.wb_api_actions import WildberriesAPIactions
+from api.wb_campaign_gateway import WBCampaignGateway
 from sql.database_manager import UCBBanditDatabase
 
 if sys.platform == "win32":
@@ -27,6 +28,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TELEGRAM_MESSAGE_LIMIT = 4000
+
 class SessionState:
     def __init__(self):
         self.log_messages = []
@@ -115,6 +118,18 @@ def send_telegram_message(message: str, bot_token: str, chat_id: str):
         logger.error(error_msg)
         st.log_messages.append(error_msg)
 
+def split_message(lines: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Сводка по кампаниям частями, влезающими в одно сообщение Telegram."""
+    messages, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
 def get_config_with_retry(wb_api, max_attempts=5, initial_delay=1):
     """Получение конфигурации с повторными попытками при ошибке 429."""
     attempt = 0
@@ -136,8 +151,81 @@ def get_config_with_retry(wb_api, max_attempts=5, initial_delay=1):
     logger.error(f"Не удалось выполнить запрос после {max_attempts} попыток: https://advert-api.wildberries.ru/adv/v0/config")
     return None
 
+async def optimize_campaigns(db, campaign_data, config_data, wb_api_token):
+    """
+    Информация о кампаниях, рекомендации бандита и ставки за один проход.
+    Запросы к WB идут через WBCampaignGateway: информация — списками до 50 id,
+    ставки — PATCH пачками до 20 кампаний.
+
+    Ошибка одной кампании (некорректные id, сбой расчёта или записи) не
+    останавливает остальные: такие кампании попадают в failed.
+
+    Returns:
+        (рекомендации, id активных кампаний, id кампаний с обновлённой ставкой,
+         {id кампании: причина} для кампаний без рекомендации)
+    """
+    failed = {}
+    async with WBCampaignGateway(wb_api_token, log=logger) as gateway:
+        ids = []
+        for data in campaign_data:
+            try:
+                ids.append(int(data['campaign_id']))
+            except (TypeError, ValueError):
+                pass
+        info_by_id = await gateway.campaigns_info(ids)
+
+        campaigns = []
+        active_ids = set()
+        for data in campaign_data:
+            company_id = str(data['campaign_id'])
+            try:
+                info = info_by_id.get(int(company_id))
+                min_bid = None
+                if info is None:
+                    logger.warning(f"Не удалось получить информацию о кампании {company_id}")
+                else:
+                    campaign_type = info.get('type')
+                    for item in config_data['config']:
+                        if item['name'] == ('cpm_min_search_catalog' if campaign_type == 9 else 'cpm_min_booster'):
+                            min_bid = float(item['value'])
+                            break
+                campaign = BanditCampaign(advert_id=company_id, product_id=int(data['product_id']), min_bid=min_bid)
+            except Exception as e:
+                logger.error(f"Ошибка обработки кампании {company_id}: {str(e)}")
+                failed[company_id] = str(e)
+                continue
+            if info is not None:
+                active_ids.add(company_id)
+            campaigns.append(campaign)
+
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=7)
+        if not db.check_table_exists():
+            raise ValueError("Таблица algo.autobidder не существует")
+
+        bandit = UCBBanditBatch(db)
+        recommendations = bandit.recommend(campaigns, start_date=start_date.isoformat(), end_date=end_date.isoformat())
+        failed.update(bandit.failed)
+        if not db.save_recommendations(autobidder_rows(recommendations)):
+            st.log_messages.append("Не удалось сохранить часть рекомендаций в algo.autobidder")
+
+        for rec in recommendations:
+            if wb_api_token and rec['recommended_cpm'] > 0 and rec['campaign_id'] in active_ids:
+                gateway.queue_bid(int(rec['campaign_id']), int(rec['product_id']), int(round(rec['recommended_cpm'])))
+        report = await gateway.flush()
+
+    for company_id, error in failed.items():
+        st.log_messages.append(f"Ошибка обработки кампании {company_id}: {error}")
+
+    for advert_id, nm_bids in report.bids_corrected.items():
+        logger.info(f"Ставка кампании {advert_id} поднята до минимальной: {nm_bids}")
+    if report.bids_failed:
+        logger.error(f"Не удалось обновить ставки для кампаний {sorted(report.bids_failed)}")
+        st.log_messages.append(f"Не удалось обновить ставки для {len(report.bids_failed)} кампаний")
+    return recommendations, active_ids, {str(a) for a in report.bids_ok}, failed
+
 def run_ucb_bandit():
-    """Запускает UCBBanditCPM для всех активных кампаний, учитывая минимальные ставки CPM."""
+    """Запускает UCB-бандит для всех активных кампаний одним пакетом, учитывая минимальные ставки CPM."""
     try:
         config = load_config()
         if not config:
@@ -145,7 +233,6 @@ def run_ucb_bandit():
 
         db = UCBBanditDatabase(config['db_config'])
         wb_api_config = WildberriesAPI(config.get('wb_api_token'))
-        wb_api_actions = WildberriesAPIactions(config.get('wb_api_token'), logger)
 
         campaign_data = db.get_active_campaign_ids()
         logger.info(
@@ -177,126 +264,39 @@ def run_ucb_bandit():
                 {'name': 'cpm_min_search_catalog', 'value': '250.0'}
             ]}
 
-        for data in campaign_data:
-            company_id = str(data['campaign_id'])
-            nm = int(data['product_id'])
-            logger.info(f"Начало обработки кампании {company_id} с product_id {nm}")
-
-            try:
-                campaign_info = wb_api_config.get_campaigns_info([int(company_id)])
-                if not campaign_info or not isinstance(campaign_info, list) or len(campaign_info) == 0:
-                    logger.warning(f"Не удалось получить информацию о кампании {company_id}: {campaign_info}")
-                    campaign_type = None
-                    min_bid = None # Change
-                    campaign_active = False
-                else:
-                    campaign_type = campaign_info[0].get('type')
-                    min_bid = None #
-                    for item in config_data['config']:
-                        if item['name'] == ('cpm_min_search_catalog' if campaign_type == 9 else 'cpm_min_booster'):
-                            min_bid = float(item['value'])
-                            break
-                    logger.info(f"Получена минимальная ставка CPM для кампании {company_id}: {min_bid}")
-                    campaign_active = True
-
-                bandit = UCBBanditCPM(advert_id=company_id, min_bid=min_bid)
-
-                end_date = datetime.now().date()
-                start_date = end_date - timedelta(days=7)
+        recommendations, active_ids, updated_ids, failed = asyncio.run(
+            optimize_campaigns(db, campaign_data, config_data, wb_api_token)
+        )
 
-                recommendation = bandit.recommend_action(
-                    start_date=start_date.isoformat(),
-                    end_date=end_date.isoformat()
+        message_lines = [f"ℹ️ Оптимизация UCB Bandit: {len(recommendations)} кампаний, ставки обновлены у {len(updated_ids)}"]
+        product_of = {str(data['campaign_id']): data.get('product_id') for data in campaign_data}
+        for company_id, error in failed.items():
+            message_lines.append(f"❌ {company_id} / {product_of.get(company_id)}: ошибка обработки: {error}")
+        for rec in recommendations:
+            company_id = rec['campaign_id']
+            if company_id in updated_ids:
+                message_lines.append(
+                    f"✅ {company_id} / {rec['product_id']}: {rec['current_cpm']:.2f} → {rec['recommended_cpm']:.2f} ₽"
                 )
-
-                logger.info(f"Рекомендация для кампании {company_id}: {recommendation}")
-
-                message_lines = [
-                    f"ℹ️ Оптимизация UCB Bandit для кампании {company_id}",
-                    f"ID Кампании: {company_id}",
-                    f"ID Товара: {nm}",
-                ]
-
-                recommended_cpm = None
-                if recommendation and isinstance(recommendation, dict):
-                    current_cpm = recommendation.get('current_cpm', 0.0)
-                    recommended_cpm = recommendation.get('recommended_cpm', 0.0)
-                    message_lines.append(f"Текущий CPM: {current_cpm:.2f} ₽")
-                    message_lines.append(f"Рекомендация: Установите CPM равный {recommended_cpm:.2f} ₽")
-                else:
-                    logger.error(f"Рекомендация пуста для кампании {company_id}")
-                    st.log_messages.append(f"Рекомендация пуста для кампании {company_id}")
-                    message_lines.append("Не удалось получить рекомендацию")
-                    campaign_active = False
-
-                if wb_api_token and recommendation and isinstance(recommendation,
-                                                                  dict) and recommended_cpm > 0 and campaign_active:
-                    bids = [
-                        {
-                            "advert_id": int(company_id),
-                            "nm_bids": [
-                                {
-                                    "nm": int(nm),
-                                    "bid": int(round(recommended_cpm))
-                                }
-                            ]
-                        }
-                    ]
-                    result = wb_api_actions.set_bids(bids)
-                    if result:
-                        logger.info(f"Ставка успешно обновлена для кампании {company_id}: {bids}")
-                        message_lines.append(f"✅ Ставка обновлена: Новая ставка CPM: {recommended_cpm:.2f} ₽")
-                        bandit.current_cpm = recommended_cpm
-                    else:
-                        logger.error(f"Не удалось обновить ставку для кампании {company_id}")
-                        message_lines = [
-                            f"❌ Ошибка оптимизации UCB Bandit для кампании {company_id}",
-                            f"ID Кампании: {company_id}",
-                            f"ID Товара: {nm}",
-                        ]
-                        message_lines.append(f"Возможно, проблема с токеном API Wildberries")
-                        message_lines.append(f"📜 Логи: {'; '.join(st.log_messages[-3:])}")
-                    time.sleep(1)
-                else:
-                    reason = []
-                    if not wb_api_token:
-                        reason.append("отсутствует wb_api_token")
-                    if not recommendation or not isinstance(recommendation, dict):
-                        reason.append("рекомендация пуста или некорректна")
-                    if recommended_cpm <= 0:
-                        reason.append("рекомендованный CPM <= 0")
-                    if not campaign_active:
-                        reason.append("кампания неактивна (API вернул 204 или пустые данные)")
-                    logger.warning(f"Не удалось обновить ставку для кампании {company_id}: {', '.join(reason)}")
-                    message_lines = [
-                        f"❌ Ошибка оптимизации UCB Bandit для кампании {company_id}",
-                        f"ID Кампании: {company_id}",
-                        f"ID Товара: {nm}",
-                    ]
-                    message_lines.append(f"Возможно, проблема с токеном API Wildberries")
-                    message_lines.append(f"📜 Логи: {'; '.join(st.log_messages[-3:])}")
-
-                if bot_token and chat_id:
-                    send_telegram_message("\n".join(message_lines), bot_token, chat_id)
-                else:
-                    logger.warning(f"Не удалось отправить уведомление в Telegram для кампании {company_id}: отсутствуют bot_token или chat_id")
-                    st.log_messages.append(f"Не удалось отправить уведомление в Telegram для кампании {company_id}: отсутствуют bot_token или chat_id")
-
-            except Exception as e:
-                logger.error(f"Ошибка обработки кампании {company_id}: {str(e)}")
-                st.log_messages.append(f"Ошибка обработки кампании {company_id}: {str(e)}")
-                message_lines = [
-                    f"❌ Ошибка оптимизации UCB Bandit для кампании {company_id}",
-                    f"ID Кампании: {company_id}",
-                    f"ID Товара: {nm}",
-                    f"Ошибка: {str(e)}",
-                    f"Возможно, проблема с токеном API Wildberries",
-                    f"📜 Логи: {'; '.join(st.log_messages[-3:])}"
-                ]
-                if bot_token and chat_id:
-                    send_telegram_message("\n".join(message_lines), bot_token, chat_id)
-                time.sleep(1)
                 continue
+            reason = []
+            if not wb_api_token:
+                reason.append("отсутствует wb_api_token")
+            if rec['recommended_cpm'] <= 0:
+                reason.append("рекомендованный CPM <= 0")
+            if company_id not in active_ids:
+                reason.append("кампания неактивна (API вернул 204 или пустые данные)")
+            if not reason:
+                reason.append("ошибка обновления ставки")
+            logger.warning(f"Не удалось обновить ставку для кампании {company_id}: {', '.join(reason)}")
+            message_lines.append(f"❌ {company_id} / {rec['product_id']}: {', '.join(reason)}")
+
+        if bot_token and chat_id:
+            for message in split_message(message_lines):
+                send_telegram_message(message, bot_token, chat_id)
+        else:
+            logger.warning("Не удалось отправить уведомление в Telegram: отсутствуют bot_token или chat_id")
+            st.log_messages.append("Не удалось отправить уведомление в Telegram: отсутствуют bot_token или chat_id")
 
         logger.info("Обработка всех кампаний завершена")
 
@@ -0,0 +1,447 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from config_usb import UCBBanditConfig
+from metrics_calculator import UCBBanditRewards
+from sql.database_manager import UCBBanditDatabase, merge_history
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Пакетный UCB по всем кампаниям прогона
+#
+# UCBBanditCPM на каждую кампанию создавал engine и делал 5–6 запросов
+# (состояние рук, переоценка CPM, статистика, ставки, повтор за 60 дней,
+# проверка таблицы, INSERT рекомендации). Здесь:
+#
+#  1) история и состояние рук всех кампаний — несколькими set-based
+#     запросами (UCBBanditDatabase.*_batch / load_bandit_states);
+#  2) награды — векторно по строкам истории + groupby по кампании;
+#  3) UCB-оценки и выбор руки — numpy-матрицы кампании × руки;
+#  4) рекомендации пишутся одним executemany (save_recommendations).
+#
+# Логика выбора и расчёта награды повторяет UCBBanditLogic.select_arm /
+# apply_cpm_change и UCBBanditCPM.recommend_action для одного прогона.
+# ---------------------------------------------------------------------------
+
+DEFAULT_CPM = 150.0
+
+
+@dataclass
+class BanditCampaign:
+    advert_id: str
+    product_id: Optional[int] = None
+    min_bid: Optional[float] = None
+
+
+@dataclass
+class ArmLayout:
+    """Руки конфига в виде массивов: процент изменения и тип руки."""
+    arms: List[str]
+    pct: np.ndarray          # процент для «N%»-рук, nan для double/reset
+    is_double: np.ndarray
+    is_reset: np.ndarray
+    initial: np.ndarray      # рука входит в initial_arms
+
+    @classmethod
+    def from_config(cls, config: UCBBanditConfig) -> "ArmLayout":
+        arms = list(config.arms)
+        pct = np.array([float(a.strip("%")) if a.endswith("%") else np.nan for a in arms])
+        initial = set(config.initial_arms)
+        return cls(
+            arms=arms,
+            pct=pct,
+            is_double=np.array([a == "double" for a in arms]),
+            is_reset=np.array([a == "reset" for a in arms]),
+            initial=np.array([a in initial for a in arms]),
+        )
+
+    def index(self, arm: str) -> int:
+        return self.arms.index(arm)
+
+
+def arm_state_matrices(states: pd.DataFrame, advert_ids: Sequence[str], layout: ArmLayout):
+    """DataFrame load_bandit_states → матрицы counts / rewards / cpms (кампании × руки)."""
+    shape = (len(advert_ids), len(layout.arms))
+    counts = np.zeros(shape, dtype=np.int64)
+    rewards = np.zeros(shape)
+    cpms = np.zeros(shape)
+    if states.empty:
+        return counts, rewards, cpms
+
+    row_of = {a: i for i, a in enumerate(advert_ids)}
+    col_of = {a: j for j, a in enumerate(layout.arms)}
+    rows = states['campaign_id'].map(row_of)
+    cols = states['arm'].map(col_of)
+    known = rows.notna() & cols.notna()
+    r = rows[known].astype(int).to_numpy()
+    c = cols[known].astype(int).to_numpy()
+    counts[r, c] = states.loc[known, 'pulls'].to_numpy(dtype=np.int64)
+    rewards[r, c] = states.loc[known, 'reward_sum'].astype(float).fillna(0.0).to_numpy()
+    cpms[r, c] = states.loc[known, 'cpm_mean'].astype(float).to_numpy()
+    return counts, rewards, cpms
+
+
+def candidate_cpms(
+        layout: ArmLayout,
+        config: UCBBanditConfig,
+        current_cpm: np.ndarray,
+        initial_cpm: np.ndarray,
+        total_pulls: np.ndarray,
+) -> np.ndarray:
+    """
+    Новый CPM для каждой пары кампания × рука (UCBBanditLogic.apply_cpm_change).
+    initial_cpm = nan — «не указан»: CPM не меняется.
+
+    Руки reset / double при total_pulls <= 5 округляются по cpm_step_size, как
+    «большие» шаги. В UCBBanditLogic.apply_cpm_change на них падает
+    float(arm.strip("%")) — поштучный путь терял такую кампанию целиком
+    (reset выбирается, когда ни одна начальная рука не проходит min_bid).
+    """
+    cur = current_cpm[:, None]
+    mult = np.where(layout.is_double, 2.0, 1.0 + np.nan_to_num(layout.pct) / 100.0)
+    new = np.where(layout.is_reset[None, :], initial_cpm[:, None], cur * mult[None, :])
+
+    small_step = (total_pulls <= 5)[:, None] & (np.abs(np.nan_to_num(layout.pct, nan=np.inf)) <= 10)[None, :]
+    step = config.cpm_step_size
+    new = np.where(small_step, np.round(new, 2), np.round(new / step) * step)
+    new = np.round(new, 2)
+    return np.where(np.isnan(initial_cpm)[:, None], cur, new)
+
+
+def select_arms(
+        layout: ArmLayout,
+        config: UCBBanditConfig,
+        counts: np.ndarray,
+        rewards: np.ndarray,
+        cpms: np.ndarray,
+        current_cpm: np.ndarray,
+        initial_cpm: np.ndarray,
+        min_bid: np.ndarray,
+):
+    """
+    Векторный UCBBanditLogic.select_arm для всех кампаний сразу.
+
+    Возвращает (индексы выбранных рук, total_pulls после выбора, ucb-матрица).
+    В ucb-матрице -inf у рук, не участвовавших в выборе.
+    """
+    n = counts.shape[0]
+    total_pulls = counts.sum(axis=1) + 1  # select_arm сначала увеличивает total_pulls
+
+    available = np.where((total_pulls <= 5)[:, None], layout.initial[None, :], True)
+    new_cpm = candidate_cpms(layout, config, current_cpm, initial_cpm, total_pulls)
+    valid = available & (np.isnan(min_bid)[:, None] | (new_cpm >= min_bid[:, None]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_reward = np.where(counts > 0, rewards / counts, 0.0)
+        max_reward = rewards.max(axis=1, keepdims=True)
+        keep = valid & (
+            (counts < config.min_pulls_to_prune) |
+            ((counts > 0) & (avg_reward > 0.1 * max_reward))
+        )
+        active = np.where(keep.any(axis=1, keepdims=True), keep, valid)
+
+        if config.adaptive_exploration:
+            factor = config.exploration_factor * np.exp(-config.exploration_decay_rate * total_pulls)
+        else:
+            factor = np.full(n, float(config.exploration_factor))
+        exploration = np.sqrt(factor[:, None] * np.log(total_pulls)[:, None] / counts)
+        ucb = avg_reward + exploration
+    if config.daily_budget:
+        ucb = np.where(cpms > config.daily_budget * 1.2, ucb * 0.05, ucb)
+    ucb = np.where(active, ucb, -np.inf)
+
+    untested = valid & (counts == 0)
+    chosen = np.where(untested.any(axis=1), untested.argmax(axis=1), ucb.argmax(axis=1))
+    # нет рук, удовлетворяющих min_bid, — сброс к начальному CPM
+    chosen = np.where(valid.any(axis=1), chosen, layout.index("reset"))
+    return chosen, total_pulls, ucb
+
+
+def row_metric_rewards(df: pd.DataFrame, config: UCBBanditConfig) -> np.ndarray:
+    """
+    Награда каждой строки истории: Σ вес × calculate_metric_reward(метрика)
+    по composite_metric_weights, посчитанная по колонкам, а не по строкам.
+    """
+    views = df['ad_views'].to_numpy(dtype=float)
+    clicks = df['ad_clicks'].to_numpy(dtype=float)
+    cost = df['ad_cost'].to_numpy(dtype=float)
+    orders = df['ad_orders'].to_numpy(dtype=float)
+    atbs = df['ad_atbs'].to_numpy(dtype=float)
+    items = df['items'].to_numpy(dtype=float)
+    revenue = df['revenue'].to_numpy(dtype=float)
+    cpm = df['ad_rate'].to_numpy(dtype=float) if 'ad_rate' in df.columns else np.zeros(len(df))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ctr = np.where(views > 0, clicks / views * 100, 0.0)
+        cpa = np.where(atbs > 0, cost / atbs, 1000.0)
+        cr_to_cart = np.where(views > 0, atbs / views * 100, 0.0)
+        cr_to_order = np.where(views > 0, orders / views * 100, 0.0)
+
+        period_days = config.period_max_hours / 24.0
+        if config.period_max_hours > 0:
+            sales_rate = items / period_days
+            warehouse = np.where((items > 0) & (sales_rate != 0), config.warehouse_cost * config.stocks / sales_rate, 0.0)
+        else:
+            warehouse = np.zeros(len(df))
+        base = config.cost_price + config.marketplace_fee + warehouse
+        costs_carts = (base + cost / atbs) * atbs
+        roi_carts = np.where((atbs > 0) & (costs_carts > 0), (revenue / costs_carts - 1) * 100, 0.0)
+        costs_orders = (base + cost / orders) * orders
+        roi_orders = np.where((orders > 0) & (costs_orders > 0), (revenue / costs_orders - 1) * 100, 0.0)
+
+        w = config.composite_metric_weights
+        by_metric = {
+            "ctr": lambda: ctr,
+            "clicks": lambda: clicks,
+            "sum": lambda: cost,
+            "cpm": lambda: np.where(cpm > 0, 1000 / (cpm + 1), 0.0),
+            "ctr/cpm": lambda: np.where(cpm > 0, ctr / (cpm + 1), 0.0),
+            "orders": lambda: orders,
+            "orders/cpm": lambda: np.where(cpm > 0, orders / (cpm + 1), 0.0),
+            "atbs": lambda: atbs,
+            "atbs/cpm": lambda: np.where(cpm > 0, atbs / (cpm + 1), 0.0),
+            "orders/atbs": lambda: np.where(orders > 0, orders / (atbs + 1), 0.0),
+            "cpa": lambda: np.where(cpa > 0, 1 / (cpa + 1), 0.0),
+            "cr_to_cart": lambda: cr_to_cart,
+            "cr_to_order": lambda: cr_to_order,
+            "roi_carts": lambda: roi_carts,
+            "roi_orders": lambda: roi_orders,
+            "roi_weighted": lambda: w.get("roi_carts", 0.0) * roi_carts + w.get("roi_orders", 0.0) * roi_orders,
+        }
+        total = np.zeros(len(df))
+        for metric, weight in w.items():
+            total += weight * by_metric.get(metric, lambda: np.zeros(len(df)))()
+    return total
+
+
+class UCBBanditBatch:
+    """Рекомендации UCB по списку кампаний за один проход по данным."""
+
+    def __init__(self, db: UCBBanditDatabase, **config_kwargs):
+        self.db = db
+        self.config_kwargs = config_kwargs
+        self.config = UCBBanditConfig(advert_id="batch", **config_kwargs)
+        self.layout = ArmLayout.from_config(self.config)
+        # advert_id → причина: кампании последнего recommend без рекомендации
+        self.failed: Dict[str, str] = {}
+
+    def _history_windows(self, advert_ids: List[str], start_date: str, end_date: str,
+                         days: int, max_days: int) -> Dict[str, pd.DataFrame]:
+        """
+        История каждой кампании за [start_date, end_date], а если её нет —
+        за последние max_days дней (как повторный запрос в recommend_action).
+        Оба окна читаются одним запросом на таблицу.
+        """
+        max_end = datetime.now().date() - timedelta(days=1)
+        max_start = max_end - timedelta(days=max_days - 1)
+        lo = min(start_date, max_start.isoformat())
+        hi = max(end_date, max_end.isoformat())
+        stats, rates = self.db.fetch_history_batch(advert_ids, lo, hi)
+
+        def window(df: pd.DataFrame, a: str, b: str) -> pd.DataFrame:
+            if df.empty:
+                return df
+            d = df['date'].astype(str)
+            return df[(d >= a) & (d <= b)]
+
+        short = merge_history(window(stats, start_date, end_date), window(rates, start_date, end_date))
+        by_campaign = {a: g for a, g in short.groupby('advert_id', sort=False)} if not short.empty else {}
+        missing = [a for a in advert_ids if a not in by_campaign]
+        if missing and days < max_days:
+            lo, hi = max_start.isoformat(), max_end.isoformat()
+            wide = merge_history(
+                window(stats[stats['advert_id'].isin(missing)] if not stats.empty else stats, lo, hi),
+                window(rates[rates['advert_id'].isin(missing)] if not rates.empty else rates, lo, hi),
+            )
+            if not wide.empty:
+                by_campaign.update({a: g for a, g in wide.groupby('advert_id', sort=False)})
+                logger.info(f"Расширен период до {lo} - {hi} для {wide['advert_id'].nunique()} кампаний")
+        return by_campaign
+
+    def recommend(
+            self,
+            campaigns: Sequence[BanditCampaign],
+            start_date: Optional[str] = None,
+            end_date: Optional[str] = None,
+            days: int = 5,
+            max_days: int = 60,
+    ) -> List[Dict]:
+        """
+        Рекомендации по всем кампаниям (поля — как у строки algo.autobidder в
+        UCBBanditCPM.recommend_action). Ничего не пишет: сохранение —
+        db.save_recommendations.
+        """
+        self.failed = {}
+        if start_date is None or end_date is None:
+            end_date_dt = datetime.now().date() - timedelta(days=1)
+            start_date = (end_date_dt - timedelta(days=days - 1)).isoformat()
+            end_date = end_date_dt.isoformat()
+
+        # id кампаний уходят литералами в IN (...) всех пакетных запросов:
+        # одно нечисловое значение сорвало бы загрузку для всех кампаний
+        valid = []
+        for c in campaigns:
+            if str(c.advert_id).strip().isdigit():
+                valid.append(c)
+            else:
+                self.failed[str(c.advert_id)] = "некорректный advert_id"
+        if not valid:
+            return self._log_result([])
+
+        try:
+            results = self._recommend_batch(valid, start_date, end_date, days, max_days)
+        except Exception as e:
+            # пакет упал целиком — пересчитываем по одной кампании, чтобы
+            # ошибка одной не оставила без рекомендаций остальные
+            logger.error(f"Пакетный расчёт UCB не удался ({e}), пересчёт по кампаниям")
+            results = []
+            for c in valid:
+                try:
+                    results.extend(self._recommend_batch([c], start_date, end_date, days, max_days))
+                except Exception as ce:
+                    self.failed[str(c.advert_id)] = str(ce)
+        return self._log_result(results)
+
+    def _log_result(self, results: List[Dict]) -> List[Dict]:
+        if self.failed:
+            logger.error(f"Нет рекомендаций UCB для {len(self.failed)} кампаний: {self.failed}")
+        logger.info(f"Сформировано {len(results)} рекомендаций UCB за один проход")
+        return results
+
+    def _recommend_batch(self, campaigns: Sequence[BanditCampaign], start_date: str, end_date: str,
+                         days: int, max_days: int) -> List[Dict]:
+        """Расчёт recommend для готового списка кампаний; ошибки строк — в self.failed."""
+        cfg = self.config
+        layout = self.layout
+        advert_ids = [str(c.advert_id) for c in campaigns]
+        min_bid = np.array([np.nan if c.min_bid is None or c.min_bid < 0 else float(c.min_bid) for c in campaigns])
+
+        initial = self.db.reassess_initial_cpms(advert_ids)
+        initial_cpm = np.array([initial.get(a, np.nan) for a in advert_ids])
+        counts, rewards_sum, cpms = arm_state_matrices(self.db.load_bandit_states(advert_ids), advert_ids, layout)
+        history = self._history_windows(advert_ids, start_date, end_date, days, max_days)
+
+        # current_cpm: последняя ставка из истории, иначе initial → min_bid → 150
+        bid_floor = np.where(np.nan_to_num(min_bid) > 0, min_bid, DEFAULT_CPM)
+        fallback = np.where(np.isnan(initial_cpm), bid_floor, initial_cpm)
+        current_cpm = np.array([
+            float(history[a]['ad_rate'].iloc[-1]) if a in history and not history[a]['ad_rate'].isna().all() else fallback[i]
+            for i, a in enumerate(advert_ids)
+        ])
+
+        chosen, total_pulls, _ = select_arms(
+            layout, cfg, counts, rewards_sum, cpms, current_cpm, initial_cpm, min_bid
+        )
+        new_cpm = candidate_cpms(layout, cfg, current_cpm, initial_cpm, total_pulls)
+        recommended = new_cpm[np.arange(len(campaigns)), chosen]
+
+        # награды и агрегаты по кампаниям
+        rows_with_history = [history[a] for a in advert_ids if a in history]
+        rewards_calc = UCBBanditRewards(cfg)
+        if rows_with_history:
+            hist = pd.concat(rows_with_history, ignore_index=True)
+            hist['row_reward'] = row_metric_rewards(hist, cfg)
+            agg = hist.groupby('advert_id', sort=False).agg(
+                clicks=('ad_clicks', 'sum'), views=('ad_views', 'sum'), cost=('ad_cost', 'sum'),
+                orders=('ad_orders', 'sum'), atbs=('ad_atbs', 'sum'), items=('items', 'sum'),
+                revenue=('revenue', 'sum'), reward=('row_reward', 'mean'),
+            )
+        else:
+            agg = pd.DataFrame()
+
+        results = []
+        for i, c in enumerate(campaigns):
+            a = advert_ids[i]
+            try:
+                results.append(self._campaign_result(i, c, a, chosen, recommended, current_cpm, bid_floor, agg, rewards_calc))
+            except Exception as e:
+                logger.error(f"Ошибка расчёта рекомендации для кампании {a}: {e}")
+                self.failed[a] = str(e)
+        return results
+
+    def _campaign_result(self, i, c, a, chosen, recommended, current_cpm, bid_floor, agg, rewards_calc) -> Dict:
+        """Строка рекомендации одной кампании по общим матрицам пакета."""
+        cfg = self.config
+        arm = self.layout.arms[chosen[i]]
+        rec_cpm = float(recommended[i])
+        t = agg.loc[a] if a in agg.index else None
+        cpa = cr_to_cart = cr_to_order = roi_carts = roi_orders = roi_weighted = reward = 0.0
+        totals = dict(atbs=0, orders=0, clicks=0, views=0, cost=0.0, items=0, revenue=0.0)
+        stop_iteration = False
+        recommendation = f"Нет данных для advert_id {a}"
+
+        if t is not None:
+            totals = dict(
+                atbs=int(t['atbs']), orders=int(t['orders']), clicks=int(t['clicks']), views=int(t['views']),
+                cost=float(t['cost']), items=int(t['items']), revenue=float(t['revenue']),
+            )
+            cpa = (totals['cost'] / totals['atbs']) if totals['atbs'] > 0 else 1000.0
+            cr_to_cart = (totals['atbs'] / totals['views'] * 100) if totals['views'] > 0 else 0.0
+            cr_to_order = (totals['orders'] / totals['views'] * 100) if totals['views'] > 0 else 0.0
+            warehouse = rewards_calc.calculate_avg_warehouse_cost(totals['items'], cfg.period_max_hours)
+            base = cfg.cost_price + cfg.marketplace_fee + warehouse
+            if totals['atbs'] > 0:
+                costs = (base + totals['cost'] / totals['atbs']) * totals['atbs']
+                roi_carts = (totals['revenue'] / costs - 1) * 100 if costs > 0 else 0.0
+            if totals['orders'] > 0:
+                costs = (base + totals['cost'] / totals['orders']) * totals['orders']
+                roi_orders = (totals['revenue'] / costs - 1) * 100 if costs > 0 else 0.0
+            roi_weighted = (
+                cfg.composite_metric_weights.get("roi_carts", 0.0) * roi_carts +
+                cfg.composite_metric_weights.get("roi_orders", 0.0) * roi_orders
+            )
+            # порядок аргументов — как в UCBBanditCPM.recommend_action
+            reward = rewards_calc.apply_reward_penalties(
+                float(t['reward']), cpa, totals['atbs'], totals['orders'], cpa, cr_to_cart, cr_to_order
+            )
+            # у каждого UCBBanditCPM своя история нормализации — нормируем как первое значение
+            reward = UCBBanditRewards(cfg).normalize_reward(reward)
+            rec_cpm = max(float(bid_floor[i]), rec_cpm)
+            recommendation = (
+                f"Настройте кампанию {a}: Установите CPM равный {rec_cpm:.2f} ₽ "
+                f"(текущий CPA: {cpa:.2f} ₽, ROI carts: {roi_carts:.2f}%, ROI orders: {roi_orders:.2f}%)"
+            )
+            if reward == 0.0 or totals['views'] == 0:
+                recommendation = f"Кампания {a} неактивна или без показов, рассмотрите оптимизацию"
+                stop_iteration = True
+
+        return {
+            "campaign_id": a,
+            "product_id": c.product_id,
+            "timestamp": datetime.now().isoformat(),
+            "arm": arm,
+            "reward": float(reward),
+            "metric": cfg.reward_metric,
+            "current_cpm": float(current_cpm[i]),
+            "recommended_cpm": rec_cpm,
+            "cpa": float(cpa),
+            "cr_to_cart": float(cr_to_cart),
+            "cr_to_order": float(cr_to_order),
+            "roi_carts": float(roi_carts),
+            "roi_orders": float(roi_orders),
+            "roi_weighted": float(roi_weighted),
+            **totals,
+            "cost_price": float(cfg.cost_price),
+            "marketplace_fee": float(cfg.marketplace_fee),
+            "warehouse_cost": float(cfg.warehouse_cost),
+            "stocks": float(cfg.stocks),
+            "stop_iteration": stop_iteration,
+            "recommendation": recommendation,
+        }
+
+
+def autobidder_rows(results: List[Dict]) -> List[Dict]:
+    """Строки для algo.autobidder: CPM округлены, служебные поля убраны."""
+    rows = []
+    for r in results:
+        row = {k: v for k, v in r.items() if k != "product_id"}
+        row["current_cpm"] = float(round(r["current_cpm"]))
+        row["recommended_cpm"] = float(round(r["recommended_cpm"]))
+        rows.append(row)
+    return rows
@@ -0,0 +1,70 @@
+"""
+Время загрузки code location wb_autogen_repository (импорт + get_all_jobs).
+
+Каждый замер — отдельный процесс python, как у демона/run worker'а:
+  • cold — файловый кэш config.yml удалён (разбор YAML + запись pickle);
+  • warm — кэш уже лежит рядом с конфигом;
+  • off  — DAGSTER_CONFIG_CACHE=0 (поведение до кэша, но с CSafeLoader).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/bench_code_location_startup.py --repeat 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CONFIG = ROOT / "dagster_conf" / "lib" / "config.yml"
+
+SNIPPET = (
+    "from dagster_conf.repositories.wb_autogen_repository import wb_autogen_repository as r;"
+    "print(len(r.get_all_jobs()))"
+)
+
+
+def _drop_cache() -> None:
+    for p in CONFIG.parent.glob(f".{CONFIG.name}.*.pickle"):
+        p.unlink()
+
+
+def _run(extra_env: dict):
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "DATABASE_URL": os.getenv("DATABASE_URL", "postgresql+asyncpg://u:p@localhost/db"),
+        **extra_env,
+    }
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", SNIPPET],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - t0
+    jobs = out.stdout.strip().splitlines()[-1]
+    return elapsed, jobs
+
+
+def main(args) -> None:
+    results = {"cold": [], "warm": [], "off": []}
+    jobs = None
+    for _ in range(args.repeat):
+        _drop_cache()
+        t, jobs = _run({})
+        results["cold"].append(t)
+        t, _ = _run({})
+        results["warm"].append(t)
+        t, _ = _run({"DAGSTER_CONFIG_CACHE": "0"})
+        results["off"].append(t)
+
+    print(f"jobs в репозитории: {jobs}")
+    for name, ts in results.items():
+        print(f"{name:>4}: best {min(ts):6.2f}s  avg {sum(ts) / len(ts):6.2f}s")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--repeat", type=int, default=3)
+    main(p.parse_args())
@@ -0,0 +1,158 @@
+"""
+Микробенчмарк разворачивания ответа fullstats (silver_wb_adv_fullstats).
+
+Синтетический ответ: 5000 кампаний × 2 дня × 2 appType × N nm + boosterStats.
+Сравнивает прежний проход циклами (next(...) по days с _to_msk на каждой дате,
+разбор даты на каждую запись boosterStats) с flatten_fullstats + фильтрами по
+уникальным датам и проверяет, что строки совпадают.
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/bench_fullstats_flatten.py --adverts 5000 --nms 5
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from dagster_conf.pipelines.fullstats_flatten import (
+    MSK, flatten_fullstats, positions_by_day, positions_for_hour, stats_all, stats_for_day,
+)
+
+
+def _to_msk(s: str) -> datetime:
+    s = s.strip()
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(MSK)
+
+
+def make_payload(adverts: int, nms: int, day: datetime, seed: int = 42):
+    rnd = random.Random(seed)
+    days = [day - timedelta(days=1), day]
+    out = []
+    for a in range(adverts):
+        advert_id = 10_000_000 + a
+        out.append({
+            "advertId": advert_id,
+            "days": [
+                {
+                    "date": d.isoformat(),
+                    "apps": [
+                        {
+                            "appType": app,
+                            "nm": [
+                                {
+                                    "nmId": 100_000 + a * nms + n,
+                                    "views": rnd.randint(0, 5000), "clicks": rnd.randint(0, 200),
+                                    "sum": round(rnd.random() * 1000, 2), "atbs": rnd.randint(0, 20),
+                                    "orders": rnd.randint(0, 10), "shks": rnd.randint(0, 10),
+                                    "sum_price": round(rnd.random() * 20000, 2),
+                                }
+                                for n in range(nms)
+                            ],
+                        }
+                        for app in (1, 32)
+                    ],
+                }
+                for d in days
+            ],
+            "boosterStats": [
+                {"date": (day + timedelta(hours=h)).isoformat(), "nm": 100_000 + a * nms, "avg_position": rnd.randint(1, 300)}
+                for h in range(0, 24, 3)
+            ],
+        })
+    return out
+
+
+METRICS = (("views", "views", 0), ("clicks", "clicks", 0), ("cost", "sum", 0.0), ("carts", "atbs", 0),
+           ("orders", "orders", 0), ("items", "shks", 0), ("revenue", "sum_price", 0.0))
+
+
+def _legacy_stats_row(advert_id, app_type, nm):
+    metrics = {col: nm.get(src, default) for col, src, default in METRICS}
+    return {"advert_id": advert_id, "app_type": app_type, "nm_id": nm["nmId"], **metrics}
+
+
+def legacy_hourly(raw_list, biz: datetime):
+    """Как было в silver_wb_adv_fullstats (1h): next(...) по days, _to_msk на каждой дате."""
+    stats, positions = [], []
+    target_date = biz.date()
+    for raw in raw_list:
+        advert_id = raw["advertId"]
+        day = next((d for d in raw.get("days", []) if _to_msk(d["date"]).date() == target_date), None)
+        if day:
+            day_start = _to_msk(day["date"]).replace(hour=0, minute=0, second=0, microsecond=0)
+            for app in day.get("apps", []):
+                for nm in app.get("nm", []):
+                    stats.append({**_legacy_stats_row(advert_id, app["appType"], nm), "day_start": day_start})
+        for b in raw.get("boosterStats", []):
+            bst = _to_msk(b["date"])
+            if bst.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1) == biz:
+                positions.append({"advert_id": advert_id, "nm_id": b["nm"], "date": bst, "avg_position": b.get("avg_position")})
+    return stats, positions
+
+
+def legacy_daily(raw_list):
+    """Как было в silver_wb_adv_fullstats (1d)."""
+    stats, positions = [], []
+    for raw in raw_list:
+        advert_id = raw["advertId"]
+        for day in raw.get("days", []):
+            _to_msk(day["date"])
+            for app in day.get("apps", []):
+                for nm in app.get("nm", []):
+                    stats.append(_legacy_stats_row(advert_id, app["appType"], nm))
+        for b in raw.get("boosterStats", []):
+            bst = _to_msk(b["date"])
+            positions.append({"advert_id": advert_id, "nm_id": b["nm"], "date": bst, "avg_position": b.get("avg_position"),
+                              "business_dttm": bst.replace(hour=0, minute=0, second=0, microsecond=0)})
+    return stats, positions
+
+
+def flat_hourly(raw_list, biz: datetime):
+    f = flatten_fullstats(raw_list)
+    return stats_for_day(f, biz), positions_for_hour(f, biz)
+
+
+def flat_daily(raw_list):
+    f = flatten_fullstats(raw_list)
+    return stats_all(f), positions_by_day(f)
+
+
+def _best(fn, *args, repeat: int):
+    best, res = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, res
+
+
+def main(args) -> None:
+    day = datetime(2026, 3, 10, tzinfo=MSK)
+    biz = day.replace(hour=14)
+    payload = make_payload(args.adverts, args.nms, day)
+    nm_rows = sum(len(nm["nm"]) for r in payload for d in r["days"] for nm in d["apps"])
+    print(f"payload: {args.adverts} кампаний, {nm_rows} строк nm, "
+          f"{sum(len(r['boosterStats']) for r in payload)} boosterStats")
+
+    for name, legacy, flat, extra in (
+        ("1h", legacy_hourly, flat_hourly, (biz,)),
+        ("1d", legacy_daily, flat_daily, ()),
+    ):
+        t_old, old = _best(legacy, payload, *extra, repeat=args.repeat)
+        t_new, new = _best(flat, payload, *extra, repeat=args.repeat)
+        assert old == new, f"{name}: строки расходятся"
+        print(f"{name}: циклы {t_old * 1000:8.1f} ms | коды дат {t_new * 1000:8.1f} ms | x{t_old / t_new:.1f} "
+              f"(stats={len(new[0])}, positions={len(new[1])})")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--adverts", type=int, default=5000)
+    p.add_argument("--nms", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3)
+    main(p.parse_args())
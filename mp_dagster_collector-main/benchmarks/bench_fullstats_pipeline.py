@@ -0,0 +1,166 @@
+"""
+Бенчмарк конвейера fullstats на локальном фейковом эндпоинте.
+
+Поднимает aiohttp-сервер, имитирующий /adv/v2/fullstats с лимитом
+«N запросов в окно» (X-Ratelimit-Remaining / X-Ratelimit-Retry, 429 при превышении),
+и прогоняет 1000 кампаний (10 чанков по 100):
+
+  * legacy    — как раньше: последовательно, после каждого чанка пауза RATE_LIMIT_DELAY;
+  * pipeline  — run_fetch_pipeline: темп по заголовкам, 429 перекладывает только свой чанк,
+                запись одним writer'ом пачками (здесь — в память, с имитацией задержки INSERT).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/bench_fullstats_pipeline.py --campaigns 1000 --window-sec 6 --burst 3
+Реальный WB: окно 60 с — время legacy масштабируется как chunks * 60 с.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import ClientResponseError, web
+
+from dagster_conf.lib.fetch_pipeline import FetchJob, run_fetch_pipeline
+from dagster_conf.lib.rate_limit import HeaderRatePacer
+
+CHUNK_SIZE = 100
+
+
+class FakeFullstats:
+    """Лимит: burst запросов на окно window_sec (скользящее окно от первого запроса)."""
+
+    def __init__(self, *, window_sec: float, burst: int, latency_sec: float):
+        self.window_sec = window_sec
+        self.burst = burst
+        self.latency_sec = latency_sec
+        self.window_start = 0.0
+        self.used = 0
+        self.calls = 0
+        self.rejected = 0
+
+    def _headers(self, remaining: int, retry: float) -> dict:
+        return {
+            "X-Ratelimit-Limit": str(self.burst),
+            "X-Ratelimit-Remaining": str(remaining),
+            "X-Ratelimit-Retry": f"{max(retry, 0.0):.3f}",
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        payload = await request.json()
+        now = time.monotonic()
+        if now - self.window_start >= self.window_sec:
+            self.window_start, self.used = now, 0
+        retry = self.window_start + self.window_sec - now
+        if self.used >= self.burst:
+            self.rejected += 1
+            return web.json_response({"error": "too many requests"}, status=429, headers=self._headers(0, retry))
+        self.used += 1
+        await asyncio.sleep(self.latency_sec)
+        body = [
+            {"advertId": item["id"], "views": 100, "clicks": 5, "sum": 12.5, "days": []}
+            for item in payload
+        ]
+        remaining = self.burst - self.used
+        return web.json_response(body, headers=self._headers(remaining, retry))
+
+
+async def _fetch(session: aiohttp.ClientSession, url: str, payload):
+    async with session.post(url, json=payload) as resp:
+        headers = dict(resp.headers)
+        headers["status"] = resp.status
+        if resp.status == 429:
+            raise ClientResponseError(
+                resp.request_info, resp.history, status=429, message="Too Many Requests", headers=resp.headers,
+            )
+        resp.raise_for_status()
+        return await resp.json(), headers
+
+
+def _jobs(campaigns: int):
+    ids = list(range(1, campaigns + 1))
+    return [
+        FetchJob(payload=[{"id": i, "dates": ["2026-01-01"]} for i in ids[k:k + CHUNK_SIZE]], size=len(ids[k:k + CHUNK_SIZE]))
+        for k in range(0, len(ids), CHUNK_SIZE)
+    ]
+
+
+def _record(job, data, headers, request_dttm, receive_dttm):
+    return {"request_dttm": request_dttm, "receive_dttm": receive_dttm, "rows": len(data), "status": headers.get("status")}
+
+
+async def bench_legacy(url: str, campaigns: int, delay: float, insert_sec: float) -> float:
+    started = time.monotonic()
+    async with aiohttp.ClientSession() as s:
+        for job in _jobs(campaigns):
+            while True:
+                try:
+                    await _fetch(s, url, job.payload)
+                    break
+                except ClientResponseError:
+                    await asyncio.sleep(delay)
+            await asyncio.sleep(insert_sec)   # новая сессия + INSERT на каждый чанк
+            await asyncio.sleep(delay)        # RATE_LIMIT_DELAY
+    return time.monotonic() - started
+
+
+async def bench_pipeline(url: str, campaigns: int, delay: float, insert_sec: float, workers: int):
+    written = []
+
+    async def write_batch(records):
+        await asyncio.sleep(insert_sec)       # один executemany на пачку
+        written.extend(records)
+
+    async with aiohttp.ClientSession() as s:
+        stats = await run_fetch_pipeline(
+            _jobs(campaigns),
+            fetch=lambda p: _fetch(s, url, p),
+            build_record=_record,
+            write_batch=write_batch,
+            pacer=HeaderRatePacer(fallback_delay=delay),
+            now=lambda: datetime.now(timezone.utc),
+            workers=workers,
+        )
+    assert len(written) == len(_jobs(campaigns)), (len(written), stats)
+    return stats
+
+
+async def main(args) -> None:
+    fake = FakeFullstats(window_sec=args.window_sec, burst=args.burst, latency_sec=args.latency_sec)
+    app = web.Application()
+    app.router.add_post("/adv/v2/fullstats", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.port}/adv/v2/fullstats"
+    chunks = len(_jobs(args.campaigns))
+
+    try:
+        stats = await bench_pipeline(url, args.campaigns, args.window_sec, args.insert_sec, args.workers)
+        print(
+            f"pipeline: {args.campaigns} кампаний / {chunks} чанков за {stats.elapsed_sec:.2f}s "
+            f"(requests={stats.requests}, 429={stats.rate_limited}, written={stats.written})"
+        )
+
+        if not args.skip_legacy:
+            await asyncio.sleep(args.window_sec)   # свежее окно лимита
+            legacy = await bench_legacy(url, args.campaigns, args.window_sec, args.insert_sec)
+            print(f"legacy:   {args.campaigns} кампаний / {chunks} чанков за {legacy:.2f}s")
+            print(f"ускорение: x{legacy / max(stats.elapsed_sec, 1e-9):.1f}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--campaigns", type=int, default=1000)
+    p.add_argument("--window-sec", type=float, default=6.0, help="окно лимита фейкового WB (у WB — 60)")
+    p.add_argument("--burst", type=int, default=3, help="запросов на окно")
+    p.add_argument("--latency-sec", type=float, default=0.3, help="время ответа fullstats")
+    p.add_argument("--insert-sec", type=float, default=0.05, help="имитация INSERT в бронзу")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--port", type=int, default=8089)
+    p.add_argument("--skip-legacy", action="store_true")
+    asyncio.run(main(p.parse_args()))
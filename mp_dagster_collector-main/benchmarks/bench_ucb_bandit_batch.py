@@ -0,0 +1,224 @@
+"""
+Бенчмарк UCB-бандита: поштучный UCBBanditCPM на каждую кампанию против
+пакетного UCBBanditBatch (bandit/ucb_batch.py) на синтетических данных.
+
+Скрипт создаёт на сервере из --dsn отдельную базу (по умолчанию
+ucb_bandit_bench) со схемами silver / algo, заполняет их
+(--campaigns кампаний, история за 60 дней, состояние рук в algo.autobidder)
+и сравнивает:
+  • batch   — UCBBanditBatch.recommend + save_recommendations;
+  • legacy  — цикл UCBBanditCPM(...).recommend_action() по кампаниям
+              (--fresh-engines: новый engine на кампанию, как было раньше).
+Рекомендации обоих путей сверяются (рука, CPM, награда). Кампании, на
+которых legacy падает (рука reset при total_pulls <= 5), batch считает:
+CPM сбрасывается к initial_cpm с округлением по cpm_step_size.
+
+Изоляция ошибок: к кампаниям добавляется кампания с некорректным id, а в
+запись — строка, которую algo.autobidder не примет; остальные рекомендации
+должны совпасть и сохраниться. По окончании база удаляется (--keep — оставить).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=.:bandit python benchmarks/bench_ucb_bandit_batch.py \\
+        --dsn postgresql+psycopg2://postgres:pg@localhost:5432/postgres --campaigns 2000
+"""
+import argparse
+import logging
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+import ucb_bandit_cpm
+from sql.database_manager import UCBBanditDatabase
+from ucb_batch import BanditCampaign, UCBBanditBatch, autobidder_rows
+
+DDL = """
+CREATE SCHEMA silver;
+CREATE SCHEMA algo;
+CREATE TABLE silver.wb_adv_product_stats_1d (
+    advert_id bigint, date date, views int, clicks int, carts int, orders int,
+    cost numeric(12,2), items int, revenue numeric(12,2)
+);
+CREATE INDEX ON silver.wb_adv_product_stats_1d (advert_id, date);
+CREATE TABLE silver.wb_adv_product_rates_1d (
+    advert_id bigint, run_dttm timestamptz, cpm_current numeric(10,2)
+);
+CREATE INDEX ON silver.wb_adv_product_rates_1d (advert_id, run_dttm);
+CREATE TABLE algo.autobidder (
+    campaign_id bigint, timestamp timestamptz, arm text, reward double precision, metric text,
+    current_cpm double precision, recommended_cpm double precision,
+    cpa double precision, cr_to_cart double precision, cr_to_order double precision,
+    roi_carts double precision, roi_orders double precision, roi_weighted double precision,
+    atbs int, orders int, clicks int, views int, cost double precision, items int, revenue double precision,
+    cost_price double precision, marketplace_fee double precision, warehouse_cost double precision,
+    stocks double precision, stop_iteration boolean, recommendation text
+);
+CREATE INDEX ON algo.autobidder (campaign_id);
+"""
+
+ARMS = [f"{i}%" for i in range(-50, 51, 5)] + ["double", "reset"]
+
+
+def seed(engine, rnd: random.Random, campaigns: int):
+    today = date.today()
+    stats, rates, states, out = [], [], [], []
+    for advert_id in range(100_000, 100_000 + campaigns):
+        kind = rnd.random()
+        # 75% — свежая история, 15% — только старая (окно 60 дней), 10% — без данных
+        if kind < 0.75:
+            days = range(0, rnd.randint(3, 20))
+        elif kind < 0.90:
+            days = range(rnd.randint(10, 30), rnd.randint(31, 55))
+        else:
+            days = range(0)
+        cpm = rnd.choice([150, 200, 250, 300, 400])
+        for back in days:
+            d = today - timedelta(days=back)
+            views = rnd.randint(0, 5000)
+            clicks = rnd.randint(0, max(views // 20, 1))
+            carts = rnd.randint(0, max(clicks // 3, 1))
+            orders = rnd.randint(0, carts)
+            stats.append(dict(a=advert_id, d=d, v=views, c=clicks, ca=carts, o=orders,
+                              cost=round(views * cpm / 1000, 2), i=orders, r=orders * rnd.randint(500, 3000)))
+            rates.append(dict(a=advert_id, t=datetime(d.year, d.month, d.day, 6), cpm=cpm + rnd.randint(-20, 20)))
+        for _ in range(rnd.choice([0, 0, 3, 8, 30, 80])):
+            states.append(dict(c=advert_id, arm=rnd.choice(ARMS), r=rnd.random(), cpm=float(cpm)))
+        out.append(BanditCampaign(advert_id=str(advert_id), product_id=advert_id * 10,
+                                  min_bid=rnd.choice([None, 125.0, 250.0])))
+
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(text("""
+            INSERT INTO silver.wb_adv_product_stats_1d VALUES (:a, :d, :v, :c, :ca, :o, :cost, :i, :r)
+        """), stats)
+        conn.execute(text("INSERT INTO silver.wb_adv_product_rates_1d VALUES (:a, :t, :cpm)"), rates)
+        conn.execute(text("""
+            INSERT INTO algo.autobidder (campaign_id, timestamp, arm, reward, current_cpm)
+            VALUES (:c, now() - interval '10 days', :arm, :r, :cpm)
+        """), states)
+        conn.execute(text("ANALYZE"))
+    return out
+
+
+def run_batch(engine, campaigns, start_date, end_date):
+    db = UCBBanditDatabase(engine=engine)
+    t0 = time.perf_counter()
+    results = UCBBanditBatch(db).recommend(campaigns, start_date=start_date, end_date=end_date)
+    t_calc = time.perf_counter() - t0
+    return results, t_calc, db
+
+
+def run_legacy(dsn, engine, campaigns, start_date, end_date, fresh_engines: bool):
+    if fresh_engines:
+        ucb_bandit_cpm.UCBBanditDatabase = lambda _cfg: UCBBanditDatabase(engine=create_engine(dsn))
+    else:
+        ucb_bandit_cpm.UCBBanditDatabase = lambda _cfg: UCBBanditDatabase(engine=engine)
+
+    results, errors = {}, 0
+    t0 = time.perf_counter()
+    for c in campaigns:
+        bandit = None
+        try:
+            bandit = ucb_bandit_cpm.UCBBanditCPM(advert_id=c.advert_id, min_bid=c.min_bid)
+            results[c.advert_id] = bandit.recommend_action(start_date=start_date, end_date=end_date)
+        except Exception:
+            # UCBBanditLogic.apply_cpm_change падает на руке reset при total_pulls <= 5
+            errors += 1
+        finally:
+            if fresh_engines and bandit is not None:
+                bandit.db.engine.dispose()
+    return results, time.perf_counter() - t0, errors
+
+
+def compare(batch, legacy) -> int:
+    mismatches = 0
+    for rec in batch:
+        old = legacy.get(rec["campaign_id"])
+        if old is None:
+            continue
+        same = (
+            old["arm"] == rec["arm"]
+            and math.isclose(old["recommended_cpm"], rec["recommended_cpm"], abs_tol=0.01)
+            and math.isclose(old["reward"], rec["reward"], abs_tol=1e-9)
+        )
+        if not same:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  расхождение {rec['campaign_id']}: legacy={old['arm']}/{old['recommended_cpm']}/{old['reward']} "
+                      f"batch={rec['arm']}/{rec['recommended_cpm']}/{rec['reward']}")
+    return mismatches
+
+
+def check_isolation(db, campaigns, batch, start_date, end_date) -> None:
+    """Одна сломанная кампания не меняет и не теряет рекомендации остальных."""
+    bandit = UCBBanditBatch(db)
+    poisoned = bandit.recommend(campaigns + [BanditCampaign(advert_id="12x")], start_date=start_date, end_date=end_date)
+    assert set(bandit.failed) == {"12x"}, bandit.failed
+    assert [(r["campaign_id"], r["arm"], r["recommended_cpm"]) for r in poisoned] == \
+           [(r["campaign_id"], r["arm"], r["recommended_cpm"]) for r in batch]
+
+    rows = autobidder_rows(batch[:50])
+    rows[10] = {**rows[10], "campaign_id": "12x"}
+    with db.engine.begin() as conn:
+        before = conn.execute(text("SELECT count(*) FROM algo.autobidder")).scalar()
+    assert not db.save_recommendations(rows)
+    with db.engine.begin() as conn:
+        saved = conn.execute(text("SELECT count(*) FROM algo.autobidder")).scalar() - before
+        conn.execute(text("DELETE FROM algo.autobidder WHERE timestamp > now() - interval '1 minute' AND metric IS NOT NULL"))
+    assert saved == len(rows) - 1, saved
+    print(f"изоляция: кампания с некорректным id отброшена, сохранено {saved} из {len(rows)} строк")
+
+
+def main(args) -> None:
+    # логи обоих путей (тысячи строк на прогон) в замер не входят
+    logging.disable(logging.ERROR)
+    rnd = random.Random(args.seed)
+
+    admin = create_engine(args.dsn, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+        conn.execute(text(f"CREATE DATABASE {args.database}"))
+    dsn = make_url(args.dsn).set(database=args.database)
+    engine = create_engine(dsn)
+    try:
+        campaigns = seed(engine, rnd, args.campaigns)
+        end_date = date.today()
+        start_date = (end_date - timedelta(days=7)).isoformat()
+        end_date = end_date.isoformat()
+
+        # batch считается первым: legacy пишет рекомендации и меняет состояние рук
+        batch, t_calc, db = run_batch(engine, campaigns, start_date, end_date)
+        check_isolation(db, campaigns, batch, start_date, end_date)
+        legacy, t_legacy, errors = run_legacy(dsn, engine, campaigns, start_date, end_date, args.fresh_engines)
+        t0 = time.perf_counter()
+        assert db.save_recommendations(autobidder_rows(batch))
+        t_save = time.perf_counter() - t0
+
+        bad = compare(batch, legacy)
+        resets = sum(1 for r in batch if r["campaign_id"] not in legacy and r["arm"] == "reset")
+        print(f"кампаний: {len(campaigns)}")
+        print(f"legacy (UCBBanditCPM{' + engine на кампанию' if args.fresh_engines else ''}): "
+              f"{t_legacy:.2f}s, ошибок {errors} (batch: рука reset у {resets} из них)")
+        print(f"batch: расчёт {t_calc:.2f}s + запись {t_save:.2f}s = {t_calc + t_save:.2f}s "
+              f"(x{t_legacy / max(t_calc + t_save, 1e-9):.1f})")
+        print(f"сверка: {len(legacy)} кампаний, расхождений {bad}")
+        assert bad == 0
+    finally:
+        engine.dispose()
+        if not args.keep:
+            with admin.connect() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--dsn", required=True)
+    p.add_argument("--database", default="ucb_bandit_bench")
+    p.add_argument("--campaigns", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=11)
+    p.add_argument("--fresh-engines", action="store_true", help="legacy: новый engine на каждую кампанию")
+    p.add_argument("--keep", action="store_true", help="не удалять базу бенчмарка")
+    main(p.parse_args())
@@ -0,0 +1,340 @@
+"""
+Проверка оптимизатора ключевых слов в процессе Dagster
+(keywords_opt/OptManager.optimize_company, dagster_conf/pipelines/ako_V2_job.py)
+на синтетических данных и поддельном WB API.
+
+Скрипт создаёт на сервере из --dsn отдельную базу (по умолчанию
+ako_inprocess_check): --companies компаний по --campaigns кампаний
+keyword_optimizator, плюс кампания со статистикой без компании и кампания
+без статистики, и проверяет:
+  • optimize_company для всех компаний в одном event loop (asyncio.gather,
+    общий движок) — у каждой компании только её кампании, минус-фразы ушли с
+    её токеном, результаты записаны в algo.cluster_optimization_results;
+  • синхронные шаги оптимизатора идут в asyncio.to_thread: кампании разных
+    компаний оптимизируются в потоках одновременно (печатается пик), а
+    фоновый тик loop'а не простаивает (печатается наибольшая задержка);
+  • кампании без компании каждая компания называет в warning;
+  • компания без кампаний — пустой результат без ошибок;
+  • ako_V2_wrapper_job.execute_in_process с партицией company_id и
+    настоящими ресурсами (postgres_engine по POSTGRES_SYNC_DSN, фабрика
+    шлюза с base_url поддельного API) — по AssetObservation на кампанию;
+  • расписание создаёт по RunRequest на компанию.
+Для сравнения печатается время старта отдельного интерпретатора с импортом
+оптимизатора — его платил каждый запуск через subprocess.
+По окончании база удаляется (--keep — оставить).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_ako_inprocess.py \\
+        --dsn postgresql+psycopg2://postgres:pg@localhost:5432/postgres --companies 3 --campaigns 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from zoneinfo import ZoneInfo
+
+from aiohttp import web
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from api.wb_campaign_gateway import WBCampaignGateway
+from keywords_opt.OptManager import OptimizationManager, optimize_company
+
+DDL = """
+CREATE SCHEMA silver;
+CREATE SCHEMA core;
+CREATE SCHEMA algo;
+CREATE TABLE silver.wb_adv_product_stats_1d (
+    date timestamptz, company_id int, advert_id int, nm_id int, app_type int,
+    cost double precision, items int, revenue double precision
+);
+CREATE TABLE silver.wb_adv_keyword_stats_1d (
+    date timestamptz, advert_id int, keyword text, clicks int, cost double precision
+);
+CREATE TABLE silver.wb_commission_1d (date date, subject_id int, kgvp_booking double precision);
+CREATE TABLE silver.wb_mp_skus_1d (response_dttm timestamptz, nm_id int, subject_id int, barcode text);
+CREATE TABLE core.product_costs (barcode text, self_cost double precision, date_from date, date_to date);
+CREATE TABLE core.algo_states (
+    campaign_id int, product_id int, model text, valid_from timestamptz, valid_to timestamptz
+);
+CREATE TABLE core.tokens (token_id int, company_id int, token text, is_active boolean);
+-- в рабочей базе таблица уже есть; без неё to_sql создаёт её при первом сохранении,
+-- и первые сохранения нескольких компаний в потоках столкнулись бы на CREATE TABLE
+CREATE TABLE algo.cluster_optimization_results (
+    cluster_name text, avg_cpc double precision, total_clicks bigint, total_sum double precision, status text,
+    recommendation text, campaign_id bigint, product_id text, max_cpc double precision, optimization_date date,
+    is_excluded boolean
+);
+"""
+
+# CPC фраз при среднем CPC кампании 2 ₽ и max_cpc ≈ 10 ₽: две последние — исключить
+KEYWORD_CPC = {"фраза 1": 1.0, "фраза 2": 1.5, "фраза 3": 2.0, "фраза 4": 20.0, "фраза 5": 40.0}
+EXCLUDED = ["фраза 4", "фраза 5"]
+
+
+class FakeWBAdvert:
+    """Поддельный advert-api: информация о кампаниях (тип 9) и минус-фразы поиска."""
+
+    def __init__(self):
+        self.excluded = {}  # advert_id → (Authorization, фразы)
+        self.app = web.Application()
+        self.app.router.add_post("/v1/promotion/adverts", self._adverts)
+        self.app.router.add_post("/v1/search/set-excluded", self._set_excluded)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _adverts(self, request):
+        return web.json_response([{"advertId": i, "type": 9} for i in await request.json()])
+
+    async def _set_excluded(self, request):
+        body = await request.json()
+        self.excluded[int(request.query["id"])] = (request.headers["Authorization"], body["excluded"])
+        return web.Response(status=200)
+
+    def start(self) -> str:
+        """Сервер в своём потоке: execute_in_process запускает async op в собственном event loop."""
+        self._thread.start()
+
+        async def run():
+            self._runner = web.AppRunner(self.app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            return site._server.sockets[0].getsockname()[1]
+
+        port = asyncio.run_coroutine_threadsafe(run(), self._loop).result()
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def seed(engine, n_companies: int, n_campaigns: int):
+    """
+    Кампании компаний 1..n_companies, кампания 999 со статистикой без компании и
+    998 без статистики; возвращает {company_id: [campaign_id]}.
+    """
+    today = datetime.now(ZoneInfo("Europe/Moscow")).date()
+    days = [today - timedelta(days=k) for k in range(1, 22)]
+    by_company = {}
+    stats, kws, skus, costs, states = [], [], [], [], []
+    campaigns = [(c, 1000 * c + i) for c in range(1, n_companies + 1) for i in range(n_campaigns)] + [(None, 999)]
+    for company_id, advert_id in campaigns:
+        nm_id = 7_000_000 + advert_id
+        if company_id is not None:
+            by_company.setdefault(company_id, []).append(advert_id)
+        for d in days:
+            dttm = datetime(d.year, d.month, d.day, 12, tzinfo=timezone.utc)
+            stats.append(dict(d=dttm, co=company_id, a=advert_id, nm=nm_id, cost=100.0, i=1, r=1000.0))
+            for keyword, cpc in KEYWORD_CPC.items():
+                kws.append(dict(d=dttm, a=advert_id, k=keyword, c=10, cost=10 * cpc))
+        skus.append(dict(d=datetime(days[0].year, days[0].month, days[0].day, 12, tzinfo=timezone.utc),
+                         nm=nm_id, b=f"bc{nm_id}"))
+        costs.append(dict(b=f"bc{nm_id}", f=days[-1] - timedelta(days=30), t=today + timedelta(days=30)))
+        states.append(dict(a=advert_id, nm=nm_id))
+    states.append(dict(a=998, nm=7_000_998))
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(text("INSERT INTO silver.wb_adv_product_stats_1d VALUES (:d, :co, :a, :nm, 1, :cost, :i, :r)"),
+                     stats)
+        conn.execute(text("INSERT INTO silver.wb_adv_keyword_stats_1d VALUES (:d, :a, :k, :c, :cost)"), kws)
+        conn.execute(text("INSERT INTO silver.wb_commission_1d VALUES (:d, 1, 20)"), [dict(d=days[0])])
+        conn.execute(text("INSERT INTO silver.wb_mp_skus_1d VALUES (:d, :nm, 1, :b)"), skus)
+        conn.execute(text("INSERT INTO core.product_costs VALUES (:b, 300, :f, :t)"), costs)
+        conn.execute(text("""
+            INSERT INTO core.algo_states
+            VALUES (:a, :nm, 'keyword_optimizator', NOW() - interval '1 day', NOW() + interval '1 day')
+        """), states)
+        conn.execute(text("INSERT INTO core.tokens VALUES (:c, :c, :t, TRUE)"),
+                     [dict(c=c, t=f"token-{c}") for c in by_company])
+    return by_company
+
+
+def check_results(engine, server, by_company, results, companies):
+    for company_id in companies:
+        campaigns = sorted(c for _, _, c, _ in results[company_id])
+        assert campaigns == by_company[company_id], (company_id, campaigns)
+        for campaign_id in campaigns:
+            token, phrases = server.excluded[campaign_id]
+            assert token == f"Bearer token-{company_id}" and sorted(phrases) == EXCLUDED, (campaign_id, token)
+    assert 999 not in server.excluded and 998 not in server.excluded
+    with engine.connect() as conn:
+        saved = dict(conn.execute(text("""
+            SELECT campaign_id, count(*) FILTER (WHERE is_excluded) FROM algo.cluster_optimization_results
+            GROUP BY campaign_id
+        """)).all())
+    expected = {c for company_id in companies for c in by_company[company_id]}
+    assert set(saved) >= expected and all(saved[c] == len(EXCLUDED) for c in expected), saved
+
+
+ORPHANS = [998, 999]
+
+
+class RecordingLogger(logging.Logger):
+    """Логгер, запоминающий warning'и (вывод отключён logging.disable)."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.warnings = []
+
+    def warning(self, msg, *args, **kwargs):
+        self.warnings.append(str(msg))
+        super().warning(msg, *args, **kwargs)
+
+
+class ThreadOverlap:
+    """Обёртка OptimizationManager._optimize_campaign: пик одновременно работающих потоков."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def wrap(self, method):
+        def wrapped(manager, *args, **kwargs):
+            with self._lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                self.threads.add(threading.get_ident())
+            try:
+                return method(manager, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+        return wrapped
+
+
+async def optimize_all(engine, url, companies, loggers):
+    """optimize_company для всех компаний в одном loop; возвращает (результаты, наибольшая задержка тика, с)."""
+    factory = partial(WBCampaignGateway, base_url=url)
+    loop = asyncio.get_running_loop()
+    delays = [0.0]
+
+    async def tick():
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(0.005)
+            delays.append(loop.time() - t0 - 0.005)
+
+    ticker = asyncio.create_task(tick())
+    results = await asyncio.gather(*(
+        optimize_company(c, engine=engine, token=f"token-{c}", logger=loggers[c], gateway_factory=factory)
+        for c in companies
+    ))
+    ticker.cancel()
+    return dict(zip(companies, results)), max(delays)
+
+
+def check_dagster(engine, server, url, by_company):
+    from dagster import build_schedule_context, instance_for_test
+    from dagster_conf.pipelines.ako_V2_job import ako_V2_wrapper_job
+    from dagster_conf.sensor_schedulers.ako_V2_schedule import ako_V2_wrapper_schedule
+
+    company_id = next(iter(by_company))
+    server.excluded.clear()
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE algo.cluster_optimization_results"))
+
+    with instance_for_test() as instance:
+        instance.add_dynamic_partitions("company_id", [str(c) for c in by_company])
+        t0 = time.perf_counter()
+        result = ako_V2_wrapper_job.execute_in_process(
+            partition_key=str(company_id),
+            instance=instance,
+            run_config={"resources": {"wb_campaign_gateway": {"config": {"base_url": url}}}},
+        )
+        t_job = time.perf_counter() - t0
+        assert result.success
+        observations = [e.event_specific_data.asset_observation for e in result.all_events
+                        if e.event_type_value == "ASSET_OBSERVATION"]
+        observed = sorted(o.metadata["campaign_id"].value for o in observations)
+        assert observed == by_company[company_id], observed
+        assert all(o.partition == str(company_id) and o.metadata["excluded"].value == len(EXCLUDED)
+                   for o in observations)
+        check_results(engine, server, by_company, {company_id: [(None, 0, c, None) for c in observed]},
+                      [company_id])
+        print(f"ako_V2_wrapper_job[{company_id}]: {t_job:.2f}s, AssetObservation на {len(observations)} кампаний")
+
+        requests = list(ako_V2_wrapper_schedule(build_schedule_context(instance=instance)))
+        assert sorted(r.partition_key for r in requests) == sorted(str(c) for c in by_company)
+        print(f"расписание: {len(requests)} RunRequest (по компании)")
+
+
+def subprocess_startup() -> float:
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import keywords_opt.OptManager"], check=True,
+                   env={**os.environ, "PYTHONPATH": os.getcwd()})
+    return time.perf_counter() - t0
+
+
+def main(args) -> None:
+    logging.disable(logging.CRITICAL)
+    for var in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"):
+        os.environ.pop(var, None)
+
+    admin = create_engine(args.dsn, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {args.database} WITH (FORCE)"))
+        conn.execute(text(f"CREATE DATABASE {args.database}"))
+    url = make_url(args.dsn).set(database=args.database)
+    if "sslmode" not in url.query:
+        url = url.update_query_dict({"sslmode": "disable"})
+    # postgres_engine_resource и token_for_company берут DSN отсюда
+    os.environ["POSTGRES_SYNC_DSN"] = url.render_as_string(hide_password=False)
+    engine = create_engine(url)
+    server = FakeWBAdvert()
+    try:
+        by_company = seed(engine, args.companies, args.campaigns)
+        base_url = server.start()
+        companies = list(by_company) + [args.companies + 1]  # последняя — без кампаний
+        loggers = defaultdict(lambda: None, {c: RecordingLogger(f"ako_inprocess_check.{c}") for c in companies})
+        overlap = ThreadOverlap()
+        original = OptimizationManager._optimize_campaign
+        OptimizationManager._optimize_campaign = overlap.wrap(original)
+        try:
+            t0 = time.perf_counter()
+            results, max_delay = asyncio.run(optimize_all(engine, base_url, companies, loggers))
+            t_all = time.perf_counter() - t0
+        finally:
+            OptimizationManager._optimize_campaign = original
+        assert results[args.companies + 1] == []
+        check_results(engine, server, by_company, results, list(by_company))
+        for company_id in companies:
+            assert any(str(ORPHANS) in w for w in loggers[company_id].warnings), (company_id, loggers[company_id].warnings)
+        if len(by_company) > 1:
+            assert overlap.peak > 1, "кампании разных компаний не оптимизировались одновременно"
+        print(f"optimize_company: {len(by_company)} компаний × {args.campaigns} кампаний в одном loop "
+              f"за {t_all:.2f}s, минус-фразы с токенами компаний, результаты сохранены")
+        print(f"  _optimize_campaign: пик {overlap.peak} одновременно в {len(overlap.threads)} потоках; "
+              f"наибольшая задержка тика loop'а {max_delay * 1000:.0f} мс; "
+              f"кампании без компании {ORPHANS} — в warning у каждой компании")
+
+        check_dagster(engine, server, base_url, by_company)
+        print(f"старт отдельного интерпретатора с импортом оптимизатора: {subprocess_startup():.2f}s на запуск")
+        print("OK")
+    finally:
+        server.stop()
+        engine.dispose()
+        if not args.keep:
+            # FORCE — соединения из пула token_for_company (dagster_conf/lib/tokens.py) живут до конца процесса
+            with admin.connect() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS {args.database} WITH (FORCE)"))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--dsn", required=True)
+    p.add_argument("--database", default="ako_inprocess_check")
+    p.add_argument("--companies", type=int, default=3)
+    p.add_argument("--campaigns", type=int, default=4)
+    p.add_argument("--keep", action="store_true", help="не удалять базу проверки")
+    main(p.parse_args())
@@ -0,0 +1,284 @@
+"""
+Проверка set-based статистики AKO (sql/ako_stats.py) на синтетических данных.
+
+Скрипт создаёт на сервере из --dsn отдельную базу (по умолчанию
+ako_stats_check) с таблицами silver.wb_adv_product_stats_1d,
+silver.wb_adv_keyword_stats_1d и ads.cluster_stats и проверяет:
+  • DatabaseManager.get_ad_stats / get_cluster_stats после prefetch_stats
+    совпадают с прежними запросами по одной кампании (date::date), а
+    запросов к базе — два на все кампании вместо двух на каждую;
+  • без prefetch_stats по-прежнему работает запрос по одной кампании;
+  • fetch_legacy_cluster_stats по всем кампаниям совпадает с прежним
+    запросом WildberriesSQLOptimizer.get_stats_from_db по каждой;
+  • миграция 7d2a91c4e5b8 создаёт покрывающие индексы (advert_id, date)
+    INCLUDE, и план запроса их использует.
+По окончании база удаляется (--keep — оставить).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_ako_stats.py \\
+        --dsn postgresql+psycopg2://postgres:pg@localhost:5432/postgres --campaigns 300
+"""
+import argparse
+import importlib.util
+import logging
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+from sql.ako_stats import fetch_legacy_cluster_stats
+from sql.database_manager_ako import DatabaseManager
+
+DDL = """
+CREATE SCHEMA silver;
+CREATE SCHEMA ads;
+CREATE TABLE silver.wb_adv_product_stats_1d (
+    date timestamptz, advert_id int, nm_id int, app_type int, views int, clicks int,
+    cost double precision, items int, revenue double precision
+);
+CREATE TABLE silver.wb_adv_keyword_stats_1d (
+    date timestamptz, advert_id int, keyword text, views int, clicks int, ctr double precision,
+    cost double precision
+);
+CREATE TABLE ads.cluster_stats (
+    ad_id int, date date, cluster_name text, views int, clicks int, sum double precision,
+    ctr double precision
+);
+"""
+
+KEYWORDS = [f"фраза {i}" for i in range(25)]
+MSK = timezone(timedelta(hours=3))
+
+
+def seed(engine, rnd, n_campaigns: int, days: list):
+    campaigns = [(300_000 + i, 7_000_000 + i) for i in range(n_campaigns)]
+    stats, kws, clusters = [], [], []
+    for advert_id, nm_id in campaigns:
+        for d in days:
+            dttm = datetime(d.year, d.month, d.day, tzinfo=MSK)
+            for app_type in (1, 32):
+                items = rnd.randint(0, 5)
+                stats.append(dict(d=dttm, a=advert_id, nm=nm_id, t=app_type, v=rnd.randint(100, 3000),
+                                  c=rnd.randint(1, 80), cost=rnd.uniform(50, 900), i=items,
+                                  r=items * rnd.uniform(500, 2500)))
+            for k in rnd.sample(KEYWORDS, 8):
+                views = rnd.randint(0, 500)
+                clicks = rnd.randint(0, max(views // 10, 0))
+                kws.append(dict(d=dttm, a=advert_id, k=k, v=views, c=clicks,
+                                ctr=clicks / views if views else 0, cost=rnd.uniform(0, 120)))
+                clusters.append(dict(a=advert_id, d=d, k=k, v=views, c=clicks, s=rnd.uniform(0, 120),
+                                     ctr=clicks / views if views else 0))
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(text("""
+            INSERT INTO silver.wb_adv_product_stats_1d VALUES (:d, :a, :nm, :t, :v, :c, :cost, :i, :r)
+        """), stats)
+        conn.execute(text("""
+            INSERT INTO silver.wb_adv_keyword_stats_1d VALUES (:d, :a, :k, :v, :c, :ctr, :cost)
+        """), kws)
+        conn.execute(text("INSERT INTO ads.cluster_stats VALUES (:a, :d, :k, :v, :c, :s, :ctr)"), clusters)
+    return campaigns
+
+
+# ─── прежние запросы (по одной кампании) ───
+
+def old_ad_stats(engine, product_id, campaign_id, start_date, end_date):
+    query = """
+        SELECT advert_id as campaign_id, nm_id as product_id, date, revenue, items, cost
+        FROM silver.wb_adv_product_stats_1d
+        WHERE nm_id = :product_id AND advert_id = :campaign_id
+          AND date::date >= :start_date AND date::date <= :end_date
+        ORDER BY date, advert_id, nm_id
+    """
+    params = dict(product_id=int(product_id), campaign_id=int(campaign_id), start_date=start_date, end_date=end_date)
+    with engine.connect() as conn:
+        df = pd.read_sql(text(query), conn, params=params, index_col='date')
+    return df[['campaign_id', 'product_id', 'revenue', 'items', 'cost']]
+
+
+def old_cluster_stats(engine, ad_id, start_date, end_date):
+    query = """
+        SELECT advert_id as ad_id, date, keyword as cluster_name, cost as sum, clicks
+        FROM silver.wb_adv_keyword_stats_1d
+        WHERE advert_id = :ad_id AND date::date >= :start_date AND date::date <= :end_date
+        ORDER BY date, advert_id, keyword
+    """
+    with engine.connect() as conn:
+        df = pd.read_sql(text(query), conn, params=dict(ad_id=ad_id, start_date=start_date, end_date=end_date),
+                         index_col='date')
+    df['cpc'] = df['sum'].div(df['clicks'].replace(0, float('nan')))
+    return df[['ad_id', 'cluster_name', 'cpc', 'clicks', 'sum']]
+
+
+def old_legacy_cluster_stats(engine, campaign_id, start_date, end_date):
+    query = """
+        SELECT ad_id, date, cluster_name, views, clicks, sum, ctr FROM ads.cluster_stats
+        WHERE ad_id = %s AND date BETWEEN %s AND %s
+    """
+    return pd.read_sql_query(query, engine, params=(campaign_id, start_date, end_date))
+
+
+class CheckDatabaseManager(DatabaseManager):
+    """DatabaseManager на движке проверочной базы."""
+
+    def __init__(self, engine):
+        super().__init__({"check": True}, None, logging.getLogger("ako_stats_check"))
+        self._check_engine = engine
+
+    def _create_engine(self):
+        return self._check_engine
+
+
+class QueryCounter:
+    """Считает запросы к таблицам статистики (служебные запросы pandas к pg_catalog — нет)."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        if "pg_catalog" not in statement:
+            self.count += 1
+
+
+def assert_same_rows(left: pd.DataFrame, right: pd.DataFrame) -> None:
+    """Те же строки и колонки; порядок строк внутри одного дня (разные app_type) не задан ни одним запросом."""
+    def norm(df):
+        return df.reset_index().sort_values(list(df.reset_index().columns)).reset_index(drop=True)
+    assert list(left.columns) == list(right.columns) and left.index.name == right.index.name
+    pd.testing.assert_frame_equal(norm(left), norm(right), check_dtype=False)
+
+
+def check_manager(engine, campaigns, start_date, end_date):
+    counter = QueryCounter(engine)
+    t0 = time.perf_counter()
+    old = {c: (old_ad_stats(engine, p, c, start_date, end_date), old_cluster_stats(engine, c, start_date, end_date))
+           for c, p in campaigns}
+    t_old, q_old = time.perf_counter() - t0, counter.count
+
+    manager = CheckDatabaseManager(engine)
+    manager._get_engine()  # индексы создаются при первом обращении
+    counter.count = 0
+    t0 = time.perf_counter()
+    stats = manager.prefetch_stats([c for c, _ in campaigns], start_date, end_date)
+    new = {c: (manager.get_ad_stats(product_id=str(p), campaign_id=c, start_date=start_date, end_date=end_date),
+               manager.get_cluster_stats(ad_id=str(c), start_date=start_date, end_date=end_date))
+           for c, p in campaigns}
+    t_new, q_new = time.perf_counter() - t0, counter.count
+    assert stats is not None and q_new == 2, q_new
+
+    for c, _ in campaigns:
+        for old_df, new_df in zip(old[c], new[c]):
+            assert_same_rows(old_df, new_df)
+    print(f"DatabaseManager: {len(campaigns)} кампаний — по одной {t_old:.2f}s ({q_old} запросов), "
+          f"prefetch {t_new:.2f}s ({q_new} запроса), результаты совпадают")
+
+    # без prefetch (или за другой период) — запрос по одной кампании
+    single = CheckDatabaseManager(engine)
+    single._get_engine()
+    c, p = campaigns[0]
+    counter.count = 0
+    df = single.get_ad_stats(product_id=str(p), campaign_id=c, start_date=start_date, end_date=end_date)
+    assert_same_rows(old[c][0], df)
+    other_start = (date.fromisoformat(start_date) + timedelta(days=1)).isoformat()
+    assert not stats.covers(c, other_start, end_date)
+    assert manager.get_cluster_stats(ad_id=str(c), start_date=other_start, end_date=end_date) is not None
+    assert counter.count == 2, counter.count
+    assert manager.get_cluster_stats(ad_id="1", start_date=start_date, end_date=end_date) is None
+
+
+def check_legacy(engine, campaigns, start_date, end_date):
+    ids = [c for c, _ in campaigns]
+    t0 = time.perf_counter()
+    batch = fetch_legacy_cluster_stats(engine, ids, start_date, end_date)
+    t_batch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    single = pd.concat([old_legacy_cluster_stats(engine, c, start_date, end_date) for c in ids], ignore_index=True)
+    t_single = time.perf_counter() - t0
+    key = ["ad_id", "date", "cluster_name"]
+    pd.testing.assert_frame_equal(batch.sort_values(key).reset_index(drop=True),
+                                  single.sort_values(key).reset_index(drop=True), check_dtype=False)
+    print(f"ads.cluster_stats: один запрос {t_batch:.2f}s против {len(ids)} запросов {t_single:.2f}s, совпадает")
+
+
+MIGRATION = (Path(__file__).resolve().parents[1] / "src" / "db" / "alembic" / "versions"
+             / "7d2a91c4e5b8_ako_stats_covering_indexes.py")
+
+
+def apply_index_migration(engine) -> list:
+    """upgrade() миграции индексов AKO на базе проверки; возвращает созданные индексы."""
+    spec = importlib.util.spec_from_file_location("ako_stats_indexes_migration", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with engine.connect() as conn:
+        ctx = MigrationContext.configure(conn)
+        with Operations.context(ctx), ctx.begin_transaction():
+            migration.upgrade()
+        return [f"{schema}.{name}" for schema, _table, name, _columns in migration.AKO_STATS_INDEXES
+                if conn.execute(text("SELECT to_regclass(:i)"), {"i": f"{schema}.{name}"}).scalar()]
+
+
+def check_plan(engine, campaigns, start_date, end_date):
+    ids = [c for c, _ in campaigns[:20]]
+    raw = engine.raw_connection()  # VACUUM — вне транзакции
+    try:
+        raw.set_isolation_level(0)
+        with raw.cursor() as cur:
+            cur.execute("VACUUM ANALYZE")
+            cur.execute(
+                "EXPLAIN SELECT advert_id, date, keyword, cost, clicks FROM silver.wb_adv_keyword_stats_1d "
+                "WHERE advert_id = ANY(%s) AND date >= %s AND date < %s",
+                (ids, date.fromisoformat(start_date), date.fromisoformat(end_date) + timedelta(days=1)),
+            )
+            plan = "\n".join(row[0] for row in cur.fetchall())
+    finally:
+        raw.close()
+    # на паре сотен строк планировщик честно выбирает Seq Scan — индекс проверяем на объёме
+    if len(campaigns) >= 100:
+        assert "wb_adv_keyword_stats_1d_ako_idx" in plan, plan
+    print(f"план: {plan.splitlines()[0].strip()}")
+
+
+def main(args) -> None:
+    logging.disable(logging.CRITICAL)
+    rnd = random.Random(args.seed)
+    today = date.today()
+    days = [today - timedelta(days=k) for k in range(1, args.days + 1)]
+    start_date, end_date = days[-3].isoformat(), days[1].isoformat()
+
+    admin = create_engine(args.dsn, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+        conn.execute(text(f"CREATE DATABASE {args.database}"))
+    engine = create_engine(make_url(args.dsn).set(database=args.database))
+    try:
+        campaigns = seed(engine, rnd, args.campaigns, days)
+        indexes = apply_index_migration(engine)
+        assert indexes == ["silver.wb_adv_product_stats_1d_ako_idx", "silver.wb_adv_keyword_stats_1d_ako_idx",
+                           "ads.cluster_stats_ako_idx"], indexes
+        check_manager(engine, campaigns, start_date, end_date)
+        check_legacy(engine, campaigns, start_date, end_date)
+        check_plan(engine, campaigns, start_date, end_date)
+        print("OK")
+    finally:
+        engine.dispose()
+        if not args.keep:
+            with admin.connect() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--dsn", required=True)
+    p.add_argument("--database", default="ako_stats_check")
+    p.add_argument("--campaigns", type=int, default=300)
+    p.add_argument("--days", type=int, default=21)
+    p.add_argument("--seed", type=int, default=5)
+    p.add_argument("--keep", action="store_true", help="не удалять базу проверки")
+    main(p.parse_args())
@@ -0,0 +1,239 @@
+"""
+Проверка витрины признаков (llm_feature_mart.py) и кэша ответов LLM
+(llm_cache.py) для llm_analyzer на синтетических данных.
+
+Скрипт создаёт на сервере из --dsn отдельную базу (по умолчанию
+llm_mart_check) с нужными таблицами silver / core и проверяет:
+  • инкрементальное обновление витрины после дозагрузки и правки последних
+    дней совпадает с полной пересборкой;
+  • один запрос по всем кампаниям совпадает с запросами по одной кампании;
+  • анализ через StubLLMClient + SQLite-кэш: повторный прогон тех же данных
+    не вызывает LLM, изменённые данные вызывают, битый JSON не кэшируется.
+По окончании база удаляется (--keep — оставить).
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_llm_feature_mart.py \\
+        --dsn postgresql+psycopg2://postgres:pg@localhost:5432/postgres --campaigns 300
+"""
+import argparse
+import copy
+import logging
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+import llm_analyzer
+from llm_cache import CachedLLM, SQLiteResponseCache, StubLLMClient
+from llm_feature_mart import MART_SOURCES, fetch_campaigns_features, refresh_feature_mart
+
+DDL = """
+CREATE SCHEMA silver;
+CREATE SCHEMA core;
+CREATE TABLE silver.wb_adv_product_stats_1d (
+    date date, advert_id bigint, nm_id bigint, views int, clicks int, ctr double precision,
+    cpc double precision, cost numeric(12,2), carts int, orders int, items int
+);
+CREATE INDEX ON silver.wb_adv_product_stats_1d (date);
+CREATE TABLE silver.wb_adv_product_rates_1d (
+    run_dttm timestamptz, advert_id bigint, subject_id bigint, cpm_current numeric(10,2)
+);
+CREATE INDEX ON silver.wb_adv_product_rates_1d (run_dttm);
+CREATE TABLE silver.wb_adv_keyword_stats_1d (
+    date date, advert_id bigint, keyword text, views int, clicks int, cost numeric(12,2)
+);
+CREATE INDEX ON silver.wb_adv_keyword_stats_1d (date);
+CREATE TABLE silver.wb_order_items_1d (
+    date timestamptz, nm_id bigint, barcode text, category text, subject text, brand text,
+    price_with_discount double precision
+);
+CREATE INDEX ON silver.wb_order_items_1d (nm_id, date);
+CREATE TABLE silver.wb_stocks_1d (date date, nm_id bigint, quantity int);
+CREATE INDEX ON silver.wb_stocks_1d (nm_id, date);
+CREATE TABLE core.individual_commissions (subject_id bigint, seller_commission numeric(6,4));
+CREATE TABLE core.product_costs (barcode text, self_cost double precision);
+"""
+
+KEYWORDS = [f"фраза {i}" for i in range(12)]
+
+
+def stats_rows(rnd: random.Random, advert_id: int, nm_id: int, d: date):
+    views = rnd.randint(50, 5000)
+    clicks = rnd.randint(1, max(views // 25, 1))
+    orders = rnd.randint(0, max(clicks // 4, 1))
+    stat = dict(d=d, a=advert_id, nm=nm_id, v=views, c=clicks, ctr=clicks / views, cpc=rnd.uniform(5, 60),
+                cost=round(views * 0.2, 2), ca=rnd.randint(orders, orders + 3), o=orders, i=orders)
+    kws = [dict(d=d, a=advert_id, k=k, v=rnd.randint(0, views), c=rnd.randint(0, clicks), cost=rnd.uniform(0, 50))
+           for k in rnd.sample(KEYWORDS, 3)]
+    rate = dict(t=datetime(d.year, d.month, d.day, 6), a=advert_id, s=advert_id % 7, cpm=rnd.choice([150, 250, 400]))
+    return stat, kws, rate
+
+
+def insert_days(conn, rnd, campaigns, days):
+    stats, kws, rates = [], [], []
+    for advert_id, nm_id in campaigns:
+        for d in days:
+            s, k, r = stats_rows(rnd, advert_id, nm_id, d)
+            stats.append(s)
+            kws.extend(k)
+            rates.append(r)
+    conn.execute(text("""
+        INSERT INTO silver.wb_adv_product_stats_1d
+        VALUES (:d, :a, :nm, :v, :c, :ctr, :cpc, :cost, :ca, :o, :i)
+    """), stats)
+    conn.execute(text("INSERT INTO silver.wb_adv_keyword_stats_1d VALUES (:d, :a, :k, :v, :c, :cost)"), kws)
+    conn.execute(text("INSERT INTO silver.wb_adv_product_rates_1d VALUES (:t, :a, :s, :cpm)"), rates)
+
+
+def seed(engine, rnd, n_campaigns: int, today: date):
+    campaigns = [(200_000 + i, 5_000_000 + i) for i in range(n_campaigns)]
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        # вчерашний день ещё не догружен — его «досыплет» второй этап
+        insert_days(conn, rnd, campaigns, [today - timedelta(days=k) for k in range(2, 40)])
+        orders, stocks = [], []
+        for _, nm_id in campaigns:
+            for k in range(0, 30, 3):
+                d = today - timedelta(days=k)
+                orders.append(dict(t=datetime(d.year, d.month, d.day, 12), nm=nm_id, b=f"bc{nm_id}",
+                                   p=rnd.randint(500, 5000)))
+                stocks.append(dict(d=d, nm=nm_id, q=rnd.randint(0, 300)))
+        conn.execute(text("""
+            INSERT INTO silver.wb_order_items_1d VALUES (:t, :nm, :b, 'Одежда', 'Платья', 'Бренд', :p)
+        """), orders)
+        conn.execute(text("INSERT INTO silver.wb_stocks_1d VALUES (:d, :nm, :q)"), stocks)
+        conn.execute(text("INSERT INTO core.individual_commissions SELECT s, 0.15 + s / 100.0 FROM generate_series(0, 6) s"))
+        conn.execute(text("""
+            INSERT INTO core.product_costs SELECT DISTINCT barcode, 300 FROM silver.wb_order_items_1d
+        """))
+        conn.execute(text("ANALYZE"))
+    return campaigns
+
+
+def mart_snapshot(engine) -> dict:
+    with engine.connect() as conn:
+        return {
+            table: sorted(map(tuple, conn.execute(text(f"SELECT * FROM algo.{table}")).fetchall()), key=repr)
+            for table in MART_SOURCES
+        }
+
+
+def check_mart(engine, rnd, campaigns, today):
+    t0 = time.perf_counter()
+    refresh_feature_mart(engine, today=today)
+    t_first = time.perf_counter() - t0
+
+    # дозагрузка вчерашнего дня и правка позавчерашнего (запоздавшая статистика)
+    with engine.begin() as conn:
+        insert_days(conn, rnd, campaigns, [today - timedelta(days=1)])
+        conn.execute(text("""
+            UPDATE silver.wb_adv_product_stats_1d SET views = views + 7, orders = orders + 1
+            WHERE date = :d AND advert_id % 3 = 0
+        """), {"d": today - timedelta(days=2)})
+
+    t0 = time.perf_counter()
+    inserted = refresh_feature_mart(engine, today=today)
+    t_incr = time.perf_counter() - t0
+    incremental = mart_snapshot(engine)
+
+    refresh_feature_mart(engine, today=today, full=True)
+    full = mart_snapshot(engine)
+    assert incremental == full, "инкрементальная витрина разошлась с полной пересборкой"
+    print(f"витрина: первое заполнение {t_first:.2f}s, инкремент {t_incr:.2f}s "
+          f"({sum(inserted.values())} строк), совпадает с полной пересборкой")
+
+
+def check_batch_query(engine, campaigns):
+    ids = [a for a, _ in campaigns]
+    t0 = time.perf_counter()
+    batch = fetch_campaigns_features(engine, ids)
+    t_batch = time.perf_counter() - t0
+
+    sample = ids[:: max(len(ids) // 20, 1)]
+    t0 = time.perf_counter()
+    single = pd.concat([fetch_campaigns_features(engine, [a]) for a in sample], ignore_index=True)
+    t_single = (time.perf_counter() - t0) / len(sample)
+
+    subset = batch[batch["advert_id"].isin(sample)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(subset, single, check_like=True)
+    assert set(batch["advert_id"]) == set(ids)
+    print(f"запрос признаков: все {len(ids)} кампаний за {t_batch:.2f}s ({len(batch)} строк); "
+          f"по одной — {t_single * 1000:.0f} мс на кампанию, совпадает")
+    return batch
+
+
+def check_cache(batch, campaigns, cache_path: Path):
+    payloads = {a: llm_analyzer.build_campaign_payload(batch[batch["advert_id"] == a]) for a, _ in campaigns}
+    payloads = {a: p for a, p in payloads.items() if p}
+    assert payloads, "нет полных дней для анализа — проверьте синтетические данные"
+
+    stub = StubLLMClient()
+    cache = SQLiteResponseCache(cache_path)
+    llm = CachedLLM(stub, cache)
+    for p in payloads.values():
+        assert llm_analyzer.analyze_campaign_clusters(p, llm) is not None
+    assert stub.calls == len(payloads), stub.calls
+
+    # второй прогон — новый объект (как следующий запуск джобы), тот же файл кэша
+    cache.close()
+    cache = SQLiteResponseCache(cache_path)
+    llm = CachedLLM(stub, cache)
+    results = [llm_analyzer.analyze_campaign_clusters(p, llm) for p in payloads.values()]
+    assert stub.calls == len(payloads) and llm.hits == len(payloads), (stub.calls, llm.hits)
+    assert all(r is not None for r in results)
+
+    # изменились данные одной кампании → промах и ровно один вызов
+    changed = copy.deepcopy(next(iter(payloads.values())))
+    changed[0]["total_statistics"]["views"] += 1
+    llm_analyzer.analyze_campaign_clusters(changed, llm)
+    assert stub.calls == len(payloads) + 1
+
+    # битый ответ не кэшируется: повтор снова идёт в LLM
+    broken = StubLLMClient(responder=lambda model, messages: "не JSON")
+    llm_broken = CachedLLM(broken, cache)
+    other = copy.deepcopy(changed)
+    other[0]["total_statistics"]["views"] += 1
+    assert llm_analyzer.analyze_campaign_clusters(other, llm_broken) is None
+    assert llm_analyzer.analyze_campaign_clusters(other, llm_broken) is None
+    assert broken.calls == 2
+    cache.close()
+    print(f"кэш ответов: {len(payloads)} кампаний, повторный прогон — {len(payloads)} попаданий, 0 вызовов LLM")
+
+
+def main(args) -> None:
+    logging.disable(logging.INFO)
+    rnd = random.Random(args.seed)
+    today = date.today()
+
+    admin = create_engine(args.dsn, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+        conn.execute(text(f"CREATE DATABASE {args.database}"))
+    engine = create_engine(make_url(args.dsn).set(database=args.database))
+    try:
+        campaigns = seed(engine, rnd, args.campaigns, today)
+        check_mart(engine, rnd, campaigns, today)
+        batch = check_batch_query(engine, campaigns)
+        with tempfile.TemporaryDirectory() as tmp:
+            check_cache(batch, campaigns, Path(tmp) / "llm_cache.sqlite")
+        print("OK")
+    finally:
+        engine.dispose()
+        if not args.keep:
+            with admin.connect() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS {args.database}"))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--dsn", required=True)
+    p.add_argument("--database", default="llm_mart_check")
+    p.add_argument("--campaigns", type=int, default=300)
+    p.add_argument("--seed", type=int, default=3)
+    p.add_argument("--keep", action="store_true", help="не удалять базу проверки")
+    main(p.parse_args())
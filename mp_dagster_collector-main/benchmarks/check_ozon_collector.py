@@ -0,0 +1,329 @@
+"""
+Проверка движка сбора Ozon (src/connectors/ozon/ozon_collector.py) против
+поддельного Ozon Seller/Performance API в том же процессе.
+
+Поддельный сервер (FakeOzonServer, aiohttp.web) реализует:
+  POST /api/client/token            — токен Performance API (срок жизни --token-ttl с);
+  GET  /api/client/statistics/expense — CSV расходов, без действующего токена 401;
+  POST /v1/report/postings/create   — отчёт заказов, готов через --ready-after с;
+  POST /v1/report/info              — processing / success + file_url;
+  GET  /files/{code}                — файл отчёта (байты с кабинетом и схемой);
+  POST /v3/finance/transaction/list — страницы page/page_size, result.page_count;
+  POST /v1/analytics/data           — строки limit/offset, число страниц не сообщается;
+каждый ответ задерживается на --latency с, по желанию 429 на каждый k-й запрос
+(кроме выдачи токена).
+
+Сценарии (все паузы масштабированы: 1 с здесь ≈ 1 мин в проде):
+  • отчёты: --companies кабинетов × схемы fbo/fbs — последовательно с
+    фиксированной паузой опроса (как было в fetch_orders) против
+    run_report_jobs с AdaptivePolling;
+  • страницы: финансы и аналитика — «запрос → вставка страницы» по одной
+    против stream_pages + write_pages (вставка пачками, запись имитируется
+    паузой --write-latency на один INSERT).
+Проверяется, что содержимое бронзы совпадает и сколько запросов получил сервер.
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_ozon_collector.py --companies 3
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+from dagster_conf.lib.asset_factories.task_lifecycle import AdaptivePolling
+from src.connectors.ozon.ozon_api import OzonAsyncClient
+from src.connectors.ozon.ozon_collector import ReportJob, call_with_retry, run_report_jobs, stream_pages, write_pages
+from src.connectors.ozon.ozon_credentials import ozon_credentials
+
+
+class FakeOzonServer:
+    """Поддельный Ozon API: отчёты с временем подготовки, страницы финансов и аналитики, счётчик запросов."""
+
+    def __init__(self, *, operations: int = 0, analytics_rows: int = 0, ready_after: float = 0.0,
+                 latency: float = 0.0, rate_limit_every: int = 0, failed_schema: str = "", token_ttl: float = 1800):
+        self.operations = operations
+        self.analytics_rows = analytics_rows
+        self.ready_after = ready_after
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.failed_schema = failed_schema
+        self.token_ttl = token_ttl
+        self.tokens: Dict[str, Tuple[str, float]] = {}  # access_token → (client_id, expires)
+        self._token_ids = itertools.count(1)
+        self.requests: Counter = Counter()
+        self.rate_limited = 0
+        self.reports: Dict[str, Tuple[str, str, float]] = {}  # code → (client_id, schema, created)
+        self._seen = 0
+        self._codes = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        await asyncio.sleep(self.latency)
+        if request.path != "/api/client/token":
+            self._seen += 1
+            if self.rate_limit_every and self._seen % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return web.json_response({"message": "too many requests"}, status=429, headers={"Retry-After": "0.01"})
+        # считаются только обслуженные запросы, 429 — в rate_limited
+        self.requests[request.path if not request.path.startswith("/files/") else "/files"] += 1
+        return await handler(request)
+
+    async def token(self, request):
+        body = await request.json()
+        access_token = f"perf-{body['client_id']}-{next(self._token_ids)}"
+        self.tokens[access_token] = (body["client_id"], time.monotonic() + self.token_ttl)
+        return web.json_response({"access_token": access_token, "expires_in": self.token_ttl, "token_type": "Bearer"})
+
+    def revoke_tokens(self) -> None:
+        self.tokens.clear()
+
+    async def expense(self, request):
+        access_token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        client_id, expires = self.tokens.get(access_token, (None, 0.0))
+        if client_id is None or time.monotonic() >= expires:
+            return web.json_response({"error": "unauthorized"}, status=401)
+        csv = f"client;dateFrom;dateTo\n{client_id};{request.query['dateFrom']};{request.query['dateTo']}\n"
+        return web.Response(body=csv.encode(), content_type="text/csv")
+
+    async def report_create(self, request):
+        body = await request.json()
+        code = f"r{next(self._codes)}"
+        schema = body["filter"]["delivery_schema"][0]
+        self.reports[code] = (request.headers["Client-Id"], schema, time.monotonic())
+        return web.json_response({"result": {"code": code}})
+
+    async def report_info(self, request):
+        code = (await request.json())["code"]
+        _, schema, created = self.reports[code]
+        if schema == self.failed_schema:
+            return web.json_response({"result": {"code": code, "status": "failed", "error": "boom"}})
+        if time.monotonic() - created < self.ready_after:
+            return web.json_response({"result": {"code": code, "status": "processing", "file": ""}})
+        return web.json_response({"result": {"code": code, "status": "success", "file": f"{self.url}/files/{code}"}})
+
+    async def report_file(self, request):
+        client_id, schema, _ = self.reports[request.match_info["code"]]
+        return web.Response(body=f"xlsx:{client_id}:{schema}".encode(), content_type="application/octet-stream")
+
+    async def finance(self, request):
+        body = await request.json()
+        page, size = body["page"], body["page_size"]
+        ops = [{"operation_id": i} for i in range((page - 1) * size, min(page * size, self.operations))]
+        return web.json_response({"result": {"operations": ops, "page_count": math.ceil(self.operations / size),
+                                             "row_count": self.operations}})
+
+    async def analytics(self, request):
+        body = await request.json()
+        offset, limit = body["offset"], body["limit"]
+        rows = [{"dimensions": [{"id": str(i)}], "metrics": [i]}
+                for i in range(offset, min(offset + limit, self.analytics_rows))]
+        return web.json_response({"result": {"data": rows, "totals": [self.analytics_rows]}})
+
+    async def start(self) -> str:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/api/client/token", self.token)
+        app.router.add_get("/api/client/statistics/expense", self.expense)
+        app.router.add_post("/v1/report/postings/create", self.report_create)
+        app.router.add_post("/v1/report/info", self.report_info)
+        app.router.add_get("/files/{code}", self.report_file)
+        app.router.add_post("/v3/finance/transaction/list", self.finance)
+        app.router.add_post("/v1/analytics/data", self.analytics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+def make_client(url: str, company: int) -> OzonAsyncClient:
+    return OzonAsyncClient(client_id=f"c{company}", api_key="key", client_secret="secret", token_id=company,
+                           seller_base_url=url, performance_base_url=f"{url}/api/client")
+
+
+# ─── отчёты ───
+
+async def reports_serial(clients, schemas, date_from, date_to, poll_interval: float) -> Dict[Tuple[str, str], bytes]:
+    """Как было: кабинеты и схемы по очереди, статус раз в poll_interval (429 повторяется, чтобы сравнение было честным)."""
+    files = {}
+    for client in clients:
+        for schema in schemas:
+            code = await call_with_retry(client.create_orders_report, date_from, date_to, schema)
+            while True:
+                info, _, _ = await call_with_retry(client.get_report_status, code)
+                if info["result"]["status"] == "success":
+                    break
+                await asyncio.sleep(poll_interval)
+            body, _, _ = await call_with_retry(client.download_orders_report, info["result"]["file"])
+            files[(client.client_id, schema)] = body
+    return files
+
+
+async def check_reports(args, url: str, server: FakeOzonServer) -> None:
+    schemas = ["fbo", "fbs"]
+    clients = [make_client(url, c) for c in range(1, args.companies + 1)]
+    for client in clients:
+        await client.__aenter__()
+    try:
+        t0 = time.perf_counter()
+        serial = await reports_serial(clients, schemas, "2025-01-01", "2025-01-01", args.poll_interval)
+        t_serial = time.perf_counter() - t0
+        server.requests.clear()
+
+        polling = AdaptivePolling(initial_interval_sec=args.poll_interval / 10, backoff_factor=1.5,
+                                  max_interval_sec=args.poll_interval, timeout_sec=60)
+        jobs = [ReportJob(c, "2025-01-01", "2025-01-01", s, label=c.client_id) for c in clients for s in schemas]
+        run = await run_report_jobs(jobs, polling=polling)
+        run.raise_first()
+        concurrent = {(r.job.label, r.job.delivery_schema): r.body for r in run.results}
+        polls = sum(r.polls for r in run.results)
+
+        assert concurrent == serial and len(serial) == len(clients) * len(schemas)
+        assert all(body == f"xlsx:{cid}:{s}".encode() for (cid, s), body in concurrent.items())
+        print(f"отчёты {len(jobs)} шт.: последовательно {t_serial:.2f}s, движок {run.elapsed_sec:.2f}s "
+              f"({t_serial / run.elapsed_sec:.1f}x), опросов статуса {polls}")
+
+        # fetch_orders клиента — те же отчёты по схемам одного кабинета, в порядке схем
+        files = await clients[0].fetch_orders("2025-01-01", "2025-01-01", schemas, polling=polling)
+        assert files == [serial[("c1", s)] for s in schemas]
+
+        # отказ одной схемы не теряет остальные отчёты
+        server.failed_schema = "fbs"
+        run = await run_report_jobs(jobs, polling=polling)
+        server.failed_schema = ""
+        assert {r.job.delivery_schema for r in run.results} == {"fbo"} and len(run.errors) == len(clients)
+        print(f"  отказ схемы fbs: готовых отчётов {len(run.results)}, ошибок {len(run.errors)}")
+    finally:
+        for client in clients:
+            await client.__aexit__(None, None, None)
+
+
+# ─── страницы ───
+
+class FakeBronze:
+    """Таблица бронзы в памяти: каждый INSERT стоит write_latency секунд, сколько бы строк в нём ни было."""
+
+    def __init__(self, write_latency: float):
+        self.write_latency = write_latency
+        self.rows: List[Dict] = []
+        self.inserts = 0
+
+    async def insert(self, records: List[Dict]) -> None:
+        await asyncio.sleep(self.write_latency)
+        self.rows.extend(records)
+        self.inserts += 1
+
+
+def record(key, data) -> Dict:
+    return {"key": key, "response_body": json.dumps(data, ensure_ascii=False)}
+
+
+async def pages_serial(fetch_page, keys, is_last, bronze: FakeBronze) -> None:
+    """Как было: запрос страницы → вставка одной строки → следующий запрос."""
+    for key in keys:
+        data, _, _ = await call_with_retry(fetch_page, key)
+        await bronze.insert([record(key, data)])
+        if is_last(data):
+            return
+
+
+async def check_pages(args, url: str, server: FakeOzonServer) -> None:
+    def finance_items(data):
+        return data["result"]["operations"]
+
+    def analytics_rows(data):
+        return data["result"]["data"]
+
+    async with make_client(url, 1) as client:
+        cases = {
+            "финансы": dict(
+                fetch=lambda page: client.fetch_sales("2025-01-01", "2025-01-01", page=page, page_size=args.page_size),
+                keys=lambda: itertools.count(1),
+                is_last=lambda d: len(finance_items(d)) < args.page_size,
+                options=dict(page_total=lambda d: d["result"]["page_count"], concurrency=args.concurrency),
+                path="/v3/finance/transaction/list",
+                expected=max(math.ceil(args.operations / args.page_size), 1),
+            ),
+            "аналитика": dict(
+                fetch=lambda offset: client.fetch_sales_funnel("2025-01-01", "2025-01-01", ["view_count"], ["sku"],
+                                                               limit=args.page_size, offset=offset),
+                keys=lambda: itertools.count(0, args.page_size),
+                is_last=lambda d: len(analytics_rows(d)) < args.page_size,
+                options=dict(speculative=args.speculative),
+                path="/v1/analytics/data",
+                expected=args.analytics_rows // args.page_size + 1,
+            ),
+        }
+        for name, case in cases.items():
+            serial = FakeBronze(args.write_latency)
+            server.requests.clear()
+            t0 = time.perf_counter()
+            await pages_serial(case["fetch"], case["keys"](), case["is_last"], serial)
+            t_serial = time.perf_counter() - t0
+            serial_requests = server.requests[case["path"]]
+
+            engine = FakeBronze(args.write_latency)
+            server.requests.clear()
+            t0 = time.perf_counter()
+            pages = stream_pages(case["fetch"], case["keys"](), is_last=case["is_last"], **case["options"])
+            written = await write_pages(pages, build_record=lambda p: record(p.key, p.data),
+                                        write_batch=engine.insert, batch_pages=args.batch_pages)
+            t_engine = time.perf_counter() - t0
+            engine_requests = server.requests[case["path"]]
+
+            assert engine.rows == serial.rows and written == len(serial.rows) == case["expected"], \
+                (name, written, len(serial.rows), case["expected"])
+            assert serial_requests == case["expected"]
+            # без page_count лишними могут быть только спекулятивные запросы за концом данных
+            extra = case["options"].get("speculative", 0)
+            assert case["expected"] <= engine_requests <= case["expected"] + extra, (name, engine_requests)
+            print(f"{name}: {written} страниц, последовательно {t_serial:.2f}s ({serial.inserts} INSERT), "
+                  f"движок {t_engine:.2f}s ({engine.inserts} INSERT, {engine_requests} запросов) "
+                  f"— {t_serial / t_engine:.1f}x")
+
+
+async def main(args) -> None:
+    for rate_limit_every in (0, args.rate_limit_every):
+        server = FakeOzonServer(operations=args.operations, analytics_rows=args.analytics_rows,
+                                ready_after=args.ready_after, latency=args.latency,
+                                rate_limit_every=rate_limit_every)
+        url = await server.start()
+        try:
+            print("без 429" if not rate_limit_every else f"429 на каждый {rate_limit_every}-й запрос")
+            await check_reports(args, url, server)
+            await check_pages(args, url, server)
+            if rate_limit_every:
+                print(f"  сервер ответил 429: {server.rate_limited} раз")
+        finally:
+            await ozon_credentials().close()
+            await server.stop()
+    print("OK: отчёты, страницы и пачки бронзы совпадают с последовательным сбором")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--companies", type=int, default=3)
+    p.add_argument("--ready-after", type=float, default=0.4, help="через сколько секунд отчёт готов")
+    p.add_argument("--poll-interval", type=float, default=0.5, help="фиксированная пауза опроса (было 30 с)")
+    p.add_argument("--operations", type=int, default=24_567)
+    p.add_argument("--analytics-rows", type=int, default=12_345)
+    p.add_argument("--page-size", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--speculative", type=int, default=0)
+    p.add_argument("--batch-pages", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.03, help="задержка ответа сервера, с")
+    p.add_argument("--write-latency", type=float, default=0.02, help="стоимость одного INSERT, с")
+    p.add_argument("--rate-limit-every", type=int, default=9)
+    asyncio.run(main(p.parse_args()))
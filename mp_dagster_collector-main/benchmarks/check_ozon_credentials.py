@@ -0,0 +1,126 @@
+"""
+Проверка процессного менеджера токенов и сессий Ozon
+(src/connectors/ozon/ozon_credentials.py) против поддельного API
+(FakeOzonServer из check_ozon_collector.py).
+
+Сценарий: --companies кабинетов × --days дней расходов Performance API
+(GET /statistics/expense), каждый вызов — отдельный `async with` клиента,
+как в ассете bronze_ozon_adv_expense_1d за день:
+  • как было: у каждого клиента своя сессия и свой токен;
+  • общий менеджер: все вызовы одновременно, токен — один запрос на
+    кабинет, соединения из общего пула;
+  • срок жизни токена (--token-ttl) истёк — одно обновление на кабинет;
+  • сервер отозвал токены раньше срока — 401, одно обновление на кабинет.
+Проверяется число запросов токена, TCP-соединений и ответы.
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_ozon_credentials.py --companies 20 --days 10
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+from aiohttp import web
+
+from benchmarks.check_ozon_collector import FakeOzonServer
+from src.connectors.ozon.ozon_api import OzonAsyncClient
+from src.connectors.ozon.ozon_credentials import OzonCredentialManager
+
+
+class CountingServer(FakeOzonServer):
+    """FakeOzonServer, который ещё считает TCP-соединения (по порту клиента)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.peers = set()
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        return await super()._middleware(request, handler)
+
+
+def client(url: str, company: int, credentials: OzonCredentialManager) -> OzonAsyncClient:
+    return OzonAsyncClient(client_id=f"c{company}", api_key="key", client_secret="secret", token_id=company,
+                           seller_base_url=url, performance_base_url=f"{url}/api/client", credentials=credentials)
+
+
+async def expense_day(url: str, company: int, day: str, credentials: OzonCredentialManager) -> bytes:
+    async with client(url, company, credentials) as c:
+        body, _ = await c.fetch_ad_campaign_expense(day, day)
+    return body
+
+
+def expected(company: int, day: str) -> bytes:
+    return f"client;dateFrom;dateTo\nc{company};{day};{day}\n".encode()
+
+
+async def wave(url, calls, credentials) -> float:
+    t0 = time.perf_counter()
+    bodies = await asyncio.gather(*(expense_day(url, c, d, credentials) for c, d in calls))
+    assert bodies == [expected(c, d) for c, d in calls]
+    return time.perf_counter() - t0
+
+
+async def main(args) -> None:
+    server = CountingServer(latency=args.latency, token_ttl=args.token_ttl)
+    url = await server.start()
+    days = [(date(2025, 1, 1) + timedelta(days=i)).isoformat() for i in range(args.days)]
+    calls = [(c, d) for c in range(1, args.companies + 1) for d in days]
+    try:
+        # как было: новая сессия и новый токен на каждый вызов (по очереди, как ассет за день)
+        t0 = time.perf_counter()
+        for company, day in calls:
+            own = OzonCredentialManager()
+            assert await expense_day(url, company, day, own) == expected(company, day)
+            await own.close()
+        t_old = time.perf_counter() - t0
+        old_tokens, old_conns = server.requests["/api/client/token"], len(server.peers)
+        print(f"как было: {len(calls)} вызовов за {t_old:.2f}s, запросов токена {old_tokens}, соединений {old_conns}")
+        assert old_tokens == len(calls)
+
+        shared = OzonCredentialManager(limit_per_host=args.limit_per_host)
+        server.requests.clear()
+        server.peers.clear()
+        t_new = await wave(url, calls, shared)
+        tokens, conns = server.requests["/api/client/token"], len(server.peers)
+        print(f"общий менеджер: {t_new:.2f}s ({t_old / t_new:.1f}x), запросов токена {tokens}, "
+              f"соединений {conns}, сессий {shared.stats['sessions_created']}, из кэша {shared.stats['token_hits']}")
+        assert tokens == args.companies, tokens
+        assert conns <= args.limit_per_host and shared.stats["sessions_created"] == 1
+
+        # повторный прогон в пределах срока жизни — без авторизации
+        await wave(url, calls, shared)
+        assert server.requests["/api/client/token"] == args.companies
+
+        # истёк срок (обновление за min(60 с, ttl/2) до конца) — по одному обновлению на кабинет
+        await asyncio.sleep(args.token_ttl / 2 + 0.05)
+        await wave(url, calls, shared)
+        refreshed = server.requests["/api/client/token"] - args.companies
+        print(f"после истечения срока: обновлений токена {refreshed}")
+        assert refreshed == args.companies, refreshed
+
+        # отзыв токенов на сервере: 401 → сброс кэша → одно обновление на кабинет
+        server.revoke_tokens()
+        before = server.requests["/api/client/token"]
+        await wave(url, calls, shared)
+        reissued = server.requests["/api/client/token"] - before
+        print(f"после отзыва токенов: 401 → обновлений {reissued}, сброшено из кэша {shared.stats['invalidated']}")
+        assert reissued == args.companies, reissued
+
+        await shared.close()
+        assert not shared._sessions
+    finally:
+        await server.stop()
+    print("OK: токены Performance API и сессии переиспользуются")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--companies", type=int, default=20)
+    p.add_argument("--days", type=int, default=10)
+    p.add_argument("--token-ttl", type=float, default=3.0, help="expires_in токена, с")
+    p.add_argument("--limit-per-host", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.01)
+    asyncio.run(main(p.parse_args()))
@@ -0,0 +1,211 @@
+"""
+Проверка пакетного шлюза кампаний WB (api/wb_campaign_gateway.py) против
+поддельного рекламного API WB в том же процессе.
+
+Поддельный сервер (FakeWBAdvertServer, aiohttp.web) реализует:
+  POST  /adv/v1/promotion/adverts      — до 50 id, иначе 400;
+  PATCH /adv/v0/bids                   — до 20 кампаний, ставка ниже минимума →
+                                         400 с «min: N» в bids[i].nm_bids[j];
+                                         архивная кампания → 400 с field
+                                         bids[i].advert_id, «сломанная» → 400
+                                         без field; пачка с ошибкой не пишется;
+  POST  /adv/v1/auto/set-excluded      — минус-фразы автокампании (тип 8);
+  POST  /adv/v1/search/set-excluded    — минус-фразы аукциона (тип 9);
+считает запросы по маршрутам и по желанию отвечает 429 на каждый k-й запрос.
+
+Сценарий: --campaigns корутин одновременно спрашивают информацию о своей
+кампании, ставят ставки (часть ниже минимума) и минус-фразы (часть кампаний
+дважды); несколько кампаний архивные или «сломанные» — их ставки не
+проходят, а остальные кампании тех же пачек должны дойти. Проверяется число
+HTTP-запросов и итоговое состояние сервера; затем то же с 429.
+
+Запуск (из mp_dagster_collector-main):
+    PYTHONPATH=. python benchmarks/check_wb_campaign_gateway.py --campaigns 230
+"""
+import argparse
+import asyncio
+import math
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+from aiohttp import web
+
+from api.wb_campaign_gateway import BIDS_BATCH, INFO_BATCH, WBCampaignGateway
+
+
+class FakeWBAdvertServer:
+    """Поддельный advert-api WB: кампании, минимальные ставки, счётчик запросов."""
+
+    def __init__(self, campaigns: Dict[int, int], min_bid: int = 150, rate_limit_every: int = 0,
+                 archived: Set[int] = frozenset(), broken: Set[int] = frozenset()):
+        self.campaigns = campaigns          # advert_id → type
+        self.min_bid = min_bid
+        self.archived = archived            # ошибка с field bids[i].advert_id
+        self.broken = broken                # ошибка без field
+        self.rate_limit_every = rate_limit_every
+        self.requests: Counter = Counter()
+        self.rate_limited = 0
+        self.bids: Dict[Tuple[int, int], int] = {}
+        self.excluded: Dict[int, Tuple[str, List[str]]] = {}
+        self._seen = 0
+        self._runner = None
+        self.url = None
+
+    def _limited(self) -> bool:
+        self._seen += 1
+        if self.rate_limit_every and self._seen % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            return True
+        return False
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests[request.path] += 1
+        if self._limited():
+            return web.json_response({"title": "too many requests"}, status=429, headers={"X-Ratelimit-Retry": "0.01"})
+        resp = await handler(request)
+        resp.headers["X-Ratelimit-Remaining"] = "10"
+        return resp
+
+    async def adverts(self, request):
+        ids = await request.json()
+        if not isinstance(ids, list) or len(ids) > INFO_BATCH:
+            return web.json_response({"error": "too many ids"}, status=400)
+        found = [{"advertId": a, "type": self.campaigns[a], "status": 9} for a in ids if a in self.campaigns]
+        if not found:
+            return web.Response(status=204)
+        return web.json_response(found)
+
+    async def bids_patch(self, request):
+        bids = (await request.json())["bids"]
+        if len(bids) > BIDS_BATCH:
+            return web.json_response({"errors": [{"detail": "too many adverts", "field": "bids"}]}, status=400)
+        errors = [
+            {"detail": f"bid is less than min: {self.min_bid}", "field": f"bids[{i}].nm_bids[{j}].bid"}
+            for i, b in enumerate(bids) for j, nb in enumerate(b["nm_bids"]) if nb["bid"] < self.min_bid
+        ]
+        errors += [
+            {"detail": "advert is archived", "field": f"bids[{i}].advert_id"}
+            for i, b in enumerate(bids) if b["advert_id"] in self.archived
+        ]
+        if any(b["advert_id"] in self.broken for b in bids):
+            errors.append({"detail": "invalid request"})
+        if errors:
+            return web.json_response({"errors": errors}, status=400)
+        for b in bids:
+            for nb in b["nm_bids"]:
+                self.bids[(b["advert_id"], nb["nm"])] = nb["bid"]
+        return web.Response(status=204)
+
+    async def set_excluded(self, request):
+        advert_id = int(request.query["id"])
+        expected = 8 if request.path.endswith("/auto/set-excluded") else 9
+        if self.campaigns.get(advert_id) != expected:
+            return web.json_response({"error": "wrong campaign type"}, status=400)
+        self.excluded[advert_id] = (request.path, (await request.json())["excluded"])
+        return web.Response(status=200)
+
+    async def start(self) -> str:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/adv/v1/promotion/adverts", self.adverts)
+        app.router.add_patch("/adv/v0/bids", self.bids_patch)
+        app.router.add_post("/adv/v1/auto/set-excluded", self.set_excluded)
+        app.router.add_post("/adv/v1/search/set-excluded", self.set_excluded)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/adv"
+        return self.url
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+async def scenario(args, rate_limit_every: int) -> None:
+    rnd = random.Random(args.seed)
+    known = {1_000 + i: (8 if i % 2 else 9) for i in range(args.campaigns)}
+    unknown = [900_000 + i for i in range(5)]
+    archived = set(rnd.sample(sorted(known), args.archived))
+    broken = set(rnd.sample(sorted(set(known) - archived), args.broken))
+    server = FakeWBAdvertServer(known, rate_limit_every=rate_limit_every, archived=archived, broken=broken)
+    url = await server.start()
+
+    bids = {a: rnd.choice([100, 175, 250, 400]) for a in known}
+    phrases_first = {a: [f"фраза {a}-{k}" for k in range(3)] for a in list(known)[:args.phrase_campaigns]}
+    phrases_final = {a: [f"минус {a}-{k}" for k in range(rnd.randint(1, 5))] for a in phrases_first}
+
+    intervals = {k: args.min_interval for k in ("info", "bids", "excluded")}
+    t0 = time.perf_counter()
+    async with WBCampaignGateway("token", base_url=url, min_intervals=intervals) as gw:
+        async def campaign(advert_id: int):
+            # как оптимизатор: информация о кампании → решение → обновления в очередь
+            info = await gw.campaign_info(advert_id)
+            if info is None:
+                return
+            gw.queue_bid(advert_id, advert_id * 10, bids[advert_id])
+            if advert_id in phrases_first:
+                gw.queue_excluded_phrases(advert_id, phrases_first[advert_id], info["type"])
+                gw.queue_excluded_phrases(advert_id, phrases_final[advert_id], info["type"])
+
+        await asyncio.gather(*(campaign(a) for a in [*known, *unknown]))
+        # повторные запросы информации берутся из кэша шлюза
+        again = await gw.campaigns_info(list(known)[:10])
+        try:
+            gw.queue_excluded_phrases(next(iter(known)), ["x"], campaign_type=4)
+            raise AssertionError("неподдерживаемый тип кампании должен отклоняться")
+        except ValueError:
+            pass
+        report = await gw.flush()
+        sent = Counter(gw.requests)
+    elapsed = time.perf_counter() - t0
+    await server.stop()
+
+    n_info = math.ceil((len(known) + len(unknown)) / INFO_BATCH)
+    n_bid_chunks = math.ceil(len(known) / BIDS_BATCH)
+    mode = f"429 на каждый {rate_limit_every}-й запрос" if rate_limit_every else "без 429"
+    print(f"{mode}: {elapsed:.2f}s, сервер получил {dict(server.requests)}, "
+          f"из них 429: {server.rate_limited}")
+    print(f"  поштучный путь сделал бы: info {len(known) + len(unknown)}, bids {len(known)}, "
+          f"минус-фразы {2 * len(phrases_first)}")
+
+    assert all(again[a] is not None for a in again)
+    if not rate_limit_every:
+        assert server.requests["/adv/v1/promotion/adverts"] == n_info, server.requests
+        # по одной лишней попытке на пачку, где были ставки ниже минимума; пачка
+        # с архивной кампанией повторяется без неё, со «сломанной» — по одной кампании
+        max_bids = 2 * n_bid_chunks + 2 * len(archived) + 2 * BIDS_BATCH * len(broken)
+        assert n_bid_chunks <= server.requests["/adv/v0/bids"] <= max_bids, server.requests
+        excluded_requests = server.requests["/adv/v1/auto/set-excluded"] + server.requests["/adv/v1/search/set-excluded"]
+        assert excluded_requests == len(phrases_first), server.requests
+    assert sum(sent.values()) == sum(server.requests.values())
+
+    rejected = archived | broken
+    assert report.bids_ok == set(known) - rejected and report.bids_failed == rejected, report
+    assert server.bids == {(a, a * 10): max(b, server.min_bid) for a, b in bids.items() if a not in rejected}
+    assert set(report.bids_corrected) == {a for a, b in bids.items() if b < server.min_bid and a not in rejected}
+    assert report.phrases_ok == set(phrases_final) and not report.phrases_failed
+    assert {a: p for a, (_, p) in server.excluded.items()} == phrases_final
+    assert all(re.search("auto" if known[a] == 8 else "search", path) for a, (path, _) in server.excluded.items())
+
+
+async def main(args) -> None:
+    await scenario(args, rate_limit_every=0)
+    await scenario(args, rate_limit_every=args.rate_limit_every)
+    print("OK: шлюз склеивает запросы, ставки и минус-фразы доходят до сервера")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--campaigns", type=int, default=230)
+    p.add_argument("--phrase-campaigns", type=int, default=60)
+    p.add_argument("--archived", type=int, default=3, help="кампаний с ошибкой bids[i] в ответе")
+    p.add_argument("--broken", type=int, default=2, help="кампаний с ошибкой без field")
+    p.add_argument("--rate-limit-every", type=int, default=7)
+    p.add_argument("--min-interval", type=float, default=0.01)
+    p.add_argument("--seed", type=int, default=5)
+    asyncio.run(main(p.parse_args()))
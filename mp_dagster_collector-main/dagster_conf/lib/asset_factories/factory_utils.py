@@ -11,6 +11,7 @@ from dagster import Failure, MultiPartitionKey, MetadataValue
 from dagster_conf.lib.timeutils import scheduled_time_msk
 from src.connectors.wb.wb_api_v2 import WildberriesAsyncClient, WBResponse
 from dagster_conf.lib.timeutils import parse_http_date
+from dagster_conf.lib.normalizer_pool import NormalizerExecution, run_normalizer_in_pool
 MSK = ZoneInfo("Europe/Moscow")
 
 def parse_business_dttm(raw: str) -> datetime:
@@ -41,6 +42,22 @@ def extract_partition(context) -> Tuple[datetime, int]:
         raise Failure(description=f"company_id должен приводиться к int, получено: {comp_raw}")
     return business_dttm, company_id
 
+def extract_partitions(context) -> List[Tuple[datetime, int]]:
+    """
+    Все (business_dttm, company_id) текущего рана.
+    Для обычного рана — одна партиция, для ранжированного (BackfillPolicy) — декартово
+    произведение диапазонов по обоим измерениям.
+    """
+    if not context.has_partition_key_range or context.partition_key_range.start == context.partition_key_range.end:
+        return [extract_partition(context)]
+
+    out: List[Tuple[datetime, int]] = []
+    for pk in context.partition_keys:
+        if not isinstance(pk, MultiPartitionKey):
+            raise Failure(description="Ожидается MultiPartitionKey для (business_dttm, company_id)")
+        out.append((parse_business_dttm(pk.keys_by_dimension["business_dttm"]), int(pk.keys_by_dimension["company_id"])))
+    return out
+
 def merge_tags(base: Dict[str, str], extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
     out = dict(base)
     if extra:
@@ -181,29 +198,8 @@ def _to_text_for_bronze(val):
     # всё прочее
     return str(val)
 
-async def default_persist_bronze(context, table_name: str, api_ctx, resp: Dict[str, Any]) -> str:
-    """Стандартная вставка в бронзу с typed bindparams для JSONB."""
-    from uuid import uuid4
-
-    request_uuid = str(uuid4())
-    now_msk = datetime.now(MSK)
-
-    # таймстемпы (при отсутствии — дефолтим текущим MSK)
-    run_schedule_dttm = scheduled_time_msk(context, default_msk=api_ctx.business_dttm)
-    run_dttm = resp.get("run_dttm")
-    request_dttm = resp.get("request_dttm")
-    response_dttm = resp.get("response_dttm")
-    receive_dttm = resp.get("receive_dttm")
-
-    status = int(resp.get("status", 0))
-
-    response_body: Any = resp.get("response_body")
-    if response_body is None:
-        response_body = resp.get("payload")
-    request_parameters: Any = resp.get("request_parameters")
-    request_body: Any = resp.get("request_body")
-
-    stmt = sa.text(f"""
+def _bronze_insert_stmt(table_name: str):
+    return sa.text(f"""
         INSERT INTO {table_name} (
             request_uuid,
             company_id,
@@ -242,31 +238,68 @@ async def default_persist_bronze(context, table_name: str, api_ctx, resp: Dict[s
         sa.bindparam("request_body", type_=JSONB),
     )
 
-    params = {
-        "request_uuid": request_uuid,
+
+def _bronze_insert_params(context, api_ctx, resp: Dict[str, Any]) -> Dict[str, Any]:
+    """Параметры одной строки бронзы (новый request_uuid на каждый вызов)."""
+    from uuid import uuid4
+
+    # таймстемпы (при отсутствии — дефолтим текущим MSK)
+    run_schedule_dttm = scheduled_time_msk(context, default_msk=api_ctx.business_dttm)
+
+    response_body: Any = resp.get("response_body")
+    if response_body is None:
+        response_body = resp.get("payload")
+
+    return {
+        "request_uuid": str(uuid4()),
         "company_id": api_ctx.company_id,
         "api_token_id": api_ctx.token_id,
         "business_dttm": api_ctx.business_dttm,
-        "response_dttm": response_dttm,
-        "receive_dttm": receive_dttm,
-        "response_code": status,
+        "response_dttm": resp.get("response_dttm"),
+        "receive_dttm": resp.get("receive_dttm"),
+        "response_code": int(resp.get("status", 0)),
         "response_body": _to_text_for_bronze(response_body),
         "run_uuid": api_ctx.run_uuid,
-        "run_dttm": run_dttm,
+        "run_dttm": resp.get("run_dttm"),
         "run_schedule_dttm": run_schedule_dttm,
-        "request_dttm": request_dttm,
-        "request_parameters": request_parameters,
-        "request_body": request_body,
+        "request_dttm": resp.get("request_dttm"),
+        "request_parameters": resp.get("request_parameters"),
+        "request_body": resp.get("request_body"),
     }
 
+
+async def default_persist_bronze(context, table_name: str, api_ctx, resp: Dict[str, Any]) -> str:
+    """Стандартная вставка в бронзу с typed bindparams для JSONB."""
+    params = _bronze_insert_params(context, api_ctx, resp)
+
     try:
         async with context.resources.postgres() as session:
-            await session.execute(stmt, params)
+            await session.execute(_bronze_insert_stmt(table_name), params)
             await session.commit()
     except Exception as e:
         context.log.warning(f"Не удалось записать Bronze: {e}")
 
-    return request_uuid
+    return params["request_uuid"]
+
+
+async def default_persist_bronze_many(context, table_name: str, items: List[Tuple[Any, Dict[str, Any]]]) -> List[Optional[str]]:
+    """
+    Пакетная вставка в бронзу: [(api_ctx, resp), ...] → одним executemany в одной сессии.
+    Возвращает request_uuid в порядке items (None — если пачку записать не удалось).
+    """
+    if not items:
+        return []
+    rows = [_bronze_insert_params(context, api_ctx, resp) for api_ctx, resp in items]
+
+    try:
+        async with context.resources.postgres() as session:
+            await session.execute(_bronze_insert_stmt(table_name), rows)
+            await session.commit()
+    except Exception as e:
+        context.log.warning(f"Не удалось записать пачку Bronze ({len(rows)} строк): {e}")
+        return [None] * len(rows)
+
+    return [r["request_uuid"] for r in rows]
 
 
 async def default_select_best_bronze(context, table_name: str, business_dttm: datetime, company_id: int) -> Optional[Dict[str, Any]]:
@@ -352,7 +385,12 @@ def make_default_persist_silver(table_name: str, pk_cols: Tuple[str, ...]):
     return _persist
 
 
-def normalize_wrapper(normalizer):
+def normalize_wrapper(normalizer, execution: Optional[NormalizerExecution] = None):
+    """
+    Приводит нормализатор к единому async-интерфейсу (context, best, api_ctx) → rows.
+    execution (из `silver.targets.<t>.normalize`) позволяет вынести синхронный
+    нормализатор в пул процессов вместо asyncio.to_thread.
+    """
     if not normalizer:
         async def _noop(context, _best, _api_ctx):
             context.log.warning("[normalize] no normalizer configured → []")
@@ -395,6 +433,8 @@ def normalize_wrapper(normalizer):
 
         if inspect.iscoroutinefunction(normalizer):
             return await normalizer(payload, **kwargs)
+        if execution is not None and execution.in_process_pool:
+            return await run_normalizer_in_pool(execution, payload, kwargs)
         return await asyncio.to_thread(normalizer, payload, **kwargs)
 
     return _call
@@ -584,9 +624,12 @@ async def call_wb_method_and_wrap(
     fetch_method: str,
     build_request_params,
     api_ctx,
+    client=None,
 ) -> Dict[str, Any]:
     """
     Унифицированный вызов метода WB-клиента + приведение результата к бронзовому протоколу.
+    • client — уже открытый (async with) клиент; если не передан, берём ресурс и
+      открываем его на время одного вызова
     • Сам подбирает имя аргумента для тела: payload/json_body
     • Прокидывает token_override, если метод его принимает
     • Возвращает также request_parameters (ИМЕННО в виде, как ушло в WB), чтобы писать в бронзу
@@ -670,7 +713,9 @@ async def call_wb_method_and_wrap(
         pass
 
     # 2) Берём ресурс-клиент
-    client = getattr(context.resources, client_resource_key, None)
+    shared_client = client is not None
+    if not shared_client:
+        client = getattr(context.resources, client_resource_key, None)
     if client is None:
         now = datetime.now(MSK)
         return {
@@ -836,7 +881,7 @@ async def call_wb_method_and_wrap(
         }
         return out
 
-    if hasattr(client, "__aenter__"):
+    if not shared_client and hasattr(client, "__aenter__"):
         context.log.debug(f"[wb_call] entering async context for {client_resource_key}")
         async with client as c:
             return await _invoke(c)
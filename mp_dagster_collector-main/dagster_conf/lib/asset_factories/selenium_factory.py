@@ -25,6 +25,7 @@ from dagster_conf.lib.asset_factories.factory_utils import (
     MSK,
 )
 from dagster_conf.lib.asset_factories.task_asset_factory import BronzeApiContext
+from dagster_conf.lib.normalizer_pool import parse_normalizer_execution
 
 
 # ------------------------- specs -------------------------
@@ -110,7 +111,9 @@ def build_assets(
         normalizer_raw = (model_bundle.get("normalizers") or {}).get(s_name)
         if normalizer_raw is None:
             raise KeyError(f"Missing normalizer for silver target '{s_name}'")
-        normalizer = normalize_wrapper(_resolve_callable(normalizer_raw))
+        t_cfg = ((pipe_cfg.get("silver") or {}).get("targets") or {}).get(s_name) or {}
+        execution = parse_normalizer_execution(t_cfg, target=f"{pipe_name}:{s_name}")
+        normalizer = normalize_wrapper(_resolve_callable(normalizer_raw), execution)
 
         pk_cols = tuple((model_bundle.get("silver_pk") or {}).get(s_name) or ())
         if not pk_cols:
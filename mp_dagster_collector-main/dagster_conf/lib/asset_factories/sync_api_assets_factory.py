@@ -14,9 +14,11 @@ from dagster import (
     Output,
     Failure,
     RetryPolicy,
+    BackfillPolicy,
     MultiPartitionsDefinition,
     MetadataValue,
 )
+import sqlalchemy as sa
 
 # Партиции
 from dagster_conf.lib.partitions import build_multipartitions
@@ -25,10 +27,12 @@ from dagster_conf.lib.partitions import build_multipartitions
 from dagster_conf.lib.asset_factories.factory_utils import (
     MSK,
     extract_partition,          # строгий разбор (business_dttm, company_id)
+    extract_partitions,         # все партиции рана (для пакетного режима)
     merge_tags,
     bronze_output_metadata,
     default_resolve_auth,       # (token_id, token) по company_id
     default_persist_bronze,     # запись аудита/сырья в бронзу
+    default_persist_bronze_many,# пакетная запись бронзы (batched-режим)
     default_select_best_bronze, # выбор «лучшая» успешная бронза
     make_default_persist_silver,# upsert-функция для Silver
     normalize_wrapper,          # обёртка нормализатора (разные сигнатуры)
@@ -40,6 +44,10 @@ from dagster_conf.lib.asset_factories.factory_utils import (
 # Единый адаптер вызова WB-клиента → bronze-dict (с логированием/протоколом)
 from dagster_conf.lib.asset_factories.factory_utils import call_wb_method_and_wrap
 
+# Запуск нормализаторов в пуле процессов (silver.targets.<t>.normalize)
+from dagster_conf.lib.normalizer_pool import parse_normalizer_execution
+from dagster_conf.lib.rate_limit import _hdr_float, _lower_headers
+
 
 # ---------------- Вспомогательное ----------------
 
@@ -167,6 +175,49 @@ class BronzeApiContext:
     run_uuid: str
 
 
+@dataclass
+class BatchExecutionSpec:
+    """
+    Пакетный режим (execution.mode: batched): один ран обрабатывает диапазон партиций
+    (business_dttm × company_id), параллелит вызовы API и пишет бронзу пачками.
+    """
+    max_partitions_per_run: int = 200
+    concurrency: int = 8
+    per_token_rps: float = 1.0
+    persist_chunk_size: int = 100
+    # task-пайпы: лимит на опрос/download токена (per_token_rps там — лимит submit)
+    request_rps: Optional[float] = None
+    # 429: повторов на партицию; пауза — по X-Ratelimit-Retry / Retry-After,
+    # retry_fallback_sec — только если WB не прислал заголовков
+    retry_max: int = 0
+    retry_fallback_sec: float = 60.0
+
+
+class TokenPacer:
+    """Выдерживает минимальный интервал между запросами одного токена (rps на аккаунт WB)."""
+
+    def __init__(self, rps: float):
+        self._interval = 1.0 / rps if rps and rps > 0 else 0.0
+        self._locks: Dict[Any, asyncio.Lock] = {}
+        self._next_at: Dict[Any, float] = {}
+
+    async def wait(self, token_key: Any) -> None:
+        if not self._interval:
+            return
+        lock = self._locks.setdefault(token_key, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_at.get(token_key, 0.0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at[token_key] = loop.time() + self._interval
+
+    def penalize(self, token_key: Any, delay: float) -> None:
+        """429: следующий запрос токена не раньше чем через delay секунд (для всех воркеров)."""
+        loop = asyncio.get_running_loop()
+        self._next_at[token_key] = max(self._next_at.get(token_key, 0.0), loop.time() + max(delay, 0.0))
+
+
 @dataclass
 class BronzeSpec:
     """Спецификация Bronze-ассета."""
@@ -189,6 +240,10 @@ class BronzeSpec:
     op_retry_policy: RetryPolicy = field(default_factory=lambda: RetryPolicy(max_retries=3, delay=60))
     op_tags: Dict[str, str] = field(default_factory=dict)
 
+    # пакетный режим (None — одна партиция на ран)
+    batch: Optional[BatchExecutionSpec] = None
+    persist_bronze_many: Optional[Callable[[Any, str, List[Tuple[BronzeApiContext, Dict[str, Any]]]], Awaitable[List[Optional[str]]]]] = None
+
 
 @dataclass
 class SilverSpec:
@@ -228,26 +283,150 @@ def _scrub_params(obj: Any) -> Any:
     return obj
 
 
+async def _preview_request_params(context, spec: SyncApiPipelineSpec, business_dttm: datetime, company_id: int) -> Dict[str, Any]:
+    """Строит параметры запроса для диагностики/аудита (ошибка не фатальна — вернём {})."""
+    try:
+        fn = spec.bronze.build_request_params
+        sig = inspect.signature(fn)
+        needs_ctx = len(sig.parameters) >= 3
+        if inspect.iscoroutinefunction(fn):
+            context.log.debug(f"[make_sync_api_assets][bronze_asset] build_request_params async: {fn}")
+            req_params_raw = await (fn(context, business_dttm, company_id) if needs_ctx
+                                    else fn(business_dttm, company_id)) or {}
+        else:
+            context.log.debug(f"[make_sync_api_assets][bronze_asset] build_request_params sync: {fn}")
+            req_params_raw = (fn(context, business_dttm, company_id) if needs_ctx
+                              else fn(business_dttm, company_id)) or {}
+    except Exception as e:
+        context.log.warning(f"[make_sync_api_assets][bronze_asset] build_request_params error: {e!r}")
+        req_params_raw = {}
+
+    context.log.debug("[make_sync_api_assets][bronze_asset] req_params_raw=%s", req_params_raw)
+    return req_params_raw
+
+
+async def _call_and_prepare_bronze(
+    context,
+    spec: SyncApiPipelineSpec,
+    api_ctx: BronzeApiContext,
+    req_params_raw: Dict[str, Any],
+    run_dttm: datetime,
+    client=None,
+) -> Dict[str, Any]:
+    """Вызов API для одной партиции → словарь, готовый к persist_bronze."""
+    req_params_sanitized = _scrub_params(req_params_raw)
+    body_preview = (req_params_raw.get("payload")
+                    or req_params_raw.get("json_body")
+                    or (req_params_raw.get("body") if isinstance(req_params_raw.get("body"), dict) else None))
+    context.log.debug("[make_sync_api_assets][bronze_asset] body_preview=%s", body_preview)
+
+    context.log.info(
+        "[make_sync_api_assets][bronze_asset] %s.%s cid=%s biz=%s token=%s",
+        spec.client_resource_key, spec.bronze.fetch_method, api_ctx.company_id,
+        api_ctx.business_dttm.date().isoformat(),
+        "YES" if api_ctx.token else "NO",
+    )
+    context.log.debug(
+        "[make_sync_api_assets][bronze_asset] keys=%s; payload_present=%s; sample=%s",
+        list(req_params_raw.keys()),
+        ("payload" in req_params_raw) or ("json_body" in req_params_raw) or ("body" in req_params_raw),
+        (str(body_preview)[:300] if body_preview is not None else "{}"),
+    )
+
+    # Вызов API
+    call_kwargs = {"client": client} if client is not None else {}
+    try:
+        req_started_at = datetime.now(MSK)
+        resp = await spec.bronze.call_api(
+            context,
+            spec.client_resource_key,
+            spec.bronze.fetch_method,
+            spec.bronze.build_request_params,
+            api_ctx,
+            **call_kwargs,
+        )
+    except Exception as e:
+        # Логируем детально до ретрая
+        context.log.error(
+            "[wb_call] ERROR during %s.%s: %r; req_keys=%s",
+            spec.client_resource_key, spec.bronze.fetch_method, e, list(req_params_raw.keys()),
+        )
+        raise
+
+    # Гарантируем корректные request_parameters/request_body из аудита транспорта
+    # 1) Пробуем взять «как ушло» из WBResponse.request (audit уровня клиента)
+    _audit = resp.get("request") or {}
+    _query_from_audit = _audit.get("query") if isinstance(_audit, dict) else None
+    _body_from_audit  = _audit.get("json_body") if isinstance(_audit, dict) else None
+
+    # 2) Собираем финальные значения с умными fallback-ами
+    final_request_parameters = (
+        _query_from_audit
+        or resp.get("request_parameters")
+        or req_params_sanitized
+        or {}
+    )
+    final_request_body = (
+        _body_from_audit
+        or resp.get("request_body")
+    )
+
+    # 3) Санитизация (уберём токены/секреты на всякий случай)
+    final_request_parameters = _scrub_params(final_request_parameters)
+    if final_request_body is not None:
+        final_request_body = _scrub_params(final_request_body)
+
+    # 4) Кладём в структуру, которую пойдёт в persist_bronze
+    resp_to_persist = dict(resp)
+    resp_to_persist["run_dttm"] = run_dttm
+    resp_to_persist["request_parameters"] = final_request_parameters
+    if final_request_body is not None:
+        resp_to_persist["request_body"] = final_request_body
+    else:
+        resp_to_persist.pop("request_body", None)
+
+    resp_to_persist["request_dttm"] = (req_started_at or
+            resp.get("request_dttm") or resp.get("requested_at")
+    )
+    resp_to_persist["receive_dttm"] = datetime.now(MSK)
+
+    context.log.debug(
+        "[bronze persist] request_parameters=%s; request_body=%s; request_dttm=%s; receive_dttm=%s",
+        str(final_request_parameters)[:1000],
+        ("<present>" if final_request_body is not None else "<absent>"),
+        resp_to_persist["request_dttm"],
+        resp_to_persist["receive_dttm"],
+    )
+    return resp_to_persist
+
+
+async def _bronze_done_in_run(context, spec: SyncApiPipelineSpec) -> set:
+    """(business_dttm, company_id) с успешной бронзой в текущем ране — не перезапрашиваем при ретрае."""
+    if not getattr(context, "retry_number", 0):
+        return set()
+    async with context.resources.postgres() as session:
+        res = await session.execute(
+            sa.text(f"""
+                SELECT DISTINCT business_dttm, company_id
+                  FROM {spec.bronze.bronze_table}
+                 WHERE run_uuid = :run
+                   AND response_code BETWEEN 200 AND 299
+            """),
+            {"run": context.run_id},
+        )
+        return {(biz.astimezone(MSK), int(cid)) for biz, cid in res.fetchall()}
+
+
 def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
     """Создаёт 1 Bronze и N Silver ассетов. Порядок: [bronze, *silvers]."""
     base_tags = {"factory": "sync_api", "pipe": spec.pipe_name}
+    batch = spec.bronze.batch
+    backfill_policy = BackfillPolicy.multi_run(batch.max_partitions_per_run) if batch else None
 
     # ---------------- Bronze ----------------
     bronze_tags = merge_tags(base_tags, merge_tags(spec.op_tags, spec.bronze.op_tags))
 
-    @asset(
-        name=f"bronze__{spec.bronze.name}",
-        key_prefix=["bronze"],
-        partitions_def=spec.bronze.partitions_def,
-        required_resource_keys=set(spec.bronze.required_resource_keys) | {spec.client_resource_key},
-        retry_policy=spec.bronze.op_retry_policy,
-        op_tags=bronze_tags,
-        description=(
-            "Вызов WB API → запись аудита и сырых данных в Bronze. "
-            "При статусе не 2xx: аудит пишется, затем ассет падает Failure (включаются ретраи Dagster)."
-        ),
-    )
-    async def bronze_asset(context) -> Output[None]:
+    async def _bronze_single(context):
         business_dttm, company_id = extract_partition(context)
         run_dttm = datetime.now(MSK)
         # Аутентификация
@@ -265,109 +444,12 @@ def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
             yield Output(value=None, metadata=md)
             raise Failure(f"No WB token for company_id={company_id}")
 
-        # Предпросмотр параметров (диагностика)
-        try:
-            fn = spec.bronze.build_request_params
-            sig = inspect.signature(fn)
-            needs_ctx = len(sig.parameters) >= 3
-            if inspect.iscoroutinefunction(fn):
-                context.log.debug(f"[make_sync_api_assets][bronze_asset] build_request_params async: {fn}")
-                req_params_raw = await (fn(context, business_dttm, company_id) if needs_ctx
-                                        else fn(business_dttm, company_id)) or {}
-            else:
-                context.log.debug(f"[make_sync_api_assets][bronze_asset] build_request_params sync: {fn}")
-                req_params_raw = (fn(context, business_dttm, company_id) if needs_ctx
-                                  else fn(business_dttm, company_id)) or {}
-        except Exception as e:
-            context.log.warning(f"[make_sync_api_assets][bronze_asset] build_request_params error: {e!r}")
-            req_params_raw = {}
-
-        context.log.debug("[make_sync_api_assets][bronze_asset] req_params_raw=%s", req_params_raw)
-        
-        req_params_sanitized = _scrub_params(req_params_raw)
-        body_preview = (req_params_raw.get("payload")
-                        or req_params_raw.get("json_body")
-                        or (req_params_raw.get("body") if isinstance(req_params_raw.get("body"), dict) else None))
-        context.log.debug("[make_sync_api_assets][bronze_asset] body_preview=%s", body_preview)
-
-        context.log.info(
-            "[make_sync_api_assets][bronze_asset] %s.%s cid=%s biz=%s token=%s",
-            spec.client_resource_key, spec.bronze.fetch_method, company_id,
-            business_dttm.date().isoformat(),
-            "YES" if token else "NO",
-        )
-        context.log.debug(
-            "[make_sync_api_assets][bronze_asset] keys=%s; payload_present=%s; sample=%s",
-            list(req_params_raw.keys()),
-            ("payload" in req_params_raw) or ("json_body" in req_params_raw) or ("body" in req_params_raw),
-            (str(body_preview)[:300] if body_preview is not None else "{}"),
-        )
-
-        # Вызов API и запись в бронзу
-        try:
-            req_started_at = datetime.now(MSK)
-            resp = await spec.bronze.call_api(
-                context,
-                spec.client_resource_key,
-                spec.bronze.fetch_method,
-                spec.bronze.build_request_params,
-                api_ctx,
-            )
-        except Exception as e:
-            # Логируем детально до ретрая
-            context.log.error(
-                "[wb_call] ERROR during %s.%s: %r; req_keys=%s",
-                spec.client_resource_key, spec.bronze.fetch_method, e, list(req_params_raw.keys()),
-            )
-            raise
-
-        status = int(resp.get("status", 0))
-        response_dttm = resp.get("response_dttm") or datetime.now(MSK)
-
-        # Гарантируем корректные request_parameters/request_body из аудита транспорта
-        # 1) Пробуем взять «как ушло» из WBResponse.request (audit уровня клиента)
-        _audit = resp.get("request") or {}
-        _query_from_audit = _audit.get("query") if isinstance(_audit, dict) else None
-        _body_from_audit  = _audit.get("json_body") if isinstance(_audit, dict) else None
-
-        # 2) Собираем финальные значения с умными fallback-ами
-        final_request_parameters = (
-            _query_from_audit
-            or resp.get("request_parameters")
-            or req_params_sanitized
-            or {}
-        )
-        final_request_body = (
-            _body_from_audit
-            or resp.get("request_body")
-        )
-
-        # 3) Санитизация (уберём токены/секреты на всякий случай)
-        final_request_parameters = _scrub_params(final_request_parameters)
-        if final_request_body is not None:
-            final_request_body = _scrub_params(final_request_body)
-
-        # 4) Кладём в структуру, которую пойдёт в persist_bronze
-        resp_to_persist = dict(resp)
-        resp_to_persist["run_dttm"] = run_dttm
-        resp_to_persist["request_parameters"] = final_request_parameters
-        if final_request_body is not None:
-            resp_to_persist["request_body"] = final_request_body
-        else:
-            resp_to_persist.pop("request_body", None)
+        # Предпросмотр параметров (диагностика) → вызов API → запись в бронзу
+        req_params_raw = await _preview_request_params(context, spec, business_dttm, company_id)
+        resp_to_persist = await _call_and_prepare_bronze(context, spec, api_ctx, req_params_raw, run_dttm)
 
-        resp_to_persist["request_dttm"] = (req_started_at or
-                resp.get("request_dttm") or resp.get("requested_at")
-        )
-        resp_to_persist["receive_dttm"] = datetime.now(MSK)
-
-        context.log.debug(
-            "[bronze persist] request_parameters=%s; request_body=%s; request_dttm=%s; receive_dttm=%s",
-            str(final_request_parameters)[:1000],
-            ("<present>" if final_request_body is not None else "<absent>"),
-            resp_to_persist["request_dttm"],
-            resp_to_persist["receive_dttm"],
-        )
+        status = int(resp_to_persist.get("status", 0))
+        response_dttm = resp_to_persist.get("response_dttm") or datetime.now(MSK)
 
         request_uuid = await spec.bronze.persist_bronze(
             context, spec.bronze.bronze_table, api_ctx, resp_to_persist
@@ -391,6 +473,137 @@ def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
         )
         yield Output(value=None, metadata=md)
 
+    async def _bronze_batched(context):
+        partitions = extract_partitions(context)
+        run_dttm = datetime.now(MSK)
+
+        done = await _bronze_done_in_run(context, spec)
+        todo = [p for p in partitions if p not in done]
+        context.log.info(
+            f"[bronze__{spec.bronze.name}] batched: partitions={len(partitions)} "
+            f"already_ok={len(partitions) - len(todo)} concurrency={batch.concurrency}"
+        )
+
+        # Токены резолвим один раз на компанию
+        auth: Dict[int, Tuple[Optional[int], Optional[str]]] = {}
+        for cid in sorted({cid for _, cid in todo}):
+            auth[cid] = await spec.bronze.resolve_auth(context, cid)
+
+        pacer = TokenPacer(batch.per_token_rps)
+        sem = asyncio.Semaphore(max(1, batch.concurrency))
+
+        async def _one(client, business_dttm: datetime, company_id: int):
+            token_id, token = auth[company_id]
+            api_ctx = BronzeApiContext(
+                business_dttm=business_dttm, company_id=company_id,
+                token_id=token_id, token=token, run_uuid=context.run_id,
+            )
+            if not token:
+                context.log.warning(f"[bronze__{spec.bronze.name}] no token for company_id={company_id}")
+                return api_ctx, None
+            async with sem:
+                for attempt in range(max(0, batch.retry_max) + 1):
+                    await pacer.wait(token_id)
+                    req_params_raw = await _preview_request_params(context, spec, business_dttm, company_id)
+                    try:
+                        resp = await _call_and_prepare_bronze(
+                            context, spec, api_ctx, req_params_raw, run_dttm, client=client,
+                        )
+                    except Exception as e:
+                        now = datetime.now(MSK)
+                        resp = {
+                            "status": 500, "response_body": repr(e), "run_dttm": run_dttm,
+                            "request_parameters": _scrub_params(req_params_raw),
+                            "request_dttm": now, "response_dttm": now, "receive_dttm": now,
+                        }
+                    if int(resp.get("status", 0)) != 429 or attempt >= batch.retry_max:
+                        break
+                    # 429: ждём столько, сколько просит WB, — весь токен, не только эту партицию
+                    h = _lower_headers(resp.get("headers"))
+                    delay = _hdr_float(h, "x-ratelimit-retry", "retry-after", "x-ratelimit-reset")
+                    delay = batch.retry_fallback_sec if delay is None else delay
+                    pacer.penalize(token_id, delay)
+                    context.log.warning(
+                        f"[bronze__{spec.bronze.name}] 429 company_id={company_id} biz={business_dttm.date()}; "
+                        f"retry {attempt + 1}/{batch.retry_max} in {delay:g}s"
+                    )
+            return api_ctx, resp
+
+        failed: List[str] = []
+        ok = 0
+        step = max(1, batch.persist_chunk_size)
+        pending: List[Tuple[BronzeApiContext, Dict[str, Any]]] = []
+
+        async def _flush() -> None:
+            # Бронза пишется по мере готовности ответов: при падении рана
+            # записанное не теряется и пропускается при повторе (_bronze_done_in_run)
+            nonlocal ok
+            chunk = pending[:]
+            pending.clear()
+            uuids = await spec.bronze.persist_bronze_many(context, spec.bronze.bronze_table, chunk)
+            for (api_ctx, resp), req_uuid in zip(chunk, uuids):
+                status = int(resp.get("status", 0))
+                if 200 <= status < 300 and req_uuid:
+                    ok += 1
+                else:
+                    failed.append(
+                        f"{api_ctx.business_dttm.date()}|{api_ctx.company_id}:{status if req_uuid else 'not_persisted'}"
+                    )
+
+        async def _drain(client) -> None:
+            for fut in asyncio.as_completed([_one(client, b, c) for b, c in todo]):
+                api_ctx, resp = await fut
+                if resp is None:
+                    failed.append(f"{api_ctx.business_dttm.date()}|{api_ctx.company_id}:no_token")
+                    continue
+                pending.append((api_ctx, resp))
+                if len(pending) >= step:
+                    await _flush()
+            if pending:
+                await _flush()
+
+        # Одна HTTP-сессия на весь ран (токен передаётся в каждый запрос через token_override)
+        client_res = getattr(context.resources, spec.client_resource_key)
+        if hasattr(client_res, "__aenter__"):
+            async with client_res as client:
+                await _drain(client)
+        else:
+            await _drain(client_res)
+
+        md = {
+            "partitions": MetadataValue.int(len(partitions)),
+            "ok": MetadataValue.int(ok + len(partitions) - len(todo)),
+            "failed": MetadataValue.int(len(failed)),
+            "failed_partitions": MetadataValue.json(failed[:200]),
+        }
+        yield Output(value=None, metadata=md)
+
+        if failed:
+            raise Failure(
+                description=(
+                    f"bronze__{spec.bronze.name}: {len(failed)} из {len(partitions)} партиций без успешного ответа. "
+                    f"Аудит записан; при повторе успешные партиции пропускаются."
+                )
+            )
+
+    @asset(
+        name=f"bronze__{spec.bronze.name}",
+        key_prefix=["bronze"],
+        partitions_def=spec.bronze.partitions_def,
+        required_resource_keys=set(spec.bronze.required_resource_keys) | {spec.client_resource_key},
+        retry_policy=spec.bronze.op_retry_policy,
+        backfill_policy=backfill_policy,
+        op_tags=bronze_tags,
+        description=(
+            "Вызов WB API → запись аудита и сырых данных в Bronze. "
+            "При статусе не 2xx: аудит пишется, затем ассет падает Failure (включаются ретраи Dagster)."
+        ),
+    )
+    async def bronze_asset(context) -> Output[None]:
+        body = _bronze_batched(context) if batch else _bronze_single(context)
+        async for event in body:
+            yield event
+
     assets: List[AssetsDefinition] = [bronze_asset]
 
     # ---------------- Silver fan-out ----------------
@@ -398,24 +611,11 @@ def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
         silver_tags = merge_tags(base_tags, merge_tags(spec.op_tags, s.op_tags))
 
         def _make_silver_asset(s: SilverSpec, silver_tags: Dict[str, str]):
-            @asset(
-                name=f"silver__{s.name}",
-                key_prefix=["silver"],
-                partitions_def=s.partitions_def,
-                required_resource_keys=set(s.required_resource_keys),
-                # Оркестрационная зависимость от бронзы, без передачи значения
-                deps=[bronze_asset.key],
-                op_tags=silver_tags,
-                description=(
-                    "Берёт «лучшую» успешную запись из Bronze для партиции, нормализует и делает upsert в Silver. "
-                    "Если успешной бронзы нет — пропускает без ошибки."
-                ),
-            )
-            async def silver_asset(context) -> Optional[int]:
-                business_dttm, company_id = extract_partition(context)
-
+            async def _materialize_partition(context, business_dttm: datetime, company_id: int, auth_cache: Dict[int, Any]):
                 # Для унификации контекста: резолвим токен (нормализатору обычно не нужен)
-                token_id, token = await spec.bronze.resolve_auth(context, company_id)
+                if company_id not in auth_cache:
+                    auth_cache[company_id] = await spec.bronze.resolve_auth(context, company_id)
+                token_id, token = auth_cache[company_id]
                 api_ctx = BronzeApiContext(
                     business_dttm=business_dttm,
                     company_id=company_id,
@@ -430,7 +630,7 @@ def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
                         f"[silver__{s.name}] ещё нет успешной бронзы для company_id={company_id} "
                         f"biz={business_dttm.date()} — пропуск."
                     )
-                    return None
+                    return None, None
 
                 # нормализация → типизация → upsert
                 try:
@@ -487,13 +687,51 @@ def make_sync_api_assets(spec: SyncApiPipelineSpec) -> List[AssetsDefinition]:
 
                 if not prepared:
                     context.log.warning(f"[silver__{s.name}] пустой результат нормализации — пропуск.")
-                    return 0
+                    return 0, best
 
                 try:
                     written = int(await s.persist_silver(context, prepared) or 0)
                 except Exception as e:
                     context.log.error(f"[silver__{s.name}] persist error: {e!r}")
                     raise
+                return written, best
+
+            @asset(
+                name=f"silver__{s.name}",
+                key_prefix=["silver"],
+                partitions_def=s.partitions_def,
+                required_resource_keys=set(s.required_resource_keys),
+                # Оркестрационная зависимость от бронзы, без передачи значения
+                deps=[bronze_asset.key],
+                backfill_policy=backfill_policy,
+                op_tags=silver_tags,
+                description=(
+                    "Берёт «лучшую» успешную запись из Bronze для партиции, нормализует и делает upsert в Silver. "
+                    "Если успешной бронзы нет — пропускает без ошибки."
+                ),
+            )
+            async def silver_asset(context) -> Optional[int]:
+                auth_cache: Dict[int, Any] = {}
+
+                if batch:
+                    partitions = extract_partitions(context)
+                    total, skipped = 0, 0
+                    for business_dttm, company_id in partitions:
+                        written, _best = await _materialize_partition(context, business_dttm, company_id, auth_cache)
+                        if written is None:
+                            skipped += 1
+                        total += int(written or 0)
+                    context.add_output_metadata({
+                        "rows": MetadataValue.int(total),
+                        "partitions": MetadataValue.int(len(partitions)),
+                        "skipped_no_bronze": MetadataValue.int(skipped),
+                    })
+                    return total
+
+                business_dttm, company_id = extract_partition(context)
+                written, best = await _materialize_partition(context, business_dttm, company_id, auth_cache)
+                if not written:
+                    return written
 
                 context.add_output_metadata({
                     "rows": MetadataValue.int(written),
@@ -536,12 +774,16 @@ def build_assets(
         * (опц.) build_request_params: callable|str               # если не задано — берём api.request
         * (опц.) api.request: { query/body/headers } с шаблонами  # {{ business_dttm|... }}, {{ company_id }}
         * (опц.) op_tags / bronze_op_tags / silver_op_tags: dict
+        * (опц.) execution: { mode: single|batched, max_partitions_per_run, concurrency, per_token_rps, persist_chunk_size }
+          — batched: один ран на диапазон партиций; rps на токен — execution.per_token_rps
+            (по умолчанию api.rate_limit.rps); 429 повторяется api.retry.max раз с паузой
+            по X-Ratelimit-Retry / Retry-After (api.retry.backoff_sec — если заголовков нет)
     - model_bundle:
         * bronze_model: SQLAlchemy-модель
         * silver_models: dict[str, Model] — {silver_name -> модель}
         * silver_pk: dict[str, tuple[str, ...]]
         * normalizers: dict[str, Normalizer]
-        * (опц.) resolve_auth / select_best_bronze / persist_bronze / persist_silver
+        * (опц.) resolve_auth / select_best_bronze / persist_bronze / persist_bronze_many / persist_silver
     """
     # --- партиционирование ---
     partitions_def: Optional[MultiPartitionsDefinition] = pipe_cfg.get("partitions_def")
@@ -616,6 +858,32 @@ def build_assets(
     persist_bronze_cb = asyncify(model_bundle.get("persist_bronze") or default_persist_bronze)
     persist_silver_map: Dict[str, Callable] = model_bundle.get("persist_silver", {}) or {}
 
+    # --- режим исполнения ---
+    exec_cfg = pipe_cfg.get("execution") or {}
+    mode = str(exec_cfg.get("mode") or "single").lower()
+    if mode not in ("single", "batched"):
+        raise ValueError(f"{pipe_name}: неизвестный execution.mode={mode!r} (single|batched)")
+
+    batch_spec: Optional[BatchExecutionSpec] = None
+    persist_bronze_many_cb = None
+    if mode == "batched":
+        batch_spec = BatchExecutionSpec(
+            max_partitions_per_run=int(exec_cfg.get("max_partitions_per_run", 200)),
+            concurrency=int(exec_cfg.get("concurrency", 8)),
+            per_token_rps=float(exec_cfg.get("per_token_rps") or (api_cfg.get("rate_limit") or {}).get("rps", 1)),
+            persist_chunk_size=int(exec_cfg.get("persist_chunk_size", 100)),
+            retry_max=int((api_cfg.get("retry") or {}).get("max", 0)),
+            retry_fallback_sec=float((api_cfg.get("retry") or {}).get("backoff_sec", 60.0)),
+        )
+        if model_bundle.get("persist_bronze_many"):
+            persist_bronze_many_cb = asyncify(model_bundle["persist_bronze_many"])
+        elif model_bundle.get("persist_bronze"):
+            # кастомная запись бронзы — сохраняем её семантику, вызывая поштучно
+            async def persist_bronze_many_cb(context, table_name, items):
+                return [await persist_bronze_cb(context, table_name, a, r) for a, r in items]
+        else:
+            persist_bronze_many_cb = default_persist_bronze_many
+
     # --- BronzeSpec ---
     bronze_spec = BronzeSpec(
         name=pipe_name,
@@ -629,6 +897,8 @@ def build_assets(
         bronze_table=bronze_table,
         required_resource_keys=("postgres", client_resource_key),
         op_tags=pipe_cfg.get("bronze_op_tags", {}) or {},
+        batch=batch_spec,
+        persist_bronze_many=persist_bronze_many_cb,
     )
 
     # --- SilverSpec list (fan-out) ---
@@ -661,7 +931,9 @@ def build_assets(
         if normalizer is None:
             raise ValueError(f"Не найден нормализатор для silver '{silver_name}'")
 
-        normalize_cb = asyncify(normalize_wrapper(normalizer))
+        st = (silver_tables_cfg.get(silver_key) or silver_tables_cfg.get(silver_name) or {})
+        execution = parse_normalizer_execution(st, target=f"{pipe_name}:{silver_name}")
+        normalize_cb = asyncify(normalize_wrapper(normalizer, execution))
 
         # корректное имя таблицы с учётом схемы
         _tbl = silver_model.__table__
@@ -8,16 +8,19 @@ from datetime import datetime, timedelta
 from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Awaitable
 from contextlib import asynccontextmanager
 
+from aiohttp import ClientResponseError
 from dagster import (
     asset,
     AssetsDefinition,
     AssetIn,
+    BackfillPolicy,
     Output,
     Failure,
     RetryPolicy,
     MultiPartitionsDefinition,
     MetadataValue,
 )
+import sqlalchemy as sa
 
 # Партиции — если билдер не передал готовый объект, построим из pipe_cfg
 from dagster_conf.lib.partitions import build_multipartitions
@@ -26,6 +29,7 @@ from dagster_conf.lib.partitions import build_multipartitions
 from dagster_conf.lib.asset_factories.factory_utils import (
     MSK,
     extract_partition,                # строгий разбор MultiPartitionKey → (business_dttm, company_id)
+    extract_partitions,               # все партиции рана (для пакетного режима)
     merge_tags,                       # объединение op_tags
     bronze_output_metadata,           # стандартные метаданные для Bronze materialization
     default_resolve_auth,             # (token_id, token) по company_id
@@ -38,6 +42,25 @@ from dagster_conf.lib.asset_factories.factory_utils import (
     as_unified_resp,
 )
 
+# Запуск нормализаторов в пуле процессов (silver.targets.<t>.normalize)
+from dagster_conf.lib.normalizer_pool import parse_normalizer_execution
+
+# Пакетный режим и пейсинг токенов — общие с sync_api
+from dagster_conf.lib.asset_factories.sync_api_assets_factory import BatchExecutionSpec, TokenPacer
+
+# Жизненный цикл задач WB: состояние по партиции + адаптивный опрос
+from dagster_conf.lib.asset_factories.task_lifecycle import (
+    AdaptivePolling,
+    TaskStateStore,
+    TASK_STATE_TABLE,
+    STATE_SUBMITTED,
+    STATE_READY,
+    STATE_DOWNLOADED,
+    STATE_FAILED,
+    STATE_EXPIRED,
+    polling_from_config,
+)
+
 # ---------------------------
 #   Спецификации (dataclass)
 # ---------------------------
@@ -89,6 +112,13 @@ class TaskBronzeSpec:
     op_retry_policy: RetryPolicy = field(default_factory=lambda: RetryPolicy(max_retries=3, delay=60))
     op_tags: Dict[str, str] = field(default_factory=dict)
 
+    # адаптивный опрос (None — фиксированный poll_interval_sec) и хранилище task_id для resume
+    polling: Optional[AdaptivePolling] = None
+    state_store: Optional[TaskStateStore] = None
+
+    # пакетный режим (None — одна партиция на ран)
+    batch: Optional[BatchExecutionSpec] = None
+
 
 @dataclass
 class TaskSilverSpec:
@@ -138,6 +168,23 @@ async def _maybe_client_ctx(client):
         yield client
 
 
+async def _bronze_done_in_run(context, bronze_table: str) -> set:
+    """(business_dttm, company_id) с успешной бронзой в текущем ране — не перевыгружаем при ретрае."""
+    if not getattr(context, "retry_number", 0):
+        return set()
+    async with context.resources.postgres() as session:
+        res = await session.execute(
+            sa.text(f"""
+                SELECT DISTINCT business_dttm, company_id
+                  FROM {bronze_table}
+                 WHERE run_uuid = :run
+                   AND response_code BETWEEN 200 AND 299
+            """),
+            {"run": context.run_id},
+        )
+        return {(biz.astimezone(MSK), int(cid)) for biz, cid in res.fetchall()}
+
+
 def make_task_poll_download_assets(spec: TaskPollPipelineSpec) -> List[AssetsDefinition]:
     """
     Создаёт 1 Bronze (submit→poll→download) и N Silver ассетов.
@@ -166,54 +213,59 @@ def make_task_poll_download_assets(spec: TaskPollPipelineSpec) -> List[AssetsDef
         return {}, None
 
     base_tags = {"factory": "task_poll_download", "pipe": spec.pipe_name}
-
-    # ---------- Bronze ----------
-    bronze_tags = merge_tags(base_tags, merge_tags(spec.op_tags, spec.bronze.op_tags))
-
-    @asset(
-        name=f"bronze__{spec.bronze.name}",
-        key_prefix=["bronze"],
-        partitions_def=spec.bronze.partitions_def,
-        required_resource_keys=set(spec.bronze.required_resource_keys) | {spec.client_resource_key},
-        retry_policy=spec.bronze.op_retry_policy,
-        op_tags=bronze_tags,
-        description=(
-            "WB submit → poll(status) → download; пишет аудит и сырые данные в Bronze. "
-            "Если статус ответа не 2xx — ассет падает Failure (Dagster ретраит партицию)."
-        ),
+    b = spec.bronze
+    polling = b.polling or AdaptivePolling(
+        initial_interval_sec=float(b.poll_interval_sec),
+        backoff_factor=1.0,
+        max_interval_sec=float(b.poll_interval_sec),
+        timeout_sec=int(b.poll_timeout_sec),
     )
-    async def bronze_asset(context) -> Output[None]:
-        business_dttm, company_id = extract_partition(context)
-        token_id, token = await spec.bronze.resolve_auth(context, company_id)
-        run_dttm = datetime.now(MSK)
-        api_ctx = BronzeApiContext(
-            business_dttm=business_dttm,
-            company_id=company_id,
-            token_id=token_id,
-            token=token,
-            run_uuid=context.run_id,
-        )
-
-        if not token:
-            md = bronze_output_metadata(api_ctx, request_uuid="", status=401, response_dttm=datetime.now(MSK))
-            yield Output(value=None, metadata=md)
-            raise Failure(f"No WB token for company_id={company_id}")
+    store = b.state_store
+    batch = b.batch
+    backfill_policy = BackfillPolicy.multi_run(batch.max_partitions_per_run) if batch else None
 
-        client_obj = getattr(context.resources, spec.client_resource_key)
-        if not hasattr(client_obj, spec.bronze.submit_method):
-            raise Failure(f"Client '{spec.client_resource_key}' has no method '{spec.bronze.submit_method}'")
-        if not hasattr(client_obj, spec.bronze.status_method):
-            raise Failure(f"Client '{spec.client_resource_key}' has no method '{spec.bronze.status_method}'")
-        if not hasattr(client_obj, spec.bronze.download_method):
-            raise Failure(f"Client '{spec.client_resource_key}' has no method '{spec.bronze.download_method}'")
+    def _extract_task_id(payload: Any) -> Optional[Any]:
+        if not isinstance(payload, dict):
+            return None
+        if "data" in payload:
+            return (payload.get("data") or {}).get("taskId")
+        return payload.get("taskId")
+
+    async def _task_flow(
+        context, client, api_ctx: BronzeApiContext, run_dttm: datetime,
+        pacer: Optional[TokenPacer] = None, request_pacer: Optional[TokenPacer] = None,
+    ) -> Tuple[str, int, datetime, Optional[str]]:
+        """
+        submit (или resume) → adaptive poll → download для одной партиции.
+        Бронза (аудит) пишется в любом исходе. Возвращает (request_uuid, status, response_dttm, error|None).
+        pacer — лимит submit на токен, request_pacer — общий лимит всех запросов токена (пакетный режим).
+        """
+        business_dttm, company_id, token = api_ctx.business_dttm, api_ctx.company_id, api_ctx.token
+
+        submit_fn = getattr(client, b.submit_method)
+        status_fn = getattr(client, b.status_method)
+        download_fn = getattr(client, b.download_method)
+
+        submit_sig = inspect.signature(submit_fn)
+        status_sig = inspect.signature(status_fn)
+        download_sig = inspect.signature(download_fn)
 
         # строим submit-параметры
-        submit_params = spec.bronze.build_request_params(business_dttm, company_id) or {}
+        submit_params = b.build_request_params(business_dttm, company_id) or {}
         alias_map = {"dateFrom": "date_from", "dateTo": "date_to"}
         submit_params = {alias_map.get(k, k): v for k, v in submit_params.items()}
         if "token" in submit_params:
             submit_params["token_override"] = submit_params.pop("token")
 
+        # фильтруем kwargs по сигнатуре submit
+        submit_params = {k: v for k, v in submit_params.items() if k in submit_sig.parameters}
+        if "token_override" in submit_sig.parameters and "token_override" not in submit_params and token:
+            submit_params["token_override"] = token
+
+        # kwargs для status/download
+        status_kwargs = {"token_override": token} if "token_override" in status_sig.parameters else {}
+        download_kwargs = {"token_override": token} if "token_override" in download_sig.parameters else {}
+
         now_msk = datetime.now(MSK)
         flow_started_at = now_msk  # request_dttm всего потока
 
@@ -222,168 +274,299 @@ def make_task_poll_download_assets(spec: TaskPollPipelineSpec) -> List[AssetsDef
         submit_body_from_audit: str | None = None
         poll_params_from_audit: dict | None = None
 
-        async with _maybe_client_ctx(client_obj) as client:
-            submit_fn = getattr(client, spec.bronze.submit_method)
-            status_fn = getattr(client, spec.bronze.status_method)
-            download_fn = getattr(client, spec.bronze.download_method)
-
-            submit_sig = inspect.signature(submit_fn)
-            status_sig = inspect.signature(status_fn)
-            download_sig = inspect.signature(download_fn)
+        async def _persist(resp: Dict[str, Any]) -> str:
+            return await b.persist_bronze(context, b.bronze_table, api_ctx, resp)
 
-            # фильтруем kwargs по сигнатуре submit
-            submit_params = {k: v for k, v in submit_params.items() if k in submit_sig.parameters}
-            if "token_override" in submit_sig.parameters and "token_override" not in submit_params and token:
-                submit_params["token_override"] = token
+        async def _paced(call, *args, submit: bool = False, **kwargs):
+            # в пакетном режиме submit, опрос и download одного токена идут через общий пейсер
+            if submit and pacer is not None:
+                await pacer.wait(api_ctx.token_id)
+            if request_pacer is not None:
+                await request_pacer.wait(api_ctx.token_id)
+            return await call(*args, **kwargs)
 
+        async def _save_state(task_id, state: str, last_status: Optional[str] = None, submitted: bool = False):
+            if store is None:
+                return
             try:
-                # --- SUBMIT ---
-                submit_resp = await submit_fn(**submit_params)
+                await store.save(
+                    context, spec.pipe_name, business_dttm, company_id,
+                    task_id=task_id, state=state, last_status=last_status, submitted=submitted,
+                )
+            except Exception as e:
+                # состояние — оптимизация ретраев, его недоступность не должна ронять выгрузку
+                context.log.warning(f"[{spec.pipe_name}] task state not saved: {e!r}")
+
+        try:
+            # --- RESUME или SUBMIT ---
+            task_id = None
+            resumed = None
+            if store is not None:
+                try:
+                    resumed = await store.resumable(
+                        context, spec.pipe_name, business_dttm, company_id, ttl_sec=polling.resume_ttl_sec,
+                    )
+                except Exception as e:
+                    context.log.warning(f"[{spec.pipe_name}] task state not loaded: {e!r}")
+
+            if resumed:
+                task_id = resumed["task_id"]
+                submit_params_from_audit = {"resumed_task_id": task_id, **_scrub_params(submit_params)}
+                context.log.info(
+                    f"[{spec.pipe_name}] resume task_id={task_id} state={resumed['state']} "
+                    f"company_id={company_id} biz={business_dttm.date()}"
+                )
+            else:
+                submit_resp = await _paced(submit_fn, submit=True, **submit_params)
                 submit_params_from_audit, submit_body_from_audit = _extract_from_resp(submit_resp)
                 status_code, payload, headers, resp_dt = as_unified_resp(submit_resp, default_dt=now_msk)
 
-                task_id = (
-                    (payload.get("data") or {}).get("taskId")
-                    if isinstance(payload, dict) and "data" in payload
-                    else (payload.get("taskId") if isinstance(payload, dict) else None)
-                )
+                task_id = _extract_task_id(payload)
                 if not task_id:
-                    request_uuid = await spec.bronze.persist_bronze(
-                        context,
-                        spec.bronze.bronze_table,
-                        api_ctx,
-                        {
-                            "status": int(status_code),
-                            "payload": {"error": "taskId not found in submit response", "payload": payload},
-                            "headers": headers,
-                            "request_dttm": flow_started_at,
-                            "response_dttm": resp_dt,
-                            "receive_dttm": resp_dt,
-                            "request_parameters": submit_params_from_audit or _scrub_params(submit_params),
-                            "request_body": submit_body_from_audit,
-                        },
+                    request_uuid = await _persist({
+                        "status": int(status_code),
+                        "payload": {"error": "taskId not found in submit response", "payload": payload},
+                        "headers": headers,
+                        "request_dttm": flow_started_at,
+                        "response_dttm": resp_dt,
+                        "receive_dttm": resp_dt,
+                        "request_parameters": submit_params_from_audit or _scrub_params(submit_params),
+                        "request_body": submit_body_from_audit,
+                    })
+                    return request_uuid, int(status_code), resp_dt, (
+                        f"taskId not found in submit response; company_id={company_id}"
                     )
-                    md = bronze_output_metadata(api_ctx, request_uuid, int(status_code), resp_dt)
-                    yield Output(value=None, metadata=md)
-                    raise Failure(f"taskId not found in submit response; company_id={company_id}")
-
-                # kwargs для status/download
-                status_kwargs = {"token_override": token} if "token_override" in status_sig.parameters else {}
-                download_kwargs = {"token_override": token} if "token_override" in download_sig.parameters else {}
-
-                # --- POLL ---
-                deadline = now_msk.timestamp() + int(spec.bronze.poll_timeout_sec)
-                while True:
-                    poll_raw = await status_fn(task_id, **status_kwargs)
-                    poll_params_from_audit, _ = _extract_from_resp(poll_raw)
-                    poll_code, poll_payload, poll_headers, poll_dt = as_unified_resp(poll_raw, default_dt=now_msk)
-                    state = spec.bronze.extract_status(poll_payload) or ""
-                    context.log.info(f"[{spec.pipe_name}] task_id={task_id} status={state}")
-
-                    if state in spec.bronze.done_status_values:
-                        break
-                    if state in spec.bronze.error_status_values:
-                        request_uuid = await spec.bronze.persist_bronze(
-                            context,
-                            spec.bronze.bronze_table,
-                            api_ctx,
-                            {
-                                "status": int(poll_code) if poll_code else 500,
-                                "payload": {"error": f"WB task failed with status={state}", "payload": poll_payload},
-                                "headers": poll_headers,
-                                "request_dttm": flow_started_at,
-                                "response_dttm": poll_dt,
-                                "receive_dttm": poll_dt,
-                                "request_parameters": (poll_params_from_audit or {"taskId": task_id}),
-                            },
-                        )
-                        md = bronze_output_metadata(api_ctx, request_uuid, int(poll_code or 500), poll_dt)
-                        yield Output(value=None, metadata=md)
-                        raise Failure(f"WB task failed with status={state}")
-
-                    if datetime.now(MSK).timestamp() > deadline:
-                        request_uuid = await spec.bronze.persist_bronze(
-                            context,
-                            spec.bronze.bronze_table,
-                            api_ctx,
-                            {
-                                "status": 504,
-                                "payload": {"error": "polling timeout", "last_payload": poll_payload},
-                                "headers": poll_headers,
-                                "request_dttm": flow_started_at,
-                                "response_dttm": poll_dt,
-                                "receive_dttm": poll_dt,
-                                "request_parameters": (poll_params_from_audit or {"taskId": task_id}),
-                            },
-                        )
-                        md = bronze_output_metadata(api_ctx, request_uuid, 504, poll_dt)
-                        yield Output(value=None, metadata=md)
-                        raise Failure("WB task polling timeout")
-
-                    await asyncio.sleep(int(spec.bronze.poll_interval_sec))
-
-                # --- DOWNLOAD ---
-                download_raw = await download_fn(task_id, **download_kwargs)
-                download_params_from_audit, _ = _extract_from_resp(download_raw)
-                dl_code, dl_payload, dl_headers, dl_dt = as_unified_resp(download_raw, default_dt=now_msk)
-                dl_recv = getattr(download_raw, "received_at", None) or datetime.now(MSK)
-
-                final_request_parameters = {
-                    "submit": submit_params_from_audit or {},
-                    "status": poll_params_from_audit or {"taskId": task_id},
-                    "download": download_params_from_audit or {"taskId": task_id},
-                }
-                final_request_body = submit_body_from_audit
-
-                request_uuid = await spec.bronze.persist_bronze(
-                    context,
-                    spec.bronze.bronze_table,
-                    api_ctx,
-                    {
-                        "status": int(dl_code),
-                        "payload": dl_payload,
-                        "headers": dl_headers,
-                        "run_dttm": run_dttm,
+                await _save_state(task_id, STATE_SUBMITTED, submitted=True)
+
+            # --- POLL (адаптивный интервал) ---
+            deadline = datetime.now(MSK).timestamp() + int(polling.timeout_sec)
+            delays = polling.delays()
+            while True:
+                try:
+                    poll_raw = await _paced(status_fn, task_id, **status_kwargs)
+                except ClientResponseError as e:
+                    if e.status != 404:
+                        raise
+                    # WildberriesAsyncClient бросает исключение на любой статус >= 400:
+                    # 404 — задача неизвестна WB (протухла), опрашивать её дальше бессмысленно
+                    await _save_state(task_id, STATE_EXPIRED, last_status="404")
+                    err_dt = datetime.now(MSK)
+                    request_uuid = await _persist({
+                        "status": 404,
+                        "payload": {"error": f"WB task expired (404): {e.message}", "taskId": task_id},
+                        "headers": dict(e.headers or {}),
+                        "request_dttm": flow_started_at,
+                        "response_dttm": err_dt,
+                        "receive_dttm": err_dt,
+                        "request_parameters": {"taskId": task_id},
+                    })
+                    return request_uuid, 404, err_dt, (
+                        f"WB task {task_id} expired (404); следующий ретрай поставит новую задачу"
+                    )
+                poll_params_from_audit, _ = _extract_from_resp(poll_raw)
+                poll_code, poll_payload, poll_headers, poll_dt = as_unified_resp(poll_raw, default_dt=now_msk)
+                state = b.extract_status(poll_payload) or ""
+                context.log.info(f"[{spec.pipe_name}] task_id={task_id} status={state}")
+
+                if state in b.done_status_values:
+                    await _save_state(task_id, STATE_READY, last_status=state)
+                    break
+                if state in b.error_status_values or int(poll_code or 0) == 404:
+                    # клиенты, возвращающие статус без исключения: 404 — задача протухла, ретрай поставит новую
+                    await _save_state(task_id, STATE_FAILED if state else STATE_EXPIRED, last_status=state or str(poll_code))
+                    request_uuid = await _persist({
+                        "status": int(poll_code) if poll_code else 500,
+                        "payload": {"error": f"WB task failed with status={state or poll_code}", "payload": poll_payload},
+                        "headers": poll_headers,
                         "request_dttm": flow_started_at,
-                        "response_dttm": dl_dt,
-                        "receive_dttm": dl_recv,
-                        "request_parameters": final_request_parameters,
-                        "request_body": final_request_body,
-                    },
+                        "response_dttm": poll_dt,
+                        "receive_dttm": poll_dt,
+                        "request_parameters": (poll_params_from_audit or {"taskId": task_id}),
+                    })
+                    return request_uuid, int(poll_code or 500), poll_dt, f"WB task failed with status={state or poll_code}"
+
+                if datetime.now(MSK).timestamp() > deadline:
+                    # задачу не помечаем завершённой — ретрай продолжит её опрашивать
+                    request_uuid = await _persist({
+                        "status": 504,
+                        "payload": {"error": "polling timeout", "last_payload": poll_payload},
+                        "headers": poll_headers,
+                        "request_dttm": flow_started_at,
+                        "response_dttm": poll_dt,
+                        "receive_dttm": poll_dt,
+                        "request_parameters": (poll_params_from_audit or {"taskId": task_id}),
+                    })
+                    return request_uuid, 504, poll_dt, "WB task polling timeout"
+
+                await asyncio.sleep(next(delays))
+
+            # --- DOWNLOAD ---
+            download_raw = await _paced(download_fn, task_id, **download_kwargs)
+            download_params_from_audit, _ = _extract_from_resp(download_raw)
+            dl_code, dl_payload, dl_headers, dl_dt = as_unified_resp(download_raw, default_dt=now_msk)
+            dl_recv = getattr(download_raw, "received_at", None) or datetime.now(MSK)
+
+            final_request_parameters = {
+                "submit": submit_params_from_audit or {},
+                "status": poll_params_from_audit or {"taskId": task_id},
+                "download": download_params_from_audit or {"taskId": task_id},
+            }
+            final_request_body = submit_body_from_audit
+
+            request_uuid = await _persist({
+                "status": int(dl_code),
+                "payload": dl_payload,
+                "headers": dl_headers,
+                "run_dttm": run_dttm,
+                "request_dttm": flow_started_at,
+                "response_dttm": dl_dt,
+                "receive_dttm": dl_recv,
+                "request_parameters": final_request_parameters,
+                "request_body": final_request_body,
+            })
+
+            if int(dl_code) < 200 or int(dl_code) >= 300:
+                # READY остаётся — ретрай повторит только download
+                return request_uuid, int(dl_code), dl_dt, (
+                    f"bronze__{b.name}: статус download != 2xx (response_code={dl_code}). "
+                    f"Аудит записан; инициируем повтор согласно RetryPolicy."
                 )
-                md = bronze_output_metadata(api_ctx, request_uuid, int(dl_code), dl_dt)
 
-                if int(dl_code) < 200 or int(dl_code) >= 300:
-                    yield Output(value=None, metadata=md)
-                    raise Failure(
-                        f"bronze__{spec.bronze.name}: статус download != 2xx (response_code={dl_code}). "
-                        f"Аудит записан; инициируем повтор согласно RetryPolicy."
-                    )
+            await _save_state(task_id, STATE_DOWNLOADED, last_status=str(dl_code))
+            context.log.info(
+                f"[bronze__{b.name}] OK company_id={company_id} biz={business_dttm.date()} status={dl_code}"
+            )
+            return request_uuid, int(dl_code), dl_dt, None
+
+        except Exception as e:
+            request_uuid = await _persist({
+                "status": 500,
+                "payload": {"error": f"unhandled task flow error: {e!s}"},
+                "headers": {},
+                "request_dttm": flow_started_at,
+                "response_dttm": now_msk,
+                "receive_dttm": now_msk,
+                "request_parameters": submit_params_from_audit or _scrub_params(submit_params),
+                "request_body": submit_body_from_audit,
+            })
+            return request_uuid, 500, now_msk, f"Unhandled task flow error: {e!s}"
 
-                context.log.info(
-                    f"[bronze__{spec.bronze.name}] OK company_id={company_id} biz={business_dttm.date()} status={dl_code}"
+    def _check_client(client_obj) -> None:
+        for method in (b.submit_method, b.status_method, b.download_method):
+            if not hasattr(client_obj, method):
+                raise Failure(f"Client '{spec.client_resource_key}' has no method '{method}'")
+
+    # ---------- Bronze ----------
+    bronze_tags = merge_tags(base_tags, merge_tags(spec.op_tags, b.op_tags))
+
+    async def _bronze_single(context):
+        business_dttm, company_id = extract_partition(context)
+        token_id, token = await b.resolve_auth(context, company_id)
+        run_dttm = datetime.now(MSK)
+        api_ctx = BronzeApiContext(
+            business_dttm=business_dttm,
+            company_id=company_id,
+            token_id=token_id,
+            token=token,
+            run_uuid=context.run_id,
+        )
+
+        if not token:
+            md = bronze_output_metadata(api_ctx, request_uuid="", status=401, response_dttm=datetime.now(MSK))
+            yield Output(value=None, metadata=md)
+            raise Failure(f"No WB token for company_id={company_id}")
+
+        client_obj = getattr(context.resources, spec.client_resource_key)
+        _check_client(client_obj)
+
+        async with _maybe_client_ctx(client_obj) as client:
+            request_uuid, status, response_dttm, error = await _task_flow(context, client, api_ctx, run_dttm)
+
+        md = bronze_output_metadata(api_ctx, request_uuid, status, response_dttm)
+        yield Output(value=None, metadata=md)
+        if error:
+            raise Failure(error)
+
+    async def _bronze_batched(context):
+        partitions = extract_partitions(context)
+        run_dttm = datetime.now(MSK)
+
+        done = await _bronze_done_in_run(context, b.bronze_table)
+        todo = [p for p in partitions if p not in done]
+        context.log.info(
+            f"[bronze__{b.name}] batched: partitions={len(partitions)} "
+            f"already_ok={len(partitions) - len(todo)} concurrency={batch.concurrency}"
+        )
+
+        # Токены резолвим один раз на компанию
+        auth: Dict[int, Tuple[Optional[int], Optional[str]]] = {}
+        for cid in sorted({cid for _, cid in todo}):
+            auth[cid] = await b.resolve_auth(context, cid)
+
+        client_obj = getattr(context.resources, spec.client_resource_key)
+        _check_client(client_obj)
+
+        # лимиты WB на токен жёсткие — разносим submit, опрос и download одного токена по времени
+        pacer = TokenPacer(batch.per_token_rps)
+        request_pacer = TokenPacer(batch.request_rps or batch.per_token_rps)
+        sem = asyncio.Semaphore(max(1, batch.concurrency))
+
+        async def _one(client, business_dttm: datetime, company_id: int):
+            token_id, token = auth[company_id]
+            api_ctx = BronzeApiContext(
+                business_dttm=business_dttm, company_id=company_id,
+                token_id=token_id, token=token, run_uuid=context.run_id,
+            )
+            if not token:
+                context.log.warning(f"[bronze__{b.name}] no token for company_id={company_id}")
+                return api_ctx, (None, 401, None, "no_token")
+            async with sem:
+                return api_ctx, await _task_flow(
+                    context, client, api_ctx, run_dttm, pacer=pacer, request_pacer=request_pacer,
                 )
-                yield Output(value=None, metadata=md)
 
-            except Failure:
-                raise
-            except Exception as e:
-                request_uuid = await spec.bronze.persist_bronze(
-                    context,
-                    spec.bronze.bronze_table,
-                    api_ctx,
-                    {
-                        "status": 500,
-                        "payload": {"error": f"unhandled task flow error: {e!s}"},
-                        "headers": {},
-                        "request_dttm": flow_started_at,
-                        "response_dttm": now_msk,
-                        "receive_dttm": now_msk,
-                        "request_parameters": submit_params_from_audit or _scrub_params(submit_params),
-                        "request_body": submit_body_from_audit,
-                    },
+        # Одна HTTP-сессия на весь ран (токен передаётся в каждый запрос через token_override)
+        async with _maybe_client_ctx(client_obj) as client:
+            outcomes = await asyncio.gather(*[_one(client, biz, cid) for biz, cid in todo])
+
+        failed = [
+            f"{api_ctx.business_dttm.date()}|{api_ctx.company_id}:{status}"
+            for api_ctx, (_uuid, status, _dt, error) in outcomes if error
+        ]
+        md = {
+            "partitions": MetadataValue.int(len(partitions)),
+            "ok": MetadataValue.int(len(partitions) - len(failed)),
+            "failed": MetadataValue.int(len(failed)),
+            "failed_partitions": MetadataValue.json(failed[:200]),
+        }
+        yield Output(value=None, metadata=md)
+
+        if failed:
+            raise Failure(
+                description=(
+                    f"bronze__{b.name}: {len(failed)} из {len(partitions)} партиций без успешной выгрузки. "
+                    f"Аудит записан; при повторе успешные партиции пропускаются, поставленные задачи продолжаются."
                 )
-                raise Failure(f"Unhandled task flow error: {e!s}")
+            )
+
+    @asset(
+        name=f"bronze__{b.name}",
+        key_prefix=["bronze"],
+        partitions_def=b.partitions_def,
+        required_resource_keys=set(b.required_resource_keys) | {spec.client_resource_key},
+        retry_policy=b.op_retry_policy,
+        backfill_policy=backfill_policy,
+        op_tags=bronze_tags,
+        description=(
+            "WB submit → poll(status) → download; пишет аудит и сырые данные в Bronze. "
+            "Если статус ответа не 2xx — ассет падает Failure (Dagster ретраит партицию, "
+            "уже поставленная задача WB при этом продолжается, а не создаётся заново)."
+        ),
+    )
+    async def bronze_asset(context) -> Output[None]:
+        body = _bronze_batched(context) if batch else _bronze_single(context)
+        async for event in body:
+            yield event
 
     assets: List[AssetsDefinition] = [bronze_asset]
 
@@ -391,101 +574,129 @@ def make_task_poll_download_assets(spec: TaskPollPipelineSpec) -> List[AssetsDef
     for s in spec.silvers:
         silver_tags = merge_tags(base_tags, merge_tags(spec.op_tags, s.op_tags))
 
-        @asset(
-            name=f"silver__{s.name}",
-            key_prefix=["silver"],
-            partitions_def=s.partitions_def,
-            required_resource_keys=set(s.required_resource_keys),
-            # оркестрационная зависимость от бронзы
-            deps=[bronze_asset.key],
-            op_tags=silver_tags,
-            description=(
-                "Берёт «лучшую» успешную запись из Bronze для партиции, нормализует и делает upsert в Silver. "
-                "Если успешной бронзы нет — пропускает без ошибки."
-            ),
-        )
-        async def silver_asset(context) -> Optional[int]:
-            business_dttm, company_id = extract_partition(context)
-
-            # Единый контекст (может понадобиться нормалайзеру)
-            token_id, token = await spec.bronze.resolve_auth(context, company_id)
-            api_ctx = BronzeApiContext(
-                business_dttm=business_dttm,
-                company_id=company_id,
-                token_id=token_id,
-                token=token,
-                run_uuid=context.run_id,
-            )
-            best = await s.select_best_bronze(context, spec.bronze.bronze_table, business_dttm, company_id)
-            if not best:
-                context.log.warning(
-                    f"[silver__{s.name}] нет успешной бронзы для company_id={company_id} biz={business_dttm.date()} — пропуск."
+        def _make_silver_asset(s: TaskSilverSpec, silver_tags: Dict[str, str]):
+            async def _materialize_partition(context, business_dttm: datetime, company_id: int, auth_cache: Dict[int, Any]):
+                # Единый контекст (может понадобиться нормалайзеру)
+                if company_id not in auth_cache:
+                    auth_cache[company_id] = await b.resolve_auth(context, company_id)
+                token_id, token = auth_cache[company_id]
+                api_ctx = BronzeApiContext(
+                    business_dttm=business_dttm,
+                    company_id=company_id,
+                    token_id=token_id,
+                    token=token,
+                    run_uuid=context.run_id,
                 )
-                return None
-            else:
-                context.log.info(f"[silver__{s.name}] получена бронза {best}")
-            rows_iter = await s.normalize(context, best, api_ctx)
-
-            prepared: List[Dict[str, Any]] = []
-            for r in rows_iter or []:
-                if not r:
-                    continue
-                base = {
-                    "run_uuid": api_ctx.run_uuid,
-                    "request_uuid": best.get("request_uuid"),
-                    "company_id": company_id,
-                    "receive_dttm": best.get("receive_dttm") or business_dttm,
-                    "business_dttm": business_dttm,
-                }
-                merged = {**base, **dict(r)}
-                prepared.append(
-                    coerce_row_types(
-                        s.silver_model,
-                        {k: v for k, v in merged.items() if k != "inserted_at"}
+                best = await s.select_best_bronze(context, b.bronze_table, business_dttm, company_id)
+                if not best:
+                    context.log.warning(
+                        f"[silver__{s.name}] нет успешной бронзы для company_id={company_id} biz={business_dttm.date()} — пропуск."
                     )
-                )
-            # ── Диагностика нормализации и схемы ──────────────────────────────
-            model_cols = {c.name for c in getattr(s.silver_model, "__table__").columns}
-            pk_cols    = set(s.pk_cols or ())
-            norm_count = len(prepared)
-            first_keys = sorted(list(prepared[0].keys())) if norm_count else []
-            all_keys   = sorted({k for row in prepared for k in row.keys()})
-            missing_pk_in_first = sorted([c for c in pk_cols if norm_count and not prepared[0].get(c) and prepared[0].get(c) != 0])
-            unknown_cols = sorted([c for c in all_keys if c not in model_cols])
-            missing_in_model = sorted([c for c in pk_cols if c not in model_cols])  # должно быть пусто
+                    return None, None
+                else:
+                    context.log.info(f"[silver__{s.name}] получена бронза {best}")
+                rows_iter = await s.normalize(context, best, api_ctx)
+
+                prepared: List[Dict[str, Any]] = []
+                for r in rows_iter or []:
+                    if not r:
+                        continue
+                    base = {
+                        "run_uuid": api_ctx.run_uuid,
+                        "request_uuid": best.get("request_uuid"),
+                        "company_id": company_id,
+                        "receive_dttm": best.get("receive_dttm") or business_dttm,
+                        "business_dttm": business_dttm,
+                    }
+                    merged = {**base, **dict(r)}
+                    prepared.append(
+                        coerce_row_types(
+                            s.silver_model,
+                            {k: v for k, v in merged.items() if k != "inserted_at"}
+                        )
+                    )
+                # ── Диагностика нормализации и схемы ──────────────────────────────
+                model_cols = {c.name for c in getattr(s.silver_model, "__table__").columns}
+                pk_cols    = set(s.pk_cols or ())
+                norm_count = len(prepared)
+                first_keys = sorted(list(prepared[0].keys())) if norm_count else []
+                all_keys   = sorted({k for row in prepared for k in row.keys()})
+                missing_pk_in_first = sorted([c for c in pk_cols if norm_count and not prepared[0].get(c) and prepared[0].get(c) != 0])
+                unknown_cols = sorted([c for c in all_keys if c not in model_cols])
+                missing_in_model = sorted([c for c in pk_cols if c not in model_cols])  # должно быть пусто
 
-            context.log.info(
-                f"[silver__{s.name}] normalized={norm_count} "
-                f"first_keys={first_keys} "
-                f"pk={sorted(list(pk_cols))} "
-                f"missing_pk_in_first={missing_pk_in_first} "
-                f"unknown_cols={unknown_cols} "
-                f"missing_in_model={missing_in_model}"
-            )
-            # Небольшая подсветка частой причины: null-ы в PK на части строк
-            if norm_count and pk_cols:
-                null_pk_stats = {
-                    c: sum(1 for row in prepared if (row.get(c) in (None, "")) and row.get(c) != 0)
-                    for c in pk_cols
-                }
-                bad_rows = sum(1 for row in prepared if any((row.get(c) in (None, "")) and row.get(c) != 0 for c in pk_cols))
                 context.log.info(
-                    f"[silver__{s.name}] null_pk_stats={null_pk_stats} bad_rows={bad_rows}"
+                    f"[silver__{s.name}] normalized={norm_count} "
+                    f"first_keys={first_keys} "
+                    f"pk={sorted(list(pk_cols))} "
+                    f"missing_pk_in_first={missing_pk_in_first} "
+                    f"unknown_cols={unknown_cols} "
+                    f"missing_in_model={missing_in_model}"
                 )
+                # Небольшая подсветка частой причины: null-ы в PK на части строк
+                if norm_count and pk_cols:
+                    null_pk_stats = {
+                        c: sum(1 for row in prepared if (row.get(c) in (None, "")) and row.get(c) != 0)
+                        for c in pk_cols
+                    }
+                    bad_rows = sum(1 for row in prepared if any((row.get(c) in (None, "")) and row.get(c) != 0 for c in pk_cols))
+                    context.log.info(
+                        f"[silver__{s.name}] null_pk_stats={null_pk_stats} bad_rows={bad_rows}"
+                    )
 
-            written = int(await s.persist_silver(context, prepared) or 0)
-            context.add_output_metadata({
-                "rows": MetadataValue.int(written),
-                "business_dttm": MetadataValue.text(business_dttm.isoformat()),
-                "company_id": MetadataValue.text(str(company_id)),
-                "request_uuid": MetadataValue.text(str(best.get("request_uuid", ""))),
-                "receive_dttm": MetadataValue.text(
-                    (best.get("receive_dttm") or business_dttm).isoformat()
+                written = int(await s.persist_silver(context, prepared) or 0)
+                return written, best
+
+            @asset(
+                name=f"silver__{s.name}",
+                key_prefix=["silver"],
+                partitions_def=s.partitions_def,
+                required_resource_keys=set(s.required_resource_keys),
+                # оркестрационная зависимость от бронзы
+                deps=[bronze_asset.key],
+                backfill_policy=backfill_policy,
+                op_tags=silver_tags,
+                description=(
+                    "Берёт «лучшую» успешную запись из Bronze для партиции, нормализует и делает upsert в Silver. "
+                    "Если успешной бронзы нет — пропускает без ошибки."
                 ),
-            })
-            return written
-
-        assets.append(silver_asset)
+            )
+            async def silver_asset(context) -> Optional[int]:
+                auth_cache: Dict[int, Any] = {}
+
+                if batch:
+                    partitions = extract_partitions(context)
+                    total, skipped = 0, 0
+                    for business_dttm, company_id in partitions:
+                        written, _best = await _materialize_partition(context, business_dttm, company_id, auth_cache)
+                        if written is None:
+                            skipped += 1
+                        total += int(written or 0)
+                    context.add_output_metadata({
+                        "rows": MetadataValue.int(total),
+                        "partitions": MetadataValue.int(len(partitions)),
+                        "skipped_no_bronze": MetadataValue.int(skipped),
+                    })
+                    return total
+
+                business_dttm, company_id = extract_partition(context)
+                written, best = await _materialize_partition(context, business_dttm, company_id, auth_cache)
+                if best is None:
+                    return None
+                context.add_output_metadata({
+                    "rows": MetadataValue.int(written),
+                    "business_dttm": MetadataValue.text(business_dttm.isoformat()),
+                    "company_id": MetadataValue.text(str(company_id)),
+                    "request_uuid": MetadataValue.text(str(best.get("request_uuid", ""))),
+                    "receive_dttm": MetadataValue.text(
+                        (best.get("receive_dttm") or business_dttm).isoformat()
+                    ),
+                })
+                return written
+
+            return silver_asset
+
+        assets.append(_make_silver_asset(s, silver_tags))
 
     return assets
 
@@ -506,7 +717,9 @@ def build_assets(
     Единые ключи конфига (в духе sync_api):
       - pipe_cfg.partitions_def ИЛИ описания партиций → через build_multipartitions
       - pipe_cfg.client_resource_key (по умолчанию "wildberries_client")
-      - pipe_cfg.api.polling: { submit, status, download, status_path, done, error, interval_sec, timeout_sec }
+      - pipe_cfg.api.polling: { submit, status, download, status_path, done, error, interval_sec, timeout_sec,
+                                (опц.) initial_interval_sec, backoff_factor, max_interval_sec, resume_ttl_sec }
+      - (опц.) pipe_cfg.execution: { mode: single|batched, max_partitions_per_run, concurrency, submit_rps }
       - pipe_cfg.api.request: { query: ... }  (опционально)
       - pipe_cfg.api.build_request_params: dotted‑path|callable (приоритет над .request.query)
       - model_bundle: те же поля, что и для sync_api (bronze_model, silver_models, silver_pk, normalizers, ...)
@@ -612,7 +825,9 @@ def build_assets(
                 )
 
         # 3) оборачиваем уже реальный callable
-        normalizer = normalize_wrapper(raw_norm)
+        t_cfg = ((pipe_cfg.get("silver") or {}).get("targets") or {}).get(silver_name) or {}
+        execution = parse_normalizer_execution(t_cfg, target=f"{pipe_name}:{silver_name}")
+        normalizer = normalize_wrapper(raw_norm, execution)
         if normalizers_map.get(silver_name) is None:
             context_str = f"{pipe_name}:{silver_name}"
             # при сборке ассетов лога нет, поэтому можно хотя бы через print:
@@ -636,6 +851,24 @@ def build_assets(
             )
         )
 
+    # --- жизненный цикл задач: адаптивный опрос + resume по task_id ---
+    polling = polling_from_config(polling_cfg)
+    state_store = TaskStateStore(f"{getattr(tbl, 'schema', None) or 'bronze_v2'}.{TASK_STATE_TABLE}")
+
+    # --- режим исполнения ---
+    exec_cfg = pipe_cfg.get("execution") or {}
+    mode = str(exec_cfg.get("mode") or "single").lower()
+    if mode not in ("single", "batched"):
+        raise ValueError(f"{pipe_name}: неизвестный execution.mode={mode!r} (single|batched)")
+    batch_spec: Optional[BatchExecutionSpec] = None
+    if mode == "batched":
+        batch_spec = BatchExecutionSpec(
+            max_partitions_per_run=int(exec_cfg.get("max_partitions_per_run", 200)),
+            concurrency=int(exec_cfg.get("concurrency", 8)),
+            per_token_rps=float(exec_cfg.get("submit_rps") or (api_cfg.get("rate_limit") or {}).get("rps", 1)),
+            request_rps=float((api_cfg.get("rate_limit") or {}).get("rps", 1)),
+        )
+
     bronze_spec = TaskBronzeSpec(
         name=pipe_name,
         client_resource_key=client_resource_key,
@@ -652,6 +885,9 @@ def build_assets(
         poll_interval_sec=interval_sec,
         poll_timeout_sec=timeout_sec,
         bronze_table=bronze_table,
+        polling=polling,
+        state_store=state_store,
+        batch=batch_spec,
     )
 
     spec = TaskPollPipelineSpec(
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import Column, DateTime, Integer, MetaData, PrimaryKeyConstraint, String, Table, Text
+from sqlalchemy.sql import func
+
+from dagster_conf.lib.timeutils import MSK
+
+
+# ---------------------------------------------------------------------------
+# Жизненный цикл WB-задач (submit → poll → download) для task_poll_download
+#
+# Состояние задачи хранится по партиции (pipe, business_dttm, company_id) в
+# bronze_v2.task_poll_state. При ретрае Dagster ассет не создаёт новую задачу,
+# а продолжает опрашивать уже поставленную (пока она не старше resume_ttl_sec).
+#
+#   SUBMITTED → (poll) → READY → (download 2xx) → DOWNLOADED
+#                      ↘ FAILED / EXPIRED
+# ---------------------------------------------------------------------------
+
+TASK_STATE_TABLE = "task_poll_state"
+
+STATE_SUBMITTED = "SUBMITTED"
+STATE_READY = "READY"
+STATE_DOWNLOADED = "DOWNLOADED"
+STATE_FAILED = "FAILED"
+STATE_EXPIRED = "EXPIRED"
+
+RESUMABLE_STATES = (STATE_SUBMITTED, STATE_READY)
+
+
+def task_state_table(metadata: MetaData, schema: str) -> Table:
+    """DDL таблицы состояния задач (создаётся init_db_autogen вместе с бронзой)."""
+    key = f"{schema}.{TASK_STATE_TABLE}"
+    if key in metadata.tables:
+        return metadata.tables[key]
+    return Table(
+        TASK_STATE_TABLE,
+        metadata,
+        Column("pipe_name", String, nullable=False),
+        Column("business_dttm", DateTime(timezone=True), nullable=False),
+        Column("company_id", Integer, nullable=False),
+        Column("task_id", Text, nullable=False),
+        Column("state", String, nullable=False),
+        Column("run_uuid", Text, nullable=True),
+        Column("submitted_at", DateTime(timezone=True), nullable=False),
+        Column("updated_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+        Column("last_status", Text, nullable=True),
+        PrimaryKeyConstraint("pipe_name", "business_dttm", "company_id"),
+        schema=schema,
+    )
+
+
+@dataclass
+class AdaptivePolling:
+    """
+    Интервалы опроса статуса: сначала часто (маленькие отчёты готовы за секунды),
+    затем геометрически реже до max_interval_sec.
+    """
+    initial_interval_sec: float = 2.0
+    backoff_factor: float = 1.5
+    max_interval_sec: float = 30.0
+    timeout_sec: int = 1800
+    resume_ttl_sec: int = 3 * 3600
+
+    def delays(self) -> Iterator[float]:
+        delay = max(self.initial_interval_sec, 0.1)
+        while True:
+            yield delay
+            delay = min(delay * max(self.backoff_factor, 1.0), self.max_interval_sec)
+
+
+def polling_from_config(polling_cfg: Dict[str, Any]) -> AdaptivePolling:
+    """
+    api.polling → AdaptivePolling.
+    interval_sec (старый фиксированный интервал) трактуется как потолок, если max_interval_sec не задан.
+    """
+    interval = float(polling_cfg.get("interval_sec") or 10)
+    return AdaptivePolling(
+        initial_interval_sec=float(polling_cfg.get("initial_interval_sec") or min(2.0, interval)),
+        backoff_factor=float(polling_cfg.get("backoff_factor") or 1.5),
+        max_interval_sec=float(polling_cfg.get("max_interval_sec") or interval),
+        timeout_sec=int(polling_cfg.get("timeout_sec") or 1800),
+        resume_ttl_sec=int(polling_cfg.get("resume_ttl_sec") or 3 * 3600),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Хранилище состояния
+# ---------------------------------------------------------------------------
+
+class TaskStateStore:
+    """Чтение/запись bronze_v2.task_poll_state через async_sessionmaker ресурса postgres."""
+
+    def __init__(self, table: str):
+        self.table = table
+
+    async def load(self, context, pipe_name: str, business_dttm: datetime, company_id: int) -> Optional[Dict[str, Any]]:
+        async with context.resources.postgres() as session:
+            row = (await session.execute(
+                sa.text(f"""
+                    SELECT task_id, state, submitted_at, last_status
+                      FROM {self.table}
+                     WHERE pipe_name = :pipe AND business_dttm = :biz AND company_id = :cid
+                """),
+                {"pipe": pipe_name, "biz": business_dttm, "cid": company_id},
+            )).mappings().first()
+        return dict(row) if row else None
+
+    async def resumable(
+        self, context, pipe_name: str, business_dttm: datetime, company_id: int, *, ttl_sec: int,
+    ) -> Optional[Dict[str, Any]]:
+        """Задача, которую можно продолжить опрашивать (не завершена и не протухла)."""
+        st = await self.load(context, pipe_name, business_dttm, company_id)
+        if not st or st["state"] not in RESUMABLE_STATES:
+            return None
+        submitted_at = st["submitted_at"]
+        if submitted_at and datetime.now(MSK) - submitted_at > timedelta(seconds=ttl_sec):
+            return None
+        return st
+
+    async def save(
+        self, context, pipe_name: str, business_dttm: datetime, company_id: int,
+        *, task_id: Any, state: str, last_status: Optional[str] = None, submitted: bool = False,
+    ) -> None:
+        now = datetime.now(MSK)
+        async with context.resources.postgres() as session:
+            await session.execute(
+                sa.text(f"""
+                    INSERT INTO {self.table} AS t
+                        (pipe_name, business_dttm, company_id, task_id, state, run_uuid,
+                         submitted_at, updated_at, last_status)
+                    VALUES (:pipe, :biz, :cid, :task_id, :state, :run, :now, :now, :last_status)
+                    ON CONFLICT (pipe_name, business_dttm, company_id) DO UPDATE SET
+                        task_id      = EXCLUDED.task_id,
+                        state        = EXCLUDED.state,
+                        run_uuid     = EXCLUDED.run_uuid,
+                        submitted_at = CASE WHEN :submitted THEN EXCLUDED.submitted_at
+                                            ELSE t.submitted_at END,
+                        updated_at   = EXCLUDED.updated_at,
+                        last_status  = EXCLUDED.last_status
+                """),
+                {
+                    "pipe": pipe_name, "biz": business_dttm, "cid": company_id,
+                    "task_id": str(task_id), "state": state, "run": context.run_id,
+                    "now": now, "last_status": last_status, "submitted": submitted,
+                },
+            )
+            await session.commit()
@@ -3,7 +3,6 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional
 import re
-import yaml
 import uuid
 from sqlalchemy import (
     Table,
@@ -30,6 +29,10 @@ from sqlalchemy.orm import DeclarativeBase, declared_attr, Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID, JSONB, BYTEA
 from sqlalchemy.types import TIMESTAMP
 
+from dagster_conf.lib.config_cache import load_config
+from dagster_conf.lib.table_partitioning import partitioning_for_pipeline
+from dagster_conf.lib.asset_factories.task_lifecycle import task_state_table
+
 
 # --------- БАЗА И МИКСИНЫ  ---------
 
@@ -85,8 +88,7 @@ def _silver_class_name(table_name: str) -> str:
 # --------- РАЗБОР КОНФИГА И ГЕНЕРАЦИЯ МОДЕЛЕЙ ---------
 
 def _load_cfg(path: Path) -> dict:
-    with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+    return load_config(path)
 
 
 def _build_silver_columns(
@@ -144,9 +146,10 @@ def build_models_from_config(
     col_lineage: dict = cfg.get("column_lineage", {}) or {}
 
     # ---------- стандартизированные колонки миксинов ----------
-    def _std_bronze_cols() -> List[Column]:
+    def _std_bronze_cols(*, partitioned: bool = False) -> List[Column]:
+        # у партиционированной таблицы ключ партиционирования обязан входить в PK
         return [
-            Column("business_dttm", DateTime(timezone=True), nullable=False, doc="Бизнес‑дата/период"),
+            Column("business_dttm", DateTime(timezone=True), nullable=False, primary_key=partitioned, doc="Бизнес‑дата/период"),
             Column("api_token_id", Integer, nullable=False, index=True, doc="Ссылка на токен из core.tokens"),
             Column("company_id", Integer, nullable=False, index=True, doc="ID компании"),
             Column("run_uuid", UUID(as_uuid=True), nullable=False, index=True, doc="Идентификатор DAG Run"),
@@ -255,19 +258,40 @@ def build_models_from_config(
 
     # ---------- основной цикл по пайпам ----------
     for pipe_name, pipe_cfg in pipelines.items():
+        bronze_part, silver_parts = partitioning_for_pipeline(
+            pipe_name, pipe_cfg, bronze_schema=bronze_schema, silver_schema=silver_schema,
+        )
+
         # ===== БРОНЗА =====
         bronze_table = pipe_cfg.get("bronze_table") or pipe_name
         bronze_model_name = _bronze_class_name(bronze_table)
 
+        bronze_kw: Dict[str, Any] = {}
+        if bronze_part:
+            bronze_kw["postgresql_partition_by"] = bronze_part.partition_by
+            bronze_kw["info"] = {"time_partitioning": bronze_part}
+
         bronze_table_obj = Table(
             bronze_table,
             BronzeBase.metadata,
-            *_std_bronze_cols(),
+            *_std_bronze_cols(partitioned=bronze_part is not None),
             schema=bronze_schema,
             *[
                 Index(ix["name"], *[ixc for ixc in ix["columns"]])
                 for ix in (pipe_cfg.get("bronze_indexes") or [])
             ],
+            # покрывающий индекс под default_select_best_bronze:
+            # WHERE company_id AND business_dttm AND 2xx ORDER BY response_dttm DESC LIMIT 1
+            *[
+                Index(
+                    f"ix_{bronze_table}__best_bronze",
+                    "company_id",
+                    "business_dttm",
+                    text("response_dttm DESC"),
+                    postgresql_where=text("response_code BETWEEN 200 AND 299"),
+                )
+            ],
+            **bronze_kw,
         )
 
         BronzeModel = type(
@@ -341,8 +365,22 @@ def build_models_from_config(
             for ix in (silver_tbl_cfg.get("silver_indexes") or []):
                 table_args.append(Index(ix["name"], *[c for c in ix["columns"]]))
 
+            silver_part = silver_parts.get(silver_table)
+            silver_kw: Dict[str, Any] = {}
+            if silver_part:
+                if pk_cols and silver_part.column not in pk_cols:
+                    raise RuntimeError(
+                        f"{pipe_name}.{silver_table}: partitioning by {silver_part.column} "
+                        f"requires it in primary_key, got {pk_cols}"
+                    )
+                silver_kw["postgresql_partition_by"] = silver_part.partition_by
+                silver_kw["info"] = {"time_partitioning": silver_part}
+
             if pk_cols:
                 table_args.append(PrimaryKeyConstraint(*pk_cols, name=f"pk_{silver_table}"))
+            elif silver_part:
+                base_cols = [Column("id", BigInteger, autoincrement=True)] + base_cols
+                table_args.append(PrimaryKeyConstraint("id", silver_part.column, name=f"pk_{silver_table}"))
             else:
                 base_cols = [Column("id", BigInteger, primary_key=True, autoincrement=True)] + base_cols
 
@@ -359,6 +397,7 @@ def build_models_from_config(
                 *(base_cols + user_column_objs),
                 *table_args,
                 schema=silver_schema,
+                **silver_kw,
             )
 
             all_cols = set(silver_table_obj.c.keys())
@@ -388,6 +427,10 @@ def build_models_from_config(
             "silver_pk": silver_pk_map,
         }
 
+    # состояние WB-задач (resume submit → poll → download при ретраях)
+    if any((p or {}).get("factory_type", "task_poll_download") == "task_poll_download" for p in pipelines.values()):
+        task_state_table(BronzeBase.metadata, bronze_schema)
+
     return registry, BronzeBase.metadata, SilverBase.metadata
 
 
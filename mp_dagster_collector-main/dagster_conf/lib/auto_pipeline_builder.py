@@ -3,7 +3,6 @@ import re, json, datetime as dt
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Tuple, Optional
 from zoneinfo import ZoneInfo
-import yaml
 from dagster import (
     AssetsDefinition,
     AssetSelection,
@@ -16,6 +15,7 @@ from dagster import (
     build_schedule_from_partitioned_job,
 )
 from dagster_conf.lib.asset_factories.factory_utils import resolve_build_params
+from dagster_conf.lib.config_cache import load_config
 DEFAULT_TZ = "Europe/Moscow"
 
 
@@ -63,10 +63,7 @@ FACTORY_DISPATCH: Dict[str, FactoryFn] = {
 
 def _load_cfg(config_path: Path) -> dict:
     """Читает YAML-конфиг. Бросает FileNotFoundError, если файл отсутствует."""
-    if not config_path.exists():
-        raise FileNotFoundError(f"config.yml не найден: {config_path}")
-    with config_path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+    return load_config(config_path)
 
 
 def _factory_for(pipe_name: str, pipe_cfg: dict) -> FactoryFn:
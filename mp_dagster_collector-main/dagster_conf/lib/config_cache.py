@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import yaml
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Кэш разобранного config.yml
+#
+# config.yml (~2.7k строк) разбирается чистым PyYAML заметно дольше, чем
+# строятся сами ассеты, и платится это при каждом импорте code location:
+# тик демона, run worker, webserver. Здесь:
+#
+#  1) ключ — sha256 содержимого файла (mtime не используем: в докер-образе он
+#     у всех файлов одинаковый);
+#  2) разобранный конфиг кладётся pickle-файлом рядом с конфигом:
+#       .config.yml.<sha[:16]>.pickle
+#     при несовпадении хэша — разбор заново (CSafeLoader, если есть libyaml);
+#  3) в пределах процесса конфиг разбирается один раз (его читают и
+#     auto_model_builder, и auto_pipeline_builder), каждому отдаётся копия;
+#  4) DAGSTER_CONFIG_CACHE=0 — выключить файловый кэш; каталог кэша можно
+#     вынести через DAGSTER_CONFIG_CACHE_DIR (если рядом с конфигом read-only).
+# ---------------------------------------------------------------------------
+
+CACHE_FORMAT = 1
+
+_MEMO: Dict[Tuple[str, str], bytes] = {}
+_LOCK = threading.Lock()
+
+
+def _yaml_loader():
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def config_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _cache_enabled() -> bool:
+    return os.getenv("DAGSTER_CONFIG_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def cache_path_for(config_path: Path, digest: str) -> Path:
+    base = Path(os.getenv("DAGSTER_CONFIG_CACHE_DIR") or config_path.parent)
+    return base / f".{config_path.name}.{digest[:16]}.pickle"
+
+
+def _read_pickle(path: Path, digest: str) -> Optional[bytes]:
+    """Сериализованный cfg из файла кэша (или None, если кэша нет/он чужой)."""
+    try:
+        with path.open("rb") as f:
+            header = pickle.load(f)
+            if header.get("format") != CACHE_FORMAT or header.get("sha256") != digest:
+                return None
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"[config-cache] битый кэш {path}: {e}")
+        return None
+
+
+def _write_pickle(path: Path, config_name: str, digest: str, blob: bytes) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("wb") as f:
+            pickle.dump({"format": CACHE_FORMAT, "sha256": digest}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(blob)
+        os.replace(tmp, path)
+    except OSError as e:
+        # read-only FS и т.п. — просто работаем без файлового кэша
+        log.info(f"[config-cache] не удалось записать {path}: {e}")
+        tmp.unlink(missing_ok=True)
+        return
+
+    # кэши прошлых версий этого конфига больше не нужны
+    for old in path.parent.glob(f".{config_name}.*.pickle"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def load_config(config_path: Path) -> dict:
+    """
+    Разобранный config.yml: память процесса → pickle рядом с конфигом → YAML.
+    Каждый вызов получает собственную копию (билдеры и фабрики вправе её менять).
+    """
+    config_path = Path(config_path)
+    if not config_path.exists():
+        raise FileNotFoundError(f"config.yml не найден: {config_path}")
+
+    raw = config_path.read_bytes()
+    digest = config_hash(raw)
+    key = (str(config_path.resolve()), digest)
+
+    with _LOCK:
+        blob = _MEMO.get(key)
+        if blob is None:
+            cache_path = cache_path_for(config_path, digest) if _cache_enabled() else None
+            if cache_path is not None:
+                blob = _read_pickle(cache_path, digest)
+
+            if blob is None:
+                cfg = yaml.load(raw.decode("utf-8"), Loader=_yaml_loader()) or {}
+                blob = pickle.dumps(cfg, protocol=pickle.HIGHEST_PROTOCOL)
+                if cache_path is not None:
+                    _write_pickle(cache_path, config_path.name, digest, blob)
+
+            _MEMO[key] = blob
+
+    return pickle.loads(blob)
+
+
+def clear_memo() -> None:
+    with _LOCK:
+        _MEMO.clear()
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from aiohttp import ClientResponseError
+
+from dagster_conf.lib.rate_limit import HeaderRatePacer
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Конвейер запросов к WB: fetch-воркеры → asyncio.Queue → один writer
+#
+#  • воркеры берут задачи (чанк кампаний fullstats, одна кампания для
+#    «по-advert» эндпоинтов) из очереди и ходят в WB, темп задаёт
+#    HeaderRatePacer по X-Ratelimit-* / Retry-After из ответов;
+#  • 429 возвращает в очередь только эту задачу (с паузой по заголовкам),
+#    остальные воркеры продолжают после окна лимита;
+#  • результаты складываются в очередь записи, которую один writer (с одной
+#    долгоживущей сессией) сливает пачками.
+# ─────────────────────────────────────────────────────────────────────────────
+
+FetchFn = Callable[[Any], Awaitable[Tuple[Any, Mapping[str, Any]]]]
+
+
+@dataclass
+class FetchJob:
+    """Один запрос к WB; size — число кампаний в нём (для логов)."""
+    payload: Any
+    size: int = 1
+    attempt: int = 0
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class FetchStats:
+    requests: int = 0
+    written: int = 0
+    skipped: int = 0
+    rate_limited: int = 0
+    failed: List[Any] = field(default_factory=list)  # meta (или size) задач без результата
+    errors: List[BaseException] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+
+async def run_fetch_pipeline(
+    jobs: List[FetchJob],
+    *,
+    fetch: FetchFn,
+    build_record: Callable[[FetchJob, Any, Mapping[str, Any], Any, Any], Optional[Dict[str, Any]]],
+    write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+    pacer: HeaderRatePacer,
+    now: Callable[[], Any],
+    workers: int = 2,
+    write_batch_size: int = 20,
+    max_attempts: int = 5,
+    log=None,
+    tag: str = "fetch",
+) -> FetchStats:
+    """
+    Прогоняет jobs через fetch-воркеров и единственного writer'а.
+    fetch(payload) → (data, headers); 429 — ClientResponseError(status=429, headers=...).
+    build_record(job, data, headers, request_dttm, receive_dttm) → строка бронзы или None (пропуск).
+    Любая другая ошибка fetch не останавливает остальные задачи; первая из них
+    пробрасывается после того, как всё успешно полученное записано.
+    Задачи, исчерпавшие max_attempts на 429, попадают в stats.failed — решение за вызывающим.
+    """
+    stats = FetchStats()
+    started = time.monotonic()
+
+    work_q: "asyncio.Queue[FetchJob]" = asyncio.Queue()
+    out_q: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    for j in jobs:
+        work_q.put_nowait(j)
+
+    async def _worker(n: int) -> None:
+        while True:
+            job = await work_q.get()
+            try:
+                await pacer.acquire()
+                request_dttm = now()
+                stats.requests += 1
+                try:
+                    data, headers = await fetch(job.payload)
+                except ClientResponseError as e:
+                    if e.status != 429:
+                        raise
+                    stats.rate_limited += 1
+                    delay = pacer.penalize(getattr(e, "headers", None))
+                    job.attempt += 1
+                    if job.attempt >= max_attempts:
+                        stats.failed.append(job.meta or job.size)
+                        if log:
+                            log.error(f"[{tag}] {job.meta or job.size}: исчерпано {max_attempts} попыток после 429")
+                    else:
+                        if log:
+                            log.warning(f"[{tag}] 429 → {job.meta or job.size} в очередь, пауза {delay:.1f}s, попытка {job.attempt}")
+                        work_q.put_nowait(job)
+                    continue
+
+                pacer.observe(headers)
+                rec = build_record(job, data, headers, request_dttm, now())
+                if rec is None:
+                    stats.skipped += 1
+                else:
+                    await out_q.put(rec)
+            except Exception as e:
+                stats.errors.append(e)
+                stats.failed.append(job.meta or job.size)
+                if log:
+                    log.error(f"[{tag}] worker#{n}: ошибка задачи {job.meta or job.size}: {e!r}")
+            finally:
+                work_q.task_done()
+
+    async def _writer() -> None:
+        while True:
+            rec = await out_q.get()
+            if rec is None:
+                return
+            batch = [rec]
+            done = False
+            while len(batch) < write_batch_size:
+                try:
+                    nxt = out_q.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if nxt is None:
+                    done = True
+                    break
+                batch.append(nxt)
+            await write_batch(batch)
+            stats.written += len(batch)
+            if done:
+                return
+
+    writer = asyncio.create_task(_writer())
+    tasks = [asyncio.create_task(_worker(i)) for i in range(max(1, workers))]
+    try:
+        await work_q.join()
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await out_q.put(None)
+        await writer
+
+    stats.elapsed_sec = time.monotonic() - started
+    if stats.errors:
+        raise stats.errors[0]
+    return stats
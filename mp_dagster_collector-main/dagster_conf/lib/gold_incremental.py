@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from dagster_conf.lib.table_partitioning import TimePartitioning, ensure_partitions
+from dagster_conf.lib.timeutils import MSK
+
+
+# ---------------------------------------------------------------------------
+# Инкрементальные gold-витрины вместо REFRESH MATERIALIZED VIEW
+#
+# Витрина — обычная таблица, партиционированная по дате (RANGE, месяцы).
+# SQL витрины (SELECT, из которого раньше строилось MV) хранится в
+# <meta_schema>.gold_definitions: при первом запуске он снимается из каталога
+# (pg_get_viewdef), MV заменяется таблицей с тем же именем и наполняется
+# полным пересчётом.
+#
+# Дальше каждый запуск, одной транзакцией:
+#   1) по каждому источнику сравнивает водяной знак (max(change_col) или
+#      отпечаток содержимого для таблиц без колонки изменений) с сохранённым;
+#      change_col — время записи строки в БД (silver_v2.inserted_at, DEFAULT
+#      now(): silver_v2 пишется только INSERT'ами), а не метка ответа API;
+#      водяной знак не уходит дальше начала самой старой пишущей транзакции,
+#      так что строки, закоммиченные после прогона «задним числом», не теряются;
+#   2) изменившиеся строки источника → затронутые срезы (company_id, date);
+#      справочник без дат (комиссии, компании, продавцы) → все срезы
+#      затронутых компаний;
+#   3) ANALYZE только изменившихся источников;
+#   4) DELETE срезов + INSERT … SELECT определения, отфильтрованного по срезам;
+#   5) новые водяные знаки.
+#
+# Индексы по change_col источников — в миграции alembic (3c6f1e2a9d47).
+#
+# Ограничение: физическое удаление строк источника без вставки в тот же срез
+# водяной знак не видит — такие срезы поправит только полная пересборка
+# (rebuild_full).
+# ---------------------------------------------------------------------------
+
+MSK_DATE = "({col} AT TIME ZONE 'Europe/Moscow')::date"
+
+
+@dataclass(frozen=True)
+class GoldSource:
+    """Источник витрины и правило «изменившиеся строки → срезы (company_id, date)»."""
+    name: str                                  # ключ водяного знака
+    table: str                                 # schema.table
+    change_col: Optional[str] = "inserted_at"  # None → отпечаток содержимого (таблица без метки изменений)
+    company_expr: Optional[str] = "company_id"   # None → срезы всех компаний
+    date_exprs: Tuple[str, ...] = (MSK_DATE.format(col="business_dttm"),)  # () → все даты
+    join: Optional[str] = None                 # JOIN к строкам источника (алиас t) для company_expr
+    lookback: str = "5 minutes"                # запас на расхождение часов/сессий
+
+
+@dataclass(frozen=True)
+class GoldTarget:
+    schema: str
+    table: str
+    sources: Tuple[GoldSource, ...]
+    company_col: str = "company_id"
+    date_col: str = "date"
+    meta_schema: str = "gold"
+    premake: int = 2
+
+    @property
+    def qualified_name(self) -> str:
+        return f'"{self.schema}"."{self.table}"'
+
+    @property
+    def key(self) -> str:
+        return f"{self.schema}.{self.table}"
+
+    def partitioning(self, start: Optional[date]) -> TimePartitioning:
+        return TimePartitioning(
+            schema=self.schema, table=self.table, interval="monthly",
+            column=self.date_col, premake=self.premake, start=start,
+        )
+
+
+@dataclass
+class RefreshStats:
+    bootstrapped: bool = False
+    changed_sources: List[str] = field(default_factory=list)
+    slices: int = 0
+    deleted: int = 0
+    inserted: int = 0
+
+
+# ---------------------------------------------------------------------------
+# Служебные таблицы
+# ---------------------------------------------------------------------------
+
+def ensure_meta(conn, target: GoldTarget) -> None:
+    m = target.meta_schema
+    conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{m}"'))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{m}".gold_definitions (
+            target      text PRIMARY KEY,
+            definition  text NOT NULL,
+            captured_at timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS "{m}".gold_watermarks (
+            target      text NOT NULL,
+            source      text NOT NULL,
+            watermark   timestamptz,
+            fingerprint text,
+            updated_at  timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (target, source)
+        )
+    """))
+
+
+def _relkind(conn, schema: str, table: str) -> Optional[str]:
+    return conn.execute(text("""
+        SELECT c.relkind
+          FROM pg_class c
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = :schema AND c.relname = :table
+    """), {"schema": schema, "table": table}).scalar()
+
+
+def load_definition(conn, target: GoldTarget) -> str:
+    row = conn.execute(
+        text(f'SELECT definition FROM "{target.meta_schema}".gold_definitions WHERE target = :t'),
+        {"t": target.key},
+    ).scalar()
+    if not row:
+        raise RuntimeError(f"{target.key}: нет сохранённого определения витрины в {target.meta_schema}.gold_definitions")
+    return row.strip().rstrip(";")
+
+
+def _save_definition(conn, target: GoldTarget, definition: str) -> None:
+    conn.execute(text(f"""
+        INSERT INTO "{target.meta_schema}".gold_definitions (target, definition)
+        VALUES (:t, :d)
+        ON CONFLICT (target) DO UPDATE SET definition = EXCLUDED.definition, captured_at = now()
+    """), {"t": target.key, "d": definition})
+
+
+def _load_watermarks(conn, target: GoldTarget) -> Dict[str, Tuple[Optional[datetime], Optional[str]]]:
+    rows = conn.execute(
+        text(f'SELECT source, watermark, fingerprint FROM "{target.meta_schema}".gold_watermarks WHERE target = :t'),
+        {"t": target.key},
+    ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def _save_watermark(conn, target: GoldTarget, source: str, watermark, fingerprint) -> None:
+    conn.execute(text(f"""
+        INSERT INTO "{target.meta_schema}".gold_watermarks (target, source, watermark, fingerprint, updated_at)
+        VALUES (:t, :s, :w, :f, now())
+        ON CONFLICT (target, source) DO UPDATE
+           SET watermark = EXCLUDED.watermark, fingerprint = EXCLUDED.fingerprint, updated_at = now()
+    """), {"t": target.key, "s": source, "w": watermark, "f": fingerprint})
+
+
+def _shadow(target: GoldTarget, src: GoldSource) -> str:
+    """Копия источника без метки изменений на момент последнего прогона (для диффа)."""
+    return f'"{target.meta_schema}"."{target.table}__{src.name}_prev"'
+
+
+def _fingerprint(conn, src: GoldSource) -> str:
+    return conn.execute(text(
+        f"SELECT md5(COALESCE(string_agg(t::text, '|' ORDER BY t::text), '')) FROM {src.table} t"
+    )).scalar()
+
+
+def _snapshot_source(conn, target: GoldTarget, src: GoldSource) -> None:
+    shadow = _shadow(target, src)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {shadow} AS SELECT * FROM {src.table} WITH NO DATA"))
+    conn.execute(text(f"TRUNCATE {shadow}"))
+    conn.execute(text(f"INSERT INTO {shadow} SELECT * FROM {src.table}"))
+
+
+# Начало самой старой открытой пишущей транзакции (кроме своей): её строки получат
+# change_col = now() не раньше этого момента, но видны станут только после коммита.
+# pg_stat_activity показывает чужие сессии той же роли (или при pg_read_all_stats).
+_OLDEST_WRITER = """
+    SELECT min(xact_start)
+      FROM pg_stat_activity
+     WHERE backend_xid IS NOT NULL
+       AND pid <> pg_backend_pid()
+       AND datname = current_database()
+"""
+
+
+def _current_watermark(conn, src: GoldSource) -> Tuple[Optional[datetime], Optional[str]]:
+    if src.change_col is None:
+        return None, _fingerprint(conn, src)
+    return conn.execute(text(
+        f"SELECT LEAST((SELECT max({src.change_col}) FROM {src.table}), ({_OLDEST_WRITER}))"
+    )).scalar(), None
+
+
+# ---------------------------------------------------------------------------
+# Затронутые срезы
+# ---------------------------------------------------------------------------
+
+_SLICES = "_gold_slices"
+
+
+def _slices_from_rows(target: GoldTarget, src: GoldSource, rows_sql: str, definition: str) -> str:
+    """INSERT срезов по набору строк источника (rows_sql — FROM-выражение с алиасом t)."""
+    if src.join:
+        rows_sql = f"{rows_sql} {src.join}"
+    if not src.date_exprs:
+        # справочник без дат: все срезы затронутых компаний — и лежащие в витрине
+        # (строки могут исчезнуть), и те, что даёт определение (строки могут появиться)
+        companies = "" if src.company_expr is None else (
+            f"WHERE x.company_id IN (SELECT {src.company_expr} FROM {rows_sql})"
+        )
+        return f"""
+            INSERT INTO {_SLICES} (company_id, date)
+            SELECT x.company_id, x.date
+              FROM (
+                    SELECT g.{target.company_col} AS company_id, g.{target.date_col} AS date
+                      FROM {target.qualified_name} g
+                    UNION
+                    SELECT v.{target.company_col}, v.{target.date_col} FROM ({definition}) v
+                   ) x
+             {companies}
+        """
+    dates = ", ".join(f"({e})::date" for e in src.date_exprs)
+    if src.company_expr is None:
+        # срезы всех компаний витрины на затронутые даты
+        return f"""
+            INSERT INTO {_SLICES} (company_id, date)
+            SELECT DISTINCT g.{target.company_col}, g.{target.date_col}
+              FROM {target.qualified_name} g
+             WHERE g.{target.date_col} >= COALESCE(
+                   (SELECT min(d) FROM {rows_sql}, LATERAL unnest(ARRAY[{dates}]) AS d),
+                   '-infinity'
+             )
+        """
+    return f"""
+        INSERT INTO {_SLICES} (company_id, date)
+        SELECT DISTINCT {src.company_expr}, d
+          FROM {rows_sql}, LATERAL unnest(ARRAY[{dates}]) AS d
+         WHERE d IS NOT NULL AND {src.company_expr} IS NOT NULL
+    """
+
+
+def _collect_source(
+    conn, target: GoldTarget, src: GoldSource, previous, definition: str,
+) -> Optional[Tuple[Any, Any]]:
+    """Кладёт срезы изменившихся строк в _gold_slices; возвращает новый водяной знак или None (без изменений)."""
+    if previous is None:
+        # источник добавлен в спецификацию после бутстрапа — только начинаем отслеживать
+        if src.change_col is None:
+            _snapshot_source(conn, target, src)
+        return _current_watermark(conn, src)
+
+    prev_wm, prev_fp = previous
+    new_wm, new_fp = _current_watermark(conn, src)
+
+    if src.change_col is None:
+        if new_fp == prev_fp:
+            return None
+        shadow = _shadow(target, src)
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {shadow} AS SELECT * FROM {src.table} WITH NO DATA"))
+        changed = (
+            f"((SELECT * FROM {src.table} EXCEPT SELECT * FROM {shadow})"
+            f" UNION ALL (SELECT * FROM {shadow} EXCEPT SELECT * FROM {src.table})) t"
+        )
+        conn.execute(text(_slices_from_rows(target, src, changed, definition)))
+        _snapshot_source(conn, target, src)
+        return new_wm, new_fp
+
+    if new_wm is None or (prev_wm is not None and new_wm <= prev_wm):
+        return None
+
+    if prev_wm is None:
+        # на момент прошлого прогона источник был пуст — новые все строки
+        rows = f"{src.table} t"
+        params = {}
+    else:
+        rows = f"(SELECT * FROM {src.table} WHERE {src.change_col} >= CAST(:since AS timestamptz) - INTERVAL '{src.lookback}') t"
+        params = {"since": prev_wm}
+    conn.execute(text(_slices_from_rows(target, src, rows, definition)), params)
+    return new_wm, None
+
+
+# ---------------------------------------------------------------------------
+# Пересчёт
+# ---------------------------------------------------------------------------
+
+def _ensure_partitions_from(conn, target: GoldTarget, start: Optional[date]) -> List[str]:
+    return ensure_partitions(conn, target.partitioning(start), now=datetime.now(MSK))
+
+
+def _capture_all_watermarks(conn, target: GoldTarget) -> None:
+    for src in target.sources:
+        wm, fp = _current_watermark(conn, src)
+        if src.change_col is None:
+            _snapshot_source(conn, target, src)
+        _save_watermark(conn, target, src.name, wm, fp)
+
+
+def bootstrap_from_matview(conn, target: GoldTarget, log=None) -> int:
+    """
+    MV → партиционированная таблица с тем же именем (в транзакции вызывающего):
+    определение сохраняется, водяные знаки снимаются до полного пересчёта.
+    """
+    definition = conn.execute(
+        text("SELECT pg_get_viewdef(CAST(:rel AS regclass), true)"),
+        {"rel": target.qualified_name},
+    ).scalar()
+    min_date = conn.execute(text(f"SELECT min({target.date_col}) FROM {target.qualified_name}")).scalar()
+
+    _save_definition(conn, target, definition)
+    _capture_all_watermarks(conn, target)
+
+    shape = f'"{target.schema}"."{target.table}__shape"'
+    conn.execute(text(f"CREATE TABLE {shape} (LIKE {target.qualified_name})"))
+    conn.execute(text(f"DROP MATERIALIZED VIEW {target.qualified_name}"))
+    conn.execute(text(
+        f"CREATE TABLE {target.qualified_name} (LIKE {shape}) PARTITION BY RANGE ({target.date_col})"
+    ))
+    conn.execute(text(f"DROP TABLE {shape}"))
+    conn.execute(text(
+        f'CREATE INDEX IF NOT EXISTS "ix_{target.table}_slice" '
+        f"ON {target.qualified_name} ({target.company_col}, {target.date_col})"
+    ))
+
+    created = _ensure_partitions_from(conn, target, _as_date(min_date))
+    inserted = conn.execute(text(
+        f"INSERT INTO {target.qualified_name} SELECT * FROM ({load_definition(conn, target)}) v"
+    )).rowcount
+    if log:
+        log.info(f"[gold] {target.key}: MV → партиционированная таблица, партиций {len(created)}, строк {inserted}")
+    return inserted
+
+
+def rebuild_full(conn, target: GoldTarget) -> int:
+    """Полная пересборка (эквивалент REFRESH): TRUNCATE + INSERT всего определения, водяные знаки заново."""
+    definition = load_definition(conn, target)
+    _capture_all_watermarks(conn, target)
+    conn.execute(text(f"TRUNCATE {target.qualified_name}"))
+    min_date = conn.execute(text(f"SELECT min({target.date_col}) FROM ({definition}) v")).scalar()
+    _ensure_partitions_from(conn, target, _as_date(min_date))
+    return conn.execute(text(f"INSERT INTO {target.qualified_name} SELECT * FROM ({definition}) v")).rowcount
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+def refresh_incremental(conn, target: GoldTarget, log=None) -> RefreshStats:
+    """Один инкрементальный прогон витрины. Коммит — за вызывающим (всё в одной транзакции)."""
+    stats = RefreshStats()
+    ensure_meta(conn, target)
+
+    kind = _relkind(conn, target.schema, target.table)
+    if kind == "m":
+        stats.inserted = bootstrap_from_matview(conn, target, log=log)
+        stats.bootstrapped = True
+        return stats
+    if kind is None:
+        raise RuntimeError(f"{target.key}: витрина не найдена (ни MV, ни таблицы)")
+
+    definition = load_definition(conn, target)
+    watermarks = _load_watermarks(conn, target)
+
+    conn.execute(text(
+        f"CREATE TEMP TABLE {_SLICES} ON COMMIT DROP AS "
+        f"SELECT {target.company_col} AS company_id, {target.date_col} AS date "
+        f"FROM {target.qualified_name} WITH NO DATA"
+    ))
+
+    new_marks: Dict[str, Tuple[Any, Any]] = {}
+    for src in target.sources:
+        mark = _collect_source(conn, target, src, watermarks.get(src.name), definition)
+        if mark is not None:
+            new_marks[src.name] = mark
+            stats.changed_sources.append(src.name)
+
+    if not stats.changed_sources:
+        return stats
+
+    # статистика нужна планировщику только там, где данные поменялись
+    for src in target.sources:
+        if src.name in new_marks:
+            conn.execute(text(f"ANALYZE {src.table}"))
+
+    conn.execute(text(f"CREATE TEMP TABLE {_SLICES}_u ON COMMIT DROP AS SELECT DISTINCT * FROM {_SLICES}"))
+    bounds = conn.execute(text(
+        f"SELECT count(*), min(date), max(date), array_agg(DISTINCT company_id) FROM {_SLICES}_u"
+    )).first()
+    stats.slices = int(bounds[0] or 0)
+
+    if stats.slices:
+        conn.execute(text(f"ANALYZE {_SLICES}_u"))
+        _ensure_partitions_from(conn, target, _as_date(bounds[1]))
+
+        stats.deleted = conn.execute(text(f"""
+            DELETE FROM {target.qualified_name} g
+             USING {_SLICES}_u s
+             WHERE g.{target.company_col} = s.company_id AND g.{target.date_col} = s.date
+        """)).rowcount
+        # диапазонные условия — константы, Postgres проталкивает их внутрь определения
+        stats.inserted = conn.execute(text(f"""
+            INSERT INTO {target.qualified_name}
+            SELECT v.*
+              FROM ({definition}) v
+             WHERE v.{target.date_col} BETWEEN :lo AND :hi
+               AND v.{target.company_col} = ANY(:companies)
+               AND (v.{target.company_col}, v.{target.date_col}) IN (SELECT company_id, date FROM {_SLICES}_u)
+        """), {"lo": bounds[1], "hi": bounds[2], "companies": list(bounds[3] or [])}).rowcount
+
+    for name, (wm, fp) in new_marks.items():
+        _save_watermark(conn, target, name, wm, fp)
+
+    if log:
+        log.info(
+            f"[gold] {target.key}: источники {stats.changed_sources}, срезов {stats.slices}, "
+            f"удалено {stats.deleted}, вставлено {stats.inserted}"
+        )
+    return stats
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow есть в requirements.txt, но без него пул работает на pickle
+    pa = None
+
+
+# ---------------------------------------------------------------------------
+# Выполнение тяжёлых нормализаторов в пуле процессов
+#
+# Формат в config.yml (на уровне silver-таргета):
+#
+#   silver:
+#     targets:
+#       wb_fin_reports_1w:
+#         normalizer: dagster_conf.lib.wb_universal_normalizer:WbUniversalNormalizer.norm__wb_fin_reports_1w
+#         normalize: { executor: process, max_workers: 4 }
+#
+# executor: thread (по умолчанию, asyncio.to_thread) | process.
+# В воркер уходит dotted-path нормализатора (резолвится там же и кэшируется) и
+# сырой payload бронзы; обратно — результат в колоночном виде: однотипные
+# скалярные колонки — одним Arrow IPC-буфером (без поэлементного pickle),
+# остальные (dict/list, смешанные типы, pandas-объекты) — списками значений.
+# В родительском процессе колонки собираются обратно в список строк.
+# ---------------------------------------------------------------------------
+
+SUPPORTED_EXECUTORS = ("thread", "process")
+
+
+@dataclass(frozen=True)
+class NormalizerExecution:
+    """Как запускать синхронный нормализатор одного silver-таргета."""
+    executor: str = "thread"
+    normalizer_path: Optional[str] = None
+    max_workers: Optional[int] = None
+
+    @property
+    def in_process_pool(self) -> bool:
+        return self.executor == "process"
+
+
+def parse_normalizer_execution(t_cfg: Optional[dict], *, target: str) -> Optional[NormalizerExecution]:
+    """Разбирает блок `normalize` silver-таргета. None — обычный запуск в потоке."""
+    t_cfg = t_cfg or {}
+    raw = t_cfg.get("normalize")
+    if not raw:
+        return None
+
+    executor = str(raw.get("executor") or "thread").lower()
+    if executor not in SUPPORTED_EXECUTORS:
+        raise ValueError(
+            f"{target}: неизвестный normalize.executor={executor!r}, "
+            f"поддерживаются: {', '.join(SUPPORTED_EXECUTORS)}"
+        )
+
+    path = t_cfg.get("normalizer")
+    if executor == "process" and not isinstance(path, str):
+        raise ValueError(f"{target}: normalize.executor=process требует normalizer в виде dotted-path строки")
+
+    workers = raw.get("max_workers")
+    return NormalizerExecution(
+        executor=executor,
+        normalizer_path=path if isinstance(path, str) else None,
+        max_workers=int(workers) if workers else None,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Пул процессов (один на процесс-оркестратор, создаётся лениво)
+# ---------------------------------------------------------------------------
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _default_workers() -> int:
+    env = os.getenv("NORMALIZER_POOL_WORKERS")
+    if env:
+        return max(int(env), 1)
+    return max((os.cpu_count() or 2) - 1, 1)
+
+
+def get_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Общий ProcessPoolExecutor. Воркеры стартуют через spawn: форк процесса с
+    живым event loop / gRPC-потоками Dagster небезопасен.
+    Если запрошено больше воркеров, чем в текущем пуле, — пул пересоздаётся.
+    """
+    global _POOL, _POOL_WORKERS
+    want = max_workers or _default_workers()
+    with _POOL_LOCK:
+        if _POOL is None or want > _POOL_WORKERS:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=False)
+            _POOL = ProcessPoolExecutor(max_workers=want, mp_context=mp.get_context("spawn"))
+            _POOL_WORKERS = want
+        return _POOL
+
+
+@atexit.register
+def shutdown_pool() -> None:
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL, _POOL_WORKERS = None, 0
+
+
+# ---------------------------------------------------------------------------
+# Сторона воркера
+# ---------------------------------------------------------------------------
+
+_WORKER_NORMALIZERS: Dict[str, Any] = {}
+
+
+def _worker_resolve(path: str):
+    fn = _WORKER_NORMALIZERS.get(path)
+    if fn is None:
+        from dagster_conf.lib.asset_factories.factory_utils import resolve_build_params
+        fn = resolve_build_params(path)
+        _WORKER_NORMALIZERS[path] = fn
+    return fn
+
+
+def rows_to_columns(rows) -> Tuple[List[str], Dict[str, List[Any]]]:
+    """list[dict] → (порядок колонок, {колонка: значения}); отсутствующие ключи → None."""
+    rows = list(rows or [])
+    columns: List[str] = []
+    seen = set()
+    for r in rows:
+        for k in r.keys():
+            if k not in seen:
+                seen.add(k)
+                columns.append(k)
+    data = {c: [r.get(c) for r in rows] for c in columns}
+    return columns, data
+
+
+def columns_to_rows(columns: List[str], data: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    if not columns:
+        return []
+    cols = [data[c] for c in columns]
+    return [dict(zip(columns, values)) for values in zip(*cols)]
+
+
+# Типы, которые Arrow переносит без потери значения и типа (для колонки из значений одного типа).
+# dict/list не берём: struct дописал бы отсутствующие ключи как None. date/datetime/Decimal
+# Arrow переносит верно, но to_pylist собирает их медленнее, чем pickle (datetime с tz — в разы).
+_ARROW_SCALARS = (bool, int, float, str, bytes)
+
+
+def _arrow_column(values: List[Any]):
+    kinds = {type(v) for v in values if v is not None}
+    if len(kinds) > 1 or (kinds and kinds.pop() not in _ARROW_SCALARS):
+        return None
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return None  # например, aware и naive datetime вместе или int вне int64
+
+
+def encode_columns(columns: List[str], data: Dict[str, List[Any]]) -> Tuple[List[str], Optional[bytes], Dict[str, List[Any]]]:
+    """(columns, data) → (порядок колонок, Arrow IPC-поток скалярных колонок или None, прочие колонки)."""
+    if pa is None or not columns:
+        return columns, None, data
+    arrays, rest = {}, {}
+    for c in columns:
+        arr = _arrow_column(data[c])
+        if arr is None:
+            rest[c] = data[c]
+        else:
+            arrays[c] = arr
+    if not arrays:
+        return columns, None, rest
+    table = pa.table(arrays)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return columns, sink.getvalue().to_pybytes(), rest
+
+
+def decode_columns(columns: List[str], ipc: Optional[bytes], rest: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    data = dict(rest)
+    if ipc is not None:
+        table = pa.ipc.open_stream(ipc).read_all()
+        data.update(table.to_pydict())
+    return columns_to_rows(columns, data)
+
+
+def _run_in_worker(path: str, payload: Any, kwargs: Dict[str, Any]):
+    fn = _worker_resolve(path)
+    rows = fn(payload, **kwargs)
+    return encode_columns(*rows_to_columns(rows))
+
+
+# ---------------------------------------------------------------------------
+# Сторона оркестратора
+# ---------------------------------------------------------------------------
+
+async def run_normalizer_in_pool(
+    execution: NormalizerExecution,
+    payload: Any,
+    kwargs: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Отправляет нормализацию в пул процессов и возвращает список строк."""
+    pool = get_pool(execution.max_workers)
+    loop = asyncio.get_running_loop()
+    columns, ipc, rest = await loop.run_in_executor(
+        pool, _run_in_worker, execution.normalizer_path, payload, kwargs,
+    )
+    return decode_columns(columns, ipc, rest)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Темп запросов к WB по заголовкам X-Ratelimit-* / Retry-After
+#
+# Общий для конвейеров сбора (fetch_pipeline) и клиентов оптимизаторов
+# (api/wb_campaign_gateway.py): один HeaderRatePacer на токен/эндпоинт.
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def _lower_headers(headers: Optional[Mapping[str, Any]]) -> Dict[str, str]:
+    try:
+        return {str(k).lower(): str(v) for k, v in (headers or {}).items()}
+    except Exception:
+        return {}
+
+
+def _hdr_float(h: Dict[str, str], *names: str) -> Optional[float]:
+    for n in names:
+        v = h.get(n)
+        if v is None or v == "":
+            continue
+        try:
+            return float(v)
+        except ValueError:
+            continue
+    return None
+
+
+class HeaderRatePacer:
+    """
+    Темп запросов одного токена по заголовкам WB:
+      X-Ratelimit-Remaining > 0      → следующий запрос можно сразу (не раньше min_interval);
+      X-Ratelimit-Retry / Reset      → ждём указанное число секунд;
+      Retry-After (429)              → то же;
+      заголовков нет                 → консервативная пауза fallback_delay.
+    """
+
+    def __init__(self, *, fallback_delay: float = 60.0, min_interval: float = 0.0, clock=time.monotonic):
+        self.fallback_delay = float(fallback_delay)
+        self.min_interval = float(min_interval)
+        self._clock = clock
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def next_at(self) -> float:
+        return self._next_at
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            delay = self._next_at - self._clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # пока ответ не пришёл, не даём остальным воркерам стрелять залпом
+            self._next_at = self._clock() + self.min_interval
+
+    def _push(self, delay: float) -> None:
+        self._next_at = max(self._next_at, self._clock() + max(delay, 0.0))
+
+    def observe(self, headers: Optional[Mapping[str, Any]]) -> None:
+        """Учитывает заголовки успешного ответа."""
+        h = _lower_headers(headers)
+        remaining = _hdr_float(h, "x-ratelimit-remaining")
+        wait = _hdr_float(h, "x-ratelimit-retry", "x-ratelimit-reset", "retry-after")
+        if remaining is not None and remaining > 0:
+            self._push(self.min_interval)
+        elif wait is not None:
+            self._push(wait)
+        else:
+            # нет заголовков или remaining == 0 без подсказки, когда обновится окно
+            self._push(self.fallback_delay)
+
+    def penalize(self, headers: Optional[Mapping[str, Any]]) -> float:
+        """429: пауза для всех воркеров токена. Возвращает выбранную задержку."""
+        h = _lower_headers(headers)
+        wait = _hdr_float(h, "x-ratelimit-retry", "retry-after", "x-ratelimit-reset")
+        delay = wait if wait is not None else self.fallback_delay
+        self._push(delay)
+        return delay
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from dagster import RunRequest, SensorDefinition, SensorResult, SkipReason
+
+from dagster_conf.lib.tokens import TokenSnapshot, token_snapshot
+
+DEFAULT_TZ = "Europe/Moscow"
+UTC = ZoneInfo("UTC")
+
+# кабинеты, по которым собираем рекламные эндпоинты / отчёты селлера
+WB_ADV_TOKEN_IDS = (2, 3, 4, 5, 45)
+WB_SELLER_TOKEN_IDS = (1, 2, 3, 4, 5, 45)
+
+# ---------------------------------------------------------------------------
+# Общая основа «токенных» сенсоров (fullstats, stats_keywords, promotions, …)
+#
+# Раньше каждый сенсор раз в минуту сравнивал now.minute с окном и, попав в
+# окно, открывал свой psycopg2.connect за списком токенов. Здесь:
+#
+#  1) слот — последний тик cron (МСК) ≤ now; ранний выход, если слот уже
+#     выпущен (курсор сенсора) или окно запуска прошло — тик без обращений к БД;
+#  2) токены — из общего TTL-снимка core.tokens (dagster_conf.lib.tokens);
+#  3) RunRequest'ы на все токены слота отдаются одним SensorResult вместе с
+#     новым курсором;
+#  4) run_key / теги — те же, что были у сенсоров, так что дедуп Dagster
+#     по run_key продолжает работать и при переключении.
+# ---------------------------------------------------------------------------
+
+
+def _cron_field(value: str, lo: int, hi: int) -> Optional[Tuple[int, ...]]:
+    """'*' → None; '5' / '0,30' / '*/15' → отсортированный кортеж значений."""
+    if value == "*":
+        return None
+    m = re.fullmatch(r"\*/(\d+)", value)
+    if m:
+        return tuple(range(lo, hi + 1, int(m.group(1))))
+    out = sorted({int(v) for v in value.split(",")})
+    if not out or out[0] < lo or out[-1] > hi:
+        raise ValueError(f"значение вне диапазона {lo}..{hi}: {value!r}")
+    return tuple(out)
+
+
+def parse_cron(cron: str) -> Tuple[Tuple[int, ...], Optional[Tuple[int, ...]]]:
+    """
+    Поддерживаемое подмножество: 'M H * * *', где M — число/список/шаг,
+    H — то же или '*'. Возвращает (минуты, часы|None).
+    """
+    fields = re.split(r"\s+", cron.strip())
+    if len(fields) != 5 or fields[2:] != ["*", "*", "*"]:
+        raise ValueError(f"Неподдерживаемый cron для сенсора: {cron!r}")
+    minutes = _cron_field(fields[0], 0, 59)
+    if minutes is None:
+        raise ValueError(f"Минутный cron не поддерживается сенсором: {cron!r}")
+    return minutes, _cron_field(fields[1], 0, 23)
+
+
+def latest_slot(cron: str, now: datetime) -> datetime:
+    """Последний тик cron ≤ now (в таймзоне now)."""
+    minutes, hours = parse_cron(cron)
+    top = now.replace(minute=0, second=0, microsecond=0)
+    for back in range(0, 25):
+        base = top - timedelta(hours=back)
+        if hours is not None and base.hour not in hours:
+            continue
+        for m in reversed(minutes):
+            cand = base.replace(minute=m)
+            if cand <= now:
+                return cand
+    raise ValueError(f"Не удалось найти тик cron {cron!r} до {now}")
+
+
+def next_slot(cron: str, now: datetime) -> datetime:
+    """Ближайший тик cron > now."""
+    minutes, hours = parse_cron(cron)
+    top = now.replace(minute=0, second=0, microsecond=0)
+    for ahead in range(0, 25):
+        base = top + timedelta(hours=ahead)
+        if hours is not None and base.hour not in hours:
+            continue
+        for m in minutes:
+            cand = base.replace(minute=m)
+            if cand > now:
+                return cand
+    raise ValueError(f"Не удалось найти тик cron {cron!r} после {now}")
+
+
+def read_cursor(raw: Optional[str]) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def token_run_config(token_id: int, token: str, ops: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """run_config токенных джоб: wildberries_client + postgres (+ конфиг ассетов)."""
+    run_config: Dict[str, Any] = {
+        "resources": {
+            "wildberries_client": {"config": {"token": token, "token_id": token_id}},
+            "postgres": {"config": {}},
+        }
+    }
+    if ops:
+        run_config["ops"] = ops
+    return run_config
+
+
+def token_slot_sensor(
+    *,
+    name: str,
+    job,
+    cron: str,
+    token_ids: Sequence[int],
+    run_key: str = "{slot:%Y%m%d}-{token_id}",
+    ops: Optional[Dict[str, Any]] = None,
+    window_minutes: int = 5,
+    delay_minutes: int = 0,
+    scheduled_tag: bool = True,
+    timezone: str = DEFAULT_TZ,
+    description: Optional[str] = None,
+    minimum_interval_seconds: int = 60,
+    snapshot: Optional[Callable[[], TokenSnapshot]] = None,
+) -> SensorDefinition:
+    """
+    Сенсор «по слоту cron × токен»: в окне [slot + delay, slot + delay + window)
+    выпускает по RunRequest на каждый токен из token_ids. delay_minutes — для
+    джоб, у которых плановое время (slot) — начало часа, а старт — через
+    несколько минут после него.
+
+    run_key — шаблон str.format с полями slot (datetime МСК) и token_id.
+    scheduled_tag — проставлять dagster/scheduled_execution_time = slot (UTC).
+    """
+    parse_cron(cron)  # валидация при импорте code location
+    tz = ZoneInfo(timezone)
+    window = timedelta(minutes=window_minutes)
+    delay = timedelta(minutes=delay_minutes)
+    ids = tuple(token_ids)
+
+    def _eval(context):
+        now = datetime.now(tz)
+        slot = latest_slot(cron, now - delay)
+        cursor = read_cursor(context.cursor)
+
+        if cursor.get("slot") == slot.isoformat() or now >= slot + delay + window:
+            due = next_slot(cron, now - delay) + delay
+            return SkipReason(f"следующий запуск {due:%Y-%m-%d %H:%M} ({timezone})")
+
+        rows = (snapshot or token_snapshot)().tokens(ids)
+        if not rows:
+            context.log.warning("Нет активных токенов в core.tokens")
+            return SkipReason("Нет активных токенов в core.tokens")
+
+        tags = {"dagster/scheduled_execution_time": slot.astimezone(UTC).isoformat()} if scheduled_tag else {}
+        run_requests: List[RunRequest] = [
+            RunRequest(
+                run_key=run_key.format(slot=slot, token_id=token_id),
+                run_config=token_run_config(token_id, token, ops),
+                tags=tags,
+            )
+            for token_id, token in rows
+        ]
+        context.log.info(
+            f"Scheduling {job.name} for slot {slot:%Y-%m-%d %H:%M}: token_id={[t for t, _ in rows]}"
+        )
+        return SensorResult(
+            run_requests=run_requests,
+            cursor=json.dumps({"slot": slot.isoformat()}),
+        )
+
+    return SensorDefinition(
+        name=name,
+        evaluation_fn=_eval,
+        job=job,
+        minimum_interval_seconds=minimum_interval_seconds,
+        description=description or (
+            f"{job.name}: cron '{cron}' ({timezone}) +{delay_minutes} мин, "
+            f"окно {window_minutes} мин, токены {list(ids)}"
+        ),
+    )
@@ -0,0 +1,387 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+from sqlalchemy import text
+
+from dagster_conf.lib.timeutils import MSK
+
+
+# ---------------------------------------------------------------------------
+# Декларативное партиционирование bronze/silver по business_dttm
+#
+# Формат в config.yml (на уровне пайплайна):
+#
+#   partitioning:
+#     bronze: { interval: daily,   retention_days: 90, premake: 3 }
+#     silver: { interval: monthly, retention_days: 730 }
+#
+# и/или точечно для silver-таргета:
+#
+#   silver:
+#     targets:
+#       wb_adv_keyword_stats_1h:
+#         partitioning: { interval: daily, retention_days: 180 }
+#
+# Колонка по умолчанию — business_dttm (можно переопределить `column:`).
+# ---------------------------------------------------------------------------
+
+SUPPORTED_INTERVALS = ("daily", "monthly")
+DEFAULT_PREMAKE = 3
+
+_BOUND_RE = re.compile(r"FROM \((?P<lo>[^)]*)\) TO \((?P<hi>[^)]*)\)", re.I)
+
+
+@dataclass(frozen=True)
+class TimePartitioning:
+    """Параметры RANGE-партиционирования одной таблицы."""
+    schema: str
+    table: str
+    interval: str = "monthly"
+    column: str = "business_dttm"
+    retention_days: Optional[int] = None
+    premake: int = DEFAULT_PREMAKE
+    start: Optional[date] = None
+
+    @property
+    def qualified_name(self) -> str:
+        return f'"{self.schema}"."{self.table}"'
+
+    @property
+    def partition_by(self) -> str:
+        return f"RANGE ({self.column})"
+
+
+def parse_partitioning(
+    raw: Optional[dict],
+    *,
+    schema: str,
+    table: str,
+    start: Optional[date] = None,
+) -> Optional[TimePartitioning]:
+    """Разбирает блок `partitioning` из config.yml. None — таблица не партиционируется."""
+    if not raw:
+        return None
+
+    interval = str(raw.get("interval") or "monthly").lower()
+    if interval not in SUPPORTED_INTERVALS:
+        raise ValueError(
+            f"{schema}.{table}: неизвестный partitioning.interval={interval!r}, "
+            f"поддерживаются: {', '.join(SUPPORTED_INTERVALS)}"
+        )
+
+    retention = raw.get("retention_days")
+    return TimePartitioning(
+        schema=schema,
+        table=table,
+        interval=interval,
+        column=str(raw.get("column") or "business_dttm"),
+        retention_days=int(retention) if retention else None,
+        premake=int(raw.get("premake", DEFAULT_PREMAKE)),
+        start=start,
+    )
+
+
+def _pipeline_start(pipe_cfg: dict) -> Optional[date]:
+    raw = ((pipe_cfg.get("partitions") or {}).get("business_dttm") or {}).get("start")
+    if not raw:
+        return None
+    if isinstance(raw, date):
+        return raw if not isinstance(raw, datetime) else raw.date()
+    return date.fromisoformat(str(raw).strip()[:10])
+
+
+def partitioning_for_pipeline(
+    pipe_name: str,
+    pipe_cfg: dict,
+    *,
+    bronze_schema: str,
+    silver_schema: str,
+) -> Tuple[Optional[TimePartitioning], Dict[str, TimePartitioning]]:
+    """Возвращает (bronze, {silver_table: spec}) для одного пайплайна из config.yml."""
+    block = pipe_cfg.get("partitioning") or {}
+    start = _pipeline_start(pipe_cfg)
+
+    bronze_table = pipe_cfg.get("bronze_table") or pipe_name
+    bronze = parse_partitioning(block.get("bronze"), schema=bronze_schema, table=bronze_table, start=start)
+
+    silvers: Dict[str, TimePartitioning] = {}
+    targets = ((pipe_cfg.get("silver") or {}).get("targets") or pipe_cfg.get("silver_tables") or {})
+    for silver_table, t_cfg in targets.items():
+        raw = (t_cfg or {}).get("partitioning") or block.get("silver")
+        spec = parse_partitioning(raw, schema=silver_schema, table=silver_table, start=start)
+        if spec:
+            silvers[silver_table] = spec
+    return bronze, silvers
+
+
+def partitioning_from_config(
+    config_path: Path,
+    *,
+    bronze_schema: str = "bronze_v2",
+    silver_schema: str = "silver_v2",
+) -> List[TimePartitioning]:
+    """Все партиционируемые таблицы из config.yml (без генерации ORM-моделей)."""
+    with config_path.open("r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+
+    out: List[TimePartitioning] = []
+    for pipe_name, pipe_cfg in (cfg.get("pipelines") or {}).items():
+        bronze, silvers = partitioning_for_pipeline(
+            pipe_name, pipe_cfg or {}, bronze_schema=bronze_schema, silver_schema=silver_schema,
+        )
+        if bronze:
+            out.append(bronze)
+        out.extend(silvers.values())
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Границы партиций
+# ---------------------------------------------------------------------------
+
+def period_start(spec: TimePartitioning, moment: datetime) -> datetime:
+    """Начало периода (MSK), в который попадает moment."""
+    m = moment.astimezone(MSK) if moment.tzinfo else moment.replace(tzinfo=MSK)
+    if spec.interval == "daily":
+        return m.replace(hour=0, minute=0, second=0, microsecond=0)
+    return m.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_period(spec: TimePartitioning, start: datetime) -> datetime:
+    if spec.interval == "daily":
+        return (start + timedelta(days=1)).replace(hour=0)
+    y, m = (start.year + 1, 1) if start.month == 12 else (start.year, start.month + 1)
+    return start.replace(year=y, month=m, day=1)
+
+
+def partition_name(spec: TimePartitioning, start: datetime) -> str:
+    fmt = "%Y%m%d" if spec.interval == "daily" else "%Y%m"
+    return f"{spec.table}_p{start.strftime(fmt)}"
+
+
+def expected_partitions(spec: TimePartitioning, now: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Партиции, которые должны существовать на момент now:
+    от max(start пайплайна, now - retention) до текущего периода + premake.
+    """
+    lo = period_start(spec, now)
+    if spec.start:
+        lo = period_start(spec, datetime.combine(spec.start, datetime.min.time(), tzinfo=MSK))
+    if spec.retention_days:
+        lo = max(lo, period_start(spec, now - timedelta(days=spec.retention_days)))
+
+    hi = period_start(spec, now)
+    for _ in range(max(spec.premake, 0)):
+        hi = next_period(spec, hi)
+
+    out: List[Tuple[str, datetime, datetime]] = []
+    cur = lo
+    while cur <= hi:
+        nxt = next_period(spec, cur)
+        out.append((partition_name(spec, cur), cur, nxt))
+        cur = nxt
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Каталог Postgres
+# ---------------------------------------------------------------------------
+
+def _parse_bound(raw: str) -> Optional[datetime]:
+    s = raw.strip().strip("'")
+    if s.upper() in ("MINVALUE", "MAXVALUE"):
+        return None
+    dt = datetime.fromisoformat(s)
+    # границы по date-колонке приходят без смещения — считаем их MSK, как и наши партиции
+    return dt if dt.tzinfo else dt.replace(tzinfo=MSK)
+
+
+def is_partitioned(conn, spec: TimePartitioning) -> bool:
+    kind = conn.execute(text("""
+        SELECT c.relkind
+          FROM pg_class c
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = :schema AND c.relname = :table
+    """), {"schema": spec.schema, "table": spec.table}).scalar()
+    return kind == "p"
+
+
+def existing_partitions(conn, spec: TimePartitioning) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """[(name, lower, upper)] — None для MINVALUE/MAXVALUE и DEFAULT-партиции."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+          FROM pg_inherits i
+          JOIN pg_class c      ON c.oid = i.inhrelid
+          JOIN pg_class p      ON p.oid = i.inhparent
+          JOIN pg_namespace n  ON n.oid = p.relnamespace
+         WHERE n.nspname = :schema AND p.relname = :table
+    """), {"schema": spec.schema, "table": spec.table}).fetchall()
+
+    out = []
+    for name, bound in rows:
+        m = _BOUND_RE.search(bound or "")
+        if not m:
+            out.append((name, None, None))
+            continue
+        out.append((name, _parse_bound(m.group("lo")), _parse_bound(m.group("hi"))))
+    return out
+
+
+def _overlaps(lo: datetime, hi: datetime, parts) -> bool:
+    for _name, p_lo, p_hi in parts:
+        if p_lo is None and p_hi is None:
+            continue  # DEFAULT
+        if (p_lo is None or p_lo < hi) and (p_hi is None or lo < p_hi):
+            return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Обслуживание: создание будущих и удаление просроченных партиций
+#
+# DEFAULT-партиция принимает строки вне созданных диапазонов (бэкфилл старше
+# retention, запись дальше premake) — иначе INSERT падает с
+# «no partition of relation found for row». При создании диапазона строки из
+# DEFAULT переносятся в новую партицию, строки старше retention удаляются
+# вместе с просроченными партициями.
+# ---------------------------------------------------------------------------
+
+def default_partition_name(spec: TimePartitioning) -> str:
+    return f"{spec.table}_default"
+
+
+def ensure_default_partition(conn, spec: TimePartitioning, parts=None) -> Optional[str]:
+    """Создаёт DEFAULT-партицию, если её нет. Возвращает имя созданной или None."""
+    parts = existing_partitions(conn, spec) if parts is None else parts
+    if any(lo is None and hi is None for _name, lo, hi in parts):
+        return None
+    name = default_partition_name(spec)
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{spec.schema}"."{name}" PARTITION OF {spec.qualified_name} DEFAULT'
+    ))
+    parts.append((name, None, None))
+    return name
+
+
+def _default_rows_between(conn, spec: TimePartitioning, default: str, lo: datetime, hi: datetime) -> bool:
+    return bool(conn.execute(text(
+        f'SELECT EXISTS (SELECT 1 FROM "{spec.schema}"."{default}" '
+        f'WHERE "{spec.column}" >= :lo AND "{spec.column}" < :hi)'
+    ), {"lo": lo, "hi": hi}).scalar())
+
+
+def _create_from_default(conn, spec: TimePartitioning, default: str, name: str, lo: datetime, hi: datetime) -> None:
+    """
+    Партиция для диапазона, строки которого уже лежат в DEFAULT: отдельная
+    таблица ← перенос строк → ATTACH (CREATE ... PARTITION OF упал бы на
+    проверке DEFAULT). Индексы родителя создаются при ATTACH.
+    """
+    qualified = f'"{spec.schema}"."{name}"'
+    conn.execute(text(f"CREATE TABLE {qualified} (LIKE {spec.qualified_name} INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM "{spec.schema}"."{default}" '
+        f'WHERE "{spec.column}" >= :lo AND "{spec.column}" < :hi RETURNING *) '
+        f"INSERT INTO {qualified} SELECT * FROM moved"
+    ), {"lo": lo, "hi": hi})
+    conn.execute(text(
+        f"ALTER TABLE {spec.qualified_name} ATTACH PARTITION {qualified} "
+        f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    ))
+
+
+def ensure_partitions(conn, spec: TimePartitioning, *, now: Optional[datetime] = None) -> List[str]:
+    """Создаёт DEFAULT и недостающие партиции (история от start/retention + premake вперёд)."""
+    now = now or datetime.now(MSK)
+    if not is_partitioned(conn, spec):
+        return []
+
+    parts = existing_partitions(conn, spec)
+    created: List[str] = []
+    default_created = ensure_default_partition(conn, spec, parts)
+    if default_created:
+        created.append(default_created)
+    default = next(name for name, lo, hi in parts if lo is None and hi is None)
+
+    for name, lo, hi in expected_partitions(spec, now):
+        if _overlaps(lo, hi, parts):
+            continue
+        if not default_created and _default_rows_between(conn, spec, default, lo, hi):
+            _create_from_default(conn, spec, default, name, lo, hi)
+        else:
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{spec.schema}"."{name}" '
+                f"PARTITION OF {spec.qualified_name} "
+                f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+            ))
+        parts.append((name, lo, hi))
+        created.append(name)
+    return created
+
+
+def drop_expired_partitions(conn, spec: TimePartitioning, *, now: Optional[datetime] = None) -> List[str]:
+    """DETACH + DROP партиций, целиком лежащих старше retention_days; из DEFAULT — DELETE тех же строк."""
+    if not spec.retention_days:
+        return []
+    now = now or datetime.now(MSK)
+    if not is_partitioned(conn, spec):
+        return []
+
+    cutoff = period_start(spec, now - timedelta(days=spec.retention_days))
+    dropped: List[str] = []
+    for name, lo, hi in existing_partitions(conn, spec):
+        if lo is None and hi is None:
+            conn.execute(text(
+                f'DELETE FROM "{spec.schema}"."{name}" WHERE "{spec.column}" < :cutoff'
+            ), {"cutoff": cutoff})
+            continue
+        if hi is None or hi > cutoff:
+            continue
+        conn.execute(text(f'ALTER TABLE {spec.qualified_name} DETACH PARTITION "{spec.schema}"."{name}"'))
+        conn.execute(text(f'DROP TABLE IF EXISTS "{spec.schema}"."{name}"'))
+        dropped.append(name)
+    return dropped
+
+
+def migrate_heap_to_partitioned(conn, spec: TimePartitioning, table_obj) -> Optional[str]:
+    """
+    Переводит существующую обычную таблицу в партиционированную:
+      1) старая таблица переименовывается в <table>_legacy;
+      2) создаётся партиционированный родитель по DDL модели (table_obj);
+      3) legacy подключается партицией [MINVALUE, начало периода после max(column)).
+    Возвращает имя legacy-партиции или None, если миграция не требуется.
+    """
+    exists = conn.execute(text("""
+        SELECT c.relkind
+          FROM pg_class c
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = :schema AND c.relname = :table
+    """), {"schema": spec.schema, "table": spec.table}).scalar()
+    if exists is None or exists == "p":
+        return None
+
+    legacy = f"{spec.table}_legacy"
+    max_dt = conn.execute(text(
+        f'SELECT max("{spec.column}") FROM {spec.qualified_name}'
+    )).scalar()
+
+    conn.execute(text(f'ALTER TABLE {spec.qualified_name} RENAME TO "{legacy}"'))
+    # имена индексов/ограничений уникальны в схеме — освобождаем их для родителя
+    for (idx_name,) in conn.execute(text("""
+        SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table
+    """), {"schema": spec.schema, "table": legacy}).fetchall():
+        conn.execute(text(f'ALTER INDEX "{spec.schema}"."{idx_name}" RENAME TO "{idx_name[:54]}_legacy"'))
+
+    table_obj.create(bind=conn)
+
+    upper = next_period(spec, period_start(spec, max_dt)) if max_dt else period_start(spec, datetime.now(MSK))
+    conn.execute(text(
+        f'ALTER TABLE {spec.qualified_name} ATTACH PARTITION "{spec.schema}"."{legacy}" '
+        f"FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat()}')"
+    ))
+    return legacy
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import Dict
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from sqlalchemy import create_engine, text
 
@@ -27,7 +30,21 @@ def _build_sync_dsn() -> str:
     return f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{name}?sslmode={sslm}"
 
 
-_ENGINE = create_engine(_build_sync_dsn(), future=True, pool_pre_ping=True)
+@lru_cache(maxsize=1)
+def _engine():
+    """Движок создаётся при первом обращении, а не при импорте code location."""
+    dsn = _build_sync_dsn()
+    # как раньше psycopg2.connect(..., sslmode="require") в сенсорах
+    connect_args = {} if "sslmode=" in dsn else {"sslmode": os.getenv("DB_SSLMODE", "require")}
+    return create_engine(
+        dsn,
+        future=True,
+        pool_pre_ping=True,
+        pool_size=1,
+        max_overflow=2,
+        pool_recycle=1800,
+        connect_args=connect_args,
+    )
 
 
 @lru_cache(maxsize=128)
@@ -36,7 +53,7 @@ def token_for_company(company_id: int) -> Dict[str, object]:
     Возвращает {token_id, token} для заданного company_id из core.tokens.
     Правило: берём активный токен (is_active=TRUE) по возрастанию token_id.
     """
-    with _ENGINE.connect() as conn:
+    with _engine().connect() as conn:
         row = conn.execute(
             text(
                 """
@@ -53,3 +70,63 @@ def token_for_company(company_id: int) -> Dict[str, object]:
         if not row:
             raise RuntimeError(f"Активный token не найден для company_id={company_id}")
         return {"token_id": int(row[0]), "token": row[1]}
+
+
+# ---------------------------------------------------------------------------
+# Снимок core.tokens для сенсоров
+#
+# Все сенсоры code location (тикают раз в минуту) читают токены из одного
+# процессного снимка: один SELECT на TTL через пул _engine() вместо
+# psycopg2.connect на каждый тик каждого сенсора.
+# ---------------------------------------------------------------------------
+
+TOKENS_TTL_SEC = float(os.getenv("SENSOR_TOKENS_TTL_SEC", "300"))
+
+
+@dataclass(frozen=True)
+class TokenRow:
+    token_id: int
+    token: str
+
+
+class TokenSnapshot:
+    """Кэш core.tokens с TTL; потокобезопасен (демон вычисляет сенсоры в пуле потоков)."""
+
+    def __init__(self, ttl_sec: float = TOKENS_TTL_SEC, loader=None, clock=time.monotonic):
+        self._ttl = ttl_sec
+        self._loader = loader or _load_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows: Dict[int, TokenRow] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _fresh(self) -> Dict[int, TokenRow]:
+        with self._lock:
+            now = self._clock()
+            if self._loaded_at is None or now - self._loaded_at >= self._ttl:
+                self._rows = {r.token_id: r for r in self._loader()}
+                self._loaded_at = now
+            return self._rows
+
+    def tokens(self, token_ids: Iterable[int]) -> List[Tuple[int, str]]:
+        """(token_id, token) для указанных id в порядке token_id — как отдавал прежний SELECT ... IN (...)."""
+        rows = self._fresh()
+        return [(tid, rows[tid].token) for tid in sorted(set(token_ids)) if tid in rows]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+
+def _load_tokens() -> List[TokenRow]:
+    with _engine().connect() as conn:
+        rows = conn.execute(
+            text("SELECT token_id, token FROM core.tokens")
+        ).all()
+    return [TokenRow(int(r[0]), r[1]) for r in rows]
+
+
+@lru_cache(maxsize=1)
+def token_snapshot() -> TokenSnapshot:
+    """Общий на процесс code location снимок токенов."""
+    return TokenSnapshot()
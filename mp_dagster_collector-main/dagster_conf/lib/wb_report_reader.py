@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Чтение XLSX-отчётов WB (финотчёт ZIP→XLSX) для нормализаторов
+#
+#  1) распаковка base64 ZIP из bronze.response_body без промежуточных копий;
+#  2) быстрый движок чтения: calamine (если установлен python-calamine),
+#     иначе openpyxl (pandas открывает книгу в read_only-режиме);
+#  3) явные dtypes для текстовых колонок — без угадывания типов по ячейкам;
+#  4) кэш «один разбор на request_uuid» в памяти процесса + Parquet side cache
+#     на диске, общий для процессов/воркеров/ретраев: WB_REPORT_CACHE_DIR
+#     (по умолчанию <tmp>/wb_report_cache, off — выключить), файлы старше
+#     WB_REPORT_CACHE_TTL_SEC и сверх WB_REPORT_CACHE_MAX_MB удаляются;
+#  5) разрез по «Обоснование для оплаты» сразу во все fin-таргеты за один проход.
+# ---------------------------------------------------------------------------
+
+PAYMENT_REASON_COL = "Обоснование для оплаты"
+
+# Группа fin-таргетов → значения «Обоснование для оплаты»
+FIN_REASON_GROUPS: Dict[str, frozenset] = {
+    "adjustments": frozenset({"Удержание", "Штраф", "Добровольная компенсация при возврате"}),
+    "sales": frozenset({"Продажа", "Возврат"}),
+    "logistics": frozenset({"Логистика"}),
+}
+
+# Колонки, которые должны остаться строками (иначе баркоды/артикулы превращаются в float)
+FIN_REPORT_STR_COLS = (
+    "Баркод", "Srid", "Артикул поставщика", "Размер", "Название", "Бренд", "Предмет",
+    "Склад", "Страна", "Тип документа", PAYMENT_REASON_COL, "Тип коробов",
+    "Виды логистики, штрафов и доплат", "Виды логистики, штрафов и корректировок ВВ",
+    "Наименование банка-эквайера",
+)
+FIN_REPORT_DTYPES: Dict[str, Any] = {c: "string" for c in FIN_REPORT_STR_COLS}
+
+CACHE_MAX_REPORTS = int(os.getenv("WB_REPORT_CACHE_MAX", "4"))
+# Parquet-кэш нужен на время одного прогона (шаги, воркеры пула, ретраи)
+CACHE_TTL_SEC = int(os.getenv("WB_REPORT_CACHE_TTL_SEC", str(6 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("WB_REPORT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def excel_engine() -> str:
+    """calamine (Rust, в разы быстрее) при наличии, иначе openpyxl."""
+    return "calamine" if _has_module("python_calamine") else "openpyxl"
+
+
+def _parquet_available() -> bool:
+    return _has_module("pyarrow") or _has_module("fastparquet")
+
+
+# ---------------------------------------------------------------------------
+# Распаковка payload
+# ---------------------------------------------------------------------------
+
+def _payload_data(payload: Any) -> Any:
+    raw = payload
+    # допускаем, что нам передали запись бронзы целиком
+    if isinstance(raw, dict) and "response_body" in raw:
+        raw = raw["response_body"]
+    if isinstance(raw, (bytes, bytearray)):
+        if bytes(raw[:2]) == b"PK":
+            return bytes(raw)
+        raw = raw.decode("utf-8", "ignore")
+    if isinstance(raw, str):
+        try:
+            return json.loads(raw)
+        except Exception:
+            return raw
+    return raw
+
+
+def _b64_from(data: Any) -> Optional[str]:
+    # WB обычно кладёт base64 в поле "file"
+    if isinstance(data, dict):
+        return data.get("file") or (data.get("data") or {}).get("file")
+    return None
+
+
+def report_cache_key(payload: Any, meta: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """request_uuid из meta; без него — sha1 от base64 (дёшево по сравнению с разбором XLSX)."""
+    ru = (meta or {}).get("request_uuid")
+    if ru:
+        return str(ru)
+    data = _payload_data(payload)
+    if isinstance(data, bytes):
+        return hashlib.sha1(data).hexdigest()
+    b64 = _b64_from(data)
+    if b64:
+        return hashlib.sha1(b64.encode("ascii", "ignore")).hexdigest()
+    return None
+
+
+def read_xlsx_bytes(xlsx: bytes, *, dtype: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """XLSX (bytes) → DataFrame с явными dtypes для известных колонок."""
+    engine = excel_engine()
+    buf = io.BytesIO(xlsx)
+    df = pd.read_excel(buf, engine=engine, dtype=dtype or None)
+    return df
+
+
+def read_report_frame(payload: Any) -> pd.DataFrame:
+    """
+    bronze → response_body (JSON) → base64 ZIP → XLSX → pandas.DataFrame
+    Возвращает DataFrame с оригинальными (русскими) заголовками WB.
+    """
+    data = _payload_data(payload)
+
+    if isinstance(data, bytes):
+        zbytes = data
+    else:
+        b64 = _b64_from(data)
+        if not b64:
+            # иногда приходит уже распакованный JSON/список — на такой случай просто делаем DataFrame
+            return pd.DataFrame(data if isinstance(data, list) else ([data] if data else []))
+        zbytes = base64.b64decode(b64)
+
+    with zipfile.ZipFile(io.BytesIO(zbytes)) as zf:
+        # берём первый .xlsx
+        xlsx_name = next((n for n in zf.namelist() if n.lower().endswith(".xlsx")), None)
+        if not xlsx_name:
+            raise ValueError("ZIP не содержит .xlsx")
+        xlsx = zf.read(xlsx_name)
+    del zbytes
+
+    df = read_xlsx_bytes(xlsx, dtype=FIN_REPORT_DTYPES)
+    if PAYMENT_REASON_COL in df.columns:
+        df[PAYMENT_REASON_COL] = df[PAYMENT_REASON_COL].str.strip()
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Кэш: память процесса (LRU) + Parquet на диске
+# ---------------------------------------------------------------------------
+
+_FRAMES: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_SPLITS: Dict[str, Dict[str, pd.DataFrame]] = {}
+_LOCK = threading.Lock()
+_KEY_LOCKS: Dict[str, threading.Lock] = {}
+
+
+def _cache_dir() -> Optional[Path]:
+    raw = os.getenv("WB_REPORT_CACHE_DIR") or str(Path(tempfile.gettempdir()) / "wb_report_cache")
+    if raw.lower() in ("off", "0", "none") or not _parquet_available():
+        return None
+    p = Path(raw)
+    try:
+        p.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        log.warning(f"[xlsx-cache] каталог {p} недоступен, Parquet-кэш выключен: {e}")
+        return None
+    return p
+
+
+def evict_parquet_cache(directory: Optional[Path] = None, *, now: Optional[float] = None) -> int:
+    """
+    Удаляет файлы кэша старше CACHE_TTL_SEC, затем самые старые (по mtime —
+    он обновляется при чтении) сверх CACHE_MAX_BYTES. Возвращает число удалённых.
+    """
+    directory = directory or _cache_dir()
+    if directory is None:
+        return 0
+    now = now or time.time()
+    files = []
+    for path in directory.glob("*.parquet"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue  # удалил соседний процесс
+        files.append((st.st_mtime, st.st_size, path))
+
+    removed = 0
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        if now - mtime <= CACHE_TTL_SEC and total <= CACHE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _parquet_path(key: str) -> Optional[Path]:
+    d = _cache_dir()
+    if d is None:
+        return None
+    safe = "".join(ch for ch in key if ch.isalnum() or ch in "-_")
+    return d / f"{safe}.parquet"
+
+
+def _load_parquet(key: str) -> Optional[pd.DataFrame]:
+    path = _parquet_path(key)
+    if path is None or not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path)
+        os.utime(path)  # свежий mtime — не вытеснять используемый отчёт
+        return df
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"[xlsx-cache] не удалось прочитать {path}: {e}")
+        return None
+
+
+def _store_parquet(key: str, df: pd.DataFrame) -> None:
+    path = _parquet_path(key)
+    if path is None:
+        return
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        evict_parquet_cache(path.parent)
+    except Exception as e:
+        # смешанные типы в object-колонках и т.п. — кэш необязателен
+        log.warning(f"[xlsx-cache] не удалось записать {path}: {e}")
+        tmp.unlink(missing_ok=True)
+
+
+def _remember(key: str, df: pd.DataFrame) -> None:
+    _FRAMES[key] = df
+    _FRAMES.move_to_end(key)
+    while len(_FRAMES) > max(CACHE_MAX_REPORTS, 1):
+        old, _ = _FRAMES.popitem(last=False)
+        _SPLITS.pop(old, None)
+        _KEY_LOCKS.pop(old, None)
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _LOCK:
+        return _KEY_LOCKS.setdefault(key, threading.Lock())
+
+
+def cached_report_frame(payload: Any, meta: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Разбирает отчёт один раз на request_uuid (память → Parquet → XLSX)."""
+    key = report_cache_key(payload, meta)
+    if key is None:
+        return read_report_frame(payload)
+
+    with _key_lock(key):
+        with _LOCK:
+            df = _FRAMES.get(key)
+            if df is not None:
+                _FRAMES.move_to_end(key)
+                return df
+
+        df = _load_parquet(key)
+        if df is None:
+            df = read_report_frame(payload)
+            _store_parquet(key, df)
+
+        with _LOCK:
+            _remember(key, df)
+        return df
+
+
+def split_by_reason(df: pd.DataFrame, groups: Dict[str, frozenset] = FIN_REASON_GROUPS) -> Dict[str, pd.DataFrame]:
+    """Один проход по «Обоснование для оплаты» → {группа: DataFrame}."""
+    out: Dict[str, pd.DataFrame] = {g: df.iloc[0:0] for g in groups}
+    if df.empty:
+        return out
+    if PAYMENT_REASON_COL not in df.columns:
+        # нет колонки — фильтр не применяем (как и раньше)
+        return {g: df for g in groups}
+
+    reason_to_group = {r: g for g, reasons in groups.items() for r in reasons}
+    codes = df[PAYMENT_REASON_COL].map(reason_to_group)
+    for g, sub in df.groupby(codes, sort=False):
+        out[g] = sub
+    return out
+
+
+def fin_report_slice(payload: Any, meta: Optional[Dict[str, Any]], group: str) -> pd.DataFrame:
+    """
+    Срез финотчёта под один fin-таргет. Разбор XLSX и разрез по причинам
+    выполняются один раз на request_uuid; наружу отдаётся копия.
+    """
+    if group not in FIN_REASON_GROUPS:
+        raise KeyError(f"Неизвестная группа финотчёта: {group!r}")
+
+    key = report_cache_key(payload, meta)
+    if key is None:
+        return split_by_reason(read_report_frame(payload))[group].copy()
+
+    with _LOCK:
+        parts = _SPLITS.get(key)
+    if parts is None:
+        df = cached_report_frame(payload, meta)
+        parts = split_by_reason(df)
+        with _LOCK:
+            if key in _FRAMES:
+                _SPLITS[key] = parts
+    return parts[group].copy()
+
+
+def clear_cache() -> None:
+    with _LOCK:
+        _FRAMES.clear()
+        _SPLITS.clear()
+        _KEY_LOCKS.clear()
@@ -4060,39 +4060,17 @@ class WbUniversalNormalizer(Normalizer):
         bronze → response_body (JSON) → base64 ZIP → XLSX → pandas.DataFrame
         Возвращает DataFrame с оригинальными (русскими) заголовками WB.
         """
-        import json, base64, io, zipfile, pandas as pd
+        from dagster_conf.lib.wb_report_reader import read_report_frame
+        return read_report_frame(payload)
 
-        raw = payload
-        # допускаем, что нам передали запись бронзы целиком
-        if isinstance(raw, dict) and "response_body" in raw:
-            raw = raw["response_body"]
-
-        if isinstance(raw, (bytes, bytearray)):
-            raw = raw.decode("utf-8", "ignore")
-        # JSON с ключом "file"
-        try:
-            data = json.loads(raw) if isinstance(raw, str) else raw
-        except Exception:
-            data = raw
-
-        # WB обычно кладёт base64 в поле "file"
-        b64 = None
-        if isinstance(data, dict):
-            b64 = data.get("file") or (data.get("data") or {}).get("file")
-        if not b64:
-            # иногда приходит уже распакованный JSON/список — на такой случай просто делаем DataFrame
-            import pandas as pd
-            return pd.DataFrame(data if isinstance(data, list) else ([data] if data else []))
-
-        zbytes = base64.b64decode(b64)
-        with zipfile.ZipFile(io.BytesIO(zbytes)) as zf:
-            # берём первый .xlsx
-            xlsx_name = next((n for n in zf.namelist() if n.lower().endswith(".xlsx")), None)
-            if not xlsx_name:
-                raise ValueError("ZIP не содержит .xlsx")
-            with zf.open(xlsx_name) as f:
-                df = pd.read_excel(f)  # WB шлёт нормальные заголовки
-        return df
+    @staticmethod
+    def _wb__fin_report_slice(payload, meta, group):
+        """
+        Строки финотчёта для группы fin-таргетов (adjustments | sales | logistics).
+        XLSX разбирается один раз на request_uuid, разрез по «Обоснование для оплаты» — за один проход.
+        """
+        from dagster_conf.lib.wb_report_reader import fin_report_slice
+        return fin_report_slice(payload, meta, group)
 
     @staticmethod
     def _wb__safe_date_col(df, col):
@@ -4140,17 +4118,10 @@ class WbUniversalNormalizer(Normalizer):
         """
         import pandas as pd
         meta = meta or {}
-        df = self._wb__xlsx_from_bronze(payload)
+        df = self._wb__fin_report_slice(payload, meta, "adjustments")
         if df is None or df.empty:
             return []
 
-        reason_col = "Обоснование для оплаты"
-        reasons = {"Удержание", "Штраф", "Добровольная компенсация при возврате"}
-        if reason_col in df.columns:
-            df = df[df[reason_col].isin(reasons)].copy()
-        if df.empty:
-            return []
-
         rename_map = {
             "Номер поставки": "income_id",
             "Предмет": "subject",
@@ -4224,17 +4195,10 @@ class WbUniversalNormalizer(Normalizer):
         """
         import pandas as pd
         meta = meta or {}
-        df = self._wb__xlsx_from_bronze(payload)
+        df = self._wb__fin_report_slice(payload, meta, "adjustments")
         if df is None or df.empty:
             return []
 
-        reason_col = "Обоснование для оплаты"
-        reasons = {"Удержание", "Штраф", "Добровольная компенсация при возврате"}
-        if reason_col in df.columns:
-            df = df[df[reason_col].isin(reasons)].copy()
-        if df.empty:
-            return []
-
         rename_map = {
             "Номер поставки": "income_id",
             "Предмет": "subject",
@@ -4301,17 +4265,10 @@ class WbUniversalNormalizer(Normalizer):
         """
         import pandas as pd
         meta = meta or {}
-        df = self._wb__xlsx_from_bronze(payload)
+        df = self._wb__fin_report_slice(payload, meta, "sales")
         if df is None or df.empty:
             return []
 
-        reason_col = "Обоснование для оплаты"
-        reasons = {"Продажа", "Возврат"}
-        if reason_col in df.columns:
-            df = df[df[reason_col].isin(reasons)].copy()
-        if df.empty:
-            return []
-
         rename_map = {
             "Номер поставки": "income_id",
             "Предмет": "subject",
@@ -4385,16 +4342,10 @@ class WbUniversalNormalizer(Normalizer):
         """
         import pandas as pd
         meta = meta or {}
-        df = self._wb__xlsx_from_bronze(payload)
+        df = self._wb__fin_report_slice(payload, meta, "logistics")
         if df is None or df.empty:
             return []
 
-        reason_col = "Обоснование для оплаты"
-        if reason_col in df.columns:
-            df = df[df[reason_col] == "Логистика"].copy()
-        if df.empty:
-            return []
-
         rename_map = {
             "Номер поставки": "income_id",
             "Код номенклатуры": "nm_id",
@@ -1,34 +1,81 @@
 import dagster as dg
 from dagster_conf.resources.pg_resource import postgres_resource
-from sqlalchemy import text
+from dagster_conf.lib.gold_incremental import MSK_DATE, GoldSource, GoldTarget, refresh_incremental
+
+# Источники витрины и правило «изменившиеся строки → срезы (company_id, date)».
+# silver_v2: метка изменений — inserted_at (DEFAULT now(); silver_v2 пишется только INSERT'ами).
+# core-справочники без метки изменений отслеживаются по отпечатку содержимого.
+VM_PRODUCT_ORDERS_1D = GoldTarget(
+    schema="gold",
+    table="vm_product_orders_1d",
+    sources=(
+        GoldSource(name="wb_sales_funnels_1d", table="silver_v2.wb_sales_funnels_1d"),
+        GoldSource(name="wb_adv_product_stats_1d", table="silver_v2.wb_adv_product_stats_1d"),
+        GoldSource(name="wb_commission_1d", table="silver_v2.wb_commission_1d"),
+        GoldSource(name="wb_paid_storage_1d", table="silver_v2.wb_paid_storage_1d", date_exprs=("date",)),
+        # недельный отчёт доносит строки задним числом: срез — по дате заказа, продажи и отчёта
+        GoldSource(
+            name="wb_fin_reports_1w",
+            table="silver_v2.wb_fin_reports_1w",
+            date_exprs=(MSK_DATE.format(col="order_dt"), MSK_DATE.format(col="sale_dt"), "rr_dt"),
+        ),
+        # справочник без метки изменений: отпечаток содержимого, срезы — все компании с date_from
+        GoldSource(
+            name="product_costs",
+            table="core.product_costs",
+            change_col=None,
+            company_expr=None,
+            date_exprs=("date_from",),
+        ),
+        # комиссии по предметам — без компании и дат: пересчёт всех срезов
+        GoldSource(
+            name="individual_commissions",
+            table="core.individual_commissions",
+            change_col=None,
+            company_expr=None,
+            date_exprs=(),
+        ),
+        # компания/продавец → все срезы затронутых компаний
+        GoldSource(
+            name="companies",
+            table="core.companies",
+            change_col=None,
+            company_expr="t.company_id",
+            date_exprs=(),
+        ),
+        GoldSource(
+            name="sellers",
+            table="core.sellers",
+            change_col=None,
+            company_expr="c.company_id",
+            date_exprs=(),
+            join="JOIN core.companies c ON c.seller_id = t.seller_id",
+        ),
+    ),
+)
+
 
 @dg.op(
     required_resource_keys={"postgres"},
-    description="Обновление витрины gold.vm_product_orders_1d",
+    description="Инкрементальное обновление витрины gold.vm_product_orders_1d",
 )
 async def refresh_vm_product_orders_1d(context):
     session_maker = context.resources.postgres
 
-    context.log.info(f"Start refreshing materialized view gold.vm_product_orders_1d")
+    context.log.info("Start incremental refresh of gold.vm_product_orders_1d")
     async with session_maker() as session:
-        await session.execute(text("ANALYZE silver_v2.wb_sales_funnels_1d"))
-        await session.execute(text("ANALYZE silver_v2.wb_fin_reports_1w"))
-        await session.execute(text("ANALYZE silver_v2.wb_adv_product_stats_1d"))
-        await session.execute(text("ANALYZE silver_v2.wb_paid_storage_1d"))
-        await session.execute(text("ANALYZE silver_v2.wb_commission_1d"))
-        await session.execute(text("ANALYZE core.individual_commissions"))
-        await session.execute(text("ANALYZE core.companies"))
-        await session.execute(text("ANALYZE core.sellers"))
-        await session.execute(text("ANALYZE core.product_costs"))
-
-        await session.execute(text("REFRESH MATERIALIZED VIEW gold.vm_product_orders_1d"))
-        res = await session.execute(text("SELECT max(date) FROM gold.vm_product_orders_1d"))
-        max_date = res.first()
+        stats = await session.run_sync(
+            lambda sync_session: refresh_incremental(sync_session.connection(), VM_PRODUCT_ORDERS_1D, log=context.log)
+        )
         await session.commit()
 
-    context.log.info(f"Finish refreshing gold.vm_product_orders_1d. Max date: {max_date}")
+    context.log.info(
+        f"Finish refreshing gold.vm_product_orders_1d: bootstrapped={stats.bootstrapped} "
+        f"sources={stats.changed_sources or '-'} slices={stats.slices} "
+        f"deleted={stats.deleted} inserted={stats.inserted}"
+    )
 
-    return {"inserted": 0}
+    return {"inserted": stats.inserted, "deleted": stats.deleted, "slices": stats.slices}
 
 @dg.job(
     name="gold__vm_product_orders_1d",
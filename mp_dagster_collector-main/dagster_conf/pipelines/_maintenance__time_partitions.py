@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import dagster as dg
+from dagster_conf.resources.pg_resource import postgres_resource
+from dagster_conf.lib.table_partitioning import (
+    partitioning_from_config,
+    ensure_partitions,
+    drop_expired_partitions,
+)
+
+CFG_PATH = Path(__file__).parents[1] / "lib" / "config.yml"
+
+
+@dg.op(
+    required_resource_keys={"postgres"},
+    description="Создание будущих и удаление просроченных партиций bronze_v2/silver_v2 по config.yml",
+)
+async def maintain_time_partitions(context):
+    session_maker = context.resources.postgres
+    specs = partitioning_from_config(CFG_PATH)
+
+    created_total, dropped_total = 0, 0
+    for spec in specs:
+        async with session_maker() as session:
+            def _maintain(sync_session):
+                conn = sync_session.connection()
+                return ensure_partitions(conn, spec), drop_expired_partitions(conn, spec)
+
+            created, dropped = await session.run_sync(_maintain)
+            await session.commit()
+
+        created_total += len(created)
+        dropped_total += len(dropped)
+        context.log.info(
+            f"[partitions] {spec.schema}.{spec.table} ({spec.interval}): "
+            f"created={created or '-'} dropped={dropped or '-'}"
+        )
+
+    return {"tables": len(specs), "created": created_total, "dropped": dropped_total}
+
+
+@dg.job(
+    name="maintenance__time_partitions",
+    description="Обслуживание партиций bronze/silver таблиц, сгенерированных auto_model_builder",
+    tags={"layer": "maintenance"},
+    resource_defs={"postgres": postgres_resource},
+    executor_def=dg.in_process_executor,
+)
+def maintain_time_partitions_job():
+    maintain_time_partitions()
+
+
+@dg.schedule(
+    cron_schedule="0 1 * * *",
+    job=maintain_time_partitions_job,
+    execution_timezone="Europe/Moscow",
+    default_status=dg.DefaultScheduleStatus.RUNNING,
+)
+def maintain_time_partitions_schedule(context):
+    return dg.RunRequest(
+        run_config={},
+        tags={"dagster/scheduled_execution_time": context.scheduled_execution_time.isoformat()},
+    )
@@ -0,0 +1,138 @@
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from aiohttp import ClientResponseError
+from dagster import DagsterRunNotFoundError, Failure, MetadataValue
+from sqlalchemy import text
+
+from dagster_conf.lib.fetch_pipeline import FetchJob, FetchStats, run_fetch_pipeline
+from dagster_conf.lib.rate_limit import HeaderRatePacer
+
+
+MSK = ZoneInfo("Europe/Moscow")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Параллельный обход кампаний для «по-advert» эндпоинтов WB
+# (stats/keywords, auto/stat-words)
+#
+#  • до `concurrency` запросов в полёте; старт запросов разносит HeaderRatePacer
+#    по X-Ratelimit-* конкретного эндпоинта (min_interval — паспортный лимит);
+#  • 429 возвращает в очередь только свою кампанию;
+#  • ответы копятся и пишутся в бронзу одним multi-row INSERT на пачку в
+#    долгоживущей сессии;
+#  • курсор по кампаниям — уже записанные в бронзу advert_id группы запусков
+#    (root_run_id и его re-execution'ы): ни ретрай шага, ни повтор рана «from
+#    failure» не перезапрашивают готовые кампании; silver читает бронзу всей группы.
+#    Первая попытка одиночного рана курсор не запрашивает;
+#  • кампании, так и не полученные после 429, роняют шаг (Failure) — уже
+#    записанное остаётся, ретрай доберёт только их.
+# ─────────────────────────────────────────────────────────────────────────────
+
+FetchOne = Callable[[int], Awaitable[Tuple[Dict[str, Any], Mapping[str, Any]]]]
+BuildRecord = Callable[[int, Dict[str, Any], Mapping[str, Any], datetime], Optional[Dict[str, Any]]]
+
+
+def run_group_ids(context) -> List[str]:
+    """run_id всех запусков группы текущего (root_run_id + re-execution'ы)."""
+    try:
+        group = context.instance.get_run_group(context.run_id)
+    except DagsterRunNotFoundError:
+        group = None
+    if not group:
+        return [context.run_id]
+    return sorted({context.run_id, *(r.run_id for r in group[1])})
+
+
+async def completed_adverts(session, table, run_uuids: List[str], api_token_id: int) -> set:
+    """advert_id, уже записанные в бронзу запусками группы (курсор для резюма)."""
+    rows = await session.execute(
+        text(f"""
+            SELECT DISTINCT (request_parameters->>'advert_id')::bigint
+              FROM {table.__table__.schema}.{table.__tablename__}
+             WHERE run_uuid = ANY(CAST(:runs AS uuid[])) AND api_token_id = :tid
+        """),
+        {"runs": run_uuids, "tid": api_token_id},
+    )
+    return {r[0] for r in rows.fetchall() if r[0] is not None}
+
+
+async def collect_adverts_to_bronze(
+    context,
+    *,
+    table,
+    advert_ids: List[int],
+    fetch_one: FetchOne,
+    build_record: BuildRecord,
+    min_interval: float,
+    concurrency: int = 4,
+    batch_size: int = 50,
+    tag: str = "adverts",
+) -> FetchStats:
+    """
+    fetch_one(advert_id) → (data, headers); build_record(advert_id, data, headers, request_dttm) → строка
+    бронзы или None. Ошибки, кроме 429, логируются и пропускают кампанию (как раньше в цикле);
+    кампании, исчерпавшие попытки после 429, — Failure после записи полученного.
+    """
+    api_token_id = context.resources.wildberries_client.token_id
+
+    async with context.resources.postgres() as session:
+        # Первая попытка одиночного рана в бронзу ещё не писала: курсор нужен только
+        # ретраю шага или re-execution (индекса по run_uuid в этих таблицах нет)
+        run_uuids = run_group_ids(context)
+        done: set = set()
+        if getattr(context, "retry_number", 0) or len(run_uuids) > 1:
+            done = await completed_adverts(session, table, run_uuids, api_token_id)
+        todo = [a for a in dict.fromkeys(advert_ids) if a not in done]
+        if done:
+            context.log.info(f"[{tag}] резюм: {len(done)} кампаний уже в бронзе, осталось {len(todo)}")
+        if not todo:
+            return FetchStats()
+
+        async def fetch(advert_id: int):
+            try:
+                return await fetch_one(advert_id)
+            except ClientResponseError as e:
+                if e.status == 429:
+                    raise
+                context.log.warning(f"[{tag}] Ошибка для advert_id={advert_id}: {e}")
+            except Exception as e:
+                context.log.warning(f"[{tag}] Ошибка для advert_id={advert_id}: {e}")
+            return None, {}
+
+        def build(job: FetchJob, data, headers, request_dttm, receive_dttm):
+            if data is None:
+                return None
+            return build_record(job.payload, data, headers or {}, request_dttm)
+
+        async def write_batch(records):
+            await session.execute(table.__table__.insert(), records)
+            await session.commit()
+
+        stats = await run_fetch_pipeline(
+            [FetchJob(payload=a, meta={"advert_id": a}) for a in todo],
+            fetch=fetch,
+            build_record=build,
+            write_batch=write_batch,
+            pacer=HeaderRatePacer(fallback_delay=min_interval, min_interval=min_interval),
+            now=lambda: datetime.now(MSK),
+            workers=concurrency,
+            write_batch_size=batch_size,
+            log=context.log,
+            tag=tag,
+        )
+
+    context.log.info(
+        f"[{tag}] кампаний={len(todo)} requests={stats.requests} written={stats.written} "
+        f"skipped={stats.skipped} 429={stats.rate_limited} за {stats.elapsed_sec:.1f}s"
+    )
+    if stats.failed:
+        failed_ids = sorted(m["advert_id"] for m in stats.failed if isinstance(m, dict))
+        raise Failure(
+            description=f"[{tag}] {len(failed_ids)} кампаний не получено после 429 — ретрай шага доберёт только их",
+            metadata={
+                "failed_adverts": MetadataValue.int(len(failed_ids)),
+                "failed_advert_ids": MetadataValue.json(failed_ids[:500]),
+            },
+        )
+    return stats
@@ -1,36 +1,62 @@
-from dagster import job, op
-import subprocess
-from pathlib import Path
 import os
 
-
-@op
-def run_ako_V2_script(context):
-    # Путь к скрипту
-    script_path = Path(__file__).resolve().parent.parent.parent / "keywords_opt" / "OptManager.py"
-
-    # Корень проекта — /opt/mp_data_collector
-    project_root = Path(__file__).resolve().parent.parent.parent
-    env = os.environ.copy()
-    env["PYTHONPATH"] = str(project_root)
-
-    context.log.info(f"Running script at: {script_path}")
-    context.log.info(f"PYTHONPATH: {project_root}")
-
-    result = subprocess.run(
-        ["python", str(script_path)],
-        capture_output=True,
-        text=True,
-        env=env
+from dagster import AssetObservation, DynamicPartitionsDefinition, MetadataValue, job, op
+
+from dagster_conf.lib.tokens import token_for_company
+from dagster_conf.resources.pg_resource import postgres_engine_resource
+from dagster_conf.resources.wb_campaign_gateway import wb_campaign_gateway
+from keywords_opt.OptManager import optimize_company
+
+# Те же значения, что у sync_companies_job / build_multipartitions
+COMPANY_PARTITIONS = DynamicPartitionsDefinition(name="company_id")
+
+
+@op(required_resource_keys={"postgres_engine", "wb_campaign_gateway"})
+async def run_ako_V2_script(context):
+    """
+    Оптимизация ключевых слов (keywords_opt/OptManager.optimize_company) для
+    компании из партиции — в процессе run'а, без запуска отдельного
+    интерпретатора. Логи оптимизатора идут в context.log по мере работы,
+    по каждой кампании — AssetObservation с метриками.
+    """
+    company_id = int(context.partition_key)
+    token = token_for_company(company_id)["token"]
+
+    def on_campaign(recommendations, max_cpc, campaign_id, product_id, excluded_keywords, phrases_updated):
+        context.log_event(
+            AssetObservation(
+                asset_key=["algo", "cluster_optimization_results"],
+                partition=context.partition_key,
+                metadata={
+                    "campaign_id": int(campaign_id),
+                    "product_id": MetadataValue.text(str(product_id)),
+                    "max_cpc": float(max_cpc),
+                    "keywords": len(recommendations),
+                    "excluded": len(excluded_keywords),
+                    "phrases_updated": bool(phrases_updated),
+                },
+            )
+        )
+
+    results = await optimize_company(
+        company_id,
+        engine=context.resources.postgres_engine,
+        token=token,
+        logger=context.log,
+        gateway_factory=context.resources.wb_campaign_gateway,
+        telegram_bot_token=os.getenv("TELEGRAM_BOT_TOKEN"),
+        telegram_chat_id=os.getenv("TELEGRAM_CHAT_ID"),
+        on_campaign=on_campaign,
     )
-
-    context.log.info("Script STDOUT:\n" + result.stdout)
-    context.log.warning("Script STDERR:\n" + result.stderr)
-
-    if result.returncode != 0:
-        raise RuntimeError(f"Script failed with exit code {result.returncode}")
+    context.log.info(f"[ako] company_id={company_id}: обработано кампаний {len(results)}")
 
 
-@job
+@job(
+    partitions_def=COMPANY_PARTITIONS,
+    resource_defs={
+        "postgres_engine": postgres_engine_resource,
+        "wb_campaign_gateway": wb_campaign_gateway,
+    },
+)
 def ako_V2_wrapper_job():
     run_ako_V2_script()
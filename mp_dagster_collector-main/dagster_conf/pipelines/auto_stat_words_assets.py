@@ -5,7 +5,7 @@ from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 
 import dagster as dg
-from dagster import asset
+from dagster import asset, RetryPolicy
 from sqlalchemy import text, select
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
@@ -14,10 +14,16 @@ from src.db.silver.models import SilverWbAdvKeywordClusters1d
 from dagster_conf.resources.wb_client import wildberries_client
 from dagster_conf.resources.pg_resource import postgres_resource
 from dagster_conf.pipelines.wb_bronze_ops import extract_metadata_from_headers
+from dagster_conf.pipelines.advert_fanout import collect_adverts_to_bronze, run_group_ids
 
 
-# скорость не более 4 req/sec
+# скорость не более 4 req/sec: минимальный интервал между стартами запросов,
+# если WB не прислал X-Ratelimit-* (иначе темп берётся из заголовков)
 PER_ADVERT_DELAY = 0.3
+# запросов в полёте одновременно
+ADVERT_CONCURRENCY = 4
+# строк бронзы на один INSERT
+BRONZE_BATCH_SIZE = 50
 
 
 @asset(
@@ -29,6 +35,7 @@ PER_ADVERT_DELAY = 0.3
     key_prefix=["bronze"],
     name="wb_adv_auto_stat_words_1d",
     description="Сохраняет кластеры ключевых слов за вчерашний день в bronze.wb_adv_auto_stat_words_1d",
+    retry_policy=RetryPolicy(max_retries=3, delay=30),
 )
 async def bronze_wb_adv_auto_stat_words_1d(context) -> None:
     # 1) Метаданные запуска
@@ -57,22 +64,13 @@ async def bronze_wb_adv_auto_stat_words_1d(context) -> None:
             if a.get("status") in ACTIVE_STATUSES
         ]
 
-        # 5) Для каждого advert_id запрашиваем кластеры
-        for advert_id in active_advert_ids:
-            context.log.info(f"[clusters] advert_id={advert_id}")
-            try:
-                # fetch_clusters_batch возвращает List[Tuple[data, headers]]
-                raw_data, headers = (await client.fetch_clusters_batch([advert_id]))[0]
-            except Exception as e:
-                context.log.warning(f"[clusters] Ошибка для advert_id={advert_id}: {e}")
-                continue
-
+        # 5) Кластеры по кампаниям: параллельно, темп — по заголовкам лимита,
+        #    запись в бронзу пачками; при ретрае готовые кампании не перезапрашиваются
+        def build_record(advert_id, raw_data, headers, request_dttm):
             # 6) Метаданные ответа
             response_uuid, response_dttm = extract_metadata_from_headers(headers)
-            response_code                = int(headers.get("status", 200))
-
-            # 7) Сохраняем в бронзу
-            record = {
+            # 7) Строка бронзы
+            return {
                 "api_token_id":       api_token_id,
                 "run_uuid":           run_uuid,
                 "run_dttm":           run_dttm,
@@ -81,18 +79,21 @@ async def bronze_wb_adv_auto_stat_words_1d(context) -> None:
                 "request_parameters": {"advert_id": advert_id},
                 "request_body":       None,
                 "response_dttm":      response_dttm,
-                "response_code":      response_code,
+                "response_code":      int(headers.get("status", 200)),
                 "response_body":      json.dumps(raw_data, ensure_ascii=False),
             }
 
-            async with context.resources.postgres() as session:
-                await session.execute(
-                    WbAdvAutoStatWords1d.__table__.insert().values(**record)
-                )
-                await session.commit()
-
-            # 8) Интервал между запросами
-            await asyncio.sleep(PER_ADVERT_DELAY)
+        await collect_adverts_to_bronze(
+            context,
+            table=WbAdvAutoStatWords1d,
+            advert_ids=active_advert_ids,
+            fetch_one=client.fetch_clusters_one,
+            build_record=build_record,
+            min_interval=PER_ADVERT_DELAY,
+            concurrency=ADVERT_CONCURRENCY,
+            batch_size=BRONZE_BATCH_SIZE,
+            tag="clusters",
+        )
 
 
 @asset(
@@ -104,12 +105,12 @@ async def bronze_wb_adv_auto_stat_words_1d(context) -> None:
     description="Переносит кластеры слов и исключённые слова из bronze.wb_adv_auto_stat_words_1d → silver.wb_adv_keyword_clusters_1d",
 )
 async def silver_wb_adv_keyword_clusters_1d(context):
-    run_id = context.run_id
+    run_ids = run_group_ids(context)  # бронза рана и его re-execution'ов
 
     async with context.resources.postgres() as session:
         # 1) грузим все бронзовые записи этого запуска
         result = await session.execute(
-            select(WbAdvAutoStatWords1d).where(WbAdvAutoStatWords1d.run_uuid == run_id)
+            select(WbAdvAutoStatWords1d).where(WbAdvAutoStatWords1d.run_uuid.in_(run_ids))
         )
         bronze_rows = result.scalars().all()
 
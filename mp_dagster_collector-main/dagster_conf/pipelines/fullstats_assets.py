@@ -17,12 +17,22 @@ from src.db.silver.models import (
     SilverWbAdvProductStats1d, SilverWbAdvProductStats1h, SilverWbAdvProductPositions1d, SilverWbAdvProductPositions1h
 )
 from dagster_conf.pipelines.utils import prev_hour_mskt
+from dagster_conf.lib.fetch_pipeline import FetchJob, run_fetch_pipeline
+from dagster_conf.lib.rate_limit import HeaderRatePacer
+from dagster_conf.pipelines.fullstats_flatten import (
+    STATS_METRICS, flatten_fullstats, positions_by_day, positions_for_hour, stats_all, stats_for_day,
+)
+from dagster_conf.pipelines.hourly_delta import PREV_FROM, PREV_UNTIL, CumulativeDeltaSpec, upsert_hourly_deltas
 
 
 # Максимальное число ID за один запрос
 CHUNK_SIZE = 100
-# Пауза между чанками (секунды)
+# Пауза между чанками (секунды), если WB не прислал X-Ratelimit-* заголовков
 RATE_LIMIT_DELAY = 60
+# Параллельные запросы fullstats (темп всё равно задают заголовки лимита)
+FETCH_WORKERS = 2
+# Сколько чанков писать в бронзу одним executemany
+WRITE_BATCH_SIZE = 10
 ACTIVE_STATUSES = {4, 9, 11}
 MSK = ZoneInfo("Europe/Moscow")
 MAX_SKEW = timedelta(minutes=15)
@@ -34,32 +44,41 @@ def chunked(it, size):
         yield it[i : i + size]
 
 
+async def fetch_once(client, payload, context):
+    """
+    Один вызов client.fetch_ad_stats без повторов (429 пробрасывается как ClientResponseError).
+    Возвращает (result, headers).
+    """
+    res = await client.fetch_ad_stats(payload)
+    if isinstance(res, tuple) and len(res) == 2:
+        data, headers = res
+    else:
+        data, headers = res, {}
+
+    try:
+        h = {str(k).lower(): str(v) for k, v in (headers or {}).items()}
+    except Exception:
+        h = {}
+    context.log.debug("[fullstats] headers(raw): %s", json.dumps(h, ensure_ascii=False))
+    context.log.info(
+        "[fullstats] date=%s | x-request-id=%s | status=%s | content-length=%s | ratelimit-remaining=%s",
+        h.get("date"),
+        h.get("x-request-id") or h.get("x-response-id"),
+        h.get(":status") or h.get("status"),
+        h.get("content-length"),
+        h.get("x-ratelimit-remaining"),
+    )
+
+    return data, headers
+
+
 async def safe_fetch(client, payload, context):
     """
     Вызывает client.fetch_ad_stats и при 429 повторяет запрос после паузы.
     Гарантированно возвращает (result, headers).
     """
     try:
-        res = await client.fetch_ad_stats(payload)
-        if isinstance(res, tuple) and len(res) == 2:
-            data, headers = res
-        else:
-            data, headers = res, {}
-
-        try:
-            h = {str(k).lower(): str(v) for k, v in (headers or {}).items()}
-        except Exception:
-            h = {}
-        context.log.debug("[fullstats] headers(raw): %s", json.dumps(h, ensure_ascii=False))
-        context.log.info(
-            "[fullstats] date=%s | x-request-id=%s | status=%s | content-length=%s",
-            h.get("date"),
-            h.get("x-request-id") or h.get("x-response-id"),
-            h.get(":status") or h.get("status"),
-            h.get("content-length"),
-        )
-
-        return data, headers
+        return await fetch_once(client, payload, context)
 
     except ClientResponseError as e:
         if e.status == 429:
@@ -306,95 +325,147 @@ async def bronze_wb_adv_fullstats(context) -> None:
     # ────────────────────────────────────────────────────────────────────────────
     # HTTP-запросы fullstats и запись в бронзу
     # ────────────────────────────────────────────────────────────────────────────
-    async with context.resources.wildberries_client as client:
-        async def process_chunk_group(ids, make_payload):
-            if not ids:
-                return
-            for chunk in chunked(list(ids), CHUNK_SIZE):
-                payload = make_payload(chunk)
+    jobs: list[FetchJob] = []
 
-                # момент отправки (MSK)
-                request_dttm = datetime.now(MSK)
+    def add_chunk_group(ids, make_payload, group: str):
+        for chunk in chunked(sorted(ids), CHUNK_SIZE):
+            jobs.append(FetchJob(payload=make_payload(chunk), size=len(chunk), meta={"group": group, "first_id": chunk[0]}))
 
-                # HTTP-запрос
-                context.log.debug("sample payload: %s", json.dumps(payload[:2], ensure_ascii=False))
-                raw_list, headers = await safe_fetch(client, payload, context)
+    if time_grain == "1d":
+        add_chunk_group(
+            ids_both,
+            lambda chunk: [{"id": aid, "dates": [date_1, date_2]} for aid in chunk],
+            "both",
+        )
 
-                receive_dttm = datetime.now(MSK)
-                _, response_dttm = extract_metadata_from_headers(headers)
-                response_code = int((headers or {}).get("status", 200))
+    # B) кампании только вчера (для 1d) ИЛИ весь набор ids_day1 (для 1h)
+    add_chunk_group(
+        ids_only_day1 if time_grain == "1d" else ids_day1,
+        lambda chunk: [{"id": aid, "dates": [date_1]} for aid in chunk],
+        "day1",
+    )
 
-                error_text = (headers or {}).get("wb-error")
+    # C) кампании только позавчера (только 1d)
+    if time_grain == "1d":
+        add_chunk_group(
+            ids_only_day2,
+            lambda chunk: [{"id": aid, "dates": [date_2]} for aid in chunk],
+            "day2",
+        )
 
-                # ── проверка "15 минут" только для 1h ────────────────────────────
-                if time_grain == "1h":
-                    if run_dttm.tzinfo is None or (response_dttm and response_dttm.tzinfo is None):
-                        context.log.error(
-                            "[fullstats_1h] tzinfo отсутствует: run_dttm=%r, response_dttm=%r; запись пропущена",
-                            run_dttm, response_dttm
-                        )
-                        await asyncio.sleep(RATE_LIMIT_DELAY)
-                        continue
+    if not jobs:
+        return
 
-                    msk_run  = run_dttm.astimezone(MSK)
-                    msk_resp = (response_dttm or request_dttm).astimezone(MSK)
-                    delta = msk_resp - msk_run
-                    if delta > MAX_SKEW:
-                        context.log.warning(
-                            "[fullstats_1h] Пропуск записи: response_dttm=%s (MSK=%s) > run_dttm=%s (MSK=%s) на %s (> %s). "
-                            "run_uuid=%s, chunk_size=%d",
-                            response_dttm, msk_resp, run_dttm, msk_run, delta, MAX_SKEW, run_uuid, len(chunk)
-                        )
-                        await asyncio.sleep(RATE_LIMIT_DELAY)
-                        continue
+    # защита: берём только те ключи, которые реально есть в модели
+    cols = {c.name for c in model.__table__.columns}
 
-                record_common = {
-                    "run_uuid": run_uuid,
-                    "run_dttm": run_dttm,
-                    "run_schedule_dttm": run_schedule_dttm,
-                    "business_dttm": business_dttm_static,
-                    "request_uuid": uuid.uuid4(),
-                    "request_dttm": request_dttm,
-                    "request_parameters": {"wb_error": error_text} if (response_code >= 400 and error_text) else None,
-                    "request_body": payload,                       # JSONB
-                    "response_dttm": response_dttm or request_dttm,
-                    "receive_dttm": receive_dttm,
-                    "response_code": response_code,
-                    "response_body": json.dumps(raw_list),         # TEXT
-                    "api_token_id": api_token_id,
-                }
-
-                # защита: берём только те ключи, которые реально есть в модели
-                cols = {c.name for c in model.__table__.columns}
-                payload_for_model = {k: v for k, v in record_common.items() if k in cols}
-
-                async with context.resources.postgres() as session:
-                    await session.execute(model.__table__.insert().values(**payload_for_model))
-                    await session.commit()
+    def build_record(job: FetchJob, raw_list, headers, request_dttm, receive_dttm):
+        _, response_dttm = extract_metadata_from_headers(headers)
+        response_code = int((headers or {}).get("status", 200))
+        error_text = (headers or {}).get("wb-error")
 
-                context.log.info(
-                    f"[bronze_wb_adv_fullstats_{time_grain}] записан чанк на {len(chunk)} кампаний, run_uuid={run_uuid}"
+        # ── проверка "15 минут" только для 1h ────────────────────────────
+        if time_grain == "1h":
+            if run_dttm.tzinfo is None or (response_dttm and response_dttm.tzinfo is None):
+                context.log.error(
+                    "[fullstats_1h] tzinfo отсутствует: run_dttm=%r, response_dttm=%r; запись пропущена",
+                    run_dttm, response_dttm
+                )
+                return None
+
+            msk_run  = run_dttm.astimezone(MSK)
+            msk_resp = (response_dttm or request_dttm).astimezone(MSK)
+            delta = msk_resp - msk_run
+            if delta > MAX_SKEW:
+                context.log.warning(
+                    "[fullstats_1h] Пропуск записи: response_dttm=%s (MSK=%s) > run_dttm=%s (MSK=%s) на %s (> %s). "
+                    "run_uuid=%s, chunk_size=%d",
+                    response_dttm, msk_resp, run_dttm, msk_run, delta, MAX_SKEW, run_uuid, job.size
                 )
-                await asyncio.sleep(RATE_LIMIT_DELAY)
+                return None
+
+        record_common = {
+            "run_uuid": run_uuid,
+            "run_dttm": run_dttm,
+            "run_schedule_dttm": run_schedule_dttm,
+            "business_dttm": business_dttm_static,
+            "request_uuid": uuid.uuid4(),
+            "request_dttm": request_dttm,
+            "request_parameters": {"wb_error": error_text} if (response_code >= 400 and error_text) else None,
+            "request_body": job.payload,                   # JSONB
+            "response_dttm": response_dttm or request_dttm,
+            "receive_dttm": receive_dttm,
+            "response_code": response_code,
+            "response_body": json.dumps(raw_list),         # TEXT
+            "api_token_id": api_token_id,
+        }
+        return {k: v for k, v in record_common.items() if k in cols}
 
-        if time_grain == "1d":
-            await process_chunk_group(
-                ids_both,
-                lambda chunk: [{"id": aid, "dates": [date_1, date_2]} for aid in chunk],
+    # ────────────────────────────────────────────────────────────────────────────
+    # Конвейер: fetch-воркеры (темп по X-Ratelimit-*) → очередь → один writer
+    # ────────────────────────────────────────────────────────────────────────────
+    # min_interval — не чаще 1 запроса в RATE_LIMIT_DELAY, даже если X-Ratelimit-Remaining > 0
+    pacer = HeaderRatePacer(fallback_delay=RATE_LIMIT_DELAY, min_interval=RATE_LIMIT_DELAY)
+
+    async with context.resources.wildberries_client as client, context.resources.postgres() as session:
+        async def fetch(payload):
+            context.log.debug("sample payload: %s", json.dumps(payload[:2], ensure_ascii=False))
+            return await fetch_once(client, payload, context)
+
+        async def write_batch(records):
+            await session.execute(model.__table__.insert(), records)
+            await session.commit()
+            context.log.info(
+                f"[bronze_wb_adv_fullstats_{time_grain}] записано чанков: {len(records)}, run_uuid={run_uuid}"
             )
 
-        # B) кампании только вчера (для 1d) ИЛИ весь набор ids_day1 (для 1h)
-        await process_chunk_group(
-            ids_only_day1 if time_grain == "1d" else ids_day1,
-            lambda chunk: [{"id": aid, "dates": [date_1]} for aid in chunk],
+        stats = await run_fetch_pipeline(
+            jobs,
+            fetch=fetch,
+            build_record=build_record,
+            write_batch=write_batch,
+            pacer=pacer,
+            now=lambda: datetime.now(MSK),
+            workers=FETCH_WORKERS,
+            write_batch_size=WRITE_BATCH_SIZE,
+            log=context.log,
+            tag="fullstats",
         )
 
-        # C) кампании только позавчера (только 1d)
-        if time_grain == "1d":
-            await process_chunk_group(
-                ids_only_day2,
-                lambda chunk: [{"id": aid, "dates": [date_2]} for aid in chunk],
-            )
+    context.log.info(
+        f"[bronze_wb_adv_fullstats_{time_grain}] chunks={len(jobs)} requests={stats.requests} "
+        f"written={stats.written} skipped={stats.skipped} rate_limited={stats.rate_limited} "
+        f"elapsed={stats.elapsed_sec:.1f}s"
+    )
+    if stats.failed:
+        raise Failure(f"fullstats: {len(stats.failed)} чанков не получено после 429: {stats.failed[:20]}")
+
+
+FULLSTATS_KEY_COLS = ("advert_id", "app_type", "nm_id")
+STATS_METRIC_COLS = tuple(STATS_METRICS.values())
+STATS_UPSERT_COLS = (
+    "company_id", "request_uuid", *FULLSTATS_KEY_COLS,
+    "request_dttm", "business_dttm", "response_dttm", *STATS_METRIC_COLS,
+)
+POSITIONS_UPSERT_COLS = (
+    "company_id", "request_uuid", "advert_id", "nm_id", "date", "avg_position",
+    "business_dttm", "response_dttm",
+)
+
+
+def _fullstats_1h_delta_spec(silver_stats_model) -> CumulativeDeltaSpec:
+    return CumulativeDeltaSpec(
+        table=f"silver.{silver_stats_model.__tablename__}",
+        columns=STATS_UPSERT_COLS,
+        match_cols=("company_id", *FULLSTATS_KEY_COLS),
+        time_col="business_dttm",
+        metric_cols=STATS_METRIC_COLS,
+        conflict_cols=("business_dttm", "advert_id", "app_type", "nm_id"),
+        update_where=(
+            "EXCLUDED.response_dttm IS NOT NULL "
+            "AND (t.response_dttm IS NULL OR EXCLUDED.response_dttm > t.response_dttm)"
+        ),
+    )
 
 
 async def safe_upsert(session, stmt, context):
@@ -460,6 +531,53 @@ async def silver_wb_adv_fullstats(context):
             dt = dt.replace(tzinfo=timezone.utc)
         return dt.astimezone(MSK)
 
+    # upsert'ы под executemany: значения берутся из EXCLUDED, строки — из flatten_fullstats
+    ins = pg_insert(silver_stats_model)
+    stats_upsert = ins.on_conflict_do_update(
+        index_elements=[
+            silver_stats_model.business_dttm,
+            silver_stats_model.advert_id,
+            silver_stats_model.app_type,
+            silver_stats_model.nm_id,
+        ],
+        set_={c: ins.excluded[c] for c in STATS_UPSERT_COLS},
+        where=sa.and_(
+            ins.excluded.response_dttm.isnot(None),
+            sa.or_(
+                silver_stats_model.response_dttm.is_(None),
+                ins.excluded.response_dttm > silver_stats_model.response_dttm,
+            ),
+        ),
+    )
+
+    ins_pos = pg_insert(silver_positions_model)
+    if is_hourly:
+        positions_upsert = ins_pos.on_conflict_do_update(
+            index_elements=[
+                silver_positions_model.request_uuid,
+                silver_positions_model.advert_id,
+                silver_positions_model.nm_id,
+                silver_positions_model.date,
+            ],
+            set_={c: ins_pos.excluded[c] for c in POSITIONS_UPSERT_COLS},
+        )
+    else:
+        positions_upsert = ins_pos.on_conflict_do_update(
+            index_elements=[
+                silver_positions_model.business_dttm,
+                silver_positions_model.advert_id,
+                silver_positions_model.nm_id,
+            ],
+            set_={c: ins_pos.excluded[c] for c in POSITIONS_UPSERT_COLS},
+            where=sa.and_(
+                ins_pos.excluded.response_dttm.isnot(None),
+                sa.or_(
+                    silver_positions_model.response_dttm.is_(None),
+                    ins_pos.excluded.response_dttm > silver_positions_model.response_dttm,
+                ),
+            ),
+        )
+
     async with context.resources.postgres() as session:
         # бронзовые чанки этого запуска
         result = await session.execute(
@@ -469,251 +587,111 @@ async def silver_wb_adv_fullstats(context):
         context.log.info("bronze chunks: %s", len(bronze_rows))
 
         total_rows = 0
+        # кумулятивные строки часового режима: пишутся дельтами после цикла.
+        # В часовом режиме чанк — SAVEPOINT, а коммит один: позиции и stats_1h
+        # (дельты) фиксируются вместе или не фиксируются вовсе
+        hourly_rows: list[dict] = []
+        company_by_token: dict = {}
 
         for bronze in bronze_rows:
+            savepoint = await session.begin_nested() if is_hourly else None
             try:
                 # company_id по токену
-                company_id = (await session.execute(
-                    text("SELECT company_id FROM core.tokens WHERE token_id = :token_id"),
-                    {"token_id": bronze.api_token_id}
-                )).scalar_one()
+                company_id = company_by_token.get(bronze.api_token_id)
+                if company_id is None:
+                    company_id = (await session.execute(
+                        text("SELECT company_id FROM core.tokens WHERE token_id = :token_id"),
+                        {"token_id": bronze.api_token_id}
+                    )).scalar_one()
+                    company_by_token[bronze.api_token_id] = company_id
 
                 raw_list = json.loads(bronze.response_body) or []
+                chunk_hourly: list[dict] = []
 
                 # общие для апдейта поля ODS
                 response_dttm_bronze = _to_msk(bronze.response_dttm)
                 request_dttm_bronze  = _to_msk(bronze.request_dttm)
 
+                # один проход по JSON; каждая уникальная дата разбирается в МСК один раз
+                flat = flatten_fullstats(raw_list)
                 processed = 0
-                for raw in raw_list:
-                    advert_id = raw["advertId"]
+
+                if is_hourly:
+                    # целевой бизнес-час из бронзы обязателен
+                    biz = bronze.business_dttm
+                    if biz is None:
+                        context.log.error("bronze.business_dttm is NULL, skip request_uuid=%s", bronze.request_uuid)
+                        await savepoint.rollback()
+                        continue
+                    biz = _to_msk(biz)
 
                     # ────────────────────────────────────────────────────────────────
-                    # 1) Обработка блока "days" → stats
+                    # 1) "days" → stats: один день на advert, соответствующий целевому часу
                     # ────────────────────────────────────────────────────────────────
-                    if is_hourly:
-                        # целевой бизнес-час из бронзы обязателен
-                        biz = bronze.business_dttm
-                        if biz is None:
-                            context.log.error("bronze.business_dttm is NULL, skip request_uuid=%s", bronze.request_uuid)
-                            continue
-                        biz = _to_msk(biz)
-
-                        target_date = biz.date()
-                        # ищем один день, соответствующий целевому часу
-                        day = next((d for d in raw.get("days", []) if _to_msk(d["date"]).date() == target_date), None)
-                        if not day:
-                            context.log.info("skip hourly: no day for %s (advert_id=%s)", target_date.isoformat(), advert_id)
-                            # позиции всё равно попробуем ниже из boosterStats
-                        else:
-                            day_dttm = _to_msk(day["date"])
-                            day_start = day_dttm.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                            for app in day.get("apps", []):
-                                app_type = app["appType"]
-                                for nm in app.get("nm", []):
-                                    nm_id = nm["nmId"]
-
-                                    # кумулятив за день из текущего ответа
-                                    cumul = {
-                                        "views":   nm.get("views", 0),
-                                        "clicks":  nm.get("clicks", 0),
-                                        "cost":    nm.get("sum", 0.0),
-                                        "carts":   nm.get("atbs", 0),
-                                        "orders":  nm.get("orders", 0),
-                                        "items":   nm.get("shks", 0),
-                                        "revenue": nm.get("sum_price", 0.0),
-                                    }
-
-                                    # предыдущие часы текущего бизнес-дня < biz
-                                    prev = await session.execute(text(f"""
-                                        SELECT  COALESCE(SUM(views),   0) AS views,
-                                                COALESCE(SUM(clicks),  0) AS clicks,
-                                                COALESCE(SUM(cost),    0) AS cost,
-                                                COALESCE(SUM(carts),   0) AS carts,
-                                                COALESCE(SUM(orders),  0) AS orders,
-                                                COALESCE(SUM(items),   0) AS items,
-                                                COALESCE(SUM(revenue), 0) AS revenue
-                                          FROM silver.{silver_stats_model.__tablename__}
-                                         WHERE company_id   = :company_id
-                                           AND advert_id    = :advert_id
-                                           AND app_type     = :app_type
-                                           AND nm_id        = :nm_id
-                                           AND business_dttm >= :day_start
-                                           AND business_dttm <  :current_biz
-                                    """), {
-                                        "company_id": company_id,
-                                        "advert_id": advert_id,
-                                        "app_type":  app_type,
-                                        "nm_id":     nm_id,
-                                        "day_start": day_start,
-                                        "current_biz": biz,
-                                    })
-                                    prev_map = prev.mappings().one()
-                                    delta = {
-                                        "views":   int(cumul["views"]   - prev_map["views"]),
-                                        "clicks":  int(cumul["clicks"]  - prev_map["clicks"]),
-                                        "cost":    float(cumul["cost"]   - prev_map["cost"]),
-                                        "carts":   int(cumul["carts"]   - prev_map["carts"]),
-                                        "orders":  int(cumul["orders"]  - prev_map["orders"]),
-                                        "items":   int(cumul["items"]   - prev_map["items"]),
-                                        "revenue": float(cumul["revenue"] - prev_map["revenue"]),
-                                    }
-
-                                    rec = {
-                                        "company_id":    company_id,
-                                        "request_uuid":  bronze.request_uuid,
-                                        "advert_id":     advert_id,
-                                        "app_type":      app_type,
-                                        "nm_id":         nm_id,
-                                        "request_dttm":  bronze.request_dttm,
-                                        "business_dttm": bronze.business_dttm,
-                                        "response_dttm": bronze.response_dttm,
-                                        **delta,
-                                    }
-
-                                    ins = pg_insert(silver_stats_model).values(**rec)
-                                    upsert = ins.on_conflict_do_update(
-                                        index_elements=[
-                                            silver_stats_model.business_dttm,
-                                            silver_stats_model.advert_id,
-                                            silver_stats_model.app_type,
-                                            silver_stats_model.nm_id,
-                                        ],
-                                        set_=rec,
-                                        where=sa.and_(
-                                            ins.excluded.response_dttm.isnot(None),
-                                            sa.or_(
-                                                silver_stats_model.response_dttm.is_(None),
-                                                ins.excluded.response_dttm > silver_stats_model.response_dttm,
-                                            ),
-                                        ),
-                                    )
-                                    await session.execute(upsert)
-                                    processed += 1
-                    else:
-                        # DAILY: обрабатываем все дни, которые пришли в ответе (вчера/позавчера и т.п.)
-                        for day in raw.get("days", []):
-                            day_dttm = _to_msk(day["date"])
-                            biz_day_start = day_dttm.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                            for app in day.get("apps", []):
-                                app_type = app["appType"]
-                                for nm in app.get("nm", []):
-                                    nm_id = nm["nmId"]
-                                    metrics = {
-                                        "views":   nm.get("views", 0),
-                                        "clicks":  nm.get("clicks", 0),
-                                        "cost":    nm.get("sum", 0.0),
-                                        "carts":   nm.get("atbs", 0),
-                                        "orders":  nm.get("orders", 0),
-                                        "items":   nm.get("shks", 0),
-                                        "revenue": nm.get("sum_price", 0.0),
-                                    }
-
-                                    rec = {
-                                        "company_id":    company_id,
-                                        "request_uuid":  bronze.request_uuid,
-                                        "advert_id":     advert_id,
-                                        "app_type":      app_type,
-                                        "nm_id":         nm_id,
-                                        "request_dttm":  request_dttm_bronze,
-                                        "business_dttm": bronze.business_dttm,
-                                        "response_dttm": bronze.response_dttm,
-                                        **metrics,
-                                    }
-
-                                    ins = pg_insert(silver_stats_model).values(**rec)
-                                    upsert = ins.on_conflict_do_update(
-                                        index_elements=[
-                                            silver_stats_model.business_dttm,
-                                            silver_stats_model.advert_id,
-                                            silver_stats_model.app_type,
-                                            silver_stats_model.nm_id,
-                                        ],
-                                        set_=rec,
-                                        where=sa.and_(
-                                            ins.excluded.response_dttm.isnot(None),
-                                            sa.or_(
-                                                silver_stats_model.response_dttm.is_(None),
-                                                ins.excluded.response_dttm > silver_stats_model.response_dttm,
-                                            ),
-                                        ),
-                                    )
-                                    await session.execute(upsert)
-                                    processed += 1
+                    day_stats = stats_for_day(flat, biz)
+                    missing = flat.advert_ids - {rec["advert_id"] for rec in day_stats}
+                    if missing:
+                        context.log.info(
+                            "skip hourly: no day for %s (adverts=%s)", biz.date().isoformat(), len(missing)
+                        )
+
+                    # дельта к прошлым часам дня [day_start, biz) считается в SQL
+                    # одним стейтментом для всего запуска (см. hourly_delta)
+                    for rec in day_stats:
+                        rec[PREV_FROM] = rec.pop("day_start")
+                        rec[PREV_UNTIL] = biz
+                        chunk_hourly.append({
+                            "company_id":    company_id,
+                            "request_uuid":  bronze.request_uuid,
+                            "request_dttm":  bronze.request_dttm,
+                            "business_dttm": bronze.business_dttm,
+                            "response_dttm": bronze.response_dttm,
+                            **rec,
+                        })
+                    processed += len(day_stats)
 
                     # ────────────────────────────────────────────────────────────────
-                    # 2) Обработка boosterStats → positions
+                    # 2) boosterStats → positions
+                    # у WB часто date = конец окна (HH:00) → берём записи, чьё начало окна = целевой час
                     # ────────────────────────────────────────────────────────────────
-                    for raw_boost in raw.get("boosterStats", []):
-                        bst_date = _to_msk(raw_boost["date"])
-
-                        if is_hourly:
-                            # целевой «ведомый» час берём из бронзы (он уже от scheduled tag)
-                            target_hour = bronze.business_dttm  # tz-aware MSK, начало часа
-
-                            # у WB часто date = конец окна (HH:00) → переводим в начало окна
-                            bst_bucket = business_hour_start(bst_date)
-
-                            # берём только записи, попадающие в нужный час
-                            if bst_bucket != target_hour:
-                                continue
-
-                            rec_pos = {
-                                "company_id": company_id,
-                                "request_uuid": bronze.request_uuid,
-                                "advert_id": advert_id,
-                                "nm_id": raw_boost["nm"],
-                                "date": bst_date,
-                                "avg_position": raw_boost.get("avg_position"),
-                                "business_dttm": target_hour,  # ← ключевой момент: строго из бронзы
-                                "response_dttm": response_dttm_bronze,
-                            }
-
-                            ins_pos = pg_insert(silver_positions_model).values(**rec_pos)
-                            upsert_pos = ins_pos.on_conflict_do_update(
-                                index_elements=[
-                                    silver_positions_model.request_uuid,
-                                    silver_positions_model.advert_id,
-                                    silver_positions_model.nm_id,
-                                    silver_positions_model.date,
-                                ],
-                                set_=rec_pos,
-                            )
-                        else:
-                            # DAILY: ключ = (business_dttm(day), advert_id, nm_id)
-                            biz_day_start = bst_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                            rec_pos = {
-                                "company_id":    company_id,
-                                "request_uuid":  bronze.request_uuid,
-                                "advert_id":     advert_id,
-                                "nm_id":         raw_boost["nm"],
-                                "date":          bst_date,
-                                "avg_position":  raw_boost.get("avg_position"),
-                                "business_dttm": biz_day_start,
-                                "response_dttm": response_dttm_bronze,
-                            }
-                            ins_pos = pg_insert(silver_positions_model).values(**rec_pos)
-                            upsert_pos = ins_pos.on_conflict_do_update(
-                                index_elements=[
-                                    silver_positions_model.business_dttm,
-                                    silver_positions_model.advert_id,
-                                    silver_positions_model.nm_id,
-                                ],
-                                set_=rec_pos,
-                                where=sa.and_(
-                                    ins_pos.excluded.response_dttm.isnot(None),
-                                    sa.or_(
-                                        silver_positions_model.response_dttm.is_(None),
-                                        ins_pos.excluded.response_dttm > silver_positions_model.response_dttm,
-                                    ),
-                                ),
-                            )
-
-                        await session.execute(upsert_pos)
+                    pos_records = positions_for_hour(
+                        flat,
+                        biz,
+                        company_id=company_id,
+                        request_uuid=bronze.request_uuid,
+                        business_dttm=bronze.business_dttm,  # ← ключевой момент: строго из бронзы
+                        response_dttm=response_dttm_bronze,
+                    )
+                else:
+                    # DAILY: все дни, которые пришли в ответе (вчера/позавчера и т.п.)
+                    stats_records = stats_all(
+                        flat,
+                        company_id=company_id,
+                        request_uuid=bronze.request_uuid,
+                        request_dttm=request_dttm_bronze,
+                        business_dttm=bronze.business_dttm,
+                        response_dttm=bronze.response_dttm,
+                    )
+                    if stats_records:
+                        await session.execute(stats_upsert, stats_records)
+                    processed += len(stats_records)
+
+                    # DAILY positions: ключ = (business_dttm(day), advert_id, nm_id)
+                    pos_records = positions_by_day(
+                        flat,
+                        company_id=company_id,
+                        request_uuid=bronze.request_uuid,
+                        response_dttm=response_dttm_bronze,
+                    )
 
-                await session.commit()
+                if pos_records:
+                    await session.execute(positions_upsert, pos_records)
+
+                if savepoint is not None:
+                    await savepoint.commit()  # RELEASE SAVEPOINT; общий коммит — после дельт
+                else:
+                    await session.commit()
+                hourly_rows.extend(chunk_hourly)
                 total_rows += processed
                 context.log.info(
                     "chunk committed: request_uuid=%s, rows=%s",
@@ -721,13 +699,27 @@ async def silver_wb_adv_fullstats(context):
                 )
 
             except Exception as e:
-                await session.rollback()
+                if savepoint is not None:
+                    await savepoint.rollback()
+                else:
+                    await session.rollback()
                 context.log.exception(
                     "chunk rollback: request_uuid=%s — %s",
                     bronze.request_uuid, e
                 )
                 continue
 
+        if is_hourly:
+            try:
+                if hourly_rows:
+                    await upsert_hourly_deltas(session, _fullstats_1h_delta_spec(silver_stats_model), hourly_rows)
+                await session.commit()
+            except Exception as e:
+                # откатываются и позиции чанков — ретрай ассета пересчитает всё заново
+                await session.rollback()
+                context.log.exception("hourly deltas rollback: rows=%s — %s", len(hourly_rows), e)
+                raise
+
         context.log.info(
             "[silver_wb_adv_fullstats_%s] processed %s bronze chunks, inserted/updated rows ≈ %s",
             time_grain, len(bronze_rows), total_rows
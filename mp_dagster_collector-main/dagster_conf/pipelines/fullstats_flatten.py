@@ -0,0 +1,148 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from zoneinfo import ZoneInfo
+
+
+MSK = ZoneInfo("Europe/Moscow")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Разворачивание ответа /adv/v2/fullstats
+#
+#   [{advertId, days: [{date, apps: [{appType, nm: [{nmId, views, ...}]}]}],
+#     boosterStats: [{date, nm, avg_position}]}]
+#
+# Даты кодируются словарём (date_code): уникальных дат в ответе единицы, поэтому
+# каждая строка даты разбирается и переводится в МСК один раз, а фильтры по
+# дню/часу считаются на уникальных датах — без next(...) и _to_msk на каждой
+# дате каждого advert. Записи для executemany собираются сразу словарями с
+# питоновскими типами, без промежуточных DataFrame/numpy-колонок: их сборка и
+# обратное .tolist() стоили дороже самого прохода по JSON.
+# ─────────────────────────────────────────────────────────────────────────────
+
+# поле WB → колонка silver
+STATS_METRICS: Dict[str, str] = {
+    "views": "views",
+    "clicks": "clicks",
+    "sum": "cost",
+    "atbs": "carts",
+    "orders": "orders",
+    "shks": "items",
+    "sum_price": "revenue",
+}
+
+
+@dataclass
+class FullstatsFlat:
+    # advert_id → [(date_code, apps), ...] в порядке days ответа
+    days: List[Tuple[int, List[Tuple[int, list]]]]
+    # элемент boosterStats: (advert_id, date_code, nm_id, avg_position)
+    boosters: List[Tuple[int, int, int, Any]]
+    dates: List[datetime]                                # уникальные даты ответа (МСК) по date_code
+    advert_ids: Set[int] = field(default_factory=set)    # adverts, у которых есть строки nm
+
+
+def parse_msk(value: str) -> datetime:
+    """ISO-строка (с Z/смещением или naive=UTC) → datetime в МСК."""
+    s = value.strip()
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(MSK)
+
+
+def flatten_fullstats(raw_list: Iterable[Dict[str, Any]]) -> FullstatsFlat:
+    """Один проход по ответу fullstats → days/boosterStats с кодами дат + словарь дат."""
+    codes: Dict[str, int] = {}
+    days: List[Tuple[int, List[Tuple[int, list]]]] = []
+    boosters: List[Tuple[int, int, int, Any]] = []
+    advert_ids: Set[int] = set()
+
+    for raw in raw_list or ():
+        advert_id = raw["advertId"]
+        advert_days = []
+        for day in raw.get("days") or ():
+            apps = day.get("apps") or ()
+            advert_days.append((codes.setdefault(day["date"], len(codes)), apps))
+            if any(app.get("nm") for app in apps):
+                advert_ids.add(advert_id)
+        days.append((advert_id, advert_days))
+
+        for boost in raw.get("boosterStats") or ():
+            boosters.append((advert_id, codes.setdefault(boost["date"], len(codes)), boost["nm"], boost.get("avg_position")))
+
+    return FullstatsFlat(days=days, boosters=boosters, dates=[parse_msk(s) for s in codes], advert_ids=advert_ids)
+
+
+def _day_start(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _emit_stats(out: List[Dict[str, Any]], advert_id: int, apps: list, extra: Dict[str, Any]) -> None:
+    append = out.append
+    for app in apps:
+        app_type = app["appType"]
+        for nm in app.get("nm") or ():
+            get = nm.get
+            # ключи — как в STATS_METRICS
+            append({
+                "advert_id": advert_id, "app_type": app_type, "nm_id": nm["nmId"],
+                "views": get("views") or 0, "clicks": get("clicks") or 0, "cost": float(get("sum") or 0),
+                "carts": get("atbs") or 0, "orders": get("orders") or 0, "items": get("shks") or 0,
+                "revenue": float(get("sum_price") or 0),
+                **extra,
+            })
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Записи под silver (условие считается по уникальным датам)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def stats_all(flat: FullstatsFlat, **const: Any) -> List[Dict[str, Any]]:
+    """Daily: строки всех дней ответа."""
+    out: List[Dict[str, Any]] = []
+    for advert_id, advert_days in flat.days:
+        for _, apps in advert_days:
+            _emit_stats(out, advert_id, apps, const)
+    return out
+
+
+def stats_for_day(flat: FullstatsFlat, target_day: datetime, **const: Any) -> List[Dict[str, Any]]:
+    """
+    Строки целевого дня (МСК) — по одному дню на advert (первый подходящий в
+    списке days, как раньше делал next(...)); добавляет day_start.
+    """
+    target = target_day.astimezone(MSK).date()
+    hit = [d.date() == target for d in flat.dates]
+    day_starts = [_day_start(d) for d in flat.dates]
+    out: List[Dict[str, Any]] = []
+    for advert_id, advert_days in flat.days:
+        for code, apps in advert_days:
+            if hit[code]:
+                _emit_stats(out, advert_id, apps, {**const, "day_start": day_starts[code]})
+                break
+    return out
+
+
+def positions_for_hour(flat: FullstatsFlat, target_hour: datetime, **const: Any) -> List[Dict[str, Any]]:
+    """boosterStats, у которых начало окна (date → час − 1) совпадает с целевым часом."""
+    dates = flat.dates
+    hit = [d.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1) == target_hour for d in dates]
+    return [
+        {"advert_id": advert_id, "nm_id": nm_id, "date": dates[code], "avg_position": avg_position, **const}
+        for advert_id, code, nm_id, avg_position in flat.boosters
+        if hit[code]
+    ]
+
+
+def positions_by_day(flat: FullstatsFlat, **const: Any) -> List[Dict[str, Any]]:
+    """Daily: business_dttm = начало суток date (МСК)."""
+    dates = flat.dates
+    day_starts = [_day_start(d) for d in dates]
+    return [
+        {"advert_id": advert_id, "nm_id": nm_id, "date": dates[code], "avg_position": avg_position,
+         "business_dttm": day_starts[code], **const}
+        for advert_id, code, nm_id, avg_position in flat.boosters
+    ]
@@ -0,0 +1,146 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Часовые дельты из кумулятивных снимков WB (fullstats, stats_keywords)
+#
+# WB отдаёт за день накопительные значения; в silver *_1h пишем прирост за час:
+#   delta = cumul(текущий снимок) − SUM(уже записанные часы дня до текущего).
+#
+# Вместо SELECT SUM + single-row upsert на каждую строку — постоянное число
+# стейтментов на запуск:
+#   1) CREATE TEMP TABLE … ON COMMIT DROP + один COPY всех кумулятивных строк;
+#   2) один INSERT … SELECT: предагрегат прошлых часов (GROUP BY по ключам
+#      стейджинга) LEFT JOIN стейджинг, вычитание в SQL;
+#   3) ON CONFLICT … DO UPDATE в том же стейтменте.
+#
+# Каждая строка стейджинга несёт своё окно вычитания [prev_from, prev_until) —
+# так сохраняется семантика, которая раньше жила в per-row SELECT'ах.
+# ─────────────────────────────────────────────────────────────────────────────
+
+PREV_FROM = "prev_from"
+PREV_UNTIL = "prev_until"
+
+
+@dataclass(frozen=True)
+class CumulativeDeltaSpec:
+    """Описание silver-таблицы для движка дельт."""
+    table: str                               # schema.table
+    columns: Tuple[str, ...]                 # колонки, которые пишем (как в INSERT)
+    match_cols: Tuple[str, ...]              # по ним ищем прошлые часы того же ряда
+    time_col: str                            # колонка времени в silver (business_dttm / date)
+    metric_cols: Tuple[str, ...]             # кумулятивные метрики → дельты
+    conflict_cols: Tuple[str, ...]           # ключ ON CONFLICT
+    order_col: str = "response_dttm"         # при дублях ключа в запуске берём последний по этой колонке
+    clamp_zero: bool = False                 # GREATEST(delta, 0)
+    derived: Dict[str, str] = field(default_factory=dict)  # колонка → SQL-выражение над d.<metric>
+    update_where: Optional[str] = None       # условие DO UPDATE … WHERE (алиасы t / EXCLUDED)
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def _copy_rows(session, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+    """COPY в временную таблицу через asyncpg; на других драйверах — executemany."""
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    driver = getattr(raw, "driver_connection", None)
+    if driver is not None and hasattr(driver, "copy_records_to_table"):
+        await driver.copy_records_to_table(table, records=rows, columns=list(columns))
+        return
+    cols = ", ".join(_q(c) for c in columns)
+    params = ", ".join(f":{c}" for c in columns)
+    await session.execute(
+        text(f"INSERT INTO {table} ({cols}) VALUES ({params})"),
+        [dict(zip(columns, r)) for r in rows],
+    )
+
+
+def build_delta_upsert_sql(spec: CumulativeDeltaSpec, staging: str) -> str:
+    """INSERT … SELECT с предагрегатом прошлых часов и ON CONFLICT (один стейтмент)."""
+    match = [_q(c) for c in spec.match_cols]
+    conflict = [_q(c) for c in spec.conflict_cols]
+    window = match + [PREV_FROM, PREV_UNTIL]
+
+    prev_sums = ",\n                   ".join(
+        f"SUM(t.{_q(m)}) AS {_q(m)}" for m in spec.metric_cols
+    )
+    join_prev = " AND ".join(f"p.{c} = s.{c}" for c in window)
+    join_hist = " AND ".join(f"t.{c} = w.{c}" for c in match)
+
+    def _delta(m: str) -> str:
+        expr = f"s.{_q(m)} - COALESCE(p.{_q(m)}, 0)"
+        return f"GREATEST({expr}, 0)" if spec.clamp_zero else expr
+
+    delta_cols = ",\n                   ".join(f"{_delta(m)} AS {_q(m)}" for m in spec.metric_cols)
+    plain = [c for c in spec.columns if c not in spec.metric_cols and c not in spec.derived]
+    out_cols = plain + list(spec.metric_cols) + list(spec.derived)
+
+    derived_sel = "".join(f",\n                   {expr} AS {_q(c)}" for c, expr in spec.derived.items())
+    updates = ",\n               ".join(f"{_q(c)} = EXCLUDED.{_q(c)}" for c in out_cols if c not in spec.conflict_cols)
+    where = f"\n         WHERE {spec.update_where}" if spec.update_where else ""
+
+    return f"""
+        WITH s AS (
+            SELECT DISTINCT ON ({", ".join(conflict)}) *
+              FROM {staging}
+             ORDER BY {", ".join(conflict)}, {_q(spec.order_col)} DESC NULLS LAST
+        ),
+        w AS (
+            SELECT DISTINCT {", ".join(window)} FROM s
+        ),
+        p AS (
+            SELECT {", ".join(f"w.{c}" for c in window)},
+                   {prev_sums}
+              FROM w
+              JOIN {spec.table} t
+                ON {join_hist}
+               AND t.{_q(spec.time_col)} >= w.{PREV_FROM}
+               AND t.{_q(spec.time_col)} <  w.{PREV_UNTIL}
+             GROUP BY {", ".join(f"w.{c}" for c in window)}
+        ),
+        d AS (
+            SELECT {", ".join(f"s.{_q(c)}" for c in plain)},
+                   {delta_cols}
+              FROM s
+              LEFT JOIN p ON {join_prev}
+        )
+        INSERT INTO {spec.table} AS t ({", ".join(_q(c) for c in out_cols)})
+        SELECT {", ".join(f"d.{_q(c)}" for c in plain + list(spec.metric_cols))}{derived_sel}
+          FROM d
+        ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET
+               {updates}{where}
+    """
+
+
+async def upsert_hourly_deltas(session, spec: CumulativeDeltaSpec, rows: List[Dict[str, Any]]) -> int:
+    """
+    rows — кумулятивные строки запуска: все spec.columns (метрики — накопленные за день)
+    плюс prev_from / prev_until. Пишет дельты в spec.table; коммит — за вызывающим.
+    Возвращает число строк, переданных в стейджинг.
+    """
+    if not rows:
+        return 0
+
+    staging = f"_stg_delta_{uuid.uuid4().hex[:12]}"
+    stg_cols = [c for c in spec.columns if c not in spec.derived]
+    copy_cols = stg_cols + [PREV_FROM, PREV_UNTIL]
+
+    # 1) стейджинг с типами колонок целевой таблицы (без ограничений)
+    await session.execute(text(
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+        f"SELECT {', '.join(_q(c) for c in stg_cols)} FROM {spec.table} WITH NO DATA"
+    ))
+    await session.execute(text(
+        f"ALTER TABLE {staging} ADD COLUMN {PREV_FROM} timestamptz, ADD COLUMN {PREV_UNTIL} timestamptz"
+    ))
+    await _copy_rows(session, staging, copy_cols, [tuple(r.get(c) for c in copy_cols) for r in rows])
+
+    # 2) + 3) дельты и upsert одним стейтментом
+    await session.execute(text(build_delta_upsert_sql(spec, staging)))
+    return len(rows)
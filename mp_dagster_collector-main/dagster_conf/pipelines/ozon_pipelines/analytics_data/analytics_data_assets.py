@@ -1,11 +1,13 @@
 import json
 import uuid
+import itertools
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta, timezone as std_timezone
 from zoneinfo import ZoneInfo
 from email.utils import parsedate_to_datetime
 
 from dagster import asset, RetryPolicy
+from src.connectors.ozon.ozon_collector import Page, stream_pages, write_pages
 from src.db.bronze.ozon_models import OzonAnalyticsData1d
 from dagster_conf.resources.ozon_client import ozon_client
 from dagster_conf.resources.pg_resource import postgres_resource
@@ -38,7 +40,7 @@ def _parse_response_meta(headers: Dict[str, str]) -> tuple[Optional[uuid.UUID],
     required_resource_keys={"ozon_client", "postgres"},
     key_prefix=["bronze"],
     name="ozon_analytics_data_1d",
-    description="Сохраняет сырые ответы /v1/analytics/data (воронка продаж) в bronze.ozon_analytics_data_1d. Каждый запрос — отдельная строка.",
+    description="Сохраняет сырые ответы /v1/analytics/data (воронка продаж) в bronze.ozon_analytics_data_1d. Каждый запрос — отдельная строка, вставка пачками.",
     retry_policy=RetryPolicy(max_retries=3, delay=30),
 )
 async def bronze_ozon_analytics_data_1d(context) -> None:
@@ -60,38 +62,38 @@ async def bronze_ozon_analytics_data_1d(context) -> None:
 
     limit  = int(context.op_config.get("limit", 1000))
     offset = int(context.op_config.get("offset", 0))
-
-    total_rows = 0
-
-    # 3) Пагинация и вставка «1 запрос = 1 строка»
-    async with context.resources.ozon_client as client:
+    # числа страниц /v1/analytics/data не сообщает: следующая страница грузится,
+    # пока пишется текущая; speculative_pages — сколько запрашивать сверх этого
+    speculative = int(context.op_config.get("speculative_pages", 0))
+    batch_pages = int(context.op_config.get("write_batch_pages", 20))
+
+    def _rows(data) -> list:
+        try:
+            return (data or {}).get("result", {}).get("data", []) or []
+        except Exception:
+            return []
+
+    # 3) Пагинация с предзагрузкой; «1 запрос = 1 строка», вставка пачками в одной транзакции
+    Session = context.resources.postgres
+    async with context.resources.ozon_client as client, Session() as session:
         api_token_id = client.token_id
 
-        while True:
-            context.log.info(f"[ozon analytics] fetch {date_from}..{date_to} offset={offset} limit={limit}")
-            try:
-                data, headers, http_status = await client.fetch_sales_funnel(
-                    date_from=date_from, date_to=date_to,
-                    metrics=metrics, dimension=dimension,
-                    limit=limit, offset=offset
-                )
-            except Exception as e:
-                context.log.error(f"[ozon analytics] fetch error at offset={offset}: {e}")
-                raise
+        async def fetch_page(page_offset: int):
+            context.log.info(f"[ozon analytics] fetch {date_from}..{date_to} offset={page_offset} limit={limit}")
+            return await client.fetch_sales_funnel(
+                date_from=date_from, date_to=date_to,
+                metrics=metrics, dimension=dimension,
+                limit=limit, offset=page_offset
+            )
 
+        def build_record(page: Page) -> Dict[str, Any]:
             # метаданные ответа
-            request_uuid, response_dttm, status_code = _parse_response_meta(headers)
-            request_uuid  = request_uuid  or uuid.uuid4()
-            response_dttm = response_dttm or run_dttm
-
-            # «сырое тело» как текст
-            response_text = json.dumps(data, ensure_ascii=False)
-
-            record = {
+            request_uuid, response_dttm, status_code = _parse_response_meta(page.headers)
+            return {
                 "api_token_id":       api_token_id,
                 "run_uuid":           run_uuid,
                 "run_dttm":           run_dttm,
-                "request_uuid":       request_uuid,
+                "request_uuid":       request_uuid or uuid.uuid4(),
                 "request_dttm":       run_dttm,
                 "request_parameters": {
                     "date_from": date_from,
@@ -99,27 +101,26 @@ async def bronze_ozon_analytics_data_1d(context) -> None:
                     "metrics":   metrics,
                     "dimension": dimension,
                     "limit":     limit,
-                    "offset":    offset,
+                    "offset":    page.key,
                 },
                 "request_body":       None,
-                "response_dttm":      response_dttm,
-                "response_code":      status_code or http_status,
-                "response_body":      response_text,
+                "response_dttm":      response_dttm or run_dttm,
+                "response_code":      status_code or page.status,
+                # «сырое тело» как текст
+                "response_body":      json.dumps(page.data, ensure_ascii=False),
             }
 
-            async with context.resources.postgres() as session:
-                await session.execute(OzonAnalyticsData1d.__table__.insert().values(**record))
-                await session.commit()
-                total_rows += 1
-
-            # условие выхода: если страница пустая или неполная — дальше данных нет
-            try:
-                rows = (data or {}).get("result", {}).get("data", [])
-            except Exception:
-                rows = []
-            if not rows or len(rows) < limit:
-                break
-
-            offset += limit
+        async def write_batch(records: List[Dict[str, Any]]) -> None:
+            await session.execute(OzonAnalyticsData1d.__table__.insert(), records)
+
+        pages = stream_pages(
+            fetch_page, itertools.count(offset, limit),
+            # страница пустая или неполная — дальше данных нет
+            is_last=lambda data: len(_rows(data)) < limit,
+            speculative=speculative, log=context.log, tag="ozon analytics",
+        )
+        total_rows = await write_pages(pages, build_record=build_record, write_batch=write_batch,
+                                       batch_pages=batch_pages)
+        await session.commit()
 
     context.log.info(f"[bronze_ozon_analytics_data_1d] inserted {total_rows} rows for {date_from}..{date_to}")
@@ -1,12 +1,14 @@
 import uuid
 import json
-from typing import Dict, Optional, Any
+import itertools
+from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta, timezone as std_timezone
 from zoneinfo import ZoneInfo
 from email.utils import parsedate_to_datetime
 
 from dagster import asset, RetryPolicy
 
+from src.connectors.ozon.ozon_collector import Page, stream_pages, write_pages
 from src.db.bronze.ozon_models import OzonFinanceTransactionList1d
 from dagster_conf.resources.ozon_client import ozon_client
 from dagster_conf.resources.pg_resource import postgres_resource
@@ -25,6 +27,16 @@ def _extract_items(resp: Dict[str, Any]) -> Optional[list]:
     return None
 
 
+def _page_count(resp: Dict[str, Any]) -> Optional[int]:
+    """result.page_count из ответа v3 (None — не сообщается)."""
+    result = resp.get("result") if isinstance(resp, dict) else None
+    value = result.get("page_count") if isinstance(result, dict) else None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
 def _parse_response_meta(headers: Dict[str, str]) -> tuple[Optional[uuid.UUID], Optional[datetime]]:
     """Извлекаем возможный request-id и дату ответа из заголовков."""
     req_id = headers.get("x-request-id") or headers.get("X-Request-Id") or headers.get("request-id")
@@ -65,6 +77,8 @@ async def bronze_ozon_finance_transaction_list_1d(context) -> None:
     date_from_cfg = context.op_config.get("date_from")  # ISO: 'YYYY-MM-DDTHH:MM:SSZ' или 'YYYY-MM-DD'
     date_to_cfg   = context.op_config.get("date_to")
     page_size     = int(context.op_config.get("page_size", 1000))
+    concurrency   = int(context.op_config.get("concurrency", 4))
+    batch_pages   = int(context.op_config.get("write_batch_pages", 20))
 
     if date_from_cfg and date_to_cfg:
         date_from_iso = date_from_cfg
@@ -79,54 +93,52 @@ async def bronze_ozon_finance_transaction_list_1d(context) -> None:
     async with context.resources.ozon_client as client, Session() as session:
         api_token_id = client.token_id
 
-        page = 1
-        inserted = 0
-
-        while True:
-            payload_req = {
-                "filter": {"date": {"from": date_from_iso, "to": date_to_iso}},
-                "page": page,
-                "page_size": page_size,
-            }
-
+        async def fetch_page(page: int):
             context.log.info(f"[ozon finance] page={page} size={page_size} from={date_from_iso} to={date_to_iso}")
-
-            # ⬇️ теперь клиент возвращает (data, headers, status)
-            resp_dict, headers, status = await client.fetch_sales(
+            # клиент возвращает (data, headers, status)
+            return await client.fetch_sales(
                 date_from=date_from_iso, date_to=date_to_iso, page=page, page_size=page_size
             )
 
-            # сырые данные → JSON строкой без форматирования
-            resp_text = json.dumps(resp_dict, ensure_ascii=False, separators=(",", ":"))
-
+        def build_record(page: Page) -> Dict[str, Any]:
             # метаданные ответа
-            req_uuid_from_hdr, resp_dt_from_hdr = _parse_response_meta(headers)
-            request_uuid  = req_uuid_from_hdr or uuid.uuid4()
-            response_dttm = resp_dt_from_hdr or run_dttm
-
+            req_uuid_from_hdr, resp_dt_from_hdr = _parse_response_meta(page.headers)
             # запись одной страницы (1 запрос = 1 строка)
-            record = {
+            return {
                 "api_token_id":       api_token_id,
                 "run_uuid":           run_uuid,
                 "run_dttm":           run_dttm,
-                "request_uuid":       request_uuid,
+                "request_uuid":       req_uuid_from_hdr or uuid.uuid4(),
                 "request_dttm":       run_dttm,
                 "request_parameters": None,
-                "request_body":       payload_req,
-                "response_dttm":      response_dttm,
-                "response_code":      int(status),
-                "response_body":      resp_text,
+                "request_body":       {
+                    "filter": {"date": {"from": date_from_iso, "to": date_to_iso}},
+                    "page": page.key,
+                    "page_size": page_size,
+                },
+                "response_dttm":      resp_dt_from_hdr or run_dttm,
+                "response_code":      int(page.status),
+                # сырые данные → JSON строкой без форматирования
+                "response_body":      json.dumps(page.data, ensure_ascii=False, separators=(",", ":")),
             }
-            await session.execute(OzonFinanceTransactionList1d.__table__.insert().values(**record))
-            inserted += 1
 
-            # пагинация: если вернулось меньше page_size или массив пуст — заканчиваем
-            items = _extract_items(resp_dict)
-            if not items or (isinstance(items, list) and len(items) < page_size):
-                await session.commit()
-                break
+        async def write_batch(records: List[Dict[str, Any]]) -> None:
+            await session.execute(OzonFinanceTransactionList1d.__table__.insert(), records)
+
+        def is_last(resp: Dict[str, Any]) -> bool:
+            # если вернулось меньше page_size или массив пуст — дальше данных нет
+            items = _extract_items(resp)
+            return not items or len(items) < page_size
 
-            page += 1
+        # page_count из первой страницы → остальные страницы параллельно окном concurrency
+        pages = stream_pages(
+            fetch_page, itertools.count(1),
+            is_last=is_last, page_total=_page_count,
+            concurrency=concurrency, log=context.log, tag="ozon finance",
+        )
+        inserted = await write_pages(pages, build_record=build_record, write_batch=write_batch,
+                                     batch_pages=batch_pages)
+        await session.commit()
 
         context.log.info(
             f"[bronze_ozon_finance_transaction_list_1d] inserted_pages={inserted} "
@@ -1,5 +1,4 @@
 import uuid
-import asyncio
 from typing import Dict, Optional
 from datetime import datetime, timedelta, timezone as std_timezone
 from zoneinfo import ZoneInfo
@@ -7,6 +6,8 @@ from email.utils import parsedate_to_datetime
 
 from dagster import asset, RetryPolicy
 
+from dagster_conf.lib.asset_factories.task_lifecycle import AdaptivePolling
+from src.connectors.ozon.ozon_collector import ReportJob, run_report_jobs
 from src.db.bronze.ozon_models import OzonPostingsCreate1d
 from dagster_conf.resources.ozon_client import ozon_client
 from dagster_conf.resources.pg_resource import postgres_resource
@@ -57,81 +58,61 @@ async def bronze_ozon_report_postings_file_1d(context) -> None:
         date_from = f"{y}T00:00:00+03:00"
         date_to   = f"{y}T23:59:59+03:00"
 
-    delivery_schema = context.op_config.get("delivery_schema", "fbo")  # "fbo" | "fbs"
+    # одна схема (delivery_schema) или несколько (delivery_schemas) — отчёты по ним строятся одновременно
+    delivery_schemas = context.op_config.get("delivery_schemas") or [context.op_config.get("delivery_schema", "fbo")]
+    # poll_delay_sec — потолок интервала опроса: сначала статус спрашивается каждые
+    # initial_poll_sec, затем реже; общее ожидание ограничено poll_delay_sec * max_checks
     poll_delay_sec  = int(context.op_config.get("poll_delay_sec", 15))
     max_checks      = int(context.op_config.get("max_checks", 40))
+    polling = AdaptivePolling(
+        initial_interval_sec=float(context.op_config.get("initial_poll_sec", 2)),
+        max_interval_sec=poll_delay_sec,
+        timeout_sec=poll_delay_sec * max_checks,
+    )
 
-    # 3) Создание → ожидание → скачивание.
+    # 3) Создание → ожидание → скачивание (все схемы параллельно).
     Session = context.resources.postgres
     async with context.resources.ozon_client as client, Session() as session:
         api_token_id = client.token_id
 
-        # 3.1 Создать отчёт → получить code
-        context.log.info(f"[ozon report create] {delivery_schema} {date_from}..{date_to}")
-        code = await client.create_orders_report(date_from=date_from, date_to=date_to, delivery_schema=delivery_schema)
-        if not code:
-            raise RuntimeError("Не получили code отчёта от /v1/report/postings/create")
-
-        # 3.2 Ожидать готовности, достать file_url
-        file_url: Optional[str] = None
-        for i in range(max_checks):
-            context.log.info(f"[ozon report status] try={i+1}/{max_checks} code={code}")
-            # ожидается новая сигнатура: (data, headers, status)
-            info_data, _, _ = await client.get_report_status(code)
-
-            if not isinstance(info_data, dict):
-                status_str = str(info_data).lower()
-                if status_str in {"success", "done", "ready"}:
-                    raise RuntimeError("Статус готов, но метод get_report_status не вернул JSON с file_url.")
-                if status_str in {"failed", "error"}:
-                    raise RuntimeError(f"Отчёт завершился со статусом '{status_str}'")
-                await asyncio.sleep(poll_delay_sec)
-                continue
-
-            result = info_data.get("result") or {}
-            status_str = (result.get("status") or "").lower()
-            if status_str in {"success", "done", "ready"}:
-                file_url = result.get("file_url") or result.get("file") or result.get("url")
-                break
-            if status_str in {"failed", "error"}:
-                raise RuntimeError(f"Отчёт завершился со статусом '{status_str}'")
-            await asyncio.sleep(poll_delay_sec)
-
-        if not file_url:
-            raise TimeoutError("Не получили file_url: отчёт не подготовился за отведённое число попыток.")
-
-        # 3.3 Скачивание файла
-        context.log.info(f"[ozon report download] {file_url}")
-        file_bytes, dl_headers, dl_status = await client.download_orders_report(file_url)
-
-        # метаданные ответа
-        req_uuid, resp_dttm = _parse_response_meta(dl_headers)
-        request_uuid  = req_uuid or uuid.uuid4()
-        response_dttm = resp_dttm or run_dttm
-
-        # формируем одну запись: 1 HTTP запрос (download) = 1 строка
-        record = {
-            "api_token_id":       api_token_id,
-            "run_uuid":           run_uuid,
-            "run_dttm":           run_dttm,
-            "request_uuid":       request_uuid,
-            "request_dttm":       run_dttm,
-            "request_parameters": {
-                "date_from": date_from,
-                "date_to":   date_to,
-                "delivery_schema": delivery_schema,
-                "code": code,
-            },
-            "request_body":       {"file_url": file_url},
-            "response_dttm":      response_dttm,
-            "response_code":      int(dl_status),
-            "response_body":      file_bytes,
-        }
-
-        await session.execute(OzonPostingsCreate1d.__table__.insert().values(**record))
-        await session.commit()
-
-        context.log.info(
-            f"[bronze_ozon_report_postings_file_1d] saved file for code={code} "
-            f"schema={delivery_schema} range={date_from}..{date_to} bytes={len(file_bytes)}"
+        context.log.info(f"[ozon report create] {', '.join(delivery_schemas)} {date_from}..{date_to}")
+        run = await run_report_jobs(
+            [ReportJob(client, date_from, date_to, schema) for schema in delivery_schemas],
+            polling=polling, log=context.log,
         )
+
+        # формируем записи: 1 HTTP запрос (download) = 1 строка
+        records = []
+        for result in run.results:
+            # метаданные ответа
+            req_uuid, resp_dttm = _parse_response_meta(result.headers)
+            records.append({
+                "api_token_id":       api_token_id,
+                "run_uuid":           run_uuid,
+                "run_dttm":           run_dttm,
+                "request_uuid":       req_uuid or uuid.uuid4(),
+                "request_dttm":       run_dttm,
+                "request_parameters": {
+                    "date_from": date_from,
+                    "date_to":   date_to,
+                    "delivery_schema": result.job.delivery_schema,
+                    "code": result.code,
+                },
+                "request_body":       {"file_url": result.file_url},
+                "response_dttm":      resp_dttm or run_dttm,
+                "response_code":      result.status,
+                "response_body":      result.body,
+            })
+
+        # готовые отчёты сохраняются, даже если по другой схеме отчёт не собрался
+        if records:
+            await session.execute(OzonPostingsCreate1d.__table__.insert(), records)
+            await session.commit()
+
+        for result in run.results:
+            context.log.info(
+                f"[bronze_ozon_report_postings_file_1d] saved file for code={result.code} "
+                f"schema={result.job.delivery_schema} range={date_from}..{date_to} bytes={len(result.body)} "
+                f"polls={result.polls} in {result.elapsed_sec:.1f}s"
+            )
+        run.raise_first()
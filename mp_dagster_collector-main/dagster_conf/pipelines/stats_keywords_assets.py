@@ -17,10 +17,31 @@ from dagster_conf.pipelines.wb_bronze_ops import extract_metadata_from_headers
 from src.db.bronze.models import WbAdvStatsKeywords1d, WbAdvStatsKeywords1h
 from src.db.silver.models  import SilverWbAdvKeywordStats1d, SilverWbAdvKeywordStats1h
 from dagster_conf.pipelines.utils import prev_hour_mskt
+from dagster_conf.pipelines.advert_fanout import collect_adverts_to_bronze, run_group_ids
+from dagster_conf.pipelines.hourly_delta import PREV_FROM, PREV_UNTIL, CumulativeDeltaSpec, upsert_hourly_deltas
+
+
+# silver.wb_adv_keyword_stats_1h: кумулятив дня → дельта к прошлым часам (clamp ≥ 0, ctr по дельтам)
+KEYWORD_STATS_1H_DELTA = CumulativeDeltaSpec(
+    table="silver.wb_adv_keyword_stats_1h",
+    columns=("company_id", "request_uuid", "inserted_at", "advert_id", "date", "keyword",
+             "views", "clicks", "cost", "ctr"),
+    match_cols=("advert_id", "keyword"),
+    time_col="date",
+    metric_cols=("views", "clicks", "cost"),
+    conflict_cols=("request_uuid", "advert_id", "date", "keyword"),
+    order_col="inserted_at",
+    clamp_zero=True,
+    derived={"ctr": "CASE WHEN d.views > 0 THEN d.clicks::float8 / d.views ELSE 0.0 END"},
+)
 
-
-# скорость не более 4 req/sec
+# скорость не более 4 req/sec: минимальный интервал между стартами запросов,
+# если WB не прислал X-Ratelimit-* (иначе темп берётся из заголовков)
 PER_ADVERT_DELAY = 0.3
+# запросов в полёте одновременно
+ADVERT_CONCURRENCY = 4
+# строк бронзы на один INSERT
+BRONZE_BATCH_SIZE = 50
 ACTIVE_STATUSES = {4, 9, 11}  # используется в 1d-режиме
 MSK = ZoneInfo("Europe/Moscow")
 
@@ -154,37 +175,34 @@ async def bronze_wb_adv_stats_keywords(context) -> None:
         context.log.info("[keywords_%s] Нет кампаний за %s — пропускаю", time_grain, date_from)
         return
 
-    # 3) по каждой кампании — запрос keywords и запись в бронзу
-    async with context.resources.wildberries_client as client:
-        for advert_id in advert_ids:
-            try:
-                (raw_data, headers) = (await client.fetch_keywords_batch([advert_id], date_from, date_to))[0]
-            except Exception as e:
-                context.log.warning("[keywords_%s] Ошибка для advert_id=%s: %s", time_grain, advert_id, e)
-                await asyncio.sleep(PER_ADVERT_DELAY)
-                continue
-
-            _, response_dttm = extract_metadata_from_headers(headers)
-            response_code = int(headers.get("status", 200))
-
-            record = {
-                "api_token_id":       api_token_id,
-                "run_uuid":           run_uuid,
-                "run_dttm":           run_dttm,
-                "request_uuid":       uuid.uuid4(),
-                "request_dttm":       run_dttm,
-                "request_parameters": {"advert_id": advert_id, "date_from": date_from, "date_to": date_to},
-                "request_body":       None,
-                "response_dttm":      response_dttm,
-                "response_code":      response_code,
-                "response_body":      json.dumps(raw_data.get("keywords", []), ensure_ascii=False),
-            }
-
-            async with context.resources.postgres() as session:
-                await session.execute(table.__table__.insert().values(**record))
-                await session.commit()
+    # 3) параллельно по кампаниям (темп — по заголовкам лимита) → бронза пачками
+    def build_record(advert_id, raw_data, headers, request_dttm):
+        _, response_dttm = extract_metadata_from_headers(headers)
+        return {
+            "api_token_id":       api_token_id,
+            "run_uuid":           run_uuid,
+            "run_dttm":           run_dttm,
+            "request_uuid":       uuid.uuid4(),
+            "request_dttm":       run_dttm,
+            "request_parameters": {"advert_id": advert_id, "date_from": date_from, "date_to": date_to},
+            "request_body":       None,
+            "response_dttm":      response_dttm,
+            "response_code":      int(headers.get("status", 200)),
+            "response_body":      json.dumps(raw_data.get("keywords", []), ensure_ascii=False),
+        }
 
-            await asyncio.sleep(PER_ADVERT_DELAY)
+    async with context.resources.wildberries_client as client:
+        await collect_adverts_to_bronze(
+            context,
+            table=table,
+            advert_ids=advert_ids,
+            fetch_one=lambda advert_id: client.fetch_keywords_one(advert_id, date_from, date_to),
+            build_record=build_record,
+            min_interval=PER_ADVERT_DELAY,
+            concurrency=ADVERT_CONCURRENCY,
+            batch_size=BRONZE_BATCH_SIZE,
+            tag=f"keywords_{time_grain}",
+        )
 
 
 @asset(
@@ -289,7 +307,7 @@ async def bronze_wb_adv_stats_keywords(context) -> None:
     },
 )
 async def silver_wb_adv_keyword_stats(context):
-    run_id     = context.run_id
+    run_ids    = run_group_ids(context)  # бронза рана и его re-execution'ов
     time_grain = context.op_config.get("time_grain", "1d")
     scheduled  = context.dagster_run.tags.get("dagster/scheduled_execution_time")
     run_dttm   = datetime.fromisoformat(scheduled).astimezone(ZoneInfo("Europe/Moscow"))
@@ -311,16 +329,21 @@ async def silver_wb_adv_keyword_stats(context):
     async with context.resources.postgres() as session:
         # Получаем все записи бронзы текущего запуска
         rows = await session.execute(
-            select(bronze_table).where(bronze_table.run_uuid == run_id)
+            select(bronze_table).where(bronze_table.run_uuid.in_(run_ids))
         )
         bronze_rows = rows.scalars().all()
+        hourly_rows: list[dict] = []
+        company_by_token: dict = {}
 
         for bronze in bronze_rows:
             # company_id
-            company_id = (await session.execute(
-                text("SELECT company_id FROM core.tokens WHERE token_id = :tid"),
-                {"tid": bronze.api_token_id},
-            )).scalar_one()
+            company_id = company_by_token.get(bronze.api_token_id)
+            if company_id is None:
+                company_id = (await session.execute(
+                    text("SELECT company_id FROM core.tokens WHERE token_id = :tid"),
+                    {"tid": bronze.api_token_id},
+                )).scalar_one()
+                company_by_token[bronze.api_token_id] = company_id
 
             advert_id = bronze.request_parameters["advert_id"]
             raw_list  = json.loads(bronze.response_body)
@@ -363,38 +386,26 @@ async def silver_wb_adv_keyword_stats(context):
                 for stat in kw_day.get("stats", [])
             }
 
-            # Для часового режима вычитаем накопленное за предыдущие часы
+            # Для часового режима дельты к предыдущим часам [start_dt, end_dt) считаются
+            # в SQL одним стейтментом на весь запуск (см. hourly_delta)
             if time_grain == "1h":
                 start_dt = stat_date.replace(hour=0, minute=0, second=0, microsecond=0)
                 end_dt   = run_dttm.replace(minute=0, second=0, microsecond=0)
-                q = text("""
-                    SELECT keyword,
-                           SUM(views) AS views,
-                           SUM(clicks) AS clicks,
-                           SUM(cost)   AS cost
-                      FROM silver.wb_adv_keyword_stats_1h
-                     WHERE advert_id = :advert_id
-                       AND date >= :start_dt
-                       AND date <  :end_dt
-                     GROUP BY keyword
-                """)
-                prev = await session.execute(q, {
-                    "advert_id": advert_id,
-                    "start_dt":  start_dt,
-                    "end_dt":    end_dt,
-                })
-                previous = {
-                    r.keyword: {"views": r.views or 0, "clicks": r.clicks or 0, "cost": r.cost or 0.0}
-                    for r in prev
-                }
-
-                # Вычитаем
-                for kw, stats in current_data.items():
-                    base = previous.get(kw, {"views": 0, "clicks": 0, "cost": 0.0})
-                    stats["views"]  = max(0, stats["views"]  - base["views"])
-                    stats["clicks"] = max(0, stats["clicks"] - base["clicks"])
-                    stats["cost"]   = max(0, stats["cost"]   - base["cost"])
-                    stats["ctr"]    = (stats["clicks"] / stats["views"]) if stats["views"] else 0.0
+                for keyword, stats in current_data.items():
+                    hourly_rows.append({
+                        "company_id":   company_id,
+                        "request_uuid": bronze.request_uuid,
+                        "inserted_at":  bronze.run_dttm,
+                        "advert_id":    advert_id,
+                        "date":         stat_date,
+                        "keyword":      keyword,
+                        "views":        int(stats["views"]),
+                        "clicks":       int(stats["clicks"]),
+                        "cost":         float(stats["cost"]),
+                        PREV_FROM:      start_dt,
+                        PREV_UNTIL:     end_dt,
+                    })
+                continue
 
             # Upsert в silver
             for keyword, stats in current_data.items():
@@ -425,6 +436,10 @@ async def silver_wb_adv_keyword_stats(context):
                 )
                 await session.execute(upsert)
 
+        if hourly_rows:
+            await upsert_hourly_deltas(session, KEYWORD_STATS_1H_DELTA, hourly_rows)
+            context.log.info(f"[silver_wb_adv_keyword_stats] 1h: дельты по {len(hourly_rows)} строкам")
+
         await session.commit()
 
     context.log.info(f"[silver_wb_adv_keyword_stats] Обработано записей: {len(bronze_rows)}")
\ No newline at end of file
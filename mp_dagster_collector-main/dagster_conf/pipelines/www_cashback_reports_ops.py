@@ -419,7 +419,8 @@ def _parse_cashback_file(xlsx_bytes: bytes) -> dict:
     В первом листе строки вида: <Подпись> | <Значение>.
     """
     log = get_dagster_logger()
-    wb = load_workbook(BytesIO(xlsx_bytes), data_only=True)
+    # read_only: потоковый разбор листа без построения полной модели книги
+    wb = load_workbook(BytesIO(xlsx_bytes), data_only=True, read_only=True)
     ws = wb.active
 
     result = {
@@ -455,6 +456,7 @@ def _parse_cashback_file(xlsx_bytes: bytes) -> dict:
         matched += 1
         log.debug(f"[xlsx] matched '{label}' -> {field} = {parsed}")
 
+    wb.close()
     log.debug(f"[xlsx] parsed fields: {matched}/{len(result)}")
     return result
 
@@ -16,6 +16,7 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from src.db.bronze.models import WbWwwFinReports1d
+from dagster_conf.lib.wb_report_reader import read_xlsx_bytes
 from src.db.silver.models import WbSales1d, SilverAdjustmentsByProduct, SilverAdjustmentsGeneral, WbLogistics1d
 
 
@@ -315,8 +316,7 @@ def unpack_and_load_excel(context, bronze_row: WbWwwFinReports1d) -> pd.DataFram
     with zipfile.ZipFile(io.BytesIO(raw_zip)) as zf:
         name = zf.namelist()[0]
         logger.debug(f"Unpacking '{name}' from ZIP for request {bronze_row.request_uuid}")
-        with zf.open(name) as f:
-            df = pd.read_excel(f, engine="openpyxl", dtype={"Баркод": str})
+        df = read_xlsx_bytes(zf.read(name), dtype={"Баркод": str})
 
     # Унифицированное приведение типов
     for col, dtype in column_type_mapping.items():
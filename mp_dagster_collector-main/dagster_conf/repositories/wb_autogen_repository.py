@@ -10,6 +10,7 @@ from dagster_conf.resources.wildberries_client_v2 import wildberries_client_v2
 from dagster_conf.resources.selenium_remote import selenium_remote
 
 from dagster_conf.pipelines._gold__vm_product_orders_1d import refresh_vm_product_orders_1d_schedule
+from dagster_conf.pipelines._maintenance__time_partitions import maintain_time_partitions_schedule
 
 
 CFG_PATH = Path(__file__).parents[1] / "lib" / "config.yml"
@@ -67,4 +68,5 @@ def wb_autogen_repository():
 
         # @TODO: сделать фабрику для обновления всех мат.представлений в слое gold
         refresh_vm_product_orders_1d_schedule,
+        maintain_time_partitions_schedule,
     ]
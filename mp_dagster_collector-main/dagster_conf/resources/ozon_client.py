@@ -1,6 +1,9 @@
 import os
-from dagster import resource, String, Field
+from typing import Iterator
+
+from dagster import resource, String, Field, Int
 from src.connectors.ozon.ozon_api import OzonAsyncClient
+from src.connectors.ozon.ozon_credentials import ozon_credentials
 
 
 @resource(
@@ -8,19 +11,29 @@ from src.connectors.ozon.ozon_api import OzonAsyncClient
         "client_id": String,
         "api_key": String,
         "client_secret": Field(String, is_required=False),
+        "token_id": Field(Int, is_required=False),
     }
 )
-def ozon_client(init_context) -> OzonAsyncClient:
+def ozon_client(init_context) -> Iterator[OzonAsyncClient]:
     """
     Ресурс для OzonAsyncClient.
     Параметры передаются через run_config:
       resources.ozon_client.config.client_id
       resources.ozon_client.config.api_key
       (опционально) resources.ozon_client.config.client_secret
+      (опционально) resources.ozon_client.config.token_id — core.tokens.token_id для api_token_id в бронзе
+
+    Токены Performance API и HTTP-сессии общие на процесс (ozon_credentials):
+    ассеты запуска не авторизуются заново и делят пул соединений; сессии
+    закрываются при teardown ресурса.
     """
     cfg = init_context.resource_config
-    return OzonAsyncClient(
-        client_id=cfg["client_id"],
-        api_key=cfg["api_key"],
-        client_secret=cfg.get("client_secret"),
-    )
+    try:
+        yield OzonAsyncClient(
+            client_id=cfg["client_id"],
+            api_key=cfg["api_key"],
+            client_secret=cfg.get("client_secret"),
+            token_id=cfg.get("token_id"),
+        )
+    finally:
+        ozon_credentials().close_idle()
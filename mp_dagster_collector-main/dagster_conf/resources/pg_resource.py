@@ -1,3 +1,7 @@
+from typing import Iterator
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from dagster import resource
 import os
@@ -31,3 +35,29 @@ def postgres_resource(_):
 
     return async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
+
+
+@resource(config_schema={})
+def postgres_engine_resource(_) -> Iterator[Engine]:
+    """
+    Синхронный движок SQLAlchemy (psycopg2) для кода на pandas — например,
+    оптимизатора ключевых слов (keywords_opt/OptManager.optimize_company).
+    DSN — как у dagster_conf/lib/tokens.py (POSTGRES_SYNC_DSN / DATABASE_URL / DB_*);
+    пул закрывается при teardown ресурса.
+    """
+    from dagster_conf.lib.tokens import _build_sync_dsn
+
+    dsn = _build_sync_dsn()
+    connect_args = {} if "sslmode=" in dsn else {"sslmode": os.getenv("DB_SSLMODE", "require")}
+    engine = create_engine(
+        dsn,
+        pool_pre_ping=True,
+        pool_size=5,
+        max_overflow=5,
+        pool_recycle=1800,
+        connect_args=connect_args,
+    )
+    try:
+        yield engine
+    finally:
+        engine.dispose()
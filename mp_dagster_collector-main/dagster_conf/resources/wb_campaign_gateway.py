@@ -0,0 +1,30 @@
+from functools import partial
+from typing import Callable
+
+from dagster import resource, Field, Float, Int, String
+from api.wb_campaign_gateway import BASE_URL, WBCampaignGateway
+
+
+@resource(
+    config_schema={
+        "base_url": Field(String, default_value=BASE_URL),
+        "coalesce_delay": Field(Float, default_value=0.05),
+        "concurrency": Field(Int, default_value=4),
+        "retries": Field(Int, default_value=3),
+    }
+)
+def wb_campaign_gateway(init_context) -> Callable[..., WBCampaignGateway]:
+    """
+    Фабрика WBCampaignGateway: gateway_factory(token, log=...) → клиент кампаний WB.
+    Токен известен только в op (компания из партиции), поэтому ресурс отдаёт
+    фабрику с параметрами из run_config:
+      resources.wb_campaign_gateway.config.base_url / coalesce_delay / concurrency / retries
+    """
+    cfg = init_context.resource_config
+    return partial(
+        WBCampaignGateway,
+        base_url=cfg["base_url"],
+        coalesce_delay=cfg["coalesce_delay"],
+        concurrency=cfg["concurrency"],
+        retries=cfg["retries"],
+    )
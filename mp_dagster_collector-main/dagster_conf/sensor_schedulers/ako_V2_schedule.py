@@ -1,4 +1,4 @@
-from dagster import schedule
+from dagster import schedule, RunRequest
 from dagster_conf.pipelines.ako_V2_job import ako_V2_wrapper_job
 
 
@@ -7,5 +7,7 @@ from dagster_conf.pipelines.ako_V2_job import ako_V2_wrapper_job
     job=ako_V2_wrapper_job,
     execution_timezone="Europe/Moscow"
 )
-def ako_V2_wrapper_schedule():
-    return {}
+def ako_V2_wrapper_schedule(context):
+    """По run'у на каждую компанию (dynamic-партиция company_id) — компании выполняются параллельно."""
+    for cid in context.instance.get_dynamic_partitions("company_id"):
+        yield RunRequest(partition_key=str(cid), run_config={})
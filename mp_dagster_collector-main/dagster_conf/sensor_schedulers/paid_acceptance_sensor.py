@@ -1,61 +1,15 @@
-import os
-import psycopg2
-from datetime import datetime
-from pytz import timezone, UTC
-from dagster import sensor, RunRequest
-
+from dagster_conf.lib.sensor_base import WB_SELLER_TOKEN_IDS, token_slot_sensor
 from dagster_conf.pipelines.paid_acceptance_job import wb_acceptance_report_1d_job
 
-# Окно запуска: 06:00–06:05 МСК
+# окно в минутах после старта, в котором принимаем тик
 WINDOW_MINUTES = 5
-TARGET_HOUR = 6
 
-@sensor(
+# Окно 06:00–06:05 МСК → bronze_wb_paid_acceptance_1d → silver_wb_paid_acceptances_1d; в тегах — 06:00.
+bronze_wb_paid_acceptance_daily_sensor = token_slot_sensor(
+    name="bronze_wb_paid_acceptance_daily_sensor",
     job=wb_acceptance_report_1d_job,
-    minimum_interval_seconds=60,
+    cron="0 6 * * *",
+    token_ids=WB_SELLER_TOKEN_IDS,
+    run_key="{slot:%Y%m%d}-acceptance-{token_id}",
+    window_minutes=WINDOW_MINUTES,
 )
-def bronze_wb_paid_acceptance_daily_sensor(context):
-    """
-    Каждую минуту проверяем, попадает ли текущее время в окно 06:00–06:05 МСК.
-    Если да — планируем запуск bronze_wb_paid_acceptance_1d → silver_wb_paid_acceptances_1d
-    для каждого активного токена, проставляя в тегах начало окна (06:00) в UTC.
-    """
-    now_msk = datetime.now(timezone("Europe/Moscow"))
-
-    if not (now_msk.hour == TARGET_HOUR and now_msk.minute < WINDOW_MINUTES):
-        return
-
-    conn = psycopg2.connect(os.getenv("DATABASE_URL"), sslmode="require")
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT token_id, token FROM core.tokens
-                WHERE token_id IN (1, 2, 3, 4, 5, 45)
-            """)
-            rows = cur.fetchall()
-    finally:
-        conn.close()
-
-    if not rows:
-        context.log.warning("Нет активных токенов в core.tokens")
-        return
-
-    scheduled_msk = now_msk.replace(minute=0, second=0, microsecond=0)
-    scheduled_utc = scheduled_msk.astimezone(UTC).isoformat()
-
-    for token_id, token in rows:
-        run_key = f"{scheduled_msk.strftime('%Y%m%d')}-acceptance-{token_id}"
-        run_config = {
-            "resources": {
-                "wildberries_client": {
-                    "config": {"token": token, "token_id": token_id}
-                },
-                "postgres": {"config": {}},
-            }
-        }
-        context.log.info(f"Scheduling bronze_wb_paid_acceptance_1d for token_id={token_id}")
-        yield RunRequest(
-            run_key=run_key,
-            run_config=run_config,
-            tags={"dagster/scheduled_execution_time": scheduled_utc},
-        )
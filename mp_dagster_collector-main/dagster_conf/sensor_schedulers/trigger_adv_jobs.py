@@ -15,6 +15,11 @@ TARGET_JOBS = [
     "ucb_bandit_wrapper_job",
 ]
 
+# Wrapper-джобы с dynamic-партицией company_id
+COMPANY_PARTITIONED_JOBS = {
+    "ako_V2_wrapper_job",
+}
+
 @sensor(
     name="trigger_wrapper_jobs_sensor",
     minimum_interval_seconds=60,
@@ -44,8 +49,18 @@ def trigger_wrapper_jobs_sensor(context):
     schedule_time = sched_times.pop()
 
     # 3. Генерируем RunRequest для каждого wrapper-job
+    #    (партиционированные по company_id — по run'у на компанию)
     run_key_base = f"wrapper_for_{schedule_time}"
     for job_name in TARGET_JOBS:
+        if job_name in COMPANY_PARTITIONED_JOBS:
+            for cid in instance.get_dynamic_partitions("company_id"):
+                yield RunRequest(
+                    run_key=f"{run_key_base}_{job_name}_{cid}",
+                    job_name=job_name,
+                    partition_key=str(cid),
+                    run_config={},
+                )
+            continue
         yield RunRequest(
             run_key=f"{run_key_base}_{job_name}",
             job_name=job_name,
@@ -5,6 +5,11 @@ from pathlib import Path
 from sqlalchemy import create_engine, text
 
 from dagster_conf.lib.auto_model_builder import build_models_from_config
+from dagster_conf.lib.table_partitioning import (
+    ensure_partitions,
+    drop_expired_partitions,
+    migrate_heap_to_partitioned,
+)
 
 
 def _env(name: str, default: str | None = None) -> str:
@@ -18,6 +23,8 @@ def _env(name: str, default: str | None = None) -> str:
 def main() -> None:
     database_url = _env("DATABASE_URL")
     config_path = _env("AUTOGEN_CONFIG_PATH", "dagster_conf/lib/config.yml")
+    # 1 → существующие обычные таблицы с `partitioning` в конфиге переводятся в партиционированные
+    migrate_partitions = _env("AUTOGEN_MIGRATE_PARTITIONS", "0") == "1"
     bronze_schema = _env("BRONZE_SCHEMA", "bronze_v2")
     silver_schema = _env("SILVER_SCHEMA", "silver_v2")
 
@@ -43,6 +50,16 @@ def main() -> None:
             print(f"[init_db_autogen] Ensuring schema exists: {schema}")
             conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
 
+        partitioned_tables = [
+            tbl for md in (bronze_meta, silver_meta) for tbl in md.tables.values()
+            if tbl.info.get("time_partitioning")
+        ]
+        if migrate_partitions:
+            for tbl in partitioned_tables:
+                legacy = migrate_heap_to_partitioned(conn, tbl.info["time_partitioning"], tbl)
+                if legacy:
+                    print(f"[init_db_autogen]   ~ {tbl.schema}.{tbl.name} → partitioned, old data in {legacy}")
+
         # создаём таблицы (если их нет)
         print("[init_db_autogen] Creating bronze tables if not exist…")
         bronze_meta.create_all(bind=conn)
@@ -83,6 +100,17 @@ def main() -> None:
 
         _ensure_silver_request_uuid_indexes(conn, silver_meta, silver_schema)
 
+        print("[init_db_autogen] Ensuring time partitions …")
+        for tbl in partitioned_tables:
+            spec = tbl.info["time_partitioning"]
+            created = ensure_partitions(conn, spec)
+            dropped = drop_expired_partitions(conn, spec)
+            if not created and not dropped and not migrate_partitions:
+                print(f"[init_db_autogen]   = {tbl.schema}.{tbl.name}: nothing to do "
+                      f"(set AUTOGEN_MIGRATE_PARTITIONS=1 if the table is still a plain heap)")
+                continue
+            print(f"[init_db_autogen]   + {tbl.schema}.{tbl.name}: created={len(created)} dropped={len(dropped)}")
+
     engine.dispose()
     print("[init_db_autogen] Done.")
 
@@ -1,9 +1,12 @@
+import asyncio
 import pandas as pd
 import logging
-import time
-from typing import List
-from api.wb_api_actions import WildberriesAPIactions
-from api.wb_api import WildberriesAPI
+from typing import Callable, Dict, List, Optional
+from api.wb_campaign_gateway import WBCampaignGateway
+from bot.notifications import NotificationManager
+from keywords_opt.optimizer import AdCPCOptimizer
+from keywords_opt.session_state import SessionState
+from sql.database_manager_ako import DatabaseManager
 
 class OptimizationManager:
     """
@@ -15,8 +18,12 @@ class OptimizationManager:
         optimizer (AdCPCOptimizer): Оптимизатор стоимости за клик (CPC).
         notification_manager (NotificationManager): Менеджер уведомлений для отправки сообщений в Telegram.
         logger (logging.Logger): Логгер для записи событий и ошибок.
+        gateway_factory (Callable): Фабрика клиента WB API: gateway_factory(token, log=...) → WBCampaignGateway.
+        on_campaign (Callable or None): Вызывается после отчёта по каждой кампании
+            с (recommendations, max_cpc, campaign_id, product_id, excluded_keywords, phrases_updated).
     """
-    def __init__(self, session_state, db_manager, optimizer, notification_manager, logger: logging.Logger):
+    def __init__(self, session_state, db_manager, optimizer, notification_manager, logger: logging.Logger,
+                 token: str = None, gateway_factory: Callable = None, on_campaign: Callable = None):
         """
         Инициализирует менеджер оптимизации с необходимыми компонентами.
 
@@ -26,23 +33,23 @@ class OptimizationManager:
             optimizer (AdCPCOptimizer): Оптимизатор CPC.
             notification_manager (NotificationManager): Менеджер уведомлений.
             logger (logging.Logger): Логгер для записи событий.
+            token (str, optional): Токен WB API; по умолчанию WB_API_TOKEN из db_config.
+            gateway_factory (Callable, optional): Фабрика клиента WB API (по умолчанию WBCampaignGateway).
+            on_campaign (Callable, optional): Обработчик результата каждой кампании (логи/метрики оркестратора).
         """
         self.session_state = session_state
         self.db_manager = db_manager
         self.optimizer = optimizer
         self.notification_manager = notification_manager
         self.logger = logger
-        token = self.db_manager.db_config.get('WB_API_TOKEN')
+        self.gateway_factory = gateway_factory or WBCampaignGateway
+        self.on_campaign = on_campaign
+        token = token or (self.db_manager.db_config or {}).get('WB_API_TOKEN')
         if not token:
             self.logger.error("WB_API_TOKEN отсутствует в конфигурации")
             raise ValueError("WB_API_TOKEN не предоставлен")
         self.logger.debug(f"WB_API_TOKEN (первые 10 символов): {token[:10]}...")
-        self.wb_api = WildberriesAPIactions(
-            token=token,
-            logger=self.logger,
-            use_bearer=True
-        )
-        self.wb_api_requests = WildberriesAPI(token)
+        self.token = token
 
     def run_optimization(self, product_id: str, campaign_id: int, start_date: str, end_date: str, cost_price: float,
                         margin_rate: float, commission_rate: float) -> tuple[pd.DataFrame, float, int, str]:
@@ -172,156 +179,69 @@ class OptimizationManager:
             list[tuple[pd.DataFrame, float, int, str]]: Список результатов оптимизации для каждой кампании
             (DataFrame с рекомендациями, max_cpc, campaign_id, product_id).
         """
+        return asyncio.run(self.execute_async())
+
+    async def execute_async(self, active_campaigns: Optional[List[tuple]] = None):
+        """
+        Асинхронный полный цикл: сначала оптимизация всех кампаний, затем
+        информация о кампаниях и минус-фразы одним проходом через WBCampaignGateway
+        (информация — списками до 50 id, минус-фразы — параллельно с общим темпом),
+        затем сохранение результатов и уведомления по каждой кампании.
+        Синхронные шаги (запросы к базе, расчёт, сохранение, Telegram) идут в
+        asyncio.to_thread: event loop оркестратора не блокируется, и оптимизации
+        нескольких компаний в одном loop действительно выполняются параллельно.
+
+        Args:
+            active_campaigns (list[tuple[str, int]], optional): (product_id, campaign_id),
+                если уже получены; иначе — db_manager.get_active_product_id().
+        """
         self.logger.debug("Начало выполнения оптимизации для всех активных кампаний")
         results = []
         try:
-            active_campaigns = self.db_manager.get_active_product_id()
+            if active_campaigns is None:
+                active_campaigns = await asyncio.to_thread(self.db_manager.get_active_product_id)
             if not active_campaigns:
                 self.logger.error("Нет активных кампаний для оптимизации")
                 self.session_state.add_log_message("Нет активных кампаний для оптимизации")
                 message = "❌ *Ошибка оптимизации*\nНет активных кампаний для оптимизации."
-                self.notification_manager.send_message(message)
+                await asyncio.to_thread(self.notification_manager.send_message, message)
                 return results
 
             self.logger.info(f"Найдено {len(active_campaigns)} активных кампаний для оптимизации")
+            # статистика всех кампаний двумя запросами; run_optimization читает её из db_manager
+            await asyncio.to_thread(
+                self.db_manager.prefetch_stats,
+                [campaign_id for _, campaign_id in active_campaigns],
+                self.session_state.start_date.isoformat(),
+                self.session_state.end_date.isoformat(),
+            )
+            optimized = []
             for product_id, campaign_id in active_campaigns:
                 self.logger.info(f"Оптимизация для product_id={product_id}, campaign_id={campaign_id}")
                 try:
-                    self.session_state.set_commission_rate(self.db_manager, product_id=product_id)
-                    self.session_state.set_cost_price(self.db_manager, product_id=product_id)
-
-                    params = self.session_state.get_parameters()
-                    params['product_id'] = product_id
-                    params['campaign_id'] = campaign_id
-                    params['start_date'] = self.session_state.start_date
-                    params['end_date'] = self.session_state.end_date
-                    params['cost_price'] = self.session_state.cost_price
-                    params['margin_rate'] = self.session_state.margin_rate
-                    params['commission_rate'] = self.session_state.commission_rate
-
-                    recommendations, max_cpc, campaign_id, product_id = self.run_optimization(
-                        product_id=product_id,
-                        campaign_id=campaign_id,
-                        start_date=params['start_date'].isoformat(),
-                        end_date=params['end_date'].isoformat(),
-                        cost_price=params['cost_price'],
-                        margin_rate=params['margin_rate'],
-                        commission_rate=params['commission_rate']
-                    )
+                    optimized.append(await asyncio.to_thread(self._optimize_campaign, product_id, campaign_id))
+                except Exception as e:
+                    await asyncio.to_thread(self._notify_campaign_error, campaign_id, product_id, e)
 
-                    if not recommendations.empty:
-                        excluded_keywords = recommendations[recommendations['status'] == 'Исключить']['cluster'].tolist()
-                        valid_keywords = recommendations[recommendations['status'] == 'Оставить']['cluster'].tolist()
-                        total_keywords = len(recommendations)
-                        self.logger.info(f"Результаты оптимизации: Кампания ID: {campaign_id}, Товар ID: {product_id}")
-                        self.logger.info(f"Максимальный CPC: {max_cpc:.2f}")
-                        self.logger.info(f"Валидных ключевых слов: {len(valid_keywords)}")
-                        self.logger.info(f"Исключено ключевых слов: {len(excluded_keywords)}")
-                        self.logger.info("Рекомендации:")
-                        for index, row in recommendations.iterrows():
-                            self.logger.debug(
-                                f"{row['cluster']} | {row['avg_cpc']:.2f} | {row['total_clicks']} | {row['total_sum']:.2f} | {row['status']} | {row['recommendation']}")
-
-                        update_success = False
-                        if excluded_keywords:
-                            campaign_info = self.wb_api_requests.get_campaigns_info([campaign_id])
-                            if not campaign_info or not isinstance(campaign_info, list):
-                                self.logger.error(f"Не удалось получить информацию о кампании {campaign_id}")
-                                self.session_state.add_log_message(
-                                    f"Не удалось получить информацию о кампании {campaign_id}")
-                                result = False
-                            else:
-                                campaign_type = campaign_info[0].get("type")
-                                if campaign_type == 8:
-                                    result = self.wb_api.set_excluded_phrases(
-                                        campaign_id=campaign_id,
-                                        excluded_phrases=excluded_keywords
-                                    )
-                                elif campaign_type == 9:
-                                    result = self.wb_api.set_search_excluded_phrases(
-                                        campaign_id=campaign_id,
-                                        excluded_phrases=excluded_keywords
-                                    )
-                                else:
-                                    self.logger.error(
-                                        f"Кампания {campaign_id} имеет неподдерживаемый тип: {campaign_type}")
-                                    self.session_state.add_log_message(
-                                        f"Кампания {campaign_id} имеет неподдерживаемый тип: {campaign_type}")
-                                    result = False
-
-                                if result is not None:
-                                    self.logger.info(
-                                        f"Минус-фразы обновлены для campaign_id={campaign_id}: {excluded_keywords}")
-                                    self.session_state.add_log_message(
-                                        f"Минус-фразы обновлены для campaign_id={campaign_id}")
-                                    update_success = True
-                                else:
-                                    self.logger.error(f"Не удалось обновить минус-фразы для campaign_id={campaign_id}")
-                                    self.session_state.add_log_message(
-                                        f"Не удалось обновить минус-фразы для campaign_id={campaign_id}")
-                                    message = (
-                                        f"⚠️ *Ошибка обновления минус-фраз*\n"
-                                        f"Кампания ID: {campaign_id}\n"
-                                        f"Товар ID: {product_id}\n"
-                                        f"Не удалось обновить минус-фразы. Проверьте логи."
-                                    )
-                                    self.notification_manager.send_message(message)
-
-                        if self.db_manager.save_optimization_results(recommendations, campaign_id, product_id, max_cpc):
-                            self.logger.info("Результаты успешно сохранены в базу данных")
-                            summary = (
-                                f"ℹ️ *Оптимизация ключевых слов завершена*\n"
-                                f"Кампания ID: {campaign_id}\n"
-                                f"Товар ID: {product_id}\n"
-                                f"Проанализировано ключевых слов: {total_keywords}\n"
-                                f"Максимальный CPC: {max_cpc:.2f} ₽\n"
-                                f"Валидных ключевых слов: {len(valid_keywords)}\n"
-                                f"Исключено ключевых слов: {len(excluded_keywords)}\n"
-                                f"Минус-фразы обновлены: {len(excluded_keywords) if update_success else 'ошибка'}\n"
-                                f"Результаты сохранены в базу данных."
-                            )
-                            self.notification_manager.send_message(summary)
-                        else:
-                            self.logger.error("Не удалось сохранить результаты в базу данных")
-                            error_msg = (
-                                f"⚠️ *Ошибка оптимизации*\n"
-                                f"Кампания ID: {campaign_id}\n"
-                                f"Товар ID: {product_id}\n"
-                                f"Проанализировано ключевых слов: {total_keywords}\n"
-                                f"Не удалось сохранить результаты в базу данных."
-                            )
-                            self.notification_manager.send_message(error_msg)
-                    else:
-                        self.logger.error(
-                            f"Не удалось выполнить оптимизацию для campaign_id={campaign_id}, product_id={product_id}")
-                        message = (
-                            f"❌ *Ошибка оптимизации*\n"
-                            f"Кампания ID: {campaign_id}\n"
-                            f"Товар ID: {product_id}\n"
-                            f"Не удалось выполнить оптимизацию. Проверьте логи:\n"
-                            f"{'; '.join(self.session_state.log_messages[-3:])}"
-                        )
-                        self.notification_manager.send_message(message)
+            excluded_by_campaign = {
+                campaign_id: recommendations[recommendations['status'] == 'Исключить']['cluster'].tolist()
+                for recommendations, _, campaign_id, _ in optimized
+                if not recommendations.empty
+            }
+            excluded_by_campaign = {c: kw for c, kw in excluded_by_campaign.items() if kw}
+            updated = await self._apply_excluded_phrases(excluded_by_campaign)
 
+            for recommendations, max_cpc, campaign_id, product_id in optimized:
+                try:
+                    excluded_keywords = excluded_by_campaign.get(campaign_id, [])
+                    await asyncio.to_thread(self._report_campaign, recommendations, max_cpc, campaign_id,
+                                            product_id, excluded_keywords, updated)
                     results.append((recommendations, max_cpc, campaign_id, product_id))
-
-                    if excluded_keywords:
-                        time.sleep(0.5)
-
+                    if self.on_campaign is not None:
+                        self.on_campaign(recommendations, max_cpc, campaign_id, product_id,
+                                         excluded_keywords, int(campaign_id) in updated)
                 except Exception as e:
-                    self.logger.error(
-                        f"Ошибка оптимизации для campaign_id={campaign_id}, product_id={product_id}: {str(e)}")
-                    self.session_state.add_log_message(
-                        f"Ошибка оптимизации для campaign_id={campaign_id}, product_id={product_id}: {str(e)}")
-                    message = (
-                        f"❌ *Ошибка оптимизации*\n"
-                        f"Кампания ID: {campaign_id}\n"
-                        f"Товар ID: {product_id}\n"
-                        f"Проверьте логи:\n"
-                        f"{'; '.join(self.session_state.log_messages[-3:])}"
-                    )
-                    self.notification_manager.send_message(message)
-                    continue
+                    await asyncio.to_thread(self._notify_campaign_error, campaign_id, product_id, e)
 
             unique_log_messages = list(dict.fromkeys(self.session_state.log_messages))
             if unique_log_messages:
@@ -343,15 +263,189 @@ class OptimizationManager:
                 f"Проверьте логи:\n"
                 f"{'; '.join(self.session_state.log_messages[-3:])}"
             )
-            self.notification_manager.send_message(message)
+            await asyncio.to_thread(self.notification_manager.send_message, message)
             return results
 
+    def _optimize_campaign(self, product_id, campaign_id) -> tuple[pd.DataFrame, float, int, str]:
+        """Параметры товара из БД + run_optimization для одной кампании."""
+        self.session_state.set_commission_rate(self.db_manager, product_id=product_id)
+        self.session_state.set_cost_price(self.db_manager, product_id=product_id)
+
+        params = self.session_state.get_parameters()
+        params['product_id'] = product_id
+        params['campaign_id'] = campaign_id
+        params['start_date'] = self.session_state.start_date
+        params['end_date'] = self.session_state.end_date
+        params['cost_price'] = self.session_state.cost_price
+        params['margin_rate'] = self.session_state.margin_rate
+        params['commission_rate'] = self.session_state.commission_rate
+
+        return self.run_optimization(
+            product_id=product_id,
+            campaign_id=campaign_id,
+            start_date=params['start_date'].isoformat(),
+            end_date=params['end_date'].isoformat(),
+            cost_price=params['cost_price'],
+            margin_rate=params['margin_rate'],
+            commission_rate=params['commission_rate']
+        )
+
+    async def _apply_excluded_phrases(self, excluded_by_campaign: Dict[int, List[str]]) -> set:
+        """
+        Минус-фразы всех кампаний через шлюз: тип кампании (8 — авто, 9 — аукцион)
+        из пакетного запроса информации, затем один flush.
+
+        Returns:
+            set: campaign_id, для которых минус-фразы обновлены.
+        """
+        if not excluded_by_campaign:
+            return set()
+        async with self.gateway_factory(self.token, log=self.logger) as gateway:
+            infos = await gateway.campaigns_info(excluded_by_campaign)
+            for campaign_id, excluded_keywords in excluded_by_campaign.items():
+                info = infos.get(int(campaign_id))
+                if info is None:
+                    self.logger.error(f"Не удалось получить информацию о кампании {campaign_id}")
+                    self.session_state.add_log_message(f"Не удалось получить информацию о кампании {campaign_id}")
+                    continue
+                try:
+                    gateway.queue_excluded_phrases(int(campaign_id), excluded_keywords, info.get("type"))
+                except ValueError as e:
+                    self.logger.error(str(e))
+                    self.session_state.add_log_message(str(e))
+            report = await gateway.flush()
+        return report.phrases_ok
+
+    def _report_campaign(self, recommendations: pd.DataFrame, max_cpc: float, campaign_id, product_id,
+                         excluded_keywords: List[str], updated: set) -> None:
+        """Логи, сохранение результатов и уведомления по одной кампании."""
+        if recommendations.empty:
+            self.logger.error(
+                f"Не удалось выполнить оптимизацию для campaign_id={campaign_id}, product_id={product_id}")
+            message = (
+                f"❌ *Ошибка оптимизации*\n"
+                f"Кампания ID: {campaign_id}\n"
+                f"Товар ID: {product_id}\n"
+                f"Не удалось выполнить оптимизацию. Проверьте логи:\n"
+                f"{'; '.join(self.session_state.log_messages[-3:])}"
+            )
+            self.notification_manager.send_message(message)
+            return
+
+        valid_keywords = recommendations[recommendations['status'] == 'Оставить']['cluster'].tolist()
+        total_keywords = len(recommendations)
+        self.logger.info(f"Результаты оптимизации: Кампания ID: {campaign_id}, Товар ID: {product_id}")
+        self.logger.info(f"Максимальный CPC: {max_cpc:.2f}")
+        self.logger.info(f"Валидных ключевых слов: {len(valid_keywords)}")
+        self.logger.info(f"Исключено ключевых слов: {len(excluded_keywords)}")
+        self.logger.info("Рекомендации:")
+        for index, row in recommendations.iterrows():
+            self.logger.debug(
+                f"{row['cluster']} | {row['avg_cpc']:.2f} | {row['total_clicks']} | {row['total_sum']:.2f} | {row['status']} | {row['recommendation']}")
+
+        update_success = False
+        if excluded_keywords:
+            if int(campaign_id) in updated:
+                self.logger.info(f"Минус-фразы обновлены для campaign_id={campaign_id}: {excluded_keywords}")
+                self.session_state.add_log_message(f"Минус-фразы обновлены для campaign_id={campaign_id}")
+                update_success = True
+            else:
+                self.logger.error(f"Не удалось обновить минус-фразы для campaign_id={campaign_id}")
+                self.session_state.add_log_message(f"Не удалось обновить минус-фразы для campaign_id={campaign_id}")
+                message = (
+                    f"⚠️ *Ошибка обновления минус-фраз*\n"
+                    f"Кампания ID: {campaign_id}\n"
+                    f"Товар ID: {product_id}\n"
+                    f"Не удалось обновить минус-фразы. Проверьте логи."
+                )
+                self.notification_manager.send_message(message)
+
+        if self.db_manager.save_optimization_results(recommendations, campaign_id, product_id, max_cpc):
+            self.logger.info("Результаты успешно сохранены в базу данных")
+            summary = (
+                f"ℹ️ *Оптимизация ключевых слов завершена*\n"
+                f"Кампания ID: {campaign_id}\n"
+                f"Товар ID: {product_id}\n"
+                f"Проанализировано ключевых слов: {total_keywords}\n"
+                f"Максимальный CPC: {max_cpc:.2f} ₽\n"
+                f"Валидных ключевых слов: {len(valid_keywords)}\n"
+                f"Исключено ключевых слов: {len(excluded_keywords)}\n"
+                f"Минус-фразы обновлены: {len(excluded_keywords) if update_success else 'ошибка'}\n"
+                f"Результаты сохранены в базу данных."
+            )
+            self.notification_manager.send_message(summary)
+        else:
+            self.logger.error("Не удалось сохранить результаты в базу данных")
+            error_msg = (
+                f"⚠️ *Ошибка оптимизации*\n"
+                f"Кампания ID: {campaign_id}\n"
+                f"Товар ID: {product_id}\n"
+                f"Проанализировано ключевых слов: {total_keywords}\n"
+                f"Не удалось сохранить результаты в базу данных."
+            )
+            self.notification_manager.send_message(error_msg)
+
+    def _notify_campaign_error(self, campaign_id, product_id, e: Exception) -> None:
+        self.logger.error(
+            f"Ошибка оптимизации для campaign_id={campaign_id}, product_id={product_id}: {str(e)}")
+        self.session_state.add_log_message(
+            f"Ошибка оптимизации для campaign_id={campaign_id}, product_id={product_id}: {str(e)}")
+        message = (
+            f"❌ *Ошибка оптимизации*\n"
+            f"Кампания ID: {campaign_id}\n"
+            f"Товар ID: {product_id}\n"
+            f"Проверьте логи:\n"
+            f"{'; '.join(self.session_state.log_messages[-3:])}"
+        )
+        self.notification_manager.send_message(message)
+
+
+# ─────────────────────────── точка входа ───────────────────────────
+
+async def optimize_company(company_id: int, *, engine, token: str, logger: logging.Logger,
+                           gateway_factory: Callable = None, telegram_bot_token: str = None,
+                           telegram_chat_id: str = None, start_date=None, end_date=None,
+                           margin_rate: float = 0.001, on_campaign: Callable = None):
+    """
+    Оптимизация ключевых слов всех активных кампаний одной компании в текущем
+    процессе — для оркестратора (dagster_conf/pipelines/ako_V2_job.py): движок
+    базы и клиент WB API передаются снаружи, логи идут в переданный logger,
+    результат каждой кампании — в on_campaign.
+
+    Args:
+        company_id (int): Компания; кампании отбираются DatabaseManager(company_id=...).
+        engine (sqlalchemy.engine.Engine): Движок базы данных.
+        token (str): Токен WB API компании.
+        logger (logging.Logger): Логгер (в Dagster — context.log).
+        gateway_factory (Callable, optional): Фабрика клиента WB API.
+        telegram_bot_token (str, optional): Токен бота для уведомлений.
+        telegram_chat_id (str, optional): Чат для уведомлений.
+        start_date (datetime.date, optional): Начало периода (по умолчанию — как в SessionState).
+        end_date (datetime.date, optional): Конец периода.
+        margin_rate (float): Ставка маржи.
+        on_campaign (Callable, optional): См. OptimizationManager.
+
+    Returns:
+        list[tuple[pd.DataFrame, float, int, str]]: Результаты по кампаниям, как у execute().
+    """
+    db_manager = DatabaseManager(None, None, logger, engine=engine, company_id=company_id)
+    active_campaigns = await asyncio.to_thread(db_manager.get_active_product_id)
+    if not active_campaigns:
+        return []
+
+    # product_id передаётся, чтобы SessionState не запрашивал активные кампании повторно
+    session_state = SessionState(db_manager, product_id=active_campaigns, start_date=start_date,
+                                 end_date=end_date, margin_rate=margin_rate)
+    db_manager.session_state = session_state
+    optimizer = AdCPCOptimizer(session_state.margin_rate, session_state, logger)
+    notification_manager = NotificationManager(telegram_bot_token, telegram_chat_id, session_state, logger)
+    manager = OptimizationManager(session_state, db_manager, optimizer, notification_manager, logger,
+                                  token=token, gateway_factory=gateway_factory, on_campaign=on_campaign)
+    return await manager.execute_async(active_campaigns)
+
+
 if __name__ == "__main__":
     from logs.logging_setup import LoggerManager
-    from session_state import SessionState
-    from sql.database_manager_ako import DatabaseManager
-    from optimizer import AdCPCOptimizer
-    from bot.notifications import NotificationManager
     from config import ConfigManager
 
     logger_manager = LoggerManager(log_file='optimization.log')
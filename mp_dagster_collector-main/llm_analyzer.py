@@ -3,7 +3,6 @@ from dotenv import load_dotenv
 load_dotenv()
 import pandas as pd
 import json
-from openai import OpenAI
 import os
 from sqlalchemy import create_engine, text
 import psycopg2
@@ -11,13 +10,21 @@ import numpy as np
 import requests
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
+
+from llm_cache import CachedLLM, OpenRouterClient, open_response_cache
+from llm_feature_mart import fetch_campaigns_features, refresh_feature_mart
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
 chat_id = os.getenv("TELEGRAM_CHAT_ID")
 
+LLM_MODEL = "deepseek/deepseek-chat-v3-0324:free"
+LLM_SYSTEM_PROMPT = "Ты эксперт по рекламе и аналитике данных. Отвечай ТОЛЬКО в формате JSON без комментариев."
+LLM_TEMPERATURE = 0.2
+LLM_MAX_TOKENS = 4000
+
 
 def send_telegram_message(message: str, bot_token: str, chat_id: str):
     """Отправка сообщения в Telegram."""
@@ -104,9 +111,31 @@ def convert_numpy_types(obj):
         return obj
 
 
-def analyze_campaign_clusters(campaign_data):
-    client = OpenAI(base_url="https://openrouter.ai/api/v1",
-                    api_key=os.getenv("api_key"))
+def create_llm() -> CachedLLM:
+    """Боевой клиент OpenRouter за кэшем ответов (LLM_CACHE_URL, по умолчанию — локальный SQLite)."""
+    return CachedLLM(OpenRouterClient(), open_response_cache())
+
+
+def clean_llm_response(raw_content: str) -> str:
+    cleaned_content = raw_content
+    if cleaned_content.startswith("```json"):
+        cleaned_content = cleaned_content[7:]
+    if cleaned_content.endswith("```"):
+        cleaned_content = cleaned_content[:-3]
+    return cleaned_content.strip()
+
+
+def is_valid_llm_json(raw_content: str) -> bool:
+    """В кэш попадают только ответы, которые разбираются как JSON."""
+    try:
+        json.loads(clean_llm_response(raw_content))
+        return True
+    except (TypeError, json.JSONDecodeError):
+        return False
+
+
+def analyze_campaign_clusters(campaign_data, llm: Optional[CachedLLM] = None):
+    llm = llm or create_llm()
     campaign_data = convert_numpy_types(campaign_data)
 
     first_entry = campaign_data[0]
@@ -269,25 +298,20 @@ def analyze_campaign_clusters(campaign_data):
     """
     try:
 
-        response = client.chat.completions.create(
-            model="deepseek/deepseek-chat-v3-0324:free",
-            messages=[
-                {"role": "system",
-                 "content": "Ты эксперт по рекламе и аналитике данных. Отвечай ТОЛЬКО в формате JSON без комментариев."},
+        # промпт уже содержит JSON кампании; data в ключе кэша — явная адресация по данным
+        raw_content = llm.complete(
+            LLM_MODEL,
+            [
+                {"role": "system", "content": LLM_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.2,
-            max_tokens=4000
+            data=campaign_data,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=LLM_MAX_TOKENS,
+            validate=is_valid_llm_json,
         )
 
-        raw_content = response.choices[0].message.content
-
-        cleaned_content = raw_content
-        if cleaned_content.startswith("```json"):
-            cleaned_content = cleaned_content[7:]
-        if cleaned_content.endswith("```"):
-            cleaned_content = cleaned_content[:-3]
-        cleaned_content = cleaned_content.strip()
+        cleaned_content = clean_llm_response(raw_content)
 
         try:
             result = json.loads(cleaned_content)
@@ -596,11 +620,11 @@ def generate_human_readable_message(analysis_result: Dict[str, Any]) -> str:
     return "\n".join(message_parts)
 
 
-def process_analysis(campaign_data):
+def process_analysis(campaign_data, llm: Optional[CachedLLM] = None):
     print("🔧 Проверяем структуру базы данных...")
     add_missing_columns_if_needed()
 
-    analysis_result = analyze_campaign_clusters(campaign_data)
+    analysis_result = analyze_campaign_clusters(campaign_data, llm)
 
     if not analysis_result:
         return None, "Не удалось получить анализ"
@@ -616,218 +640,91 @@ def process_analysis(campaign_data):
     return analysis_result, telegram_message
 
 
-def get_campaign_data(engine, advert_id):
-    query = f'''
-WITH campaign_metrics AS (
-    SELECT
-        CAST(date AS DATE) AS dt_val,
-        advert_id,
-        nm_id,
-        SUM(views) AS campaign_views,
-        SUM(clicks) AS campaign_clicks,
-        SUM(ctr) AS campaign_ctr,
-        SUM(cpc) AS campaign_cpc,
-        SUM(CAST(cost AS FLOAT)) AS campaign_cost,
-        SUM(carts) AS campaign_carts,
-        SUM(orders) AS campaign_orders,
-        SUM(items) AS total_items_sold,
-        CASE 
-            WHEN SUM(clicks) > 0 
-            THEN SUM(orders)::float / SUM(clicks)::float 
-            ELSE 0 
-        END AS conversion_rate
-    FROM silver.wb_adv_product_stats_1d
-    WHERE date >= NOW() - INTERVAL '30 days'
-        AND advert_id = {advert_id}
-    GROUP BY
-        CAST(date AS DATE),
-        advert_id,
-        nm_id
-),
-campaign_cpm AS (
-    SELECT
-        CAST(run_dttm AS DATE) AS dt_val,
-        advert_id,
-        subject_id,
-        AVG(cpm_current) AS campaign_cpm_rate
-    FROM silver.wb_adv_product_rates_1d
-    WHERE run_dttm >= NOW() - INTERVAL '30 days'
-        AND advert_id = {advert_id}
-    GROUP BY
-        CAST(run_dttm AS DATE),
-        advert_id,
-        subject_id
-),
-commission_data AS (
-    SELECT DISTINCT
-        subject_id,
-        seller_commission
-    FROM core.individual_commissions
-),
-sales_metrics AS (
-    SELECT
-        nm_id,
-        SUM(price_with_discount) AS total_revenue
-    FROM silver.wb_order_items_1d
-    WHERE date >= NOW() - INTERVAL '7 days'
-    GROUP BY nm_id
-),
-stock_data AS (
-    SELECT
-        nm_id,
-        MAX(quantity) AS current_stock,
-        AVG(quantity) AS average_stock_7d
-    FROM silver.wb_stocks_1d
-    WHERE date >= NOW() - INTERVAL '7 days'
-    GROUP BY nm_id
-),
-sales_metrics_7d AS (
-    SELECT
-        nm_id,
-        SUM(orders) / 7.0 AS avg_daily_orders_7d
-    FROM silver.wb_adv_product_stats_1d
-    WHERE date >= NOW() - INTERVAL '7 days'
-        AND advert_id = {advert_id}
-    GROUP BY nm_id
-),
-product_data AS (
-    SELECT DISTINCT 
-        oi.nm_id,
-        FIRST_VALUE(oi.category) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS category,
-        FIRST_VALUE(oi.subject) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS subject_name,
-        FIRST_VALUE(oi.brand) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS brand_name,
-        FIRST_VALUE(oi.barcode) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS barcode,
-        FIRST_VALUE(oi.price_with_discount) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS current_price,
-        FIRST_VALUE(pc.self_cost) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS self_cost
-    FROM silver.wb_order_items_1d oi
-    LEFT JOIN core.product_costs pc ON oi.barcode = pc.barcode
-    WHERE oi.date >= NOW() - INTERVAL '30 days'
-),
-keyword_metrics AS (
-    SELECT
-        CAST(date AS DATE) AS dt_val,
-        advert_id,
-        keyword,
-        SUM(views) AS keyword_views,
-        SUM(clicks) AS keyword_clicks,
-        SUM(CAST(cost AS FLOAT)) AS keyword_ad_cost
-    FROM silver.wb_adv_keyword_stats_1d
-    WHERE date >= NOW() - INTERVAL '30 days'
-        AND advert_id = {advert_id}
-    GROUP BY
-        CAST(date AS DATE),
-        advert_id,
-        keyword
-)
-SELECT
-    cm.dt_val,
-    cm.advert_id,
-    cm.nm_id,
-    pd.barcode,
-    pd.category,
-    pd.subject_name,
-    pd.brand_name,
-    cm.campaign_views,
-    cm.campaign_clicks,
-    cm.campaign_ctr,
-    cm.campaign_cpc,
-    cm.campaign_cost,
-    cm.campaign_carts,
-    cm.campaign_orders,
-    cm.total_items_sold,
-    cm.conversion_rate,
-    cpm.campaign_cpm_rate,
-    pd.current_price,
-    pd.self_cost,
-    cd.seller_commission AS seller_commission_rate,
-    CASE
-        WHEN pd.current_price > 0 AND cm.campaign_orders > 0
-        THEN (
-            pd.current_price::NUMERIC 
-            - pd.self_cost::NUMERIC 
-            - pd.current_price::NUMERIC * cd.seller_commission
-            - (cm.campaign_cost::NUMERIC / cm.campaign_orders::NUMERIC) 
-            - (pd.current_price::NUMERIC * 0.0135) 
-            - 100
-        )
-        ELSE 0
-    END AS commercial_margins_absolute,
-    CASE
-        WHEN pd.current_price > 0 AND cm.campaign_orders > 0
-        THEN (
-            (pd.current_price::NUMERIC
-             - pd.self_cost::NUMERIC
-             - pd.current_price::NUMERIC * cd.seller_commission
-             - (cm.campaign_cost::NUMERIC / cm.campaign_orders::NUMERIC)
-             - (pd.current_price::NUMERIC * 0.0135)
-             - 100
-            ) / pd.current_price::NUMERIC * 100
-        )
-        ELSE 0
-    END AS commercial_margins_percent,
-    CASE
-        WHEN sm7.avg_daily_orders_7d > 0 AND sd.average_stock_7d > 0
-        THEN sd.average_stock_7d / sm7.avg_daily_orders_7d
-        ELSE NULL
-    END AS sales_velocity,
-    ROUND(
-        CASE
-            WHEN cm.total_items_sold > 0 AND cm.campaign_cost > 0
-            THEN (
-                pd.self_cost::NUMERIC 
-                + pd.current_price::NUMERIC * cd.seller_commission
-                + 100 
-                + pd.current_price::NUMERIC * 0.0135 
-                + (cm.campaign_cost::NUMERIC / cm.total_items_sold::NUMERIC)
-            )
-            ELSE pd.self_cost::NUMERIC
-        END, 2
-    ) AS total_cost_per_item,
-    CASE 
-        WHEN cm.campaign_cost > 0 
-        THEN (cm.campaign_orders * pd.current_price) / cm.campaign_cost 
-        ELSE 0 
-    END AS roas,
-    sm.total_revenue,
-    sd.current_stock,
-    CASE 
-        WHEN cm.campaign_orders > 0 
-        THEN cm.campaign_orders::float / 30.0
-        ELSE 0 
-    END AS daily_sales_rate,
-    CASE
-        WHEN sm7.avg_daily_orders_7d > 0 AND sd.current_stock > 0
-        THEN sd.current_stock::float / sm7.avg_daily_orders_7d
-        ELSE NULL
-    END AS total_stock_coverage_days,
-    km.keyword AS keyword_name,
-    km.keyword_views,
-    km.keyword_clicks,
-    CASE 
-        WHEN km.keyword_views > 0 
-        THEN km.keyword_clicks::float / km.keyword_views::float 
-        ELSE 0 
-    END AS keyword_ctr,
-    km.keyword_ad_cost
-FROM campaign_metrics cm
-LEFT JOIN campaign_cpm cpm ON cm.dt_val = cpm.dt_val AND cm.advert_id = cpm.advert_id
-LEFT JOIN commission_data cd ON cpm.subject_id = cd.subject_id
-LEFT JOIN sales_metrics sm ON cm.nm_id = sm.nm_id
-LEFT JOIN stock_data sd ON cm.nm_id = sd.nm_id
-LEFT JOIN sales_metrics_7d sm7 ON cm.nm_id = sm7.nm_id
-LEFT JOIN product_data pd ON cm.nm_id = pd.nm_id
-LEFT JOIN keyword_metrics km ON cm.advert_id = km.advert_id AND cm.dt_val = km.dt_val
-ORDER BY cm.dt_val DESC, km.keyword;
-    '''
-
+def get_campaigns_data(engine, advert_ids: Iterable[int]):
+    """Входные данные анализа по всем кампаниям одним запросом к витрине признаков."""
     try:
-        data = pd.read_sql(query, engine)
-        return data
+        return fetch_campaigns_features(engine, advert_ids)
     except Exception as e:
-        print(f"Ошибка при выполнении SQL запроса для кампании {advert_id}: {e}")
+        print(f"Ошибка при выполнении SQL запроса для кампаний {list(advert_ids)}: {e}")
         return None
 
 
+def get_campaign_data(engine, advert_id):
+    return get_campaigns_data(engine, [advert_id])
+
+
+def build_campaign_payload(data: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Строки витрины одной кампании → список дней в формате промпта (с кластерами ключевых фраз)."""
+    group_cols = [
+        'dt_val', 'advert_id', 'nm_id', 'category',
+        'subject_name', 'brand_name',
+        'campaign_cpm_rate', 'campaign_views', 'campaign_clicks',
+        'campaign_orders', 'campaign_ctr', 'campaign_cost',
+        'current_price', 'self_cost', 'seller_commission_rate', 'commercial_margins_absolute',
+        'commercial_margins_percent',
+        'roas', 'total_revenue', 'daily_sales_rate',
+        'sales_velocity', 'total_cost_per_item',
+        'current_stock', 'total_stock_coverage_days',
+    ]
+
+    output = []
+    for key_values, grp in data.groupby(group_cols):
+        (
+            dt_val, ad_id, mp_sku,
+            category, subject_name, brand_name,
+            cpm, views, clicks,
+            orders, ctr, cost,
+            current_price, self_cost, seller_commission_rate,
+            commercial_margins, commercial_margins_percent, roas,
+            total_revenue, daily_sales_rate,
+            sales_velocity, total_cost_per_item,
+            current_stock, total_stock_coverage_days
+
+        ) = key_values
+
+        keyword_clusters = {
+            row['keyword_name']: {
+                'views': int(row['keyword_views']) if pd.notna(row['keyword_views']) else 0,
+                'clicks': int(row['keyword_clicks']) if pd.notna(row['keyword_clicks']) else 0,
+                'ctr': round(float(row['keyword_ctr']), 4) if pd.notna(row['keyword_ctr']) else 0.0,
+                'cost': round(float(row['keyword_ad_cost']), 4) if pd.notna(row['keyword_ad_cost']) else 0.0
+            }
+            for _, row in grp.iterrows()
+            if row['keyword_name'] is not None and pd.notna(row['keyword_name'])
+        }
+
+        output.append({
+            'dt_val': dt_val.isoformat(),
+            'ads_id': int(ad_id),
+            'mp_sku': int(mp_sku),
+            'category': category,
+            'subject_name': subject_name,
+            'brand_name': brand_name,
+            'cpm': float(cpm),
+            'total_statistics': {
+                'views': int(views),
+                'clicks': int(clicks),
+                'orders': int(orders),
+                'ctr': round(float(ctr), 4),
+                'cost': round(float(cost), 4),
+                'Price_full': round(float(current_price), 1),
+                'price_self': round(float(self_cost), 1),
+                'seller_commission_rate': round(float(seller_commission_rate), 4),
+                'commercial_margins': round(float(commercial_margins), 4),
+                'commercial_margins_percent': round(float(commercial_margins_percent), 4),
+                'roas': round(float(roas), 4),
+                'total_revenue': round(float(total_revenue), 4),
+                'daily_sales_rate': round(float(daily_sales_rate), 4),
+                'sales_velocity': round(float(sales_velocity), 4),
+                'total_cost_per_item': round(float(total_cost_per_item), 4),
+                'current_stock': int(current_stock),
+                'total_stock_coverage_days': round(float(total_stock_coverage_days), 4)
+            },
+            'keyword_clusters': keyword_clusters
+        })
+    return output
+
+
 def main():
     engine = create_db_engine()
     if not engine:
@@ -838,13 +735,20 @@ def main():
 
     campaign_ids = [26970394, 26661406]
 
+    refresh_feature_mart(engine)
+    all_data = get_campaigns_data(engine, campaign_ids)
+    if all_data is None:
+        return
+
+    llm = create_llm()
+
     for advert_id in campaign_ids:
         print(f"\n=== Обработка кампании {advert_id} ===")
 
         try:
-            data = get_campaign_data(engine, advert_id)
+            data = all_data[all_data['advert_id'] == advert_id]
 
-            if data is None or data.empty:
+            if data.empty:
                 print(f"Нет данных для кампании {advert_id}")
                 continue
 
@@ -853,79 +757,13 @@ def main():
             print("Первые несколько записей:")
             print(data.head())
 
-            group_cols = [
-                'dt_val', 'advert_id', 'nm_id', 'category',
-                'subject_name', 'brand_name',
-                'campaign_cpm_rate', 'campaign_views', 'campaign_clicks',
-                'campaign_orders', 'campaign_ctr', 'campaign_cost',
-                'current_price', 'self_cost', 'seller_commission_rate', 'commercial_margins_absolute',
-                'commercial_margins_percent',
-                'roas', 'total_revenue', 'daily_sales_rate',
-                'sales_velocity', 'total_cost_per_item',
-                'current_stock', 'total_stock_coverage_days',
-            ]
-
-            output = []
-            for key_values, grp in data.groupby(group_cols):
-                (
-                    dt_val, ad_id, mp_sku,
-                    category, subject_name, brand_name,
-                    cpm, views, clicks,
-                    orders, ctr, cost,
-                    current_price, self_cost, seller_commission_rate,
-                    commercial_margins, commercial_margins_percent, roas,
-                    total_revenue, daily_sales_rate,
-                    sales_velocity, total_cost_per_item,
-                    current_stock, total_stock_coverage_days
-
-                ) = key_values
-
-                keyword_clusters = {
-                    row['keyword_name']: {
-                        'views': int(row['keyword_views']) if pd.notna(row['keyword_views']) else 0,
-                        'clicks': int(row['keyword_clicks']) if pd.notna(row['keyword_clicks']) else 0,
-                        'ctr': round(float(row['keyword_ctr']), 4) if pd.notna(row['keyword_ctr']) else 0.0,
-                        'cost': round(float(row['keyword_ad_cost']), 4) if pd.notna(row['keyword_ad_cost']) else 0.0
-                    }
-                    for _, row in grp.iterrows()
-                    if row['keyword_name'] is not None and pd.notna(row['keyword_name'])
-                }
-
-                output.append({
-                    'dt_val': dt_val.isoformat(),
-                    'ads_id': int(ad_id),
-                    'mp_sku': int(mp_sku),
-                    'category': category,
-                    'subject_name': subject_name,
-                    'brand_name': brand_name,
-                    'cpm': float(cpm),
-                    'total_statistics': {
-                        'views': int(views),
-                        'clicks': int(clicks),
-                        'orders': int(orders),
-                        'ctr': round(float(ctr), 4),
-                        'cost': round(float(cost), 4),
-                        'Price_full': round(float(current_price), 1),
-                        'price_self': round(float(self_cost), 1),
-                        'seller_commission_rate': round(float(seller_commission_rate), 4),
-                        'commercial_margins': round(float(commercial_margins), 4),
-                        'commercial_margins_percent': round(float(commercial_margins_percent), 4),
-                        'roas': round(float(roas), 4),
-                        'total_revenue': round(float(total_revenue), 4),
-                        'daily_sales_rate': round(float(daily_sales_rate), 4),
-                        'sales_velocity': round(float(sales_velocity), 4),
-                        'total_cost_per_item': round(float(total_cost_per_item), 4),
-                        'current_stock': int(current_stock),
-                        'total_stock_coverage_days': round(float(total_stock_coverage_days), 4)
-                    },
-                    'keyword_clusters': keyword_clusters
-                })
+            output = build_campaign_payload(data)
 
             if not output:
                 print(f"Нет данных для обработки для кампании {advert_id}")
                 continue
 
-            analysis_result, telegram_message = process_analysis(output)
+            analysis_result, telegram_message = process_analysis(output, llm)
 
             if analysis_result and telegram_message:
                 print(f"\n=== Отправка результатов в Telegram ===")
@@ -941,6 +779,8 @@ def main():
             import traceback
             traceback.print_exc()
 
+    print(f"Кэш ответов LLM: попаданий {llm.hits}, вызовов {llm.misses}")
+
 
 if __name__ == "__main__":
     main()
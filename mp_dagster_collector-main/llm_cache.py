@@ -0,0 +1,219 @@
+"""
+Клиенты LLM и кэш ответов для llm_analyzer.
+
+Одинаковый анализ (та же модель, тот же промпт, те же данные кампании) раньше
+каждый раз заново уходил в LLM. Здесь:
+
+  • LLMClient — минимальный интерфейс клиента: complete(model, messages, ...) → str;
+      OpenRouterClient — боевой (OpenAI SDK поверх openrouter.ai),
+      StubLLMClient    — детерминированная локальная заглушка для проверок;
+  • ResponseCache — кэш «ключ → сырой ответ», адресуемый по содержимому:
+      ключ = sha256 от канонического JSON (модель, сообщения, параметры, данные);
+      SQLiteResponseCache (локальный файл) и PostgresResponseCache (algo.llm_response_cache);
+  • CachedLLM — клиент + кэш: попадание в кэш не вызывает LLM вовсе.
+
+В кэш пишутся только ответы, прошедшие validate (например, разобравшийся JSON),
+чтобы один битый ответ не закреплялся навсегда.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Protocol
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "llm_response_cache.sqlite"
+
+
+def cache_key(model: str, messages: Messages, data: Any = None, **params: Any) -> str:
+    """sha256 от канонического JSON: модель, сообщения (промпт), данные и параметры вызова."""
+    payload = {"model": model, "messages": messages, "data": data, "params": params}
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ───────────────────────────── клиенты ─────────────────────────────
+
+class LLMClient(Protocol):
+    def complete(self, model: str, messages: Messages, *, temperature: float, max_tokens: int) -> str:
+        ...
+
+
+class OpenRouterClient:
+    """Chat Completions через OpenAI SDK (openrouter.ai); ключ — переменная окружения api_key."""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = OPENROUTER_BASE_URL):
+        from openai import OpenAI
+
+        self._client = OpenAI(base_url=base_url, api_key=api_key or os.getenv("api_key"))
+
+    def complete(self, model: str, messages: Messages, *, temperature: float, max_tokens: int) -> str:
+        response = self._client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return response.choices[0].message.content
+
+
+class StubLLMClient:
+    """
+    Детерминированная заглушка: ответ зависит только от входа и не ходит в сеть.
+
+    responder(model, messages) → str задаёт ответ; по умолчанию — JSON в формате
+    llm_analyzer с пустым списком кампаний и хэшем промпта. calls — число вызовов.
+    """
+
+    def __init__(self, responder: Optional[Callable[[str, Messages], str]] = None):
+        self.responder = responder or self._default_response
+        self.calls = 0
+
+    @staticmethod
+    def _default_response(model: str, messages: Messages) -> str:
+        return json.dumps({
+            "campaigns": [],
+            "summary": {"total_campaigns_analyzed": 0, "campaigns_to_optimize": 0, "campaigns_to_stop": 0},
+            "prompt_sha256": cache_key(model, messages),
+        }, ensure_ascii=False)
+
+    def complete(self, model: str, messages: Messages, *, temperature: float, max_tokens: int) -> str:
+        self.calls += 1
+        return self.responder(model, messages)
+
+
+# ───────────────────────────── кэш ─────────────────────────────
+
+class ResponseCache(Protocol):
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    def put(self, key: str, model: str, response: str) -> None:
+        ...
+
+
+class SQLiteResponseCache:
+    """Кэш ответов в локальном SQLite-файле (создаётся при первом обращении)."""
+
+    def __init__(self, path: os.PathLike = DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    key        TEXT PRIMARY KEY,
+                    model      TEXT NOT NULL,
+                    response   TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_response_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, response: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO llm_response_cache (key, model, response) VALUES (?, ?, ?)",
+                (key, model, response),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PostgresResponseCache:
+    """Кэш ответов в таблице algo.llm_response_cache."""
+
+    TABLE = "algo.llm_response_cache"
+
+    def __init__(self, engine: Engine, owns_engine: bool = False):
+        self.engine = engine
+        self._owns_engine = owns_engine
+        with engine.begin() as conn:
+            conn.execute(text("CREATE SCHEMA IF NOT EXISTS algo"))
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    key        text PRIMARY KEY,
+                    model      text NOT NULL,
+                    response   text NOT NULL,
+                    created_at timestamptz NOT NULL DEFAULT now()
+                )
+            """))
+
+    def get(self, key: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(text(f"SELECT response FROM {self.TABLE} WHERE key = :key"), {"key": key}).scalar()
+
+    def put(self, key: str, model: str, response: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(f"""
+                    INSERT INTO {self.TABLE} (key, model, response) VALUES (:key, :model, :response)
+                    ON CONFLICT (key) DO NOTHING
+                """),
+                {"key": key, "model": model, "response": response},
+            )
+
+    def close(self) -> None:
+        if self._owns_engine:
+            self.engine.dispose()
+
+
+def open_response_cache(target: Optional[str] = None):
+    """
+    Кэш по строке LLM_CACHE_URL: postgresql://… → PostgresResponseCache,
+    иначе путь к SQLite-файлу; пусто → DEFAULT_CACHE_PATH.
+    """
+    target = target or os.getenv("LLM_CACHE_URL") or str(DEFAULT_CACHE_PATH)
+    if target.startswith("postgresql"):
+        return PostgresResponseCache(create_engine(target, pool_pre_ping=True), owns_engine=True)
+    return SQLiteResponseCache(target)
+
+
+class CachedLLM:
+    """Клиент LLM за кэшем ответов; hits / misses — статистика за время жизни объекта."""
+
+    def __init__(self, client: LLMClient, cache: Optional[ResponseCache] = None):
+        self.client = client
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def complete(
+        self,
+        model: str,
+        messages: Messages,
+        *,
+        data: Any = None,
+        temperature: float,
+        max_tokens: int,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        key = cache_key(model, messages, data, temperature=temperature, max_tokens=max_tokens)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                logger.info(f"Ответ LLM взят из кэша ({key[:12]})")
+                return cached
+
+        self.misses += 1
+        response = self.client.complete(model, messages, temperature=temperature, max_tokens=max_tokens)
+        if self.cache is not None and response is not None and (validate is None or validate(response)):
+            self.cache.put(key, model, response)
+        return response
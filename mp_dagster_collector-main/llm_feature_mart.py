@@ -0,0 +1,367 @@
+"""
+Витрина признаков кампаний для llm_analyzer.
+
+Раньше get_campaign_data на каждую кампанию собирал f-строкой большой запрос,
+который каждый раз заново агрегировал 30 дней silver-статистики. Теперь:
+
+  • algo.llm_campaign_features_1d — дневные метрики (advert_id, nm_id);
+  • algo.llm_campaign_cpm_1d      — средняя ставка CPM за день (advert_id, subject_id);
+  • algo.llm_keyword_features_1d  — дневные метрики ключевых фраз (advert_id, keyword).
+
+refresh_feature_mart() пересчитывает витрину инкрементально: в одной транзакции
+удаляются и заново агрегируются только дни начиная с последнего загруженного
+минус REFRESH_LOOKBACK_DAYS (досчитывание запоздавшей silver-статистики), и
+вычищаются дни старше MART_HISTORY_DAYS. Пустая витрина заполняется целиком.
+
+fetch_campaigns_features() отдаёт входные данные анализа сразу по всем
+кампаниям одним параметризованным запросом (advert_id = ANY(:advert_ids));
+товарные CTE (цены, остатки, продажи) ограничены артикулами этих кампаний.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+MART_SCHEMA = "algo"
+MART_HISTORY_DAYS = 35          # окно анализа 30 дней + запас
+REFRESH_LOOKBACK_DAYS = 3       # сколько последних дней пересчитывать заново
+
+# ───────────────────────────── DDL ─────────────────────────────
+
+MART_DDL = f"""
+CREATE SCHEMA IF NOT EXISTS {MART_SCHEMA};
+
+CREATE TABLE IF NOT EXISTS {MART_SCHEMA}.llm_campaign_features_1d (
+    dt_val           date   NOT NULL,
+    advert_id        bigint NOT NULL,
+    nm_id            bigint NOT NULL,
+    campaign_views   bigint,
+    campaign_clicks  bigint,
+    campaign_ctr     double precision,
+    campaign_cpc     double precision,
+    campaign_cost    double precision,
+    campaign_carts   bigint,
+    campaign_orders  bigint,
+    total_items_sold bigint,
+    PRIMARY KEY (advert_id, dt_val, nm_id)
+);
+CREATE INDEX IF NOT EXISTS llm_campaign_features_1d_dt_idx
+    ON {MART_SCHEMA}.llm_campaign_features_1d (dt_val);
+
+CREATE TABLE IF NOT EXISTS {MART_SCHEMA}.llm_campaign_cpm_1d (
+    dt_val            date   NOT NULL,
+    advert_id         bigint NOT NULL,
+    subject_id        bigint,
+    campaign_cpm_rate double precision
+);
+CREATE INDEX IF NOT EXISTS llm_campaign_cpm_1d_advert_idx
+    ON {MART_SCHEMA}.llm_campaign_cpm_1d (advert_id, dt_val);
+CREATE INDEX IF NOT EXISTS llm_campaign_cpm_1d_dt_idx
+    ON {MART_SCHEMA}.llm_campaign_cpm_1d (dt_val);
+
+CREATE TABLE IF NOT EXISTS {MART_SCHEMA}.llm_keyword_features_1d (
+    dt_val          date   NOT NULL,
+    advert_id       bigint NOT NULL,
+    keyword         text,
+    keyword_views   bigint,
+    keyword_clicks  bigint,
+    keyword_ad_cost double precision
+);
+CREATE INDEX IF NOT EXISTS llm_keyword_features_1d_advert_idx
+    ON {MART_SCHEMA}.llm_keyword_features_1d (advert_id, dt_val);
+CREATE INDEX IF NOT EXISTS llm_keyword_features_1d_dt_idx
+    ON {MART_SCHEMA}.llm_keyword_features_1d (dt_val);
+"""
+
+# ─────────────────── агрегаты витрины (таблица → SELECT) ───────────────────
+# Выражения те же, что были в CTE get_campaign_data; фильтр по кампании
+# заменён на диапазон дней [:start, ...).
+
+MART_SOURCES: Dict[str, str] = {
+    "llm_campaign_features_1d": """
+        SELECT
+            CAST(date AS DATE) AS dt_val,
+            advert_id,
+            nm_id,
+            SUM(views) AS campaign_views,
+            SUM(clicks) AS campaign_clicks,
+            SUM(ctr) AS campaign_ctr,
+            SUM(cpc) AS campaign_cpc,
+            SUM(CAST(cost AS FLOAT)) AS campaign_cost,
+            SUM(carts) AS campaign_carts,
+            SUM(orders) AS campaign_orders,
+            SUM(items) AS total_items_sold
+        FROM silver.wb_adv_product_stats_1d
+        WHERE date >= :start
+        GROUP BY CAST(date AS DATE), advert_id, nm_id
+    """,
+    "llm_campaign_cpm_1d": """
+        SELECT
+            CAST(run_dttm AS DATE) AS dt_val,
+            advert_id,
+            subject_id,
+            AVG(cpm_current) AS campaign_cpm_rate
+        FROM silver.wb_adv_product_rates_1d
+        WHERE run_dttm >= :start
+        GROUP BY CAST(run_dttm AS DATE), advert_id, subject_id
+    """,
+    "llm_keyword_features_1d": """
+        SELECT
+            CAST(date AS DATE) AS dt_val,
+            advert_id,
+            keyword,
+            SUM(views) AS keyword_views,
+            SUM(clicks) AS keyword_clicks,
+            SUM(CAST(cost AS FLOAT)) AS keyword_ad_cost
+        FROM silver.wb_adv_keyword_stats_1d
+        WHERE date >= :start
+        GROUP BY CAST(date AS DATE), advert_id, keyword
+    """,
+}
+
+
+def ensure_feature_mart(engine: Engine) -> None:
+    """Создаёт схему и таблицы витрины, если их ещё нет."""
+    with engine.begin() as conn:
+        conn.execute(text(MART_DDL))
+
+
+def refresh_feature_mart(
+    engine: Engine,
+    *,
+    today: Optional[date] = None,
+    lookback_days: int = REFRESH_LOOKBACK_DAYS,
+    history_days: int = MART_HISTORY_DAYS,
+    full: bool = False,
+) -> Dict[str, int]:
+    """
+    Инкрементально обновляет витрину признаков.
+
+    Для каждой таблицы: start = max(dt_val) - lookback_days (или начало окна
+    хранения, если таблица пуста / full=True); строки с dt_val >= start и
+    старше окна хранения удаляются, дни с start заново агрегируются из silver.
+    Всё в одной транзакции — читатели видят либо старую, либо новую витрину.
+
+    Возвращает {таблица: число вставленных строк}.
+    """
+    ensure_feature_mart(engine)
+    today = today or date.today()
+    keep_from = today - timedelta(days=history_days)
+    inserted: Dict[str, int] = {}
+
+    with engine.begin() as conn:
+        for table, select_sql in MART_SOURCES.items():
+            qualified = f"{MART_SCHEMA}.{table}"
+            last_day = None if full else conn.execute(text(f"SELECT max(dt_val) FROM {qualified}")).scalar()
+            start = keep_from if last_day is None else max(keep_from, last_day - timedelta(days=lookback_days))
+
+            conn.execute(
+                text(f"DELETE FROM {qualified} WHERE dt_val >= :start OR dt_val < :keep_from"),
+                {"start": start, "keep_from": keep_from},
+            )
+            result = conn.execute(text(f"INSERT INTO {qualified} {select_sql}"), {"start": start})
+            inserted[table] = result.rowcount
+            logger.info(f"Витрина {qualified}: пересчитаны дни с {start}, вставлено {result.rowcount} строк")
+
+    return inserted
+
+
+# ───────────────────── входные данные анализа (все кампании) ─────────────────────
+
+FEATURES_QUERY = f"""
+WITH campaign_metrics AS (
+    SELECT
+        dt_val,
+        advert_id,
+        nm_id,
+        campaign_views,
+        campaign_clicks,
+        campaign_ctr,
+        campaign_cpc,
+        campaign_cost,
+        campaign_carts,
+        campaign_orders,
+        total_items_sold,
+        CASE
+            WHEN campaign_clicks > 0
+            THEN campaign_orders::float / campaign_clicks::float
+            ELSE 0
+        END AS conversion_rate
+    FROM {MART_SCHEMA}.llm_campaign_features_1d
+    WHERE dt_val >= NOW() - INTERVAL '30 days'
+        AND advert_id = ANY(:advert_ids)
+),
+campaign_nms AS (
+    SELECT DISTINCT nm_id FROM campaign_metrics
+),
+campaign_cpm AS (
+    SELECT dt_val, advert_id, subject_id, campaign_cpm_rate
+    FROM {MART_SCHEMA}.llm_campaign_cpm_1d
+    WHERE dt_val >= NOW() - INTERVAL '30 days'
+        AND advert_id = ANY(:advert_ids)
+),
+commission_data AS (
+    SELECT DISTINCT
+        subject_id,
+        seller_commission
+    FROM core.individual_commissions
+),
+sales_metrics AS (
+    SELECT
+        nm_id,
+        SUM(price_with_discount) AS total_revenue
+    FROM silver.wb_order_items_1d
+    WHERE date >= NOW() - INTERVAL '7 days'
+        AND nm_id IN (SELECT nm_id FROM campaign_nms)
+    GROUP BY nm_id
+),
+stock_data AS (
+    SELECT
+        nm_id,
+        MAX(quantity) AS current_stock,
+        AVG(quantity) AS average_stock_7d
+    FROM silver.wb_stocks_1d
+    WHERE date >= NOW() - INTERVAL '7 days'
+        AND nm_id IN (SELECT nm_id FROM campaign_nms)
+    GROUP BY nm_id
+),
+sales_metrics_7d AS (
+    SELECT
+        advert_id,
+        nm_id,
+        SUM(campaign_orders) / 7.0 AS avg_daily_orders_7d
+    FROM campaign_metrics
+    WHERE dt_val >= NOW() - INTERVAL '7 days'
+    GROUP BY advert_id, nm_id
+),
+product_data AS (
+    SELECT DISTINCT
+        oi.nm_id,
+        FIRST_VALUE(oi.category) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS category,
+        FIRST_VALUE(oi.subject) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS subject_name,
+        FIRST_VALUE(oi.brand) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS brand_name,
+        FIRST_VALUE(oi.barcode) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS barcode,
+        FIRST_VALUE(oi.price_with_discount) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS current_price,
+        FIRST_VALUE(pc.self_cost) OVER (PARTITION BY oi.nm_id ORDER BY oi.date DESC) AS self_cost
+    FROM silver.wb_order_items_1d oi
+    LEFT JOIN core.product_costs pc ON oi.barcode = pc.barcode
+    WHERE oi.date >= NOW() - INTERVAL '30 days'
+        AND oi.nm_id IN (SELECT nm_id FROM campaign_nms)
+),
+keyword_metrics AS (
+    SELECT dt_val, advert_id, keyword, keyword_views, keyword_clicks, keyword_ad_cost
+    FROM {MART_SCHEMA}.llm_keyword_features_1d
+    WHERE dt_val >= NOW() - INTERVAL '30 days'
+        AND advert_id = ANY(:advert_ids)
+)
+SELECT
+    cm.dt_val,
+    cm.advert_id,
+    cm.nm_id,
+    pd.barcode,
+    pd.category,
+    pd.subject_name,
+    pd.brand_name,
+    cm.campaign_views,
+    cm.campaign_clicks,
+    cm.campaign_ctr,
+    cm.campaign_cpc,
+    cm.campaign_cost,
+    cm.campaign_carts,
+    cm.campaign_orders,
+    cm.total_items_sold,
+    cm.conversion_rate,
+    cpm.campaign_cpm_rate,
+    pd.current_price,
+    pd.self_cost,
+    cd.seller_commission AS seller_commission_rate,
+    CASE
+        WHEN pd.current_price > 0 AND cm.campaign_orders > 0
+        THEN (
+            pd.current_price::NUMERIC
+            - pd.self_cost::NUMERIC
+            - pd.current_price::NUMERIC * cd.seller_commission
+            - (cm.campaign_cost::NUMERIC / cm.campaign_orders::NUMERIC)
+            - (pd.current_price::NUMERIC * 0.0135)
+            - 100
+        )
+        ELSE 0
+    END AS commercial_margins_absolute,
+    CASE
+        WHEN pd.current_price > 0 AND cm.campaign_orders > 0
+        THEN (
+            (pd.current_price::NUMERIC
+             - pd.self_cost::NUMERIC
+             - pd.current_price::NUMERIC * cd.seller_commission
+             - (cm.campaign_cost::NUMERIC / cm.campaign_orders::NUMERIC)
+             - (pd.current_price::NUMERIC * 0.0135)
+             - 100
+            ) / pd.current_price::NUMERIC * 100
+        )
+        ELSE 0
+    END AS commercial_margins_percent,
+    CASE
+        WHEN sm7.avg_daily_orders_7d > 0 AND sd.average_stock_7d > 0
+        THEN sd.average_stock_7d / sm7.avg_daily_orders_7d
+        ELSE NULL
+    END AS sales_velocity,
+    ROUND(
+        CASE
+            WHEN cm.total_items_sold > 0 AND cm.campaign_cost > 0
+            THEN (
+                pd.self_cost::NUMERIC
+                + pd.current_price::NUMERIC * cd.seller_commission
+                + 100
+                + pd.current_price::NUMERIC * 0.0135
+                + (cm.campaign_cost::NUMERIC / cm.total_items_sold::NUMERIC)
+            )
+            ELSE pd.self_cost::NUMERIC
+        END, 2
+    ) AS total_cost_per_item,
+    CASE
+        WHEN cm.campaign_cost > 0
+        THEN (cm.campaign_orders * pd.current_price) / cm.campaign_cost
+        ELSE 0
+    END AS roas,
+    sm.total_revenue,
+    sd.current_stock,
+    CASE
+        WHEN cm.campaign_orders > 0
+        THEN cm.campaign_orders::float / 30.0
+        ELSE 0
+    END AS daily_sales_rate,
+    CASE
+        WHEN sm7.avg_daily_orders_7d > 0 AND sd.current_stock > 0
+        THEN sd.current_stock::float / sm7.avg_daily_orders_7d
+        ELSE NULL
+    END AS total_stock_coverage_days,
+    km.keyword AS keyword_name,
+    km.keyword_views,
+    km.keyword_clicks,
+    CASE
+        WHEN km.keyword_views > 0
+        THEN km.keyword_clicks::float / km.keyword_views::float
+        ELSE 0
+    END AS keyword_ctr,
+    km.keyword_ad_cost
+FROM campaign_metrics cm
+LEFT JOIN campaign_cpm cpm ON cm.dt_val = cpm.dt_val AND cm.advert_id = cpm.advert_id
+LEFT JOIN commission_data cd ON cpm.subject_id = cd.subject_id
+LEFT JOIN sales_metrics sm ON cm.nm_id = sm.nm_id
+LEFT JOIN stock_data sd ON cm.nm_id = sd.nm_id
+LEFT JOIN sales_metrics_7d sm7 ON cm.advert_id = sm7.advert_id AND cm.nm_id = sm7.nm_id
+LEFT JOIN product_data pd ON cm.nm_id = pd.nm_id
+LEFT JOIN keyword_metrics km ON cm.advert_id = km.advert_id AND cm.dt_val = km.dt_val
+ORDER BY cm.advert_id, cm.dt_val DESC, km.keyword
+"""
+
+
+def fetch_campaigns_features(engine: Engine, advert_ids: Iterable[int]) -> pd.DataFrame:
+    """Входные данные анализа по всем кампаниям одним запросом к витрине."""
+    ids: List[int] = sorted({int(a) for a in advert_ids})
+    return pd.read_sql(text(FEATURES_QUERY), engine, params={"advert_ids": ids})
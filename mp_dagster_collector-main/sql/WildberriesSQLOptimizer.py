@@ -1,8 +1,9 @@
 import logging
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 from sqlalchemy import create_engine
+from sql.ako_stats import fetch_legacy_cluster_stats
 from src.ako import AdvancedKeywordOptimizer
 
 
@@ -29,6 +30,9 @@ class WildberriesSQLOptimizer:
             f"postgresql://{db_params['user']}:{db_params['password']}@"
             f"{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
         )
+        self.engine = create_engine(self.connection_string)
+        # (start_date, end_date) → {ad_id: строки ads.cluster_stats}; заполняют prefetch_stats и get_stats_from_db
+        self._stats: Dict[Tuple[str, str], Dict[int, pd.DataFrame]] = {}
         self.optimizer = AdvancedKeywordOptimizer(
             min_views=min_views,
             min_ctr=min_ctr,
@@ -37,29 +41,29 @@ class WildberriesSQLOptimizer:
         logger.info(
             f"WildberriesSQLOptimizer успешно инициализирован с параметрами: min_views={min_views}, min_ctr={min_ctr}, max_cpc={max_cpc}")
 
+    def prefetch_stats(self, campaign_ids: Iterable[int], start_date: str, end_date: str) -> int:
+        """Загружает ads.cluster_stats сразу по всем кампаниям одним запросом (ad_id = ANY(:ids))."""
+        campaign_ids = [int(c) for c in campaign_ids]
+        logger.info(f"Загружаем статистику {len(campaign_ids)} кампаний за период {start_date} - {end_date}")
+        raw = self._fetch(campaign_ids, start_date, end_date)
+        by_campaign = {int(k): g for k, g in raw.groupby('ad_id', sort=False)}
+        cached = self._stats.setdefault((start_date, end_date), {})
+        for campaign_id in campaign_ids:
+            cached[campaign_id] = by_campaign.get(campaign_id, raw.iloc[0:0])
+        logger.info(f"Получено {len(raw)} строк для {len(by_campaign)} кампаний")
+        return len(raw)
+
+    def _fetch(self, campaign_ids, start_date: str, end_date: str) -> pd.DataFrame:
+        return fetch_legacy_cluster_stats(self.engine, campaign_ids, start_date, end_date)
+
     def get_stats_from_db(self, campaign_id: int, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
         """Получает статистику из таблицы ads.cluster_stats для указанной кампании и периода."""
         try:
-            logger.info(f"Подключаемся к PostgreSQL для получения данных кампании {campaign_id}...")
-            engine = create_engine(self.connection_string)
-            logger.info("Успешное подключение!")
-
-            query = """
-                SELECT 
-                    ad_id,
-                    date,
-                    cluster_name,
-                    views,
-                    clicks,
-                    sum,
-                    ctr
-                FROM ads.cluster_stats
-                WHERE ad_id = %s
-                AND date BETWEEN %s AND %s
-            """
-            logger.info(f"Выполняем запрос для кампании {campaign_id} за период {start_date} - {end_date}")
-
-            df = pd.read_sql_query(query, engine, params=(campaign_id, start_date, end_date))
+            cached = self._stats.setdefault((start_date, end_date), {})
+            if int(campaign_id) not in cached:
+                logger.info(f"Выполняем запрос для кампании {campaign_id} за период {start_date} - {end_date}")
+                cached[int(campaign_id)] = self._fetch([campaign_id], start_date, end_date)
+            df = cached[int(campaign_id)].copy()
 
             if not df.empty:
                 logger.info(f"Получено {len(df)} строк для кампании {campaign_id}")
@@ -101,9 +105,6 @@ class WildberriesSQLOptimizer:
         except Exception as e:
             logger.error(f"Ошибка при получении данных из базы: {str(e)}")
             return None
-        finally:
-            engine.dispose() if 'engine' in locals() else None
-            logger.info("Соединение с базой закрыто.")
 
     def optimize_campaign(self, campaign_id: int, start_date: str = None, end_date: str = None, days: int = None) -> \
     Optional[pd.DataFrame]:
@@ -163,6 +164,36 @@ class WildberriesSQLOptimizer:
 
         return optimization_result
 
+    def optimize_campaigns(self, campaign_ids: Iterable[int], start_date: str = None, end_date: str = None,
+                           days: int = None) -> Dict[int, Optional[pd.DataFrame]]:
+        """
+        Оптимизирует несколько кампаний: статистика всех кампаний загружается
+        одним запросом (prefetch_stats), затем optimize_campaign по каждой.
+
+        Returns:
+            dict: campaign_id → результат optimize_campaign.
+        """
+        if days is not None and (start_date is None or end_date is None):
+            if not (1 <= days <= 31):
+                logger.error("days должно быть в диапазоне 1–31")
+                return {}
+            end = datetime.now().date() - timedelta(days=1)
+            start = end - timedelta(days=days - 1)
+            start_date = start.isoformat()
+            end_date = end.isoformat()
+
+        if start_date is None or end_date is None:
+            logger.error("Не указаны start_date и end_date, и days не предоставлен")
+            return {}
+
+        campaign_ids = [int(c) for c in campaign_ids]
+        try:
+            self.prefetch_stats(campaign_ids, start_date, end_date)
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных из базы: {str(e)}")
+            return {}
+        return {c: self.optimize_campaign(c, start_date=start_date, end_date=end_date) for c in campaign_ids}
+
     def filter_and_update_campaign(self, campaign_id: int, start_date: str = None, end_date: str = None,
                                    days: int = None) -> Optional[pd.DataFrame]:
         """
@@ -0,0 +1,162 @@
+"""
+Статистика кампаний для оптимизатора ключевых слов (AKO).
+
+Раньше DatabaseManager.get_ad_stats / get_cluster_stats, sql_par_akoV2 и
+WildberriesSQLOptimizer.get_stats_from_db строили запрос на каждую кампанию
+и каждый раз создавали новый engine. Теперь:
+
+  • fetch_ad_stats()      — silver.wb_adv_product_stats_1d (выручка, продажи, расход);
+  • fetch_cluster_stats() — silver.wb_adv_keyword_stats_1d (расход и клики фраз);
+  • fetch_legacy_cluster_stats() — ads.cluster_stats (старый формат кластеров);
+
+каждая — один параметризованный запрос сразу по всем кампаниям
+(advert_id = ANY(:ids)) за период. Фильтр по дате сравнивает саму колонку с
+границами [start, end + 1 день) (а не date::date), поэтому работает покрывающий
+индекс (advert_id, date) INCLUDE (...) — миграция 7d2a91c4e5b8
+(src/db/alembic/versions).
+
+AkoStats.load() загружает обе таблицы на набор кампаний и отдаёт кадры по
+кампании (ad_stats / cluster_stats) из сгруппированного результата без
+повторных запросов.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+AD_STATS_COLUMNS = ["campaign_id", "product_id", "date", "revenue", "items", "cost"]
+CLUSTER_STATS_COLUMNS = ["ad_id", "date", "cluster_name", "sum", "clicks", "cpc"]
+LEGACY_CLUSTER_STATS_COLUMNS = ["ad_id", "date", "cluster_name", "views", "clicks", "sum", "ctr"]
+
+# ───────────────────────────── запросы ─────────────────────────────
+
+def _period_params(start_date, end_date) -> Dict[str, date]:
+    params = {}
+    if start_date:
+        params["start"] = pd.Timestamp(start_date).date()
+    if end_date:
+        params["end_excl"] = pd.Timestamp(end_date).date() + timedelta(days=1)
+    return params
+
+
+def _where(id_column: str, date_column: str, ids, params: Dict, product_ids=None) -> str:
+    conditions = []
+    if ids is not None:
+        conditions.append(f"{id_column} = ANY(:ids)")
+        params["ids"] = sorted({int(i) for i in ids})
+    if product_ids is not None:
+        conditions.append("nm_id = ANY(:product_ids)")
+        params["product_ids"] = sorted({int(i) for i in product_ids})
+    if "start" in params:
+        conditions.append(f"{date_column} >= :start")
+    if "end_excl" in params:
+        conditions.append(f"{date_column} < :end_excl")
+    return (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+
+def _read(engine: Engine, query: str, params: Dict, columns: List[str]) -> pd.DataFrame:
+    if any(key in params and not params[key] for key in ("ids", "product_ids")):
+        return pd.DataFrame(columns=columns)
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+
+def fetch_ad_stats(engine: Engine, campaign_ids: Optional[Iterable[int]], start_date=None,
+                   end_date=None, product_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    silver.wb_adv_product_stats_1d по всем campaign_ids за [start_date, end_date]
+    одним запросом (campaign_ids=None — все кампании; product_ids — только эти nm_id).
+    Колонки: campaign_id, product_id, date, revenue, items, cost.
+    """
+    params = _period_params(start_date, end_date)
+    query = (
+        "SELECT advert_id AS campaign_id, nm_id AS product_id, date, revenue, items, cost "
+        "FROM silver.wb_adv_product_stats_1d"
+        + _where("advert_id", "date", campaign_ids, params, product_ids)
+        + " ORDER BY date, advert_id, nm_id"
+    )
+    return _read(engine, query, params, AD_STATS_COLUMNS)
+
+
+def fetch_cluster_stats(engine: Engine, campaign_ids: Optional[Iterable[int]], start_date=None,
+                        end_date=None) -> pd.DataFrame:
+    """
+    silver.wb_adv_keyword_stats_1d по всем campaign_ids за период одним запросом.
+    Колонки: ad_id, date, cluster_name, sum, clicks, cpc (NaN при нуле кликов).
+    """
+    params = _period_params(start_date, end_date)
+    query = (
+        "SELECT advert_id AS ad_id, date, keyword AS cluster_name, cost AS sum, clicks "
+        "FROM silver.wb_adv_keyword_stats_1d"
+        + _where("advert_id", "date", campaign_ids, params)
+        + " ORDER BY date, advert_id, keyword"
+    )
+    df = _read(engine, query, params, CLUSTER_STATS_COLUMNS[:-1])
+    df["cpc"] = df["sum"].div(df["clicks"].replace(0, float("nan")))
+    return df[CLUSTER_STATS_COLUMNS]
+
+
+def fetch_legacy_cluster_stats(engine: Engine, ad_ids: Optional[Iterable[int]], start_date=None,
+                               end_date=None) -> pd.DataFrame:
+    """
+    ads.cluster_stats по всем ad_ids за период одним запросом.
+    Колонки: ad_id, date, cluster_name, views, clicks, sum, ctr.
+    """
+    params = _period_params(start_date, end_date)
+    query = (
+        "SELECT ad_id, date, cluster_name, views, clicks, sum, ctr FROM ads.cluster_stats"
+        + _where("ad_id", "date", ad_ids, params)
+        + " ORDER BY date, ad_id"
+    )
+    return _read(engine, query, params, LEGACY_CLUSTER_STATS_COLUMNS)
+
+
+# ───────────────────── сгруппированный результат ─────────────────────
+
+@dataclass
+class AkoStats:
+    """Статистика набора кампаний за период: кадры целиком и по кампаниям."""
+    campaign_ids: frozenset
+    start_date: Optional[str]
+    end_date: Optional[str]
+    ads: pd.DataFrame
+    clusters: pd.DataFrame
+    _ads_by_campaign: Dict[int, pd.DataFrame] = field(default_factory=dict, repr=False)
+    _clusters_by_campaign: Dict[int, pd.DataFrame] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self._ads_by_campaign = {int(k): g for k, g in self.ads.groupby("campaign_id", sort=False)}
+        self._clusters_by_campaign = {int(k): g for k, g in self.clusters.groupby("ad_id", sort=False)}
+
+    @classmethod
+    def load(cls, engine: Engine, campaign_ids: Iterable[int], start_date=None, end_date=None) -> "AkoStats":
+        """Два запроса на весь набор кампаний вместо двух на каждую."""
+        ids = frozenset(int(i) for i in campaign_ids)
+        ads = fetch_ad_stats(engine, ids, start_date, end_date)
+        clusters = fetch_cluster_stats(engine, ids, start_date, end_date)
+        logger.info(f"Статистика AKO: {len(ids)} кампаний, {len(ads)} строк товаров, {len(clusters)} строк фраз")
+        return cls(ids, start_date, end_date, ads, clusters)
+
+    def covers(self, campaign_id, start_date, end_date) -> bool:
+        """Загружена ли кампания за тот же период (даты сравниваются как дни)."""
+        return (
+            campaign_id is not None and int(campaign_id) in self.campaign_ids
+            and _period_params(self.start_date, self.end_date) == _period_params(start_date, end_date)
+        )
+
+    def ad_stats(self, campaign_id: int, product_id=None) -> pd.DataFrame:
+        """Строки товаров кампании (индекс — date), при product_id — только этого товара."""
+        df = self._ads_by_campaign.get(int(campaign_id), self.ads.iloc[0:0])
+        if product_id is not None:
+            df = df[df["product_id"] == int(product_id)]
+        return df.set_index("date")
+
+    def cluster_stats(self, campaign_id: int) -> pd.DataFrame:
+        """Строки фраз кампании (индекс — date)."""
+        return self._clusters_by_campaign.get(int(campaign_id), self.clusters.iloc[0:0]).set_index("date")
@@ -1,26 +1,91 @@
 import logging
+import threading
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import bindparam, create_engine, text, inspect
+from sqlalchemy.engine import Engine
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import pytz
 
 logger = logging.getLogger(__name__)
 MSK_TZ = pytz.timezone('Europe/Moscow')
 
+HISTORY_METRIC_COLUMNS = ['ad_views', 'ad_clicks', 'ad_atbs', 'ad_orders', 'ad_cost', 'items', 'revenue']
+HISTORY_COLUMN_TYPES = {
+    'ad_rate': 'float64',
+    'ad_cost': 'float64',
+    'revenue': 'float64',
+    'ad_views': 'int64',
+    'ad_clicks': 'int64',
+    'ad_atbs': 'int64',
+    'ad_orders': 'int64',
+    'items': 'int64'
+}
+
+_ENGINES: Dict[tuple, Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def shared_engine(db_config: Dict) -> Engine:
+    """
+    Один engine (и пул соединений) на процесс для одного db_config.
+    Раньше каждый UCBBanditCPM создавал свой engine — на каждую кампанию
+    новый пул и новое TLS-рукопожатие.
+    """
+    key = tuple(sorted((k, str(v)) for k, v in db_config.items()))
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            connect_args = {
+                "sslmode": db_config["sslmode"],
+                "sslrootcert": db_config["sslrootcert"]
+            }
+            engine = create_engine(
+                f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['dbname']}",
+                connect_args=connect_args,
+                pool_pre_ping=True,
+            )
+            _ENGINES[key] = engine
+            logger.info("Инициализировано подключение к базе данных PostgreSQL")
+    return engine
+
+
+def merge_history(df_stats: pd.DataFrame, df_rates: pd.DataFrame) -> pd.DataFrame:
+    """
+    Склейка статистики и ставок так же, как в fetch_sql_data, но сразу для
+    многих кампаний: у кампании со статистикой к строкам статистики
+    подклеиваются ставки за те же даты, у кампании только со ставками
+    берутся строки ставок с нулевыми метриками.
+    """
+    parts = []
+    if not df_stats.empty:
+        rates = df_rates[['advert_id', 'date', 'ad_rate']] if not df_rates.empty else \
+            pd.DataFrame(columns=['advert_id', 'date', 'ad_rate'])
+        merged = df_stats.merge(rates, on=['advert_id', 'date'], how='left')
+        merged['ad_rate'] = merged['ad_rate'].fillna(0)
+        parts.append(merged)
+    if not df_rates.empty:
+        with_stats = set(df_stats['advert_id']) if not df_stats.empty else set()
+        rates_only = df_rates[~df_rates['advert_id'].isin(with_stats)].copy()
+        if not rates_only.empty:
+            for col in HISTORY_METRIC_COLUMNS:
+                rates_only[col] = 0
+            parts.append(rates_only)
+    if not parts:
+        return pd.DataFrame()
+
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    for col, dtype in HISTORY_COLUMN_TYPES.items():
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(dtype)
+    return df.sort_values(['advert_id', 'date'], kind='stable').reset_index(drop=True)
+
+
 class UCBBanditDatabase:
     """Класс для управления взаимодействием с базой данных в UCBBanditCPM."""
 
-    def __init__(self, db_config: Dict):
-        connect_args = {
-            "sslmode": db_config["sslmode"],
-            "sslrootcert": db_config["sslrootcert"]
-        }
-        self.engine = create_engine(
-            f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['dbname']}",
-            connect_args=connect_args
-        )
-        logger.info("Инициализировано подключение к базе данных PostgreSQL")
+    def __init__(self, db_config: Optional[Dict] = None, engine: Optional[Engine] = None):
+        self.engine = engine if engine is not None else shared_engine(db_config)
 
     def load_bandit_state(self, advert_id: str, arms: list) -> tuple[Dict[str, int], Dict[str, float], Dict[str, float]]:
         """Загружает состояние бандита из таблицы algo.autobidder."""
@@ -99,23 +164,13 @@ class UCBBanditDatabase:
             df['ad_rate'] = df['ad_rate'].fillna(0)
         elif not df_rates.empty:
             df = df_rates
-            for col in ['ad_views', 'ad_clicks', 'ad_atbs', 'ad_orders', 'ad_cost', 'items', 'revenue']:
+            for col in HISTORY_METRIC_COLUMNS:
                 df[col] = 0
         else:
             logger.error(f"Данные для advert_id {advert_id} между {start_date} и {end_date} не найдены")
             return pd.DataFrame()
 
-        column_types = {
-            'ad_rate': 'float64',
-            'ad_cost': 'float64',
-            'revenue': 'float64',
-            'ad_views': 'int64',
-            'ad_clicks': 'int64',
-            'ad_atbs': 'int64',
-            'ad_orders': 'int64',
-            'items': 'int64'
-        }
-        for col, dtype in column_types.items():
+        for col, dtype in HISTORY_COLUMN_TYPES.items():
             if col in df.columns:
                 df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(dtype)
         df = df.sort_values("date")
@@ -242,3 +297,137 @@ class UCBBanditDatabase:
             error_msg = f"Ошибка при извлечении активных campaign_id: {str(e)}"
             logger.error(error_msg)
             raise ValueError(error_msg)
+
+    # ------------------------------------------------------------------
+    # Пакетные методы: один запрос на все кампании прогона вместо
+    # отдельных запросов в каждом UCBBanditCPM
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ids_param(advert_ids: Iterable) -> List[str]:
+        # campaign_id / advert_id передаются строками, как и в поштучных
+        # методах: литерал приводится к типу колонки на стороне PostgreSQL
+        return list(dict.fromkeys(str(a) for a in advert_ids))
+
+    def _read_sql_ids(self, query: str, advert_ids: Iterable, **params) -> pd.DataFrame:
+        stmt = text(query).bindparams(bindparam("advert_ids", expanding=True))
+        with self.engine.connect() as conn:
+            return pd.read_sql(stmt, conn, params={"advert_ids": self._ids_param(advert_ids), **params})
+
+    def load_bandit_states(self, advert_ids: Iterable) -> pd.DataFrame:
+        """
+        Статистика рук всех кампаний из algo.autobidder одним GROUP BY.
+        Колонки: campaign_id (str), arm, pulls, reward_sum, cpm_mean.
+        """
+        query = """
+            SELECT campaign_id, arm,
+                   COUNT(*)         AS pulls,
+                   SUM(reward)      AS reward_sum,
+                   AVG(current_cpm) AS cpm_mean
+            FROM algo.autobidder
+            WHERE campaign_id IN :advert_ids
+            GROUP BY campaign_id, arm
+        """
+        try:
+            df = self._read_sql_ids(query, advert_ids)
+        except Exception as e:
+            logger.error(f"Не удалось загрузить состояние бандита из algo.autobidder: {e}")
+            return pd.DataFrame(columns=['campaign_id', 'arm', 'pulls', 'reward_sum', 'cpm_mean'])
+        df['campaign_id'] = df['campaign_id'].astype(str)
+        logger.info(f"Загружено состояние бандита: {df['campaign_id'].nunique()} кампаний, {len(df)} пар кампания×рука")
+        return df
+
+    def fetch_history_batch(self, advert_ids: Iterable, start_date: str, end_date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Сырые статистика и ставки всех кампаний за период (по запросу на таблицу).
+        Склейка по кампаниям и окнам — merge_history.
+        """
+        query_stats = """
+            SELECT advert_id, CAST(date AS DATE) AS date, views AS ad_views, clicks AS ad_clicks,
+                   carts AS ad_atbs, orders AS ad_orders, cost AS ad_cost, items, revenue
+            FROM silver.wb_adv_product_stats_1d
+            WHERE advert_id IN :advert_ids
+              AND CAST(date AS DATE) BETWEEN :start_date AND :end_date
+        """
+        query_rates = """
+            SELECT advert_id, CAST(run_dttm AS DATE) AS date, cpm_current AS ad_rate
+            FROM silver.wb_adv_product_rates_1d
+            WHERE advert_id IN :advert_ids
+              AND CAST(run_dttm AS DATE) BETWEEN :start_date AND :end_date
+        """
+        frames = []
+        for name, query in (("silver.wb_adv_product_stats_1d", query_stats), ("silver.wb_adv_product_rates_1d", query_rates)):
+            try:
+                df = self._read_sql_ids(query, advert_ids, start_date=start_date, end_date=end_date)
+            except Exception as e:
+                logger.error(f"Не удалось выполнить запрос к {name}: {e}")
+                df = pd.DataFrame()
+            if not df.empty:
+                df['advert_id'] = df['advert_id'].astype(str)
+                df['date'] = pd.to_datetime(df['date']).dt.date
+            frames.append(df)
+        logger.info(f"Получено {len(frames[0])} строк статистики и {len(frames[1])} строк ставок между {start_date} и {end_date}")
+        return frames[0], frames[1]
+
+    def reassess_initial_cpms(self, advert_ids: Iterable) -> Dict[str, float]:
+        """Средний CPM за 7 дней по всем кампаниям сразу (см. reassess_initial_cpm)."""
+        start_date = (datetime.now() - timedelta(days=7)).isoformat()
+        query = """
+            SELECT advert_id, AVG(cpm_current) AS avg_cpm
+            FROM silver.wb_adv_product_rates_1d
+            WHERE advert_id IN :advert_ids AND cpm_current IS NOT NULL
+              AND CAST(run_dttm AS DATE) >= :start_date
+            GROUP BY advert_id
+        """
+        try:
+            df = self._read_sql_ids(query, advert_ids, start_date=start_date)
+        except Exception as e:
+            logger.error(f"Не удалось переоценить CPM из silver.wb_adv_product_rates_1d: {e}")
+            return {}
+        return {str(a): float(v) for a, v in zip(df['advert_id'], df['avg_cpm']) if v}
+
+    def save_recommendations(self, recommendations: List[Dict]) -> bool:
+        """
+        Сохраняет рекомендации всех кампаний одним executemany в одной транзакции.
+        Если пакет не записался — построчно, каждая строка в своей транзакции.
+        True — сохранены все.
+        """
+        if not recommendations:
+            return True
+        insert_query = """
+            INSERT INTO algo.autobidder (
+                campaign_id, timestamp, arm, reward, metric, current_cpm, recommended_cpm,
+                cpa, cr_to_cart, cr_to_order, roi_carts, roi_orders, roi_weighted,
+                atbs, orders, clicks, views, cost, items, revenue,
+                cost_price, marketplace_fee, warehouse_cost, stocks, stop_iteration, recommendation
+            ) VALUES (
+                :campaign_id, :timestamp, :arm, :reward, :metric, :current_cpm, :recommended_cpm,
+                :cpa, :cr_to_cart, :cr_to_order, :roi_carts, :roi_orders, :roi_weighted,
+                :atbs, :orders, :clicks, :views, :cost, :items, :revenue,
+                :cost_price, :marketplace_fee, :warehouse_cost, :stocks, :stop_iteration, :recommendation
+            )
+        """
+        timestamp = datetime.now(MSK_TZ).isoformat()
+        rows = [{**rec, 'timestamp': timestamp} for rec in recommendations]
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(insert_query), rows)
+            logger.info(f"Сохранено {len(rows)} рекомендаций в algo.autobidder")
+            return True
+        except Exception as e:
+            logger.error(f"Не удалось сохранить рекомендации в algo.autobidder одним пакетом: {str(e)}")
+
+        # пакет откатился целиком — пишем по одной строке, чтобы одна
+        # некорректная рекомендация не потеряла остальные
+        failed = []
+        for row in rows:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text(insert_query), row)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить рекомендацию для advert_id {row.get('campaign_id')}: {str(e)}")
+                failed.append(row.get('campaign_id'))
+        logger.info(f"Сохранено {len(rows) - len(failed)} из {len(rows)} рекомендаций в algo.autobidder")
+        if failed:
+            logger.error(f"Рекомендации не сохранены для кампаний {failed}")
+        return not failed
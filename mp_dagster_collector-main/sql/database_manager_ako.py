@@ -3,6 +3,8 @@ import pandas as pd
 import logging
 from datetime import datetime
 
+from sql.ako_stats import AkoStats, fetch_ad_stats, fetch_cluster_stats
+
 class DatabaseManager:
     """
     Управляет взаимодействием с базой данных PostgreSQL.
@@ -11,9 +13,10 @@ class DatabaseManager:
         db_config (dict): Конфигурация базы данных.
         logger (logging.Logger): Логгер для записи событий и ошибок.
         session_state (SessionState): Объект состояния сессии для логирования сообщений.
+        company_id (int or None): Компания, кампании которой оптимизируются (None — все).
     """
 
-    def __init__(self, db_config: dict, session_state, logger: logging.Logger):
+    def __init__(self, db_config: dict, session_state, logger: logging.Logger, engine=None, company_id: int = None):
         """
         Инициализирует менеджер базы данных с заданной конфигурацией.
 
@@ -21,10 +24,16 @@ class DatabaseManager:
             db_config (dict): Конфигурация базы данных (host, port, name, user, password, sslmode, sslrootcert).
             session_state (SessionState): Объект состояния сессии для логирования.
             logger (logging.Logger): Логгер для записи событий.
+            engine (sqlalchemy.engine.Engine, optional): Готовый движок (например, ресурс Dagster);
+                если передан, db_config для подключения не нужен.
+            company_id (int, optional): Ограничить активные кампании одной компанией.
         """
         self.db_config = db_config
         self.logger = logger
         self.session_state = session_state
+        self.company_id = company_id
+        self._engine = engine
+        self._stats = None
 
     def _create_engine(self):
         """
@@ -40,6 +49,47 @@ class DatabaseManager:
         )
         return create_engine(conn_string)
 
+    def _get_engine(self):
+        """
+        Общий движок менеджера (пул соединений) для всех запросов: переданный
+        в конструктор или созданный по db_config. Покрывающие индексы
+        статистики создаёт миграция 7d2a91c4e5b8, а не менеджер.
+
+        Returns:
+            sqlalchemy.engine.Engine: Движок для подключения к базе данных.
+        """
+        if self._engine is None:
+            self._engine = self._create_engine()
+        return self._engine
+
+    def _has_connection(self) -> bool:
+        """Есть ли чем подключиться: готовый движок или конфигурация базы."""
+        return self._engine is not None or bool(self.db_config)
+
+    def prefetch_stats(self, campaign_ids, start_date: str, end_date: str):
+        """
+        Загружает статистику товаров и ключевых слов сразу по всем кампаниям
+        (два запроса с advert_id = ANY(:ids)). Последующие get_ad_stats и
+        get_cluster_stats для этих кампаний и периода берут данные из неё.
+
+        Args:
+            campaign_ids (Iterable[int]): Идентификаторы кампаний.
+            start_date (str): Начальная дата периода.
+            end_date (str): Конечная дата периода.
+
+        Returns:
+            AkoStats or None: Загруженная статистика или None в случае ошибки.
+        """
+        try:
+            self._stats = AkoStats.load(self._get_engine(), campaign_ids, start_date, end_date)
+            return self._stats
+        except Exception as e:
+            self._stats = None
+            self.logger.error(f"Ошибка при загрузке статистики кампаний: {str(e)}")
+            if self.session_state:
+                self.session_state.add_log_message(f"Ошибка при загрузке статистики кампаний: {str(e)}")
+            return None
+
     def get_ad_stats(self, product_id: str = None, campaign_id: int = None, start_date: str = None, end_date: str = None):
         """
         Извлекает данные из таблицы silver.wb_adv_product_stats_1d.
@@ -55,55 +105,40 @@ class DatabaseManager:
         """
         try:
             self.logger.debug(f"Начало извлечения данных из таблицы wb_adv_product_stats_1d для product_id={product_id}, campaign_id={campaign_id}")
-            if not self.db_config:
+            if not self._has_connection():
                 self.logger.error("Невозможно продолжить из-за некорректной конфигурации базы данных")
                 if self.session_state:
                     self.session_state.add_log_message(
                         "Невозможно продолжить из-за некорректной конфигурации базы данных")
                 return None
 
-            engine = self._create_engine()
-            query = "SELECT advert_id as campaign_id, nm_id as product_id, date, revenue, items, cost FROM silver.wb_adv_product_stats_1d"
-            params = {}
-            conditions = []
-            if product_id is not None:
-                conditions.append("nm_id = :product_id")
-                params['product_id'] = int(product_id)
-            if campaign_id is not None:
-                conditions.append("advert_id = :campaign_id")
-                params['campaign_id'] = int(campaign_id)
-            if start_date:
-                conditions.append("date::date >= :start_date")
-                params['start_date'] = start_date
-            if end_date:
-                conditions.append("date::date <= :end_date")
-                params['end_date'] = end_date
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            query += " ORDER BY date, advert_id, nm_id"
+            if self._stats is not None and self._stats.covers(campaign_id, start_date, end_date):
+                df = self._stats.ad_stats(campaign_id, product_id)
+            else:
+                df = fetch_ad_stats(self._get_engine(), None if campaign_id is None else [campaign_id],
+                                    start_date, end_date,
+                                    None if product_id is None else [product_id]).set_index('date')
 
-            with engine.connect() as conn:
-                df = pd.read_sql(text(query), conn, params=params, index_col='date')
-                if df.empty:
-                    self.logger.error(f"Отсутствуют данные wb_adv_product_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
-                    if self.session_state:
-                        self.session_state.add_log_message(f"Отсутствуют данные wb_adv_product_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
-                    return None
-                unique_products = df['product_id'].nunique()
-                unique_campaigns = df['campaign_id'].nunique()
-                if unique_products > 1:
-                    self.logger.error(f"В кампании обнаружено {unique_products} товаров, ожидается 1")
-                    if self.session_state:
-                        self.session_state.add_log_message(
-                            f"В кампании обнаружено {unique_products} товаров, ожидается 1")
-                    raise ValueError("В кампании должен быть ровно 1 товар")
-                if unique_campaigns > 1:
-                    self.logger.error(f"Обнаружено {unique_campaigns} кампаний, ожидается 1")
-                    if self.session_state:
-                        self.session_state.add_log_message(
-                            f"Обнаружено {unique_campaigns} кампаний, ожидается 1")
-                    raise ValueError("Ожидается ровно 1 кампания")
-                df = df[['campaign_id', 'product_id', 'revenue', 'items', 'cost']]
+            if df.empty:
+                self.logger.error(f"Отсутствуют данные wb_adv_product_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
+                if self.session_state:
+                    self.session_state.add_log_message(f"Отсутствуют данные wb_adv_product_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
+                return None
+            unique_products = df['product_id'].nunique()
+            unique_campaigns = df['campaign_id'].nunique()
+            if unique_products > 1:
+                self.logger.error(f"В кампании обнаружено {unique_products} товаров, ожидается 1")
+                if self.session_state:
+                    self.session_state.add_log_message(
+                        f"В кампании обнаружено {unique_products} товаров, ожидается 1")
+                raise ValueError("В кампании должен быть ровно 1 товар")
+            if unique_campaigns > 1:
+                self.logger.error(f"Обнаружено {unique_campaigns} кампаний, ожидается 1")
+                if self.session_state:
+                    self.session_state.add_log_message(
+                        f"Обнаружено {unique_campaigns} кампаний, ожидается 1")
+                raise ValueError("Ожидается ровно 1 кампания")
+            df = df[['campaign_id', 'product_id', 'revenue', 'items', 'cost']]
 
             self.logger.debug("Данные успешно извлечены")
             return df
@@ -128,41 +163,23 @@ class DatabaseManager:
         """
         try:
             self.logger.debug("Начало извлечения данных из таблицы wb_adv_keyword_stats_1d")
-            if not self.db_config:
+            if not self._has_connection():
                 self.logger.error("Некорректная конфигурация базы данных")
                 if self.session_state:
                     self.session_state.add_log_message("Некорректная конфигурация базы данных")
                 return None
 
-            engine = self._create_engine()
-            query = """
-                SELECT 
-                    advert_id as ad_id, 
-                    date, 
-                    keyword as cluster_name, 
-                    cost as sum, 
-                    clicks
-                FROM silver.wb_adv_keyword_stats_1d
-                WHERE advert_id = :ad_id
-                    AND date::date >= :start_date
-                    AND date::date <= :end_date
-                ORDER BY date, advert_id, keyword
-            """
-            params = {
-                'ad_id': ad_id,
-                'start_date': start_date,
-                'end_date': end_date
-            }
+            if self._stats is not None and self._stats.covers(ad_id, start_date, end_date):
+                df = self._stats.cluster_stats(ad_id)
+            else:
+                df = fetch_cluster_stats(self._get_engine(), [ad_id], start_date, end_date).set_index('date')
 
-            with engine.connect() as conn:
-                df = pd.read_sql(text(query), conn, params=params, index_col='date')
-                if df.empty:
-                    self.logger.error(f"Отсутствуют данные wb_adv_keyword_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
-                    if self.session_state:
-                        self.session_state.add_log_message(f"Отсутствуют данные wb_adv_keyword_stats_1d за период {start_date} - {end_date} для product_id={product_id}, campaign_id={campaign_id}")
-                    return None
-                df['cpc'] = df['sum'].div(df['clicks'].replace(0, float('nan')))
-                df = df[['ad_id', 'cluster_name', 'cpc', 'clicks', 'sum']]
+            if df.empty:
+                self.logger.error(f"Отсутствуют данные wb_adv_keyword_stats_1d за период {start_date} - {end_date} для campaign_id={ad_id}")
+                if self.session_state:
+                    self.session_state.add_log_message(f"Отсутствуют данные wb_adv_keyword_stats_1d за период {start_date} - {end_date} для campaign_id={ad_id}")
+                return None
+            df = df[['ad_id', 'cluster_name', 'cpc', 'clicks', 'sum']]
 
             zero_clicks_keywords = df[df['clicks'] == 0]['cluster_name'].nunique()
             if zero_clicks_keywords > 0:
@@ -195,14 +212,14 @@ class DatabaseManager:
         """
         try:
             self.logger.debug("Сохранение результатов оптимизации в базу данных")
-            if not self.db_config:
+            if not self._has_connection():
                 self.logger.error("Невозможно сохранить данные из-за некорректной конфигурации базы данных")
                 if self.session_state:
                     self.session_state.add_log_message(
                         "Невозможно сохранить данные из-за некорректной конфигурации базы данных")
                 return False
 
-            engine = self._create_engine()
+            engine = self._get_engine()
             data_to_insert = recommendations.copy()
             data_to_insert['campaign_id'] = campaign_id
             data_to_insert['product_id'] = product_id
@@ -256,14 +273,14 @@ class DatabaseManager:
         try:
             self.logger.info(f"Извлечение commission_rate для product_id={product_id}" +
                              (f" на дату {date}" if date else ""))
-            if not self.db_config:
+            if not self._has_connection():
                 error_msg = "Некорректная конфигурация базы данных"
                 self.logger.error(error_msg)
                 if self.session_state:
                     self.session_state.add_log_message(error_msg)
                 raise ValueError(error_msg)
 
-            engine = self._create_engine()
+            engine = self._get_engine()
             query = """
                 SELECT c.kgvp_booking
                 FROM silver.wb_commission_1d c
@@ -323,14 +340,14 @@ class DatabaseManager:
         try:
             self.logger.info(f"Извлечение cost_price для product_id={product_id}" +
                              (f" на дату {date}" if date else ""))
-            if not self.db_config:
+            if not self._has_connection():
                 error_msg = "Некорректная конфигурация базы данных"
                 self.logger.error(error_msg)
                 if self.session_state:
                     self.session_state.add_log_message(error_msg)
                 raise ValueError(error_msg)
 
-            engine = self._create_engine()
+            engine = self._get_engine()
 
             barcode_query = """
                 SELECT barcode
@@ -405,6 +422,11 @@ class DatabaseManager:
         """
         Извлекает все product_id и campaign_id из таблицы core.algo_states, где model = 'keyword_optimizator'
         и текущая дата и время (NOW()) находятся в диапазоне valid_from и valid_to.
+        При заданном company_id — только кампании компании (по advert_id/company_id
+        в silver.wb_adv_product_stats_1d); у компании может не быть активных кампаний,
+        тогда возвращается пустой список. Активные кампании без единой строки
+        статистики с company_id не попадают ни в одну компанию — их id пишутся
+        в warning.
 
         Returns:
             list[tuple[str, int]]: Список кортежей (product_id, campaign_id), соответствующих условиям.
@@ -414,24 +436,55 @@ class DatabaseManager:
         """
         try:
             self.logger.debug("Извлечение активных product_id и campaign_id из таблицы core.algo_states")
-            if not self.db_config:
+            if not self._has_connection():
                 error_msg = "Некорректная конфигурация базы данных"
                 self.logger.error(error_msg)
                 if self.session_state:
                     self.session_state.add_log_message(error_msg)
                 raise ValueError(error_msg)
 
-            engine = self._create_engine()
+            engine = self._get_engine()
             query = """
                 SELECT campaign_id, product_id, model, valid_from, valid_to
-                FROM core.algo_states
+                FROM core.algo_states a
                 WHERE model = :model
                   AND NOW() BETWEEN valid_from AND valid_to
             """
             params = {'model': 'keyword_optimizator'}
+            if self.company_id is not None:
+                # одним запросом: кампании компании и кампании, которых нет ни у одной компании
+                query = """
+                    SELECT * FROM (
+                        SELECT campaign_id, product_id, model, valid_from, valid_to,
+                               EXISTS (
+                                   SELECT 1 FROM silver.wb_adv_product_stats_1d s
+                                   WHERE s.advert_id = a.campaign_id AND s.company_id = :company_id
+                               ) AS in_company,
+                               NOT EXISTS (
+                                   SELECT 1 FROM silver.wb_adv_product_stats_1d s
+                                   WHERE s.advert_id = a.campaign_id AND s.company_id IS NOT NULL
+                               ) AS orphan
+                        FROM core.algo_states a
+                        WHERE model = :model
+                          AND NOW() BETWEEN valid_from AND valid_to
+                    ) active
+                    WHERE in_company OR orphan
+                """
+                params['company_id'] = int(self.company_id)
 
             with engine.connect() as conn:
                 df = pd.read_sql(text(query), conn, params=params)
+                if self.company_id is not None:
+                    orphans = sorted(int(c) for c in df.loc[df['orphan'].astype(bool), 'campaign_id'])
+                    if orphans:
+                        self.logger.warning(
+                            f"Активные кампании keyword_optimizator без статистики в "
+                            f"silver.wb_adv_product_stats_1d не относятся ни к одной компании и "
+                            f"не оптимизируются: {orphans}")
+                    df = df[df['in_company'].astype(bool)]
+                if df.empty and self.company_id is not None:
+                    self.logger.info(f"У компании {self.company_id} нет активных кампаний keyword_optimizator")
+                    return []
                 if df.empty:
                     error_msg = f"Не найдено записей с model='keyword_optimizator' для текущего времени"
                     self.logger.error(error_msg)
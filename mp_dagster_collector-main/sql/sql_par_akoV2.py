@@ -1,10 +1,13 @@
 import os
 import logging
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 import pandas as pd
 from sqlalchemy import create_engine, text
 
+from sql.ako_stats import fetch_legacy_cluster_stats
+
 log_dir = Path('../logs')
 log_dir.mkdir(exist_ok=True)
 logging.basicConfig(
@@ -39,6 +42,27 @@ def load_db_config():
         return {}
     return db_config
 
+@lru_cache(maxsize=1)
+def _engine():
+    """Один engine (пул соединений) на процесс вместо нового на каждый вызов."""
+    db_config = load_db_config()
+    if not db_config:
+        return None
+    conn_string = (
+        f"postgresql://{db_config['user']}:{db_config['password']}@"
+        f"{db_config['host']}:{db_config['port']}/{db_config['name']}?sslmode={db_config['sslmode']}"
+        f"{'&sslrootcert=' + db_config['sslrootcert'] if db_config.get('sslrootcert') else ''}"
+    )
+    return create_engine(conn_string)
+
+def _ids(value):
+    """Один id или список id → список для = ANY(...); None → None."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
 # def get_product_costs_dataframe(start_date: str = None, end_date: str = None, seller_id: int = None, sku: str = None):
 #     """Retrieve placeholder data (sebest cost is hardcoded in optimizer)."""
 #     try:
@@ -85,22 +109,19 @@ def load_db_config():
 #         logger.error(f"Error: {str(e)}")
 #         return None
 
-def get_ad_stats_dataframe(start_date: str = None, end_date: str = None, campaign_id: str = None, product_id: str = None):
-    """Retrieve ad stats data from silver.wb_ad_stats_products_1d with cost."""
+def get_ad_stats_dataframe(start_date: str = None, end_date: str = None, campaign_id=None, product_id=None):
+    """Retrieve ad stats data from silver.wb_ad_stats_products_1d with cost.
+
+    campaign_id / product_id accept a single id or a list of ids (one query with = ANY);
+    for a list of campaigns avg_price is computed per campaign.
+    """
     try:
         logger.info("Starting retrieval of wb_ad_stats_products_1d table")
-        db_config = load_db_config()
-        if not db_config:
+        engine = _engine()
+        if engine is None:
             logger.error("Cannot proceed due to invalid database configuration")
             return None
 
-        conn_string = (
-            f"postgresql://{db_config['user']}:{db_config['password']}@"
-            f"{db_config['host']}:{db_config['port']}/{db_config['name']}?sslmode={db_config['sslmode']}"
-            f"{'&sslrootcert=' + db_config['sslrootcert'] if db_config.get('sslrootcert') else ''}"
-        )
-        engine = create_engine(conn_string)
-
         query = "SELECT campaign_id, product_id, date, revenue, items, cost FROM silver.wb_ad_stats_products_1d"
         params = {}
         conditions = []
@@ -110,24 +131,27 @@ def get_ad_stats_dataframe(start_date: str = None, end_date: str = None, campaig
         if end_date:
             conditions.append("date <= :end_date")
             params['end_date'] = end_date
-        if campaign_id:
-            conditions.append("campaign_id = :campaign_id")
-            params['campaign_id'] = campaign_id
-        if product_id:
-            conditions.append("product_id = :product_id")
-            params['product_id'] = product_id
+        if _ids(campaign_id) is not None:
+            conditions.append("campaign_id = ANY(:campaign_ids)")
+            params['campaign_ids'] = _ids(campaign_id)
+        if _ids(product_id) is not None:
+            conditions.append("product_id = ANY(:product_ids)")
+            params['product_ids'] = _ids(product_id)
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         query += " ORDER BY date, campaign_id, product_id"
 
         with engine.connect() as conn:
             df = pd.read_sql(text(query), conn, params=params, index_col='date')
+        df['revenue_per_item'] = df['revenue'].div(df['items'].replace(0, float('nan')))
+        df = df[['campaign_id', 'product_id', 'revenue', 'items', 'cost', 'revenue_per_item']]
+        if isinstance(campaign_id, (list, tuple, set, frozenset)):
+            totals = df.groupby('campaign_id')[['revenue', 'items']].transform('sum')
+            df['avg_price'] = totals['revenue'].div(totals['items'].replace(0, float('nan'))).fillna(0).to_numpy()
+        else:
             total_revenue = df['revenue'].sum()
             total_items = df['items'].sum()
-            avg_price = total_revenue / total_items if total_items > 0 else 0
-            df['revenue_per_item'] = df['revenue'].div(df['items'].replace(0, float('nan')))
-            df = df[['campaign_id', 'product_id', 'revenue', 'items', 'cost', 'revenue_per_item']]
-            df['avg_price'] = avg_price
+            df['avg_price'] = total_revenue / total_items if total_items > 0 else 0
 
         logger.info("Data retrieved successfully")
         return df
@@ -182,53 +206,37 @@ def get_ad_stats_dataframe(start_date: str = None, end_date: str = None, campaig
 #         logger.error(f"Error: {str(e)}")
 #         return None
 
-def get_cluster_stats_dataframe(start_date: str = None, end_date: str = None, ad_id: int = None, cluster_name: str = None):
-    """Retrieve cluster stats data from ads.cluster_stats with aggregated CPC."""
+def get_cluster_stats_dataframe(start_date: str = None, end_date: str = None, ad_id=None, cluster_name: str = None):
+    """Retrieve cluster stats data from ads.cluster_stats with aggregated CPC.
+
+    ad_id accepts a single id or a list of ids (one query, sql/ako_stats.py);
+    for a list of campaigns avg_cluster_cpc is computed per ad_id.
+    """
     try:
         logger.info("Starting retrieval of cluster_stats table")
-        db_config = load_db_config()
-        if not db_config:
+        engine = _engine()
+        if engine is None:
             logger.error("Invalid database configuration")
             return None
 
-        conn_string = (
-            f"postgresql://{db_config['user']}:{db_config['password']}@"
-            f"{db_config['host']}:{db_config['port']}/{db_config['name']}?sslmode={db_config['sslmode']}"
-            f"{'&sslrootcert=' + db_config['sslrootcert'] if db_config.get('sslrootcert') else ''}"
-        )
-        engine = create_engine(conn_string)
-
-        query = "SELECT ad_id, date, cluster_name, sum, clicks FROM ads.cluster_stats"
-        params = {}
-        conditions = []
-        if start_date:
-            conditions.append("DATE(date) >= :start_date")
-            params['start_date'] = start_date
-        if end_date:
-            conditions.append("DATE(date) <= :end_date")
-            params['end_date'] = end_date
-        if ad_id is not None:
-            conditions.append("ad_id = :ad_id")
-            params['ad_id'] = ad_id
+        df = fetch_legacy_cluster_stats(engine, _ids(ad_id), start_date, end_date)
         if cluster_name:
-            conditions.append("cluster_name = :cluster_name")
-            params['cluster_name'] = cluster_name
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY date, ad_id"
-
-        with engine.connect() as conn:
-            df = pd.read_sql(text(query), conn, params=params, index_col='date')
+            df = df[df['cluster_name'] == cluster_name]
+        df = df.set_index('date')
+        df['cpc'] = df['sum'].div(df['clicks'].replace(0, float('nan')))
+        if isinstance(ad_id, (list, tuple, set, frozenset)):
+            totals = df.groupby('ad_id')[['sum', 'clicks']].transform('sum')
+            avg_cluster_cpc = totals['sum'].div(totals['clicks'].replace(0, float('nan'))).fillna(0).to_numpy()
+        else:
             total_sum = df['sum'].sum()
             total_clicks = df['clicks'].sum()
             avg_cluster_cpc = total_sum / total_clicks if total_clicks > 0 else 0
-            df['cpc'] = df['sum'].div(df['clicks'].replace(0, float('nan')))
-            df = df[['ad_id', 'cluster_name', 'cpc', 'clicks']]
-            df['avg_cluster_cpc'] = avg_cluster_cpc
+        df = df[['ad_id', 'cluster_name', 'cpc', 'clicks']]
+        df['avg_cluster_cpc'] = avg_cluster_cpc
 
         logger.info("Data retrieved successfully")
         return df
 
     except Exception as e:
         logger.error(f"Error: {str(e)}")
-        return None
\ No newline at end of file
+        return None
@@ -5,6 +5,10 @@ import asyncio
 import aiohttp
 from aiohttp import ClientResponseError
 
+from dagster_conf.lib.asset_factories.task_lifecycle import AdaptivePolling
+from src.connectors.ozon.ozon_collector import ReportJob, run_report_jobs
+from src.connectors.ozon.ozon_credentials import OzonCredentialManager, ozon_credentials
+
 
 class OzonAsyncClient:
     """
@@ -14,20 +18,20 @@ class OzonAsyncClient:
       - Методы для работы с рекламой, комиссиями, заказами, продажами и воронкой продаж.
     """
 
-    # Performance API (Ozon Performance)
+    # Performance API (Ozon Performance); пути — относительно performance_base_url
     _PERF_BASE = "https://api-performance.ozon.ru/api/client"
-    _PERF_TOKEN = f"{_PERF_BASE}/token"
-    _PERF_EXPENSE = f"{_PERF_BASE}/statistics/expense"
-    _PERF_STATS = f"{_PERF_BASE}/statistics"
-    _PERF_REPORT = f"{_PERF_BASE}/statistics/report"
+    _PERF_TOKEN = "/token"
+    _PERF_EXPENSE = "/statistics/expense"
+    _PERF_STATS = "/statistics"
+    _PERF_REPORT = "/statistics/report"
 
-    # Marketplace API (Ozon Seller)
+    # Marketplace API (Ozon Seller); пути — относительно seller_base_url
     _MP_BASE = "https://api-seller.ozon.ru"
-    _PRICE_INFO = f"{_MP_BASE}/v5/product/info/prices"
-    _FINANCE = f"{_MP_BASE}/v3/finance/transaction/list"
-    _ANALYTICS = f"{_MP_BASE}/v1/analytics/data"
-    _REPORT_CREATE = f"{_MP_BASE}/v1/report/postings/create"
-    _REPORT_INFO = f"{_MP_BASE}/v1/report/info"
+    _PRICE_INFO = "/v5/product/info/prices"
+    _FINANCE = "/v3/finance/transaction/list"
+    _ANALYTICS = "/v1/analytics/data"
+    _REPORT_CREATE = "/v1/report/postings/create"
+    _REPORT_INFO = "/v1/report/info"
 
     def __init__(
         self,
@@ -35,43 +39,53 @@ class OzonAsyncClient:
         api_key: str,
         client_secret: Optional[str] = None,
         performance_scopes: Optional[List[str]] = None,
+        token_id: Optional[int] = None,
+        seller_base_url: Optional[str] = None,
+        performance_base_url: Optional[str] = None,
+        credentials: Optional[OzonCredentialManager] = None,
     ):
         self.client_id = client_id
         self.api_key = api_key
         self.client_secret = client_secret
+        self.token_id = token_id  # core.tokens.token_id кабинета → api_token_id в бронзе
+        # переопределяются для локального поддельного API (benchmarks/check_ozon_collector.py)
+        self.seller_base_url = (seller_base_url or self._MP_BASE).rstrip("/")
+        self.performance_base_url = (performance_base_url or self._PERF_BASE).rstrip("/")
+        self.credentials = credentials or ozon_credentials()
         self._perf_token: Optional[str] = None
         self._session: Optional[aiohttp.ClientSession] = None
-
-    async def __aenter__(self) -> "OzonAsyncClient":
-        headers = {
+        self._headers = {
             "Client-Id": self.client_id,
             "Api-Key": self.api_key,
             "Accept": "application/json",
             "Content-Type": "application/json",
         }
-        self._session = aiohttp.ClientSession(headers=headers)
-        # если есть client_secret — сразу авторизуемся для Performance API
+
+    async def __aenter__(self) -> "OzonAsyncClient":
+        # сессии общие на процесс (ozon_credentials): заголовки кабинета передаются в каждом запросе
+        self._session = self.credentials.session(self.seller_base_url)
+        # если есть client_secret — сразу авторизуемся для Performance API (токен из кэша, если он ещё жив)
         if self.client_secret:
             await self._authorize_performance()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._session:
-            await self._session.close()
+        # общие сессии закрывает владелец: ресурс ozon_client при teardown или credentials.close()
+        self._session = None
+
+    @property
+    def _perf_token_url(self) -> str:
+        return self.performance_base_url + self._PERF_TOKEN
 
     async def _authorize_performance(self) -> None:
         assert self._session, "Session not initialized"
-        payload = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
-        async with self._session.post(self._PERF_TOKEN, json=payload, timeout=30) as resp:
-            resp.raise_for_status()
-            token_data = await resp.json()
-        self._perf_token = token_data.get("access_token")
-        # добавим заголовок для Performance
-        self._session._default_headers["Authorization"] = f"Bearer {self._perf_token}"
+        self._perf_token = await self.credentials.performance_token(
+            self._perf_token_url, self.client_id, self.client_secret
+        )
+
+    async def _performance_headers(self) -> Dict[str, str]:
+        await self._authorize_performance()
+        return {**self._headers, "Authorization": f"Bearer {self._perf_token}"}
 
     async def fetch_ad_campaign_expense(
         self,
@@ -84,9 +98,16 @@ class OzonAsyncClient:
         """
         assert self._session, "Use 'async with' to initialize session"
         params = {"dateFrom": date_from, "dateTo": date_to}
-        async with self._session.get(self._PERF_EXPENSE, params=params, timeout=60) as resp:
-            resp.raise_for_status()
-            return await resp.read(), dict(resp.headers)
+        url = self.performance_base_url + self._PERF_EXPENSE
+        for attempt in range(2):
+            headers = await self._performance_headers()
+            async with self.credentials.session(url).get(url, params=params, headers=headers, timeout=60) as resp:
+                if resp.status == 401 and attempt == 0:
+                    # токен отозван раньше expires_in — сбросить кэш и повторить один раз
+                    self.credentials.invalidate(self._perf_token_url, self.client_id, self._perf_token)
+                    continue
+                resp.raise_for_status()
+                return await resp.read(), dict(resp.headers)
 
     async def fetch_commission(
             self,
@@ -100,7 +121,7 @@ class OzonAsyncClient:
         """
         assert self._session, "Use 'async with' to initialize session"
         payload = {"filter": {"visibility": visibility}, "cursor": cursor, "limit": limit}
-        async with self._session.post(self._PRICE_INFO, json=payload, timeout=30) as resp:
+        async with self._session.post(self.seller_base_url + self._PRICE_INFO, json=payload, headers=self._headers, timeout=30) as resp:
             resp.raise_for_status()
             data = await resp.json(content_type=None)
             return data, dict(resp.headers), resp.status
@@ -122,7 +143,7 @@ class OzonAsyncClient:
             "page": page,
             "page_size": page_size
         }
-        async with self._session.post(self._FINANCE, json=payload, timeout=60) as resp:
+        async with self._session.post(self.seller_base_url + self._FINANCE, json=payload, headers=self._headers, timeout=60) as resp:
             resp.raise_for_status()
             data = await resp.json(content_type=None)
             return data, dict(resp.headers), resp.status
@@ -146,7 +167,7 @@ class OzonAsyncClient:
             "limit": limit,
             "offset": offset
         }
-        async with self._session.post(self._ANALYTICS, json=payload, timeout=60) as resp:
+        async with self._session.post(self.seller_base_url + self._ANALYTICS, json=payload, headers=self._headers, timeout=60) as resp:
             resp.raise_for_status()
             data = await resp.json()
             return data, dict(resp.headers), resp.status
@@ -170,7 +191,7 @@ class OzonAsyncClient:
             },
             "language": "DEFAULT"
         }
-        async with self._session.post(self._REPORT_CREATE, json=payload, timeout=60) as resp:
+        async with self._session.post(self.seller_base_url + self._REPORT_CREATE, json=payload, headers=self._headers, timeout=60) as resp:
             resp.raise_for_status()
             data = await resp.json(content_type=None)
         return (data.get("result") or {}).get("code", "")
@@ -185,7 +206,8 @@ class OzonAsyncClient:
         (в JSON при готовности должен быть file_url)
         """
         assert self._session, "Use 'async with' to initialize session"
-        async with self._session.post(self._REPORT_INFO, json={"code": code}, timeout=60) as resp:
+        async with self._session.post(self.seller_base_url + self._REPORT_INFO, json={"code": code}, headers=self._headers,
+                                      timeout=60) as resp:
             resp.raise_for_status()
             data = await resp.json(content_type=None)
             return data, dict(resp.headers), resp.status
@@ -199,7 +221,8 @@ class OzonAsyncClient:
         Возвращает (байты файла, headers, http_status)
         """
         assert self._session, "Use 'async with' to initialize session"
-        async with self._session.get(file_url, timeout=120) as resp:
+        # ссылка может вести на другой хост (CDN) — сессия берётся по хосту ссылки
+        async with self.credentials.session(file_url).get(file_url, headers=self._headers, timeout=120) as resp:
             resp.raise_for_status()
             return await resp.read(), dict(resp.headers), resp.status
 
@@ -207,24 +230,15 @@ class OzonAsyncClient:
         self,
         date_from: str,
         date_to: str,
-        schemas: List[str] = ["fbo", "fbs"]
+        schemas: Optional[List[str]] = None,
+        polling: Optional[AdaptivePolling] = None,
     ) -> List[bytes]:
         """
         Полный цикл создания, ожидания и скачивания отчётов для списка схем.
+        Схемы обрабатываются одновременно, статус опрашивается с растущим
+        интервалом (ozon_collector.run_report_jobs). Возвращает файлы в порядке schemas.
         """
-        results = []
-        for schema in schemas:
-            code = await self.create_orders_report(date_from, date_to, schema)
-            # Poll until ready
-            for _ in range(60):
-                status = await self.get_report_status(code)
-                if status == "success":
-                    break
-                await asyncio.sleep(30)
-            # Получаем URL из info
-            info = await self._session.post(self._REPORT_INFO, json={"code": code})
-            info.raise_for_status()
-            file_url = (await info.json()).get("result", {}).get("file")
-            data = await self.download_orders_report(file_url)
-            results.append(data)
-        return results
+        jobs = [ReportJob(self, date_from, date_to, schema) for schema in (schemas or ["fbo", "fbs"])]
+        run = await run_report_jobs(jobs, polling=polling)
+        run.raise_first()
+        return [result.body for result in run.results]
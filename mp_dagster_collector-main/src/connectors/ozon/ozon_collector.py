@@ -0,0 +1,297 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from aiohttp import ClientResponseError
+
+from dagster_conf.lib.asset_factories.task_lifecycle import AdaptivePolling
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Движок сбора Ozon Seller API
+#
+#  • отчёты (create → info → download): все пары (кабинет, схема доставки)
+#    создаются и опрашиваются одновременно, интервал опроса растёт по
+#    AdaptivePolling (маленький отчёт готов за секунды, большой — за минуты);
+#  • страницы: следующая страница запрашивается, пока текущая пишется;
+#    если после первой страницы известно число страниц (page_count),
+#    остальные забираются параллельно окном concurrency;
+#  • запись: страницы копятся и вставляются в бронзу пачками
+#    (один INSERT на batch_pages страниц, write_pages).
+#
+# 429 повторяется с паузой по Retry-After или экспоненциально.
+# ─────────────────────────────────────────────────────────────────────────────
+
+READY_STATUSES = {"success", "done", "ready"}
+FAILED_STATUSES = {"failed", "error"}
+
+PageFetchFn = Callable[[Any], Awaitable[Tuple[Any, Mapping[str, Any], int]]]
+
+
+def _retry_after(headers: Optional[Mapping[str, Any]]) -> Optional[float]:
+    for name, value in (headers or {}).items():
+        if str(name).lower() == "retry-after":
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+async def call_with_retry(
+    fn: Callable[..., Awaitable[Any]],
+    *args,
+    attempts: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    log=None,
+    tag: str = "ozon",
+    **kwargs,
+) -> Any:
+    """fn(*args, **kwargs) с повтором на 429; остальные ошибки пробрасываются сразу."""
+    for attempt in range(attempts):
+        try:
+            return await fn(*args, **kwargs)
+        except ClientResponseError as e:
+            if e.status != 429 or attempt == attempts - 1:
+                raise
+            delay = _retry_after(getattr(e, "headers", None))
+            if delay is None:
+                delay = min(base_delay * 2 ** attempt, max_delay)
+            if log:
+                log.warning(f"[{tag}] 429, пауза {delay:.1f}s, попытка {attempt + 1}/{attempts}")
+            await asyncio.sleep(delay)
+
+
+# ─── отчёты ───
+
+@dataclass
+class ReportJob:
+    """Один отчёт заказов: кабинет (клиент) × схема доставки × период."""
+    client: Any  # OzonAsyncClient
+    date_from: str
+    date_to: str
+    delivery_schema: str = "fbo"
+    label: str = ""  # кабинет/компания для логов
+
+
+@dataclass
+class ReportResult:
+    job: ReportJob
+    code: str
+    file_url: str
+    body: bytes
+    headers: Dict[str, str]
+    status: int
+    polls: int = 0
+    elapsed_sec: float = 0.0
+
+
+@dataclass
+class ReportRun:
+    results: List[ReportResult] = field(default_factory=list)
+    errors: List[Tuple[ReportJob, BaseException]] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+    def raise_first(self) -> None:
+        if self.errors:
+            raise self.errors[0][1]
+
+
+def report_file_url(info: Any) -> Tuple[str, Optional[str]]:
+    """Ответ /v1/report/info → (статус в нижнем регистре, ссылка на файл или None)."""
+    result = (info.get("result") or {}) if isinstance(info, dict) else {}
+    status = str(result.get("status") or "").lower()
+    return status, result.get("file_url") or result.get("file") or result.get("url")
+
+
+async def run_report_job(
+    job: ReportJob,
+    polling: AdaptivePolling,
+    *,
+    limiter: Optional[asyncio.Semaphore] = None,
+    log=None,
+    tag: str = "ozon report",
+) -> ReportResult:
+    """
+    Создание → опрос с растущим интервалом → скачивание одного отчёта.
+    limiter ограничивает одновременные HTTP-запросы, а не ожидание между опросами.
+    """
+    limiter = limiter or asyncio.Semaphore(1)
+    client, name = job.client, f"{job.label or '-'}/{job.delivery_schema}"
+    started = time.monotonic()
+
+    async def call(fn, *args):
+        async with limiter:
+            return await call_with_retry(fn, *args, log=log, tag=tag)
+
+    code = await call(client.create_orders_report, job.date_from, job.date_to, job.delivery_schema)
+    if not code:
+        raise RuntimeError(f"[{tag}] {name}: не получили code отчёта от /v1/report/postings/create")
+
+    deadline = started + polling.timeout_sec
+    polls = 0
+    file_url = None
+    for delay in polling.delays():
+        info, _, _ = await call(client.get_report_status, code)
+        polls += 1
+        status, file_url = report_file_url(info)
+        if status in READY_STATUSES:
+            if not file_url:
+                raise RuntimeError(f"[{tag}] {name}: отчёт {code} готов, но без file_url")
+            break
+        if status in FAILED_STATUSES:
+            raise RuntimeError(f"[{tag}] {name}: отчёт {code} завершился со статусом '{status}'")
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"[{tag}] {name}: отчёт {code} не готов за {polling.timeout_sec}s ({polls} опросов)")
+        await asyncio.sleep(delay)
+
+    if log:
+        log.info(f"[{tag}] {name}: code={code} готов после {polls} опросов, скачиваем")
+    body, headers, status = await call(client.download_orders_report, file_url)
+    return ReportResult(job=job, code=code, file_url=file_url, body=body, headers=dict(headers),
+                        status=int(status), polls=polls, elapsed_sec=time.monotonic() - started)
+
+
+async def run_report_jobs(
+    jobs: Iterable[ReportJob],
+    *,
+    polling: Optional[AdaptivePolling] = None,
+    concurrency: int = 4,
+    log=None,
+    tag: str = "ozon report",
+) -> ReportRun:
+    """
+    Все отчёты одновременно (разные кабинеты — разные клиенты в ReportJob).
+    Ошибка одного отчёта не отменяет остальные: результаты в порядке jobs,
+    ошибки — в ReportRun.errors (raise_first() — пробросить первую).
+    """
+    jobs = list(jobs)
+    polling = polling or AdaptivePolling()
+    limiter = asyncio.Semaphore(max(concurrency, 1))
+    started = time.monotonic()
+    outcomes = await asyncio.gather(
+        *(run_report_job(job, polling, limiter=limiter, log=log, tag=tag) for job in jobs),
+        return_exceptions=True,
+    )
+    run = ReportRun(elapsed_sec=time.monotonic() - started)
+    for job, outcome in zip(jobs, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            run.errors.append((job, outcome))
+            if log:
+                log.error(f"[{tag}] {job.label or '-'}/{job.delivery_schema}: {outcome!r}")
+        else:
+            run.results.append(outcome)
+    return run
+
+
+# ─── страницы ───
+
+@dataclass
+class Page:
+    key: Any  # номер страницы или offset
+    data: Any
+    headers: Dict[str, str]
+    status: int
+
+
+async def stream_pages(
+    fetch_page: PageFetchFn,
+    keys: Iterable[Any],
+    *,
+    is_last: Callable[[Any], bool],
+    page_total: Optional[Callable[[Any], Optional[int]]] = None,
+    speculative: int = 0,
+    concurrency: int = 4,
+    log=None,
+    tag: str = "ozon pages",
+) -> AsyncIterator[Page]:
+    """
+    Страницы fetch_page(key) → (data, headers, status) по порядку keys.
+
+    Следующая страница запрашивается до того, как текущая отдана потребителю,
+    так что запись страницы N идёт одновременно с загрузкой N+1. speculative —
+    сколько страниц сверх этого держать в полёте, пока конец неизвестен (каждая
+    может оказаться лишним запросом за концом данных). page_total(data первой
+    страницы) → число страниц: дальше ключи обрезаются по нему и забираются
+    окном concurrency без лишних запросов.
+    """
+    keys = iter(keys)
+    pending: Deque[Tuple[int, Any, "asyncio.Task"]] = deque()
+    target = 1 + max(speculative, 0)
+    limit: Optional[int] = None
+    issued = 0
+
+    def top_up() -> None:
+        nonlocal issued
+        while len(pending) < target and (limit is None or issued < limit):
+            try:
+                key = next(keys)
+            except StopIteration:
+                return
+            task = asyncio.ensure_future(call_with_retry(fetch_page, key, log=log, tag=tag))
+            pending.append((issued, key, task))
+            issued += 1
+
+    dropped: List["asyncio.Task"] = []
+    top_up()
+    try:
+        first = True
+        while pending:
+            index, key, task = pending.popleft()
+            data, headers, status = await task
+            if first and page_total is not None:
+                total = page_total(data)
+                if total is not None:
+                    limit = max(int(total), 1)
+                    target = max(target, concurrency)
+                    # спекулятивные запросы за последней страницей не нужны
+                    while pending and pending[-1][0] >= limit:
+                        dropped.append(pending.pop()[2])
+            first = False
+
+            last = is_last(data) or (limit is not None and index >= limit - 1)
+            if not last:
+                top_up()
+            yield Page(key=key, data=data, headers=dict(headers or {}), status=int(status))
+            if last:
+                return
+    finally:
+        dropped.extend(task for _, _, task in pending)
+        for task in dropped:
+            task.cancel()
+        await asyncio.gather(*dropped, return_exceptions=True)
+
+
+async def write_pages(
+    pages: AsyncIterator[Page],
+    *,
+    build_record: Callable[[Page], Optional[Dict[str, Any]]],
+    write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+    batch_pages: int = 20,
+) -> int:
+    """Страницы → строки бронзы пачками по batch_pages; возвращает число записанных строк."""
+    batch: List[Dict[str, Any]] = []
+    written = 0
+    try:
+        async for page in pages:
+            record = build_record(page)
+            if record is not None:
+                batch.append(record)
+            if len(batch) >= batch_pages:
+                await write_batch(batch)
+                written += len(batch)
+                batch = []
+    finally:
+        # ошибка записи — отменить страницы, которые ещё в полёте
+        aclose = getattr(pages, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if batch:
+        await write_batch(batch)
+        written += len(batch)
+    return written
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Процессный менеджер учётных данных и сессий Ozon
+#
+#  • токены Performance API (client credentials) кэшируются по
+#    (token_url, client_id) до expires_in минус refresh_margin_sec
+#    (но не дольше половины срока жизни);
+#  • обновление single-flight: сколько бы задач ни попросили токен
+#    одновременно, в /api/client/token уходит один запрос;
+#  • 401 от Performance API — invalidate() сбрасывает только тот токен,
+#    с которым пришёл отказ (параллельные 401 не порождают лишних запросов);
+#  • aiohttp.ClientSession с пулом соединений — одна на (event loop, хост).
+#    Dagster держит один цикл на запуск (или на шаг в multiprocess), поэтому
+#    ассеты запуска делят соединения; сессии закрывает close() / close_idle().
+# ─────────────────────────────────────────────────────────────────────────────
+
+TOKEN_REFRESH_MARGIN_SEC = 60.0
+DEFAULT_EXPIRES_IN_SEC = 1800.0
+CONNECTOR_LIMIT_PER_HOST = 20
+
+
+@dataclass(frozen=True)
+class PerformanceToken:
+    access_token: str
+    expires_at: float  # по часам менеджера (monotonic)
+    refresh_at: float  # с этого момента токен обновляется заранее
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class OzonCredentialManager:
+    """Кэш токенов Performance API и общие сессии aiohttp на процесс."""
+
+    def __init__(
+        self,
+        *,
+        refresh_margin_sec: float = TOKEN_REFRESH_MARGIN_SEC,
+        limit_per_host: int = CONNECTOR_LIMIT_PER_HOST,
+        clock=time.monotonic,
+    ):
+        self.refresh_margin_sec = refresh_margin_sec
+        self.limit_per_host = limit_per_host
+        self._clock = clock
+        self._guard = threading.Lock()
+        self._tokens: Dict[Tuple[str, str], PerformanceToken] = {}
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, str, str], "asyncio.Task"] = {}
+        self._sessions: Dict[Tuple[asyncio.AbstractEventLoop, str], aiohttp.ClientSession] = {}
+        self.stats: Counter = Counter()  # auth_requests, token_hits, sessions_created, invalidated
+
+    # ─── сессии ───
+    def session(self, url: str) -> aiohttp.ClientSession:
+        """Общая сессия для хоста url в текущем event loop (вызывать из корутины)."""
+        loop = asyncio.get_running_loop()
+        key = (loop, _origin(url))
+        with self._guard:
+            session = self._sessions.get(key)
+            if session is None or session.closed:
+                self._drop_closed_loops()
+                connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+                session = aiohttp.ClientSession(connector=connector)
+                self._sessions[key] = session
+                self.stats["sessions_created"] += 1
+            return session
+
+    def _drop_closed_loops(self) -> None:
+        for key in [k for k in self._sessions if k[0].is_closed()]:
+            del self._sessions[key]
+
+    async def close(self) -> None:
+        """Закрывает сессии текущего event loop."""
+        loop = asyncio.get_running_loop()
+        with self._guard:
+            sessions = [s for (l, _), s in self._sessions.items() if l is loop]
+            for key in [k for k in self._sessions if k[0] is loop]:
+                del self._sessions[key]
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+    def close_idle(self) -> None:
+        """Синхронно закрывает сессии всех циклов, которые сейчас не выполняются (teardown ресурса)."""
+        with self._guard:
+            self._drop_closed_loops()
+            idle = [k for k in self._sessions if not k[0].is_running()]
+            by_loop: Dict[asyncio.AbstractEventLoop, list] = {}
+            for key in idle:
+                by_loop.setdefault(key[0], []).append(self._sessions.pop(key))
+        for loop, sessions in by_loop.items():
+            loop.run_until_complete(asyncio.gather(*(s.close() for s in sessions), return_exceptions=True))
+
+    # ─── токены Performance API ───
+    def _cached(self, token_url: str, client_id: str) -> Optional[PerformanceToken]:
+        token = self._tokens.get((token_url, client_id))
+        if token is not None and self._clock() < token.refresh_at:
+            return token
+        return None
+
+    async def performance_token(self, token_url: str, client_id: str, client_secret: str) -> str:
+        """Действующий access_token; при отсутствии или скором истечении — один запрос на всех ожидающих."""
+        token = self._cached(token_url, client_id)
+        if token is not None:
+            self.stats["token_hits"] += 1
+            return token.access_token
+
+        loop = asyncio.get_running_loop()
+        key = (loop, token_url, client_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = loop.create_task(self._fetch_token(token_url, client_id, client_secret))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return (await asyncio.shield(task)).access_token
+
+    async def _fetch_token(self, token_url: str, client_id: str, client_secret: str) -> PerformanceToken:
+        payload = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "grant_type": "client_credentials",
+        }
+        self.stats["auth_requests"] += 1
+        async with self.session(token_url).post(token_url, json=payload, timeout=30) as resp:
+            resp.raise_for_status()
+            token_data = await resp.json(content_type=None)
+        expires_in = float(token_data.get("expires_in") or DEFAULT_EXPIRES_IN_SEC)
+        now = self._clock()
+        # короткоживущий токен (expires_in меньше двух запасов) обновляется на середине срока
+        margin = min(self.refresh_margin_sec, expires_in / 2)
+        token = PerformanceToken(token_data.get("access_token"), now + expires_in, now + expires_in - margin)
+        with self._guard:
+            self._tokens[(token_url, client_id)] = token
+        return token
+
+    def invalidate(self, token_url: str, client_id: str, access_token: Optional[str] = None) -> None:
+        """Сбрасывает кэш токена (только если он всё ещё равен access_token, когда тот передан)."""
+        with self._guard:
+            token = self._tokens.get((token_url, client_id))
+            if token is not None and (access_token is None or token.access_token == access_token):
+                del self._tokens[(token_url, client_id)]
+                self.stats["invalidated"] += 1
+
+
+@lru_cache(maxsize=1)
+def ozon_credentials() -> OzonCredentialManager:
+    """Общий на процесс менеджер токенов и сессий Ozon."""
+    return OzonCredentialManager()
@@ -530,43 +530,83 @@ class WildberriesAsyncClient:
 
         return all_data, last_headers
 
-    async def fetch_clusters_batch(self, advert_ids: List[int]) -> List[Tuple[Dict[str, Any], Dict[str, str]]]:
+    async def fetch_clusters_one(self, advert_id: int) -> Tuple[Dict[str, Any], Dict[str, str]]:
         """
-        Обходит список advert_ids, вызывает GET /adv/v2/auto/stat-words по каждому ID.
-        Возвращает список кортежей: [(ответ по кампании, заголовки), ...]
+        GET /adv/v2/auto/stat-words по одной кампании, без пауз (темп задаёт вызывающий).
+        404 → пустые кластеры; 429 и прочие ошибки пробрасываются (ClientResponseError с заголовками).
         """
         assert self._session
         url = f"{ADVERT_API_URL}/adv/v2/auto/stat-words"
-        results = []
-
-        for advert_id in advert_ids:
-            params = {"id": advert_id}
-            try:
-                async with self._session.get(url, params=params, timeout=60) as resp:
-                    resp.raise_for_status()
-                    headers = dict(resp.headers)
+        params = {"id": advert_id}
+        try:
+            async with self._session.get(url, params=params, timeout=60) as resp:
+                resp.raise_for_status()
+                headers = dict(resp.headers)
 
-                    try:
-                        data = await resp.json()
-                    except Exception:
-                        print(f"Невалидный JSON для advert_id={advert_id}, текст: {await resp.text()}")
-                        data = {}
+                try:
+                    data = await resp.json()
+                except Exception:
+                    print(f"Невалидный JSON для advert_id={advert_id}, текст: {await resp.text()}")
+                    data = {}
 
-                    if not isinstance(data, dict):
-                        print(f"Не dict в ответе для advert_id={advert_id}: {data}")
-                        data = {}
+                if not isinstance(data, dict):
+                    print(f"Не dict в ответе для advert_id={advert_id}: {data}")
+                    data = {}
 
-                    results.append(({"advertId": advert_id, **data}, headers))
-            except ClientResponseError as e:
-                if e.status == 404:
-                    results.append(({"advertId": advert_id, "excluded": [], "clusters": []}, {}))
-                else:
-                    raise
+                return {"advertId": advert_id, **data}, headers
+        except ClientResponseError as e:
+            if e.status == 404:
+                return {"advertId": advert_id, "excluded": [], "clusters": []}, {}
+            raise
 
+    async def fetch_clusters_batch(self, advert_ids: List[int]) -> List[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        Обходит список advert_ids, вызывает GET /adv/v2/auto/stat-words по каждому ID.
+        Возвращает список кортежей: [(ответ по кампании, заголовки), ...]
+        """
+        results = []
+        for advert_id in advert_ids:
+            results.append(await self.fetch_clusters_one(advert_id))
             await asyncio.sleep(0.3)  # лимит 4 запроса/сек
 
         return results
 
+    async def fetch_keywords_one(
+            self,
+            advert_id: int,
+            date_from: str,
+            date_to: str
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        GET /adv/v0/stats/keywords по одной кампании, без пауз (темп задаёт вызывающий).
+        400/404 → пустой список keywords; 429 и прочие ошибки пробрасываются.
+        """
+        assert self._session
+        url = f"{ADVERT_API_URL}/adv/v0/stats/keywords"
+        params = {
+            "advert_id": advert_id,
+            "from": date_from,
+            "to": date_to
+        }
+
+        try:
+            async with self._session.get(url, params=params, timeout=60) as resp:
+                headers = dict(resp.headers)
+                try:
+                    resp.raise_for_status()
+                    data = await resp.json()
+                    return {"advertId": advert_id, **data}, headers
+                except ClientResponseError as e:
+                    if e.status in (400, 404):
+                        if e.status == 400:
+                            print(
+                                f"[fetch_keywords_batch] 400 Bad Request для advert_id={advert_id}, вероятно архивирована или неактивна.")
+                        return {"advertId": advert_id, "keywords": []}, headers
+                    raise
+        except Exception as e:
+            print(f"[fetch_keywords_batch] Необработанная ошибка advert_id={advert_id}: {e}")
+            raise
+
     async def fetch_keywords_batch(
             self,
             advert_ids: List[int],
@@ -577,36 +617,9 @@ class WildberriesAsyncClient:
         Обходит список advert_ids, вызывает GET /adv/v0/stats/keywords для каждого.
         Возвращает список кортежей: [(ответ, заголовки), ...]
         """
-        assert self._session
-        url = f"{ADVERT_API_URL}/adv/v0/stats/keywords"
         results = []
-
         for advert_id in advert_ids:
-            params = {
-                "advert_id": advert_id,
-                "from": date_from,
-                "to": date_to
-            }
-
-            try:
-                async with self._session.get(url, params=params, timeout=60) as resp:
-                    headers = dict(resp.headers)
-                    try:
-                        resp.raise_for_status()
-                        data = await resp.json()
-                        results.append(({"advertId": advert_id, **data}, headers))
-                    except ClientResponseError as e:
-                        if e.status in (400, 404):
-                            results.append(({"advertId": advert_id, "keywords": []}, headers))
-                            if e.status == 400:
-                                print(
-                                    f"[fetch_keywords_batch] 400 Bad Request для advert_id={advert_id}, вероятно архивирована или неактивна.")
-                        else:
-                            raise
-            except Exception as e:
-                print(f"[fetch_keywords_batch] Необработанная ошибка advert_id={advert_id}: {e}")
-                raise
-
+            results.append(await self.fetch_keywords_one(advert_id, date_from, date_to))
             await asyncio.sleep(0.3)  # соблюдение лимита 4 req/sec
 
         return results
@@ -0,0 +1,57 @@
+"""gold sources: indexes on silver_v2.*.inserted_at for incremental gold watermarks
+
+Revision ID: 3c6f1e2a9d47
+Revises: b2b047dc1f53
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c6f1e2a9d47'
+down_revision: Union[str, None] = 'b2b047dc1f53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Источники gold.vm_product_orders_1d с водяным знаком по inserted_at
+# (dagster_conf/lib/gold_incremental.py): max(inserted_at) и выборка «новее
+# водяного знака» должны идти по индексу. На новой базе таблицы и индексы
+# создаёт init_db_autogen по config.yml (silver_indexes).
+SILVER_V2_SOURCES = (
+    "wb_sales_funnels_1d",
+    "wb_adv_product_stats_1d",
+    "wb_commission_1d",
+    "wb_paid_storage_1d",
+    "wb_fin_reports_1w",
+)
+
+
+def _relkind(table: str):
+    return op.get_bind().execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": f"silver_v2.{table}"},
+    ).scalar()
+
+
+def upgrade() -> None:
+    for table in SILVER_V2_SOURCES:
+        kind = _relkind(table)
+        if kind is None:
+            continue
+        name, on = f"ix_{table}_inserted_at", f"silver_v2.{table} (inserted_at)"
+        if kind == "p":
+            # партиционированная таблица: CONCURRENTLY не поддерживается
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {on}")
+        else:
+            with op.get_context().autocommit_block():
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+
+
+def downgrade() -> None:
+    for table in SILVER_V2_SOURCES:
+        op.execute(f"DROP INDEX IF EXISTS silver_v2.ix_{table}_inserted_at")
@@ -0,0 +1,59 @@
+"""ako stats: covering (advert_id, date) INCLUDE indexes for set-based AKO queries
+
+Revision ID: 7d2a91c4e5b8
+Revises: 3c6f1e2a9d47
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2a91c4e5b8'
+down_revision: Union[str, None] = '3c6f1e2a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Статистика AKO (sql/ako_stats.py) читает кампании за период одним запросом
+# advert_id = ANY(:ids) AND date >= :start AND date < :end_excl; с INCLUDE
+# это index-only scan. Индексы раньше создавались при первом запросе
+# DatabaseManager / WildberriesSQLOptimizer — теперь только здесь.
+# (схема, таблица, индекс, ключ и INCLUDE)
+AKO_STATS_INDEXES = (
+    ("silver", "wb_adv_product_stats_1d", "wb_adv_product_stats_1d_ako_idx",
+     "(advert_id, date) INCLUDE (nm_id, revenue, items, cost)"),
+    ("silver", "wb_adv_keyword_stats_1d", "wb_adv_keyword_stats_1d_ako_idx",
+     "(advert_id, date) INCLUDE (keyword, cost, clicks)"),
+    ("ads", "cluster_stats", "cluster_stats_ako_idx",
+     "(ad_id, date) INCLUDE (cluster_name, views, clicks, sum, ctr)"),
+)
+
+
+def _relkind(schema: str, table: str):
+    return op.get_bind().execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": f"{schema}.{table}"},
+    ).scalar()
+
+
+def upgrade() -> None:
+    for schema, table, name, columns in AKO_STATS_INDEXES:
+        kind = _relkind(schema, table)
+        if kind is None:
+            continue
+        on = f"{schema}.{table} {columns}"
+        if kind == "p":
+            # партиционированная таблица: CONCURRENTLY не поддерживается
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {on}")
+        else:
+            with op.get_context().autocommit_block():
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {on}")
+
+
+def downgrade() -> None:
+    for schema, _table, name, _columns in AKO_STATS_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {schema}.{name}")
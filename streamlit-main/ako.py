@@ -1,9 +1,8 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Dict, Optional
 import logging
-from collections import defaultdict
 from scipy import stats as scipy_stats
 
 logging.basicConfig(
@@ -16,6 +15,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# История кластеров — один DataFrame с индексом (advertId, date), где advertId — кластер
+# ключевой фразы, а не кампания. Строки отсортированы по кластеру, внутри — по дате.
+HISTORY_INDEX = ['advertId', 'date']
+HISTORY_COLUMNS = ['shows', 'clicks', 'spend', 'ctr']
+MAX_HISTORY_DAYS = 30
+TREND_ALPHA = 0.3
+STABILITY_MIN_DAYS = 14
+
+RESULT_COLUMNS = [
+    'advertId', 'days_in_history', 'decision', 'reason',
+    'ctr', 'cpc', 'cpm', 'total_shows', 'total_clicks', 'total_spend',
+    'bid_modifier', 'efficiency_score'
+]
+
+
+def _empty_history() -> pd.DataFrame:
+    index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=HISTORY_INDEX)
+    return pd.DataFrame(columns=HISTORY_COLUMNS, index=index)
+
+
+class _ClusterLayout:
+    """
+    Раскладка истории по кластерам: строка i → ячейка (codes[i], pos[i]) матрицы
+    «кластер × день по порядку». Все метрики считаются над такими матрицами сразу
+    для всех кластеров; короткие истории дополняются справа (size — число дней).
+    """
+
+    def __init__(self, history: pd.DataFrame):
+        codes, clusters = pd.factorize(history.index.get_level_values('advertId'))
+        self.clusters = pd.Index(clusters, name='advertId')
+        self.codes = codes
+        self.size = np.bincount(codes, minlength=len(clusters))
+        starts = np.concatenate(([0], np.cumsum(self.size)[:-1]))
+        self.pos = np.arange(len(codes)) - starts[codes]
+        self.width = int(self.size.max()) if len(self.size) else 0
+        self.present = self.matrix(np.ones(len(codes), dtype=bool), fill=False)
+
+    def total(self, values: np.ndarray) -> np.ndarray:
+        # bincount складывает строки подряд — так же, как sum() по списку дней
+        return np.bincount(self.codes, weights=values, minlength=len(self.clusters))
+
+    def matrix(self, values: np.ndarray, fill=np.nan) -> np.ndarray:
+        out = np.full((len(self.clusters), self.width), fill, dtype=np.asarray(values).dtype)
+        out[self.codes, self.pos] = values
+        return out
+
+
+def _compact(matrix: np.ndarray, valid: np.ndarray):
+    """Сдвигает отмеченные значения каждой строки влево с сохранением порядка; → (матрица, число значений)."""
+    order = np.argsort(~valid, axis=1, kind='stable')
+    return np.take_along_axis(matrix, order, axis=1), valid.sum(axis=1)
+
+
+def _row_std(matrix: np.ndarray, valid: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """np.std по отмеченным значениям строк rows; строки группируются по числу значений."""
+    compact, counts = _compact(matrix, valid)
+    out = np.full(len(matrix), np.nan)
+    for count in np.unique(counts[rows & (counts > 0)]):
+        selected = rows & (counts == count)
+        out[selected] = np.std(np.ascontiguousarray(compact[selected, :count]), axis=1)
+    return out
+
+
+def _smoothed_delta(matrix: np.ndarray, size: np.ndarray) -> np.ndarray:
+    """Экспоненциальное сглаживание по дням: последнее сглаженное значение минус первое."""
+    if not matrix.size:
+        return np.zeros(len(matrix))
+    smoothed = matrix[:, 0].copy()
+    for day in range(1, matrix.shape[1]):
+        live = day < size
+        smoothed[live] = TREND_ALPHA * matrix[live, day] + (1 - TREND_ALPHA) * smoothed[live]
+    with np.errstate(invalid='ignore'):
+        return np.where(size >= 2, smoothed - matrix[:, 0], 0.0)
+
 
 class AdvancedKeywordOptimizer:
     def __init__(
@@ -42,7 +115,7 @@ class AdvancedKeywordOptimizer:
         self.stat_significance_level = stat_significance_level
         self.warmup_period_days = warmup_period_days
         self.cluster_mapping = cluster_mapping or {}
-        self.cluster_history = defaultdict(list)
+        self.cluster_history = _empty_history()
         self.median_metrics = {'ctr': 0.0, 'cpc': 0.0, 'cpm': 0.0}
         self.dynamic_thresholds = {'max_cpc': max_cpc, 'max_cpm': None}
         self.weights = weights or {'ctr': 0.3, 'cpc': 0.4, 'shows': 0.3}
@@ -62,6 +135,16 @@ class AdvancedKeywordOptimizer:
         cluster = self.cluster_mapping.get(keyword, keyword)
         return cluster
 
+    def map_keywords_to_clusters(self, keywords: pd.Series) -> pd.Series:
+        """_map_keyword_to_cluster для всего столбца сразу."""
+        missing = keywords.isna()
+        if missing.any():
+            logger.warning(f"NaN detected in {int(missing.sum())} keywords, mapping to 'unknown'")
+        clusters = keywords
+        if self.cluster_mapping:
+            clusters = keywords.map(self.cluster_mapping).where(keywords.isin(list(self.cluster_mapping)), keywords)
+        return clusters.mask(missing, "unknown")
+
     def update_dynamic_thresholds(self, df: pd.DataFrame):
         agg_df = df.groupby(['advertId']).agg({
             'shows': 'sum',
@@ -96,21 +179,22 @@ class AdvancedKeywordOptimizer:
                 logger.warning(f"Found rows with clicks > shows: {len(invalid_rows)}")
                 df.loc[df['clicks'] > df['shows'], 'ctr'] = 1.0
 
-            df['advertId'] = df['keyword'].apply(self._map_keyword_to_cluster)
+            df['advertId'] = self.map_keywords_to_clusters(df['keyword'])
             df = df.dropna(subset=['advertId'])
 
             self.update_dynamic_thresholds(df)
-            agg_df = df.groupby(['advertId', 'date']).agg({
+            agg_df = df.groupby(HISTORY_INDEX).agg({
                 'shows': 'sum',
                 'clicks': 'sum',
                 'spend': 'sum',
                 'ctr': 'mean'
-            }).reset_index()
+            })
 
             if agg_df['shows'].sum() == 0:
                 logger.warning("Aggregated data contains zero shows, check input data")
 
-            logger.debug(f"Aggregated spend values: {agg_df[['advertId', 'spend']].to_dict()}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Aggregated spend values: {agg_df['spend'].to_dict()}")
 
             self.median_metrics = {
                 'ctr': agg_df['ctr'].median() if 'ctr' in agg_df.columns else 0.0,
@@ -119,121 +203,222 @@ class AdvancedKeywordOptimizer:
             }
             logger.info(f"Updated median metrics: {self.median_metrics}")
 
-            for _, row in agg_df.iterrows():
-                advert_id = row['advertId']
-                stat_entry = {
-                    'date': row['date'],
-                    'shows': row['shows'],
-                    'clicks': row['clicks'],
-                    'spend': row['spend'],
-                    'ctr': row['ctr']
-                }
-                if not any(s['date'] == row['date'] for s in self.cluster_history[advert_id]):
-                    self.cluster_history[advert_id].append(stat_entry)
-
-            max_history_days = 30
-            for advert_id in self.cluster_history:
-                cutoff_date = datetime.now() - timedelta(days=max_history_days)
-                self.cluster_history[advert_id] = [s for s in self.cluster_history[advert_id] if
-                                                   s.get('date') >= cutoff_date]
-            logger.info(f"Updated history for {len(self.cluster_history)} clusters, limited to {max_history_days} days")
+            # уже известные дни кластера не перезаписываются
+            history = self.cluster_history
+            if not history.empty:
+                agg_df = pd.concat([history, agg_df[~agg_df.index.isin(history.index)]])
+
+            cutoff_date = datetime.now() - timedelta(days=MAX_HISTORY_DAYS)
+            agg_df = agg_df[agg_df.index.get_level_values('date') >= cutoff_date]
+            self.cluster_history = agg_df[HISTORY_COLUMNS].sort_index()
+            logger.info(f"Updated history for {self.cluster_history.index.get_level_values('advertId').nunique()} "
+                        f"clusters, limited to {MAX_HISTORY_DAYS} days")
 
         except Exception as e:
             logger.error(f"Error updating history: {str(e)}")
 
-    def compute_efficiency_score(self, stats: List[Dict]) -> float:
-        total_shows = sum(s.get('shows', 0) for s in stats)
-        total_clicks = sum(s.get('clicks', 0) for s in stats)
-        total_spend = sum(s.get('spend', 0) for s in stats)
+    # ───────────────────────────── метрики по всем кластерам ─────────────────────────────
 
-        ctr = total_clicks / total_shows if total_shows > 0 else 0.0
-        cpc = total_spend / total_clicks if total_clicks > 0 else float('inf')
+    def compute_efficiency_scores(self, history: pd.DataFrame) -> pd.Series:
+        layout = _ClusterLayout(history)
+        shows = history['shows'].to_numpy(dtype=float)
+        clicks = history['clicks'].to_numpy(dtype=float)
+        spend = history['spend'].to_numpy(dtype=float)
+        total_shows, total_clicks, total_spend = layout.total(shows), layout.total(clicks), layout.total(spend)
 
         base_ctr = max(self.median_metrics.get('ctr', 0.0), self.min_ctr)
         base_cpc = max(self.median_metrics.get('cpc', 0.0), self.max_cpc / 2)
 
-        ctr_score = min(ctr / base_ctr, 2.0)
-        cpc_score = max(self.max_cpc / cpc, 0.1) if cpc < float('inf') else 0.1
-        shows_score = min(total_shows / self.min_views, 2.0)
-
-        stability_bonus = 0.0
-        if len(stats) >= 14:
-            ctr_values = [s.get('clicks', 0) / s.get('shows', 1) for s in stats]
-            cpc_values = [s.get('spend', 0) / s.get('clicks', 1) if s.get('clicks', 0) > 0 else float('inf') for s in
-                          stats]
-            ctr_std = np.std(ctr_values) / (base_ctr + 1e-6)
-            cpc_std = np.std([c for c in cpc_values if c < float('inf')]) / (base_cpc + 1e-6) if any(
-                c < float('inf') for c in cpc_values) else 1.0
-            stability_bonus = max(0.2 * (1 - min(ctr_std, 1.0)) + 0.2 * (1 - min(cpc_std, 1.0)), 0.0)
-
-        score = (
-                self.weights['ctr'] * ctr_score +
-                self.weights['cpc'] * cpc_score +
-                self.weights['shows'] * shows_score +
-                stability_bonus
-        )
-
-        return min(max(score, 0.0), 3.0)
-
-    def compute_click_trend(self, stats: List[Dict]) -> float:
-        if len(stats) < 2:
-            return 0.0
-        clicks = [s.get('clicks', 0) for s in stats]
-        alpha = 0.3
-        smoothed = [clicks[0]]
-        for i in range(1, len(clicks)):
-            smoothed.append(alpha * clicks[i] + (1 - alpha) * smoothed[-1])
-        return smoothed[-1] - smoothed[0]
-
-    def compute_metric_trend(self, stats: List[Dict], metric: str) -> float:
-        if len(stats) < 2:
-            return 0.0
-        values = []
-        for s in stats:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ctr = np.where(total_shows > 0, total_clicks / total_shows, 0.0)
+            cpc = np.where(total_clicks > 0, total_spend / total_clicks, np.inf)
+
+            ctr_score = np.minimum(ctr / base_ctr, 2.0)
+            cpc_score = np.where(cpc < np.inf, np.maximum(self.max_cpc / cpc, 0.1), 0.1)
+            shows_score = np.minimum(total_shows / self.min_views, 2.0)
+
+            # бонус за стабильность — только для кластеров с историей от STABILITY_MIN_DAYS дней
+            stable = layout.size >= STABILITY_MIN_DAYS
+            stability_bonus = np.zeros(len(layout.clusters))
+            if stable.any():
+                day_ctr = layout.matrix(np.where(shows > 0, clicks / shows, 0.0))
+                day_cpc = layout.matrix(np.where(clicks > 0, spend / clicks, np.inf))
+                finite_cpc = layout.present & (day_cpc < np.inf)
+                ctr_std = _row_std(day_ctr, layout.present, stable) / (base_ctr + 1e-6)
+                cpc_std = np.where(finite_cpc.any(axis=1),
+                                   _row_std(day_cpc, finite_cpc, stable) / (base_cpc + 1e-6), 1.0)
+                bonus = np.maximum(0.2 * (1 - np.minimum(ctr_std, 1.0)) + 0.2 * (1 - np.minimum(cpc_std, 1.0)), 0.0)
+                stability_bonus = np.where(stable, bonus, 0.0)
+
+            score = (
+                    self.weights['ctr'] * ctr_score +
+                    self.weights['cpc'] * cpc_score +
+                    self.weights['shows'] * shows_score +
+                    stability_bonus
+            )
+        return pd.Series(np.minimum(np.maximum(score, 0.0), 3.0), index=layout.clusters, name='efficiency_score')
+
+    def compute_metric_trends(self, history: pd.DataFrame, metric: str) -> pd.Series:
+        layout = _ClusterLayout(history)
+        with np.errstate(divide='ignore', invalid='ignore'):
             if metric == 'ctr':
-                shows = s.get('shows', 0)
-                clicks = s.get('clicks', 0)
-                value = (clicks / shows) if shows > 0 else 0.0
+                shows = history['shows'].to_numpy(dtype=float)
+                values = np.where(shows > 0, history['clicks'].to_numpy(dtype=float) / shows, 0.0)
             elif metric == 'cpm':
-                shows = s.get('shows', 0)
-                spend = s.get('spend', 0)
-                value = (spend / shows * 1000) if shows > 0 else 0.0
+                shows = history['shows'].to_numpy(dtype=float)
+                values = np.where(shows > 0, history['spend'].to_numpy(dtype=float) / shows * 1000, 0.0)
             elif metric == 'cpc':
-                clicks = s.get('clicks', 0)
-                spend = s.get('spend', 0)
-                value = (spend / clicks) if clicks > 0 else float('inf')
+                clicks = history['clicks'].to_numpy(dtype=float)
+                values = np.where(clicks > 0, history['spend'].to_numpy(dtype=float) / clicks, np.inf)
             else:
-                value = s.get(metric, 0)
-            values.append(value)
-
-        alpha = 0.3
-        smoothed = [values[0]]
-        for i in range(1, len(values)):
-            smoothed.append(alpha * values[i] + (1 - alpha) * smoothed[-1])
-        return smoothed[-1] - smoothed[0]
-
-    def _check_statistical_significance(self, stats: List[Dict], metric: str = 'ctr') -> bool:
-        if len(stats) < 3 or sum(s.get('clicks', 0) for s in stats) < 2:
-            return False
-        try:
-            days = np.arange(len(stats))
+                values = history[metric].to_numpy(dtype=float)
+            trend = _smoothed_delta(layout.matrix(values), layout.size)
+        return pd.Series(trend, index=layout.clusters, name=f'{metric}_trend')
+
+    def check_statistical_significance(self, history: pd.DataFrame, metric: str = 'ctr') -> pd.Series:
+        """
+        Значимое падение метрики по дням (линейная регрессия, slope < 0 и p < stat_significance_level)
+        для каждого кластера. Для cpc дни без кликов пропускаются, а оставшиеся значения
+        ставятся на последние дни истории — как и при поштучном расчёте.
+        """
+        layout = _ClusterLayout(history)
+        shows = history['shows'].to_numpy(dtype=float)
+        clicks = history['clicks'].to_numpy(dtype=float)
+        spend = history['spend'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
             if metric == 'ctr':
-                values = [(s.get('clicks', 0) / s.get('shows', 1)) for s in stats]
+                values = clicks / shows
             elif metric == 'cpm':
-                values = [(s.get('spend', 0) / s.get('shows', 1) * 1000) for s in stats]
+                values = spend / shows * 1000
             elif metric == 'cpc':
-                values = [(s.get('spend', 0) / s.get('clicks', 1)) if s.get('clicks', 0) > 0 else float('inf') for s in
-                          stats]
-                values = [v for v in values if v < float('inf')]
+                values = np.where(clicks > 0, spend / clicks, np.inf)
             else:
-                values = [s.get(metric, 0) for s in stats]
-            if len(values) < 3:
-                return False
-            slope, _, p_value, _, _ = scipy_stats.linregress(days[-len(values):], values)
-            return slope < 0 and p_value < self.stat_significance_level
-        except Exception as e:
-            logger.error(f"Error in statistical analysis: {str(e)}")
-            return False
+                values = history[metric].to_numpy(dtype=float)
+            matrix = layout.matrix(values)
+            valid = layout.present & (matrix < np.inf) if metric == 'cpc' else layout.present
+            compact, count = _compact(matrix, valid)
+
+            mask = np.arange(layout.width) < count[:, None]
+            n = count.astype(float)
+            x = np.where(mask, (layout.size - count)[:, None] + np.arange(layout.width), 0.0)
+            y = np.where(mask, compact, 0.0)
+            dx = np.where(mask, x - (x.sum(axis=1) / n)[:, None], 0.0)
+            dy = np.where(mask, y - (y.sum(axis=1) / n)[:, None], 0.0)
+            ssxm = (dx * dx).sum(axis=1) / n
+            ssym = (dy * dy).sum(axis=1) / n
+            ssxym = (dx * dy).sum(axis=1) / n
+
+            r_den = np.sqrt(ssxm * ssym)
+            r = np.clip(np.where(r_den == 0.0, 0.0, ssxym / r_den), -1.0, 1.0)
+            slope = ssxym / ssxm
+            df = n - 2
+            tiny = 1.0e-20
+            t = r * np.sqrt(df / ((1.0 - r + tiny) * (1.0 + r + tiny)))
+            p_value = 2 * scipy_stats.t.sf(np.abs(t), df)
+
+        eligible = (layout.size >= 3) & (layout.total(clicks) >= 2) & (count >= 3)
+        significant = eligible & (slope < 0) & (p_value < self.stat_significance_level)
+        return pd.Series(significant, index=layout.clusters, name=f'{metric}_decline_significant')
+
+    def cluster_metrics(self, history: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Итоги, эффективность и тренды по всем кластерам истории; индекс — advertId."""
+        history = self.cluster_history if history is None else history
+        layout = _ClusterLayout(history)
+        total_shows = layout.total(history['shows'].to_numpy(dtype=float))
+        total_clicks = layout.total(history['clicks'].to_numpy(dtype=float))
+        total_spend = layout.total(history['spend'].to_numpy(dtype=float))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics = pd.DataFrame({
+                'total_shows': total_shows,
+                'total_clicks': total_clicks,
+                'total_spend': total_spend,
+                'ctr': np.where(total_shows > 0, total_clicks / total_shows, 0.0),
+                'cpc': np.where(total_clicks > 0, total_spend / total_clicks, np.inf),
+                'cpm': np.where(total_shows > 0, total_spend / total_shows * 1000, 0.0),
+            }, index=layout.clusters)
+        for column in ['shows', 'clicks', 'spend']:
+            if pd.api.types.is_integer_dtype(history[column]):
+                metrics[f'total_{column}'] = metrics[f'total_{column}'].astype('int64')
+
+        first_dates = history.index.get_level_values('date')[np.flatnonzero(layout.pos == 0)]
+        metrics['days_in_history'] = (pd.Timestamp(datetime.now()) - first_dates).days + 1
+        metrics['efficiency_score'] = self.compute_efficiency_scores(history)
+        for metric in ['clicks', 'ctr', 'cpm', 'cpc']:
+            metrics[f'{metric}_trend'] = self.compute_metric_trends(history, metric)
+        return metrics
+
+    def decide(self, metrics: pd.DataFrame) -> pd.DataFrame:
+        """Решения по кластерам из cluster_metrics; столбцы — как у результата analyze_cluster."""
+        shows = metrics['total_shows'].to_numpy(dtype=float)
+        cpc = metrics['cpc'].to_numpy(dtype=float)
+        cpm = metrics['cpm'].to_numpy(dtype=float)
+        efficiency = metrics['efficiency_score'].to_numpy(dtype=float)
+        click_trend = metrics['clicks_trend'].to_numpy(dtype=float)
+        ctr_trend = metrics['ctr_trend'].to_numpy(dtype=float)
+        median_cpc = self.median_metrics.get('cpc', 0.0)
+
+        count = len(metrics)
+        decision = np.full(count, 'keep', dtype=object)
+        reason = np.full(count, 'default', dtype=object)
+        bid_modifier = np.ones(count)
+
+        zero_shows = shows == 0
+        insufficient = ~zero_shows & (shows < 30)
+        warmup = ~zero_shows & ~insufficient & (metrics['days_in_history'].to_numpy() <= self.warmup_period_days)
+        ranked = ~zero_shows & ~insufficient & ~warmup
+        low_views = ranked & (shows < self.min_views)
+        normal = ranked & ~low_views
+
+        decision[insufficient] = 'insufficient_data'
+        reason[insufficient] = 'insufficient_data'
+        reason[warmup] = 'warmup_period'
+
+        low_views_keep = low_views & ((click_trend > 0) | (shows / self.min_views >= 0.5))
+        low_views_reduce = low_views & ~low_views_keep
+        reason[low_views_keep] = 'low_views_keep'
+        decision[low_views_reduce] = 'reduce_bid'
+        reason[low_views_reduce] = 'low_views'
+        bid_modifier[low_views_reduce] = 0.7
+
+        tiers = [efficiency < 0.8, efficiency < 1.3, efficiency <= 2.1]
+        decision[normal] = np.select(tiers, ['stop', 'reduce_bid', 'keep'], 'increase_bid')[normal]
+        reason[normal] = np.select(
+            tiers, ['low_efficiency', 'moderate_efficiency', 'good_efficiency'], 'high_efficiency'
+        )[normal]
+        bid_modifier[normal] = np.select(tiers, [1.0, 0.8, 1.0], 1.2)[normal]
+
+        positive = normal & ((click_trend > 0) | (ctr_trend > 0))
+        negative = normal & ~positive & (
+                (ctr_trend < -0.01) | (metrics['cpm_trend'].to_numpy() > 50) | (metrics['cpc_trend'].to_numpy() > median_cpc)
+        )
+        bid_modifier[positive] = np.minimum(bid_modifier[positive] * 1.1, 1.2)
+        reason[positive] = reason[positive] + ' (positive_trend)'
+        bid_modifier[negative] = np.maximum(bid_modifier[negative] * 0.9, 0.7)
+        reason[negative] = reason[negative] + ' (negative_trend)'
+
+        extreme_cpc = normal & (cpc < np.inf) & (cpc > median_cpc * 10)
+        extreme_cpm = normal & ~extreme_cpc & (self.max_cpm is not None) & (cpm > (self.max_cpm or 0))
+        decision[extreme_cpc | extreme_cpm] = 'stop'
+        reason[extreme_cpc] = 'extreme_high_cpc'
+        reason[extreme_cpm] = 'extreme_high_cpm'
+
+        result = pd.DataFrame({
+            'decision': decision,
+            'reason': reason,
+            'bid_modifier': bid_modifier,
+            'ctr': metrics['ctr'],
+            'cpc': metrics['cpc'].where(metrics['cpc'] < np.inf, 0.0),
+            'cpm': metrics['cpm'],
+            'total_shows': metrics['total_shows'],
+            'total_clicks': metrics['total_clicks'],
+            'total_spend': metrics['total_spend'],
+            'efficiency_score': metrics['efficiency_score'],
+        }, index=metrics.index)
+        # кластер без показов — результат по умолчанию
+        result.loc[zero_shows, ['ctr', 'cpc', 'cpm', 'total_shows', 'total_clicks', 'total_spend',
+                                'efficiency_score']] = 0
+        return result
 
     def analyze_cluster(self, advert_id: str) -> dict:
         default_result = {
@@ -249,96 +434,20 @@ class AdvancedKeywordOptimizer:
             'efficiency_score': 0.0
         }
 
-        if advert_id not in self.cluster_history:
+        if advert_id not in self.cluster_history.index.get_level_values('advertId'):
             logger.warning(f"Cluster {advert_id} not found in history")
             return default_result
 
         try:
-            stats = self.cluster_history[advert_id]
-            if not stats:
-                logger.warning(f"Empty stats for cluster {advert_id}")
-                return default_result
-
-            total_stats = {
-                'shows': sum(s.get('shows', 0) for s in stats),
-                'clicks': sum(s.get('clicks', 0) for s in stats),
-                'spend': sum(s.get('spend', 0) for s in stats)
-            }
-
-            if total_stats['shows'] == 0:
+            metrics = self.cluster_metrics(self.cluster_history.loc[[advert_id]])
+            result = self.decide(metrics).iloc[0].to_dict()
+            if metrics['total_shows'].iloc[0] == 0:
                 logger.warning(f"Cluster {advert_id} has zero shows, check data")
                 return default_result
 
-            ctr = total_stats['clicks'] / total_stats['shows'] if total_stats['shows'] > 0 else 0.0
-            cpc = total_stats['spend'] / total_stats['clicks'] if total_stats['clicks'] > 0 else float('inf')
-            cpm = (total_stats['spend'] / total_stats['shows'] * 1000) if total_stats['shows'] > 0 else 0.0
-            days_in_history = (datetime.now() - min(s.get('date') for s in stats if s.get('date'))).days + 1
-            efficiency_score = self.compute_efficiency_score(stats)
-            click_trend = self.compute_click_trend(stats)
-            ctr_trend = self.compute_metric_trend(stats, 'ctr')
-            cpm_trend = self.compute_metric_trend(stats, 'cpm')
-            cpc_trend = self.compute_metric_trend(stats, 'cpc')
-
-            result = {
-                **default_result,
-                'ctr': ctr,
-                'cpc': cpc if cpc < float('inf') else 0.0,
-                'cpm': cpm,
-                'total_shows': total_stats['shows'],
-                'total_clicks': total_stats['clicks'],
-                'total_spend': total_stats['spend'],
-                'efficiency_score': efficiency_score
-            }
-
-            if total_stats['shows'] < 30:
-                result.update({
-                    'decision': 'insufficient_data',
-                    'reason': 'insufficient_data',
-                    'bid_modifier': 1.0
-                })
-                logger.info(
-                    f"Cluster {advert_id}: insufficient data ({total_stats['shows']}<30), decision=insufficient_data")
-                return result
-
-            if days_in_history <= self.warmup_period_days:
-                result.update({
-                    'decision': 'keep',
-                    'reason': 'warmup_period',
-                    'bid_modifier': 1.0
-                })
-                logger.info(f"Cluster {advert_id}: in warmup period ({days_in_history} days), decision=keep")
-                return result
-
-            if total_stats['shows'] < self.min_views:
-                if click_trend > 0 or total_stats['shows'] / self.min_views >= 0.5:
-                    result.update({'reason': 'low_views_keep', 'decision': 'keep'})
-                else:
-                    result.update({'reason': 'low_views', 'decision': 'reduce_bid', 'bid_modifier': 0.7})
-            else:
-                if efficiency_score < 0.8:
-                    result.update({'reason': 'low_efficiency', 'decision': 'stop'})
-                elif efficiency_score < 1.3:
-                    result.update({'reason': 'moderate_efficiency', 'decision': 'reduce_bid', 'bid_modifier': 0.8})
-                elif efficiency_score <= 2.1:
-                    result.update({'decision': 'keep', 'reason': 'good_efficiency', 'bid_modifier': 1.0})
-                else:
-                    result.update({'decision': 'increase_bid', 'reason': 'high_efficiency', 'bid_modifier': 1.2})
-
-                if click_trend > 0 or ctr_trend > 0:
-                    result['bid_modifier'] = min(result['bid_modifier'] * 1.1, 1.2)
-                    result['reason'] = f"{result['reason']} (positive_trend)"
-                elif ctr_trend < -0.01 or cpm_trend > 50 or cpc_trend > self.median_metrics.get('cpc', 0.0):
-                    result['bid_modifier'] = max(result['bid_modifier'] * 0.9, 0.7)
-                    result['reason'] = f"{result['reason']} (negative_trend)"
-
-                if cpc < float('inf') and cpc > self.median_metrics.get('cpc', 0.0) * 10:
-                    result.update({'decision': 'stop', 'reason': 'extreme_high_cpc'})
-                elif self.max_cpm is not None and cpm > self.max_cpm:
-                    result.update({'decision': 'stop', 'reason': 'extreme_high_cpm'})
-
-            logger.info(f"Cluster {advert_id}: shows={total_stats['shows']}, clicks={total_stats['clicks']}, "
-                        f"ctr={ctr:.2%}, cpc={cpc:.2f}, cpm={cpm:.2f}, "
-                        f"efficiency_score={efficiency_score:.2f}, decision={result['decision']}, "
+            logger.info(f"Cluster {advert_id}: shows={result['total_shows']}, clicks={result['total_clicks']}, "
+                        f"ctr={result['ctr']:.2%}, cpc={metrics['cpc'].iloc[0]:.2f}, cpm={result['cpm']:.2f}, "
+                        f"efficiency_score={result['efficiency_score']:.2f}, decision={result['decision']}, "
                         f"reason={result['reason']}, bid_modifier={result['bid_modifier']:.2f}")
             return result
 
@@ -353,24 +462,19 @@ class AdvancedKeywordOptimizer:
                 return pd.DataFrame(columns=['advertId', 'decision', 'reason'])
 
             self.update_history(df)
-            results = []
-
-            for advert_id in self.cluster_history:
-                analysis = self.analyze_cluster(advert_id)
-                results.append({
-                    'advertId': advert_id,
-                    'days_in_history': (datetime.now() - min(
-                        s.get('date') for s in self.cluster_history[advert_id] if s.get('date'))).days + 1,
-                    **analysis
-                })
-
-            columns = [
-                'advertId', 'days_in_history', 'decision', 'reason',
-                'ctr', 'cpc', 'cpm', 'total_shows', 'total_clicks', 'total_spend',
-                'bid_modifier', 'efficiency_score'
-            ]
-            result_df = pd.DataFrame(results, columns=columns).sort_values('efficiency_score', ascending=False)
-            logger.info(f"Optimization completed, returned {len(result_df)} recommendations")
+            metrics = self.cluster_metrics()
+            results = self.decide(metrics)
+            results.insert(0, 'days_in_history', metrics['days_in_history'])
+
+            zero_shows = metrics.index[metrics['total_shows'] == 0]
+            if len(zero_shows):
+                logger.warning(f"{len(zero_shows)} clusters have zero shows, check data: {list(zero_shows[:10])}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Cluster decisions:\n{results.to_string()}")
+
+            result_df = results.reset_index()[RESULT_COLUMNS].sort_values('efficiency_score', ascending=False)
+            logger.info(f"Optimization completed, returned {len(result_df)} recommendations: "
+                        f"{result_df['decision'].value_counts().to_dict()}")
             return result_df
 
         except Exception as e:
@@ -385,15 +489,14 @@ class AdvancedKeywordOptimizer:
                 return df.copy()
 
             filtered_df = df.copy()
-            filtered_df['advertId'] = filtered_df['keyword'].apply(self._map_keyword_to_cluster)
+            filtered_df['advertId'] = self.map_keywords_to_clusters(filtered_df['keyword'])
             filtered_df = filtered_df.dropna(subset=['advertId'])
 
-            for _, row in optimization_df.iterrows():
-                mask = filtered_df['advertId'] == row['advertId']
-                if row['decision'] == 'stop':
-                    filtered_df = filtered_df[~mask]
-                else:
-                    filtered_df.loc[mask, 'spend'] *= row.get('bid_modifier', 1.0)
+            decisions = optimization_df.set_index('advertId')
+            filtered_df = filtered_df[filtered_df['advertId'].map(decisions['decision']) != 'stop']
+            if 'bid_modifier' in decisions.columns:
+                bid_modifier = filtered_df['advertId'].map(decisions['bid_modifier']).fillna(1.0)
+                filtered_df['spend'] = filtered_df['spend'] * bid_modifier
 
             logger.info(f"Filtering completed, returned {len(filtered_df)} records")
             return filtered_df
@@ -401,7 +504,3 @@ class AdvancedKeywordOptimizer:
         except Exception as e:
             logger.error(f"Error during filtering: {str(e)}")
             return df.copy()
-
-        except Exception as e:
-            logger.error(f"Error during filtering: {str(e)}")
-            return df.copy()
\ No newline at end of file
@@ -1,4 +1,5 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -7,6 +8,8 @@ import logging
 from typing import List, Optional, Dict
 from combo import WildberriesOptimizer
 from bandit import UCBBandit
+from bandit_snapshot import build_snapshot, invalidate_campaign, replay_bandit
+from data_cache import CacheKey, DEFAULT_PAGE_SIZE, Prefetcher, QueryCache, page_count, page_slice
 import json
 
 logging.basicConfig(
@@ -24,6 +27,36 @@ DEFAULT_MIN_VIEWS = 5
 DEFAULT_MIN_CTR = 0.005
 DEFAULT_MAX_CPC = 25.0
 DEFAULT_DAILY_BUDGET = 1000.0
+PREFETCH_AHEAD = 2  # сколько следующих кампаний списка предзагружать после оптимизации
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    return QueryCache()
+
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    return Prefetcher(get_query_cache())
+
+
+def load_optimization(token: str, campaign_id: str, start_date: str, end_date: str, min_views: int,
+                      min_ctr: float, max_cpc: float) -> tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """
+    Оптимизация кампании на отдельном WildberriesOptimizer: не обращается к st.session_state,
+    поэтому годится и для фоновой предзагрузки, и история кластеров не смешивается между кампаниями.
+    """
+    optimizer = WildberriesOptimizer(token=token, min_views=min_views, min_ctr=min_ctr, max_cpc=max_cpc)
+    campaign_id = int(campaign_id)
+    optimization_result = optimizer.optimize_campaign(campaign_id, start_date=start_date, end_date=end_date)
+    filtered_df = optimizer.filter_and_update_campaign(campaign_id, start_date=start_date, end_date=end_date)
+    return optimization_result, filtered_df
+
+
+def _has_optimization(result) -> bool:
+    optimization_result, _ = result
+    return optimization_result is not None and not optimization_result.empty
+
 
 class WildberriesOptimizerApp:
     def __init__(self):
@@ -135,9 +168,13 @@ class WildberriesOptimizerApp:
             if st.button("Применить настройки", key="apply_settings"):
                 self.apply_settings(api_key, start_date.isoformat(), end_date.isoformat(), min_views, min_ctr, max_cpc)
 
+            if st.button("Сбросить кэш кампании", key="clear_campaign_cache",
+                         disabled=not st.session_state.selected_campaign_id):
+                self.clear_campaign_cache(st.session_state.selected_campaign_id)
+
             if st.button("Сбросить кэш", key="clear_cache"):
-                st.cache_data.clear()
-                st.success("Кэш очищен!")
+                removed = get_query_cache().invalidate_token(st.session_state.api_key) if st.session_state.api_key else 0
+                st.success(f"Кэш очищен! Удалено записей: {removed}")
 
             st.markdown("---")
             st.header("📥 Экспорт")
@@ -209,20 +246,43 @@ class WildberriesOptimizerApp:
             st.session_state.api_initialized = False
             st.session_state.optimizer = None
 
-    @st.cache_data
-    def run_optimization(_self, campaign_id: str, start_date: str, end_date: str) -> tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    def clear_campaign_cache(self, campaign_id: str):
+        removed = get_query_cache().invalidate_campaign(st.session_state.api_key, campaign_id)
+        files = invalidate_campaign(str(campaign_id))
+        st.success(f"Кэш кампании {campaign_id} очищен: записей {removed}, файлов статистики {files}")
+        logger.info(f"Cache invalidated for campaign {campaign_id}: {removed} entries, {files} snapshot files")
+
+    def optimization_query(self, campaign_id: str, start_date: str, end_date: str):
+        """Ключ кэша и функция расчёта оптимизации кампании с текущими настройками сессии."""
+        args = (st.session_state.api_key, str(campaign_id), start_date, end_date,
+                st.session_state.min_views, st.session_state.min_ctr, st.session_state.max_cpc)
+        key = CacheKey.build(args[0], "optimization", [campaign_id], start_date, end_date,
+                             min_views=args[4], min_ctr=args[5], max_cpc=args[6])
+        return key, lambda: load_optimization(*args)
+
+    def prefetch_next_campaigns(self, campaign_id: str):
+        """Фоновая оптимизация PREFETCH_AHEAD кампаний, следующих за campaign_id в списке."""
+        campaign_list = [str(cid) for cid in st.session_state.campaign_list]
+        if str(campaign_id) not in campaign_list:
+            return
+        position = campaign_list.index(str(campaign_id))
+        prefetcher = get_prefetcher()
+        for next_id in campaign_list[position + 1: position + 1 + PREFETCH_AHEAD]:
+            key, compute = self.optimization_query(next_id, st.session_state.start_date, st.session_state.end_date)
+            if prefetcher.prefetch(key, compute, cache_if=_has_optimization):
+                logger.info(f"Prefetch queued for campaign {next_id}")
+
+    def run_optimization(self, campaign_id: str, start_date: str, end_date: str) -> tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
         if st.session_state.optimizer is None:
             logger.error("Optimizer is not initialized")
             st.error("Оптимизатор не инициализирован. Проверьте API ключ и настройки.")
             return None, None
 
         try:
-            campaign_id = int(campaign_id)
             logger.info(f"Running optimization for campaign {campaign_id} from {start_date} to {end_date}")
-            optimization_result = st.session_state.optimizer.optimize_campaign(campaign_id, start_date=start_date,
-                                                                               end_date=end_date)
-            filtered_df = st.session_state.optimizer.filter_and_update_campaign(campaign_id, start_date=start_date,
-                                                                                end_date=end_date)
+            key, compute = self.optimization_query(campaign_id, start_date, end_date)
+            optimization_result, filtered_df = get_query_cache().get_or_compute(key, compute,
+                                                                                cache_if=_has_optimization)
             if optimization_result is None or optimization_result.empty:
                 logger.warning(f"No optimization results for campaign {campaign_id}")
                 st.warning(
@@ -237,9 +297,28 @@ class WildberriesOptimizerApp:
             st.error(f"Ошибка оптимизации кампании {campaign_id}: {str(e)}")
             return None, None
 
-    @st.cache_data
-    def run_bandit(_self, campaign_ids: List[str], start_date: str, end_date: str, iterations: int, reward_metric: str,
-                   daily_budget: float, max_cpm_change: float = 0.3) -> tuple[List[Dict], Dict]:
+    def run_bandit(self, campaign_ids: List[str], start_date: str, end_date: str, iterations: int, reward_metric: str,
+                   daily_budget: float, max_cpm_change: float = 0.3, use_snapshot: bool = True,
+                   refresh_snapshot: bool = False) -> tuple[List[Dict], Dict]:
+        compute = lambda: self.compute_bandit(campaign_ids, start_date, end_date, iterations, reward_metric,
+                                              daily_budget, max_cpm_change, use_snapshot, refresh_snapshot)
+        if not use_snapshot:
+            # живой режим выбран ради свежих данных API — результат не кэшируется
+            return compute()
+        # refresh_snapshot пересчитывает результат и перезаписывает его в кэше
+        key = CacheKey.build(st.session_state.api_key, "bandit", campaign_ids, start_date, end_date,
+                             iterations=iterations, reward_metric=reward_metric, daily_budget=daily_budget,
+                             max_cpm_change=max_cpm_change)
+        return get_query_cache().get_or_compute(
+            key,
+            compute,
+            refresh=refresh_snapshot,
+            cache_if=lambda result: bool(result[0]),
+        )
+
+    def compute_bandit(self, campaign_ids: List[str], start_date: str, end_date: str, iterations: int,
+                       reward_metric: str, daily_budget: float, max_cpm_change: float = 0.3, use_snapshot: bool = True,
+                       refresh_snapshot: bool = False) -> tuple[List[Dict], Dict]:
         if st.session_state.optimizer is None:
             logger.error("Optimizer is not initialized")
             st.error("Оптимизатор не инициализирован. Проверьте API ключ и настройки.")
@@ -282,14 +361,25 @@ class WildberriesOptimizerApp:
                                max_cpm_change=max_cpm_change)
             recommendations = []
 
-            for i in range(iterations):
-                recommendation = bandit.recommend_action(
-                    wb_api=wb_api,
-                    start_date=start_date,
-                    end_date=end_date,
-                    max_days=30,
-                    campaign_info_dict=campaign_info_dict
+            if use_snapshot:
+                # статистика кампаний загружается один раз, итерации идут в памяти
+                snapshot = build_snapshot(wb_api, active_campaigns, start_date, end_date,
+                                          campaign_info_dict=campaign_info_dict, max_days=30,
+                                          refresh=refresh_snapshot)
+                raw_recommendations = replay_bandit(bandit, snapshot, iterations)
+            else:
+                raw_recommendations = (
+                    bandit.recommend_action(
+                        wb_api=wb_api,
+                        start_date=start_date,
+                        end_date=end_date,
+                        max_days=30,
+                        campaign_info_dict=campaign_info_dict
+                    )
+                    for _ in range(iterations)
                 )
+
+            for i, recommendation in enumerate(raw_recommendations):
                 if recommendation:
                     arm = recommendation['arm']
                     current_cpm = recommendation['current_cpm']
@@ -323,6 +413,17 @@ class WildberriesOptimizerApp:
             st.error(f"Ошибка выполнения бандита: {str(e)}")
             return [], {}
 
+    def paged(self, df: pd.DataFrame, key: str, page_size: int = DEFAULT_PAGE_SIZE) -> pd.DataFrame:
+        """Страница таблицы для вывода; если строк больше page_size — над таблицей выбор страницы."""
+        pages = page_count(len(df), page_size)
+        if pages == 1:
+            return df
+        # число страниц в ключе: при смене фильтров номер страницы сбрасывается
+        page = st.number_input(f"Страница (из {pages})", min_value=1, max_value=pages, value=1, step=1,
+                               key=f"page_{key}_{pages}")
+        st.caption(f"Строки {(page - 1) * page_size + 1}–{min(page * page_size, len(df))} из {len(df)}")
+        return page_slice(df, page, page_size)
+
     def download_results(self):
         if st.session_state.optimization_results:
             for campaign_id, result in st.session_state.optimization_results.items():
@@ -377,6 +478,7 @@ class WildberriesOptimizerApp:
                 st.session_state.filtered_dfs = {campaign_id: filtered_df}
                 if optimization_result is not None and not optimization_result.empty:
                     st.success(f"Оптимизация кампании {campaign_id} завершена!")
+                    self.prefetch_next_campaigns(campaign_id)
                 else:
                     st.error(
                         f"Не удалось выполнить оптимизацию для кампании {campaign_id}. Проверьте данные кампании или настройки (min_views={st.session_state.min_views}).")
@@ -494,7 +596,7 @@ class WildberriesOptimizerApp:
                         filtered_result = filtered_result[
                             filtered_result['advertId'].str.contains(keyword_search, case=False, na=False)]
 
-                table_data = filtered_result.copy()
+                table_data = self.paged(filtered_result, f"clusters_{campaign_id}").copy()
                 table_data = table_data.rename(columns={
                     'advertId': 'Кластер',
                     'total_shows': 'Показы',
@@ -523,6 +625,7 @@ class WildberriesOptimizerApp:
                 insufficient_data_clusters = filtered_result[filtered_result['decision'] == 'insufficient_data'].copy()
                 if not insufficient_data_clusters.empty:
                     st.subheader("Кластеры с недостаточными данными")
+                    insufficient_data_clusters = self.paged(insufficient_data_clusters, f"insufficient_{campaign_id}")
                     insufficient_table = insufficient_data_clusters[['advertId', 'total_shows', 'total_clicks', 'total_spend']].rename(
                         columns={
                             'advertId': 'Кластер',
@@ -659,6 +762,7 @@ class WildberriesOptimizerApp:
                 minus_clusters = recommendation_data[
                     recommendation_data['Рекомендация'].isin(['Убрать', 'Проверять'])].copy()
                 if not minus_clusters.empty:
+                    minus_clusters = self.paged(minus_clusters, f"minus_{campaign_id}")
                     minus_clusters = minus_clusters[['advertId', 'Рекомендация']].rename(columns={'advertId': 'Кластер'})
                     st.dataframe(
                         minus_clusters,
@@ -671,6 +775,7 @@ class WildberriesOptimizerApp:
                 st.subheader("Хорошие кластеры")
                 good_clusters = recommendation_data[recommendation_data['Рекомендация'] == 'Оставить'].copy()
                 if not good_clusters.empty:
+                    good_clusters = self.paged(good_clusters, f"good_{campaign_id}")
                     good_clusters = good_clusters[['advertId', 'Рекомендация']].rename(columns={'advertId': 'Кластер'})
                     st.dataframe(
                         good_clusters,
@@ -712,6 +817,19 @@ class WildberriesOptimizerApp:
             )
             max_cpm_change = max_cpm_change_percent / 100.0
             st.write(f"Текущее ограничение изменения CPM: ±{max_cpm_change_percent}%")
+            use_snapshot = st.checkbox(
+                "Воспроизведение по снимку статистики",
+                value=True,
+                help="Статистика кампаний загружается из API один раз (прошедшие даты кэшируются на диске), "
+                     "итерации бандита выполняются в памяти. Без флажка каждая итерация обращается к API, "
+                     "а результат не кэшируется."
+            )
+            refresh_snapshot = st.checkbox(
+                "Обновить снимок",
+                value=False,
+                disabled=not use_snapshot,
+                help="Перезапросить статистику из API, не используя кэш на диске."
+            )
 
             if st.button("Сбросить исходные CPM", key="reset_initial_cpm"):
                 if hasattr(st.session_state, 'optimizer') and st.session_state.optimizer:
@@ -737,7 +855,9 @@ class WildberriesOptimizerApp:
                     iterations,
                     reward_metric,
                     daily_budget,
-                    max_cpm_change
+                    max_cpm_change,
+                    use_snapshot,
+                    refresh_snapshot
                 )
                 st.session_state.bandit_results = recommendations
                 st.session_state.bandit_stats = stats
@@ -754,7 +874,7 @@ class WildberriesOptimizerApp:
         recommendations_df = pd.DataFrame(st.session_state.bandit_results)
         if not recommendations_df.empty:
             st.dataframe(
-                recommendations_df[
+                self.paged(recommendations_df, "bandit_recommendations")[
                     ['arm', 'reward', 'metric', 'current_cpm', 'recommended_cpm', 'cpm_adjustment', 'recommendation']],
                 use_container_width=True,
                 column_config={
@@ -772,7 +892,7 @@ class WildberriesOptimizerApp:
         stats_df = pd.DataFrame.from_dict(st.session_state.bandit_stats, orient='index')
         stats_df.index.name = 'campaign_id'
         st.dataframe(
-            stats_df,
+            self.paged(stats_df, "bandit_stats"),
             use_container_width=True,
             column_config={
                 "pulls": st.column_config.NumberColumn("Выборы"),
@@ -807,16 +927,18 @@ class WildberriesOptimizerApp:
                     marker=dict(size=10, color='red')
                 )
             )
-            for _, row in recommendations_df.iterrows():
-                fig.add_trace(
-                    go.Scatter(
-                        x=[row['current_cpm'], row['recommended_cpm']],
-                        y=[row['reward'], row['reward']],
-                        mode='lines',
-                        showlegend=False,
-                        line=dict(color='gray', dash='dash')
-                    )
+            # все отрезки «текущий → рекомендуемый CPM» одним следом, разделённые NaN
+            gaps = np.full(len(recommendations_df), np.nan)
+            fig.add_trace(
+                go.Scatter(
+                    x=np.column_stack([recommendations_df['current_cpm'], recommendations_df['recommended_cpm'],
+                                       gaps]).ravel(),
+                    y=np.column_stack([recommendations_df['reward'], recommendations_df['reward'], gaps]).ravel(),
+                    mode='lines',
+                    showlegend=False,
+                    line=dict(color='gray', dash='dash')
                 )
+            )
             fig.update_layout(
                 xaxis_title="CPM (руб.)",
                 yaxis_title="CTR (%)",
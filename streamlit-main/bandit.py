@@ -1,11 +1,30 @@
 from wb_api import WildberriesAPI
 import math
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+STATS_COLUMNS = ["views", "clicks", "sum", "ctr"]
+
+
+def stats_frame(stats: Optional[List[Dict]]) -> pd.DataFrame:
+    """
+    Строки статистики API (ключевые фразы или fullstats) → столбцы views / clicks / sum / ctr.
+    Отсутствующие поля заполняются так же, как раньше в цикле: views=1, остальные 0.
+    """
+    stats = stats or []
+    defaults = {"views": 1, "clicks": 0, "sum": 0.0, "ctr": 0.0}
+    return pd.DataFrame(
+        {col: [stat.get(col, default) for stat in stats] for col, default in defaults.items()},
+        columns=STATS_COLUMNS,
+        dtype=float,
+    )
+
+
 class UCBBandit:
     """
     UCB1 Многорукий бандит для управления рекламными кампаниями Wildberries.
@@ -152,43 +171,9 @@ class UCBBandit:
                 max_start_date = max_end_date - timedelta(days=max_days - 1)
                 stats = wb_api.get_stats_keywords(int(selected_arm), start_date=max_start_date.isoformat(), end_date=max_end_date.isoformat())
 
-            total_clicks = 0
-            total_views = 0
-            total_sum = 0.0
-            calculated_cpm = 0.0
-            ctr = 0.0
-
             if stats:
                 logger.info(f"Получены данные по ключевым словам для кампании {selected_arm}")
-                total_reward = 0.0
-                count = 0
-                for stat in stats:
-                    clicks = stat.get("clicks", 0)
-                    views = stat.get("views", 1)
-                    stat_sum = stat.get("sum", 0.0)
-                    total_clicks += clicks
-                    total_views += views
-                    total_sum += stat_sum
-                    if self.reward_metric == "ctr":
-                        total_reward += stat.get("ctr", 0.0)
-                    elif self.reward_metric == "clicks":
-                        total_reward += clicks
-                    elif self.reward_metric == "sum":
-                        total_reward += stat_sum
-                    elif self.reward_metric == "cpm":
-                        calculated_cpm = (stat_sum / views * 1000) if views > 0 else 0.0
-                        total_reward += 1000 / (calculated_cpm + 1)
-                    elif self.reward_metric == "ctr/cpm":
-                        ctr = (clicks / views * 100) if views > 0 else 0.0
-                        calculated_cpm = (stat_sum / views * 1000) if views > 0 else 0.0
-                        total_reward += ctr / (calculated_cpm + 1)
-                    count += 1
-                    logger.debug(f"Ключевое слово: {stat.get('keyword')}, {self.reward_metric}={stat.get(self.reward_metric, 0.0)}")
-                
-                reward = total_reward / count if count > 0 else 0.0
-                if total_views > 0:
-                    calculated_cpm = (total_sum / total_views * 1000)
-                    ctr = (total_clicks / total_views * 100)
+                frame, source = stats_frame(stats), "keywords"
             else:
                 logger.info(f"Кампания {selected_arm} (type={campaign_type}): используем get_campaign_stats")
                 stats = wb_api.get_campaign_stats(int(selected_arm), start_date, end_date)
@@ -200,85 +185,12 @@ class UCBBandit:
                         self.arms.remove(selected_arm)
                     self.update(selected_arm, 0.0, current_cpm)
                     return {"arm": selected_arm, "reward": 0.0, "metric": self.reward_metric, "current_cpm": current_cpm, "recommended_cpm": 0.0, "recommendation": f"Нет данных для кампании {selected_arm}"}
+                frame, source = stats_frame(stats), "campaign"
 
-                total_reward = 0.0
-                count = 0
-                for stat in stats:
-                    clicks = stat.get("clicks", 0)
-                    views = stat.get("views", 1)
-                    stat_sum = stat.get("sum", 0.0)
-                    total_clicks += clicks
-                    total_views += views
-                    total_sum += stat_sum
-                    if self.reward_metric == "ctr":
-                        total_reward += (clicks / views * 100) if views > 0 else 0.0
-                    elif self.reward_metric == "clicks":
-                        total_reward += clicks
-                    elif self.reward_metric == "sum":
-                        total_reward += stat_sum
-                    elif self.reward_metric == "cpm":
-                        calculated_cpm = (stat_sum / views * 1000) if views > 0 else 0.0
-                        total_reward += 1000 / (calculated_cpm + 1)
-                    elif self.reward_metric == "ctr/cpm":
-                        ctr = (clicks / views * 100) if views > 0 else 0.0
-                        calculated_cpm = (stat_sum / views * 1000) if views > 0 else 0.0
-                        total_reward += ctr / (calculated_cpm + 1)
-                    count += 1
-                    logger.debug(f"Статистика кампании: {stat}")
-                
-                reward = total_reward / count if count > 0 else 0.0
-                if total_views > 0:
-                    calculated_cpm = (total_sum / total_views * 1000)
-                    ctr = (total_clicks / total_views * 100)
-
-            if not current_cpm and total_views > 0:
-                current_cpm = calculated_cpm
-                if self.initial_cpms[selected_arm] is None:
-                    self.initial_cpms[selected_arm] = current_cpm
-                    logger.info(f"Зафиксирован исходный CPM для {selected_arm}: {current_cpm:.2f}")
-
-            recommended_cpm = current_cpm
-            if total_views > 0 and self.daily_budget:
-                recommended_cpm = min(calculated_cpm, self.daily_budget)
-                if self.reward_metric in ["ctr", "ctr/cpm"] and ctr > 0:
-                    efficiency = ctr / (calculated_cpm + 1)
-                    if efficiency > 0.008:
-                        recommended_cpm = min(calculated_cpm * 1.15, self.daily_budget) 
-                    elif efficiency < 0.006:
-                        recommended_cpm = max(calculated_cpm * 0.85, 50.0)  
-                elif self.reward_metric == "ctr/cpm":
-                    efficiency = ctr / (calculated_cpm + 1)
-                    if efficiency > 0.008:
-                        recommended_cpm = min(calculated_cpm * (1 + efficiency * 10), self.daily_budget)
-                    elif efficiency < 0.006:
-                        recommended_cpm = max(calculated_cpm * (1 - efficiency * 10), 50.0)
-
-                if self.initial_cpms[selected_arm] is not None:
-                    min_cpm = self.initial_cpms[selected_arm] * (1 - self.max_cpm_change)
-                    max_cpm = self.initial_cpms[selected_arm] * (1 + self.max_cpm_change)
-                    recommended_cpm = min(max(recommended_cpm, min_cpm), max_cpm)
-                    logger.debug(f"Кампания {selected_arm}: Исходный CPM={self.initial_cpms[selected_arm]:.2f}, Ограничение CPM: min={min_cpm:.2f}, max={max_cpm:.2f}, recommended={recommended_cpm:.2f}")
-
-            if self.daily_budget and calculated_cpm > self.daily_budget:
-                penalty = max(0.5, self.daily_budget / calculated_cpm)
-                reward *= penalty
-                logger.warning(f"Кампания {selected_arm} превышает бюджет: CPM={calculated_cpm:.2f}, бюджет={self.daily_budget}, штраф={penalty:.2f}")
-
-            self.update(selected_arm, reward, calculated_cpm)
-            recommendation = f"Приоритет кампании {selected_arm} с {self.reward_metric}={reward:.4f}, CPM={calculated_cpm:.2f}"
-            if reward == 0.0:
-                recommendation = f"Кампания {selected_arm} не имеет активности, рассмотрите её оптимизацию"
-
+            result, calculated_cpm = self.evaluate(selected_arm, current_cpm, frame, source)
+            self.update(selected_arm, result["reward"], calculated_cpm)
             self.failed_attempts[selected_arm] = 0
-
-            return {
-                "arm": selected_arm,
-                "reward": reward,
-                "metric": self.reward_metric,
-                "current_cpm": current_cpm,
-                "recommended_cpm": recommended_cpm,
-                "recommendation": recommendation
-            }
+            return result
 
         except Exception as e:
             logger.error(f"Ошибка при получении статистики для рычага {selected_arm}: {e}")
@@ -289,6 +201,109 @@ class UCBBandit:
             self.update(selected_arm, 0.0, current_cpm)
             return {"arm": selected_arm, "reward": 0.0, "metric": self.reward_metric, "current_cpm": current_cpm, "recommended_cpm": 0.0, "recommendation": f"Ошибка данных для кампании {selected_arm}"}
 
+    def stats_reward(self, frame: pd.DataFrame, source: str) -> Tuple[float, float, float, float]:
+        """
+        Награда и агрегаты по статистике кампании (векторно по строкам frame).
+
+        Args:
+            frame: Статистика (см. stats_frame).
+            source: 'keywords' — статистика ключевых фраз (CTR берётся из API), 'campaign' — fullstats.
+
+        Returns:
+            (награда, всего показов, CPM по сумме, CTR по сумме в %).
+        """
+        views = frame["views"].to_numpy(dtype=float)
+        clicks = frame["clicks"].to_numpy(dtype=float)
+        spent = frame["sum"].to_numpy(dtype=float)
+        if np.isnan(views).any() or np.isnan(clicks).any() or np.isnan(spent).any():
+            raise ValueError("в статистике есть пустые значения views / clicks / sum")
+        safe_views = np.where(views > 0, views, 1.0)
+        row_cpm = np.where(views > 0, spent / safe_views * 1000, 0.0)
+        row_ctr = np.where(views > 0, clicks / safe_views * 100, 0.0)
+
+        if self.reward_metric == "ctr":
+            row_reward = frame["ctr"].to_numpy(dtype=float) if source == "keywords" else row_ctr
+            if np.isnan(row_reward).any():
+                raise ValueError("в статистике есть пустые значения ctr")
+        elif self.reward_metric == "clicks":
+            row_reward = clicks
+        elif self.reward_metric == "sum":
+            row_reward = spent
+        elif self.reward_metric == "cpm":
+            row_reward = 1000 / (row_cpm + 1)
+        else:  # ctr/cpm
+            row_reward = row_ctr / (row_cpm + 1)
+
+        count = len(frame)
+        reward = float(row_reward.sum()) / count if count > 0 else 0.0
+        total_views = float(views.sum())
+        calculated_cpm = 0.0
+        ctr = 0.0
+        if count and self.reward_metric in ("cpm", "ctr/cpm"):
+            # как в прежнем цикле: при нулевых показах остаются значения последней строки
+            calculated_cpm = float(row_cpm[-1])
+            ctr = float(row_ctr[-1]) if self.reward_metric == "ctr/cpm" else 0.0
+        if total_views > 0:
+            calculated_cpm = float(spent.sum()) / total_views * 1000
+            ctr = float(clicks.sum()) / total_views * 100
+        return reward, total_views, calculated_cpm, ctr
+
+    def evaluate(self, selected_arm: str, current_cpm: float, frame: pd.DataFrame, source: str) -> Tuple[Dict, float]:
+        """
+        Рекомендация по статистике кампании без обращения к API и без update().
+        Общая для живого режима (recommend_action) и воспроизведения снимка (bandit_snapshot).
+
+        Returns:
+            (словарь рекомендации, CPM для update()).
+        """
+        reward, total_views, calculated_cpm, ctr = self.stats_reward(frame, source)
+
+        if not current_cpm and total_views > 0:
+            current_cpm = calculated_cpm
+            if self.initial_cpms[selected_arm] is None:
+                self.initial_cpms[selected_arm] = current_cpm
+                logger.info(f"Зафиксирован исходный CPM для {selected_arm}: {current_cpm:.2f}")
+
+        recommended_cpm = current_cpm
+        if total_views > 0 and self.daily_budget:
+            recommended_cpm = min(calculated_cpm, self.daily_budget)
+            if self.reward_metric in ["ctr", "ctr/cpm"] and ctr > 0:
+                efficiency = ctr / (calculated_cpm + 1)
+                if efficiency > 0.008:
+                    recommended_cpm = min(calculated_cpm * 1.15, self.daily_budget) 
+                elif efficiency < 0.006:
+                    recommended_cpm = max(calculated_cpm * 0.85, 50.0)  
+            elif self.reward_metric == "ctr/cpm":
+                efficiency = ctr / (calculated_cpm + 1)
+                if efficiency > 0.008:
+                    recommended_cpm = min(calculated_cpm * (1 + efficiency * 10), self.daily_budget)
+                elif efficiency < 0.006:
+                    recommended_cpm = max(calculated_cpm * (1 - efficiency * 10), 50.0)
+
+            if self.initial_cpms[selected_arm] is not None:
+                min_cpm = self.initial_cpms[selected_arm] * (1 - self.max_cpm_change)
+                max_cpm = self.initial_cpms[selected_arm] * (1 + self.max_cpm_change)
+                recommended_cpm = min(max(recommended_cpm, min_cpm), max_cpm)
+                logger.debug(f"Кампания {selected_arm}: Исходный CPM={self.initial_cpms[selected_arm]:.2f}, Ограничение CPM: min={min_cpm:.2f}, max={max_cpm:.2f}, recommended={recommended_cpm:.2f}")
+
+        if self.daily_budget and calculated_cpm > self.daily_budget:
+            penalty = max(0.5, self.daily_budget / calculated_cpm)
+            reward *= penalty
+            logger.warning(f"Кампания {selected_arm} превышает бюджет: CPM={calculated_cpm:.2f}, бюджет={self.daily_budget}, штраф={penalty:.2f}")
+
+        recommendation = f"Приоритет кампании {selected_arm} с {self.reward_metric}={reward:.4f}, CPM={calculated_cpm:.2f}"
+        if reward == 0.0:
+            recommendation = f"Кампания {selected_arm} не имеет активности, рассмотрите её оптимизацию"
+
+        return {
+            "arm": selected_arm,
+            "reward": reward,
+            "metric": self.reward_metric,
+            "current_cpm": current_cpm,
+            "recommended_cpm": recommended_cpm,
+            "recommendation": recommendation
+        }, calculated_cpm
+
     def get_arm_stats(self) -> Dict:
         """
         Возвращает статистику по всем рычагам.
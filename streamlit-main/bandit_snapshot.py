@@ -0,0 +1,235 @@
+"""
+Снимок статистики кампаний для UCB-бандита и воспроизведение итераций в памяти.
+
+В живом режиме каждая итерация UCBBandit.recommend_action заново ходит в API WB
+(ставка, статистика по ключевым фразам с паузой 1 с на каждые 7 дней, fullstats)
+за одним и тем же окном дат — 100 итераций занимают минуты и тратят квоту.
+
+Здесь данные каждой кампании загружаются один раз (параллельно, build_snapshot)
+в CampaignSnapshot — те же запросы и в том же порядке отступления, что и в
+recommend_action. Статистика за прошедшие даты сохраняется на диск в parquet
+(SNAPSHOT_DIR, ключ — кампания, источник и окно дат) и при повторном запуске
+не запрашивается. replay_bandit прогоняет итерации бандита по снимку:
+исход рычага считается один раз (UCBBandit.evaluate), выбор рычага UCB —
+векторно в numpy. Результаты совпадают с живым режимом на тех же данных.
+"""
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bandit import STATS_COLUMNS, UCBBandit, stats_frame
+from wb_api import WildberriesAPI
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / ".snapshot_cache"
+DEFAULT_WORKERS = 4
+MAX_FAILED_ATTEMPTS = 3
+
+
+@dataclass
+class CampaignSnapshot:
+    """
+    Данные одной кампании для бандита. stats=None — статистики нет ни в одном источнике;
+    error=True — загрузка упала (в живом режиме это ветка «Ошибка данных»).
+    """
+    arm: str
+    campaign: Optional[Dict]
+    current_cpm: float = 0.0
+    stats: Optional[pd.DataFrame] = None
+    source: Optional[str] = None  # 'keywords' или 'campaign'
+    error: bool = False
+
+
+# ───────────────────────────── кэш на диске ─────────────────────────────
+
+def _cache_path(cache_dir: Path, arm: str, source: str, start_date: str, end_date: str) -> Path:
+    return cache_dir / f"{arm}_{source}_{start_date}_{end_date}.parquet"
+
+
+def _cached_stats(fetch, cache_dir: Optional[Path], arm: str, source: str, start_date: str, end_date: str,
+                  refresh: bool) -> pd.DataFrame:
+    """
+    Статистика за окно из parquet-кэша или из API (fetch() → список словарей).
+    В кэш пишутся только непустые окна, целиком лежащие в прошлом: данные за
+    сегодня ещё меняются, а пустой ответ может быть временной ошибкой API.
+    """
+    path = _cache_path(cache_dir, arm, source, start_date, end_date) if cache_dir else None
+    if path is not None and not refresh and path.exists():
+        return pd.read_parquet(path, columns=STATS_COLUMNS)
+
+    frame = stats_frame(fetch())
+    if path is not None and not frame.empty and date.fromisoformat(end_date) < date.today():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        frame.to_parquet(path, index=False)
+    return frame
+
+
+def invalidate_campaign(arm: str, cache_dir: Path = SNAPSHOT_DIR) -> int:
+    """Удаляет кэш статистики кампании на диске; возвращает число удалённых файлов."""
+    removed = 0
+    for path in cache_dir.glob(f"{arm}_*.parquet"):
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+# ───────────────────────────── загрузка снимка ─────────────────────────────
+
+def _load_campaign(wb_api: WildberriesAPI, arm: str, campaign: Optional[Dict], start_date: str, end_date: str,
+                   days: int, max_days: int, cache_dir: Optional[Path], refresh: bool) -> CampaignSnapshot:
+    """Те же запросы, что recommend_action делает для выбранного рычага, но один раз."""
+    snapshot = CampaignSnapshot(arm=arm, campaign=campaign)
+    if campaign is None or campaign.get("status") in [7, 11]:
+        return snapshot
+
+    advert_id = int(arm)
+    try:
+        current_cpm = campaign.get("autoParams", {}).get("cpm", 0.0)
+        if not current_cpm:
+            current_cpm = wb_api.get_campaign_bid(advert_id) or 0.0
+        snapshot.current_cpm = current_cpm
+
+        stats = _cached_stats(lambda: wb_api.get_stats_keywords(advert_id, start_date=start_date, end_date=end_date),
+                              cache_dir, arm, "keywords", start_date, end_date, refresh)
+        if stats.empty and days < max_days:
+            max_end = (datetime.now().date() - timedelta(days=1)).isoformat()
+            max_start = (datetime.now().date() - timedelta(days=max_days)).isoformat()
+            stats = _cached_stats(lambda: wb_api.get_stats_keywords(advert_id, start_date=max_start, end_date=max_end),
+                                  cache_dir, arm, "keywords", max_start, max_end, refresh)
+        if not stats.empty:
+            snapshot.stats, snapshot.source = stats, "keywords"
+            return snapshot
+
+        stats = _cached_stats(lambda: wb_api.get_campaign_stats(advert_id, start_date, end_date),
+                              cache_dir, arm, "fullstats", start_date, end_date, refresh)
+        if not stats.empty:
+            snapshot.stats, snapshot.source = stats, "campaign"
+    except Exception as e:
+        logger.error(f"Ошибка загрузки снимка для кампании {arm}: {e}")
+        snapshot.error = True
+    return snapshot
+
+
+def build_snapshot(wb_api: WildberriesAPI, arms: List[str], start_date: str, end_date: str,
+                   campaign_info_dict: Optional[Dict] = None, days: int = 7, max_days: int = 30,
+                   max_workers: int = DEFAULT_WORKERS, cache_dir: Optional[Path] = SNAPSHOT_DIR,
+                   refresh: bool = False) -> Dict[str, CampaignSnapshot]:
+    """
+    Снимок по всем рычагам: кампании грузятся параллельно (max_workers потоков),
+    статистика прошедших дат берётся из parquet-кэша (refresh=True — перезапросить).
+    """
+    campaign_info_dict = dict(campaign_info_dict or {})
+    missing = [int(arm) for arm in arms if str(arm) not in campaign_info_dict]
+    if missing:
+        for campaign in wb_api.get_campaigns_info(missing) or []:
+            if campaign.get("advertId"):
+                campaign_info_dict[str(campaign["advertId"])] = campaign
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            arm: executor.submit(_load_campaign, wb_api, arm, campaign_info_dict.get(str(arm)),
+                                 start_date, end_date, days, max_days, cache_dir, refresh)
+            for arm in arms
+        }
+        snapshot = {arm: future.result() for arm, future in futures.items()}
+    logger.info(f"Снимок загружен: {sum(s.stats is not None for s in snapshot.values())} из {len(arms)} кампаний со статистикой")
+    return snapshot
+
+
+# ───────────────────────────── воспроизведение ─────────────────────────────
+
+def _outcome(bandit: UCBBandit, snap: CampaignSnapshot):
+    """
+    Исход выбора рычага по снимку: (вид, рекомендация, CPM для update).
+    Вид: 'ok', 'no_stats' и 'error' (считаются в исключение рычага), 'skip' (неактивна / нет информации).
+    Исход не зависит от номера итерации: исходный CPM фиксируется при первом вычислении.
+    """
+    arm = snap.arm
+    empty = {"arm": arm, "reward": 0.0, "metric": bandit.reward_metric, "current_cpm": 0.0, "recommended_cpm": 0.0}
+    if snap.campaign is None:
+        return "skip", {**empty, "recommendation": f"Не удалось получить информацию о кампании {arm}"}, None
+    if snap.campaign.get("status") in [7, 11]:
+        return "skip", {**empty, "recommendation": f"Кампания {arm} неактивна, пропустите"}, None
+
+    current_cpm = snap.current_cpm
+    if bandit.initial_cpms[arm] is None and current_cpm > 0:
+        bandit.initial_cpms[arm] = current_cpm
+    error = {**empty, "current_cpm": current_cpm, "recommendation": f"Ошибка данных для кампании {arm}"}
+    if snap.error:
+        return "error", error, current_cpm
+    if snap.stats is None:
+        return "no_stats", {**empty, "current_cpm": current_cpm,
+                            "recommendation": f"Нет данных для кампании {arm}"}, current_cpm
+    try:
+        result, calculated_cpm = bandit.evaluate(arm, current_cpm, snap.stats, snap.source)
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики для рычага {arm}: {e}")
+        return "error", error, current_cpm
+    return "ok", result, calculated_cpm
+
+
+def replay_bandit(bandit: UCBBandit, snapshot: Dict[str, CampaignSnapshot], iterations: int) -> List[Dict]:
+    """
+    iterations итераций recommend_action по снимку, без обращений к API.
+    Состояние бандита (counts, rewards, cpms, arms, total_pulls) обновляется так же, как в живом режиме.
+    """
+    arms = list(bandit.arms)
+    n = len(arms)
+    counts = np.array([bandit.counts[a] for a in arms], dtype=float)
+    rewards = np.array([bandit.rewards[a] for a in arms], dtype=float)
+    cpms = np.array([bandit.cpms[a] for a in arms], dtype=float)
+    active = np.ones(n, dtype=bool)
+    failed = np.array([getattr(bandit, "failed_attempts", {}).get(a, 0) for a in arms], dtype=int)
+    outcomes: Dict[int, tuple] = {}
+    results = []
+
+    for _ in range(iterations):
+        if not active.any():
+            results.append({"arm": None, "reward": 0.0, "metric": bandit.reward_metric, "current_cpm": 0.0,
+                            "recommended_cpm": 0.0, "recommendation": "Нет активных кампаний для анализа"})
+            continue
+
+        bandit.total_pulls += 1
+        unexplored = np.flatnonzero(active & (counts == 0))
+        if unexplored.size:
+            i = int(unexplored[0])
+        else:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ucb = rewards / counts + np.sqrt(3 * math.log(bandit.total_pulls) / counts)
+            if bandit.daily_budget:
+                ucb = np.where((cpms > 0) & (cpms > bandit.daily_budget), ucb * 0.1, ucb)
+            i = int(np.argmax(np.where(active, ucb, -np.inf)))
+
+        if i not in outcomes:
+            outcomes[i] = _outcome(bandit, snapshot.get(arms[i]) or CampaignSnapshot(arms[i], None))
+        kind, result, cpm = outcomes[i]
+
+        if kind == "ok":
+            failed[i] = 0
+        else:
+            failed[i] += 1
+            if kind in ("no_stats", "error") and failed[i] >= MAX_FAILED_ATTEMPTS:
+                # как в recommend_action: рычаг исключается до update, выбор не засчитывается
+                active[i] = False
+        if active[i]:
+            counts[i] += 1
+            rewards[i] += result["reward"]
+            if cpm is not None:
+                cpms[i] = cpm if counts[i] == 1 else (cpms[i] * (counts[i] - 1) + cpm) / counts[i]
+        results.append(dict(result))
+
+    for i, arm in enumerate(arms):
+        bandit.counts[arm] = int(counts[i])
+        bandit.rewards[arm] = float(rewards[i])
+        bandit.cpms[arm] = float(cpms[i])
+    bandit.failed_attempts = {arm: int(failed[i]) for i, arm in enumerate(arms)}
+    bandit.arms = [arm for i, arm in enumerate(arms) if active[i]]
+    return results
@@ -0,0 +1,185 @@
+"""
+Бенчмарк AdvancedKeywordOptimizer (ako.py) на синтетической кампании.
+
+Генерируется статистика по ключевым фразам за --days дней: --keywords фраз,
+разложенных по --clusters кластерам (у части фраз — пропуски по дням и дни
+без кликов, у части кластеров — короткая история). Замеряются optimize и
+filter_dataframe на свежем оптимизаторе, а также проверка значимости
+(check_statistical_significance) для ctr / cpm / cpc.
+
+С --baseline PATH тот же прогон делается на другой версии ako.py (например,
+до перехода на столбцовую историю) и результаты сверяются: решения и причины —
+точно, числа — с относительной точностью 1e-9.
+
+Запуск (из streamlit-main):
+    git show <ревизия>:streamlit-main/ako.py > /tmp/ako_baseline.py
+    python benchmarks/bench_ako_history.py --keywords 10000 --baseline /tmp/ako_baseline.py
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+NUMERIC_COLUMNS = ['days_in_history', 'ctr', 'cpc', 'cpm', 'total_shows', 'total_clicks', 'total_spend',
+                   'bid_modifier', 'efficiency_score']
+
+
+def synthetic_campaign(keywords: int, clusters: int, days: int, seed: int):
+    """Статистика в формате combo.py (date, keyword, shows, clicks, spend, ctr, advertId) и раскладка по кластерам."""
+    rng = np.random.default_rng(seed)
+    end = date.today() - timedelta(days=1)
+    dates = np.array([(end - timedelta(days=back)).isoformat() for back in range(days)][::-1])
+
+    keyword_ids = np.repeat(np.arange(keywords), days)
+    day_ids = np.tile(np.arange(days), keywords)
+    # у четверти фраз история короче (новые фразы), 10% дней пропущены
+    first_day = np.where(rng.random(keywords) < 0.25, rng.integers(0, days, keywords), 0)
+    keep = (day_ids >= first_day[keyword_ids]) & (rng.random(len(day_ids)) > 0.1)
+    keyword_ids, day_ids = keyword_ids[keep], day_ids[keep]
+
+    popularity = rng.lognormal(2.0, 1.2, keywords)
+    shows = rng.poisson(popularity[keyword_ids]) + 1
+    clicks = rng.binomial(shows, rng.uniform(0.002, 0.08, keywords)[keyword_ids])
+    spend = np.round(shows * rng.uniform(0.05, 0.6, keywords)[keyword_ids], 2)
+
+    names = np.array([f"фраза {i}" for i in range(keywords)])
+    mapping = {f"фраза {i}": f"кластер {i % clusters}" for i in range(keywords)}
+    df = pd.DataFrame({
+        'date': dates[day_ids],
+        'keyword': names[keyword_ids],
+        'shows': shows,
+        'clicks': clicks,
+        'spend': spend,
+    })
+    df['ctr'] = df['clicks'] / df['shows'].replace(0, 1)
+    df['advertId'] = df['keyword'].map(mapping)
+    return df, mapping
+
+
+def _timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def run(module, df: pd.DataFrame, mapping: dict, metrics, vectorized: bool) -> dict:
+    optimizer = module.AdvancedKeywordOptimizer(min_views=5, min_ctr=0.005, max_cpc=25.0, cluster_mapping=mapping)
+    result, t_optimize = _timed(optimizer.optimize, df)
+
+    def significance():
+        if vectorized:
+            return {m: optimizer.check_statistical_significance(optimizer.cluster_history, m) for m in metrics}
+        return {m: pd.Series({cluster: optimizer._check_statistical_significance(stats, m)
+                              for cluster, stats in optimizer.cluster_history.items()}) for m in metrics}
+
+    significant, t_significance = _timed(significance)
+
+    filter_optimizer = module.AdvancedKeywordOptimizer(min_views=5, min_ctr=0.005, max_cpc=25.0,
+                                                       cluster_mapping=mapping)
+    filtered, t_filter = _timed(filter_optimizer.filter_dataframe, df)
+    return {
+        'optimize': result, 'significance': significant, 'filter': filtered,
+        'times': {'optimize': t_optimize, 'significance': t_significance, 'filter_dataframe': t_filter},
+    }
+
+
+def compare(current: dict, baseline: dict) -> list:
+    problems = []
+    a = current['optimize'].set_index('advertId').sort_index()
+    b = baseline['optimize'].set_index('advertId').sort_index()
+    if not a.index.equals(b.index):
+        return [f"разные кластеры: {len(a)} против {len(b)}"]
+    for column in ['decision', 'reason']:
+        diff = (a[column] != b[column]).sum()
+        if diff:
+            problems.append(f"{column}: расходится у {diff} кластеров")
+    for column in NUMERIC_COLUMNS:
+        if not np.allclose(a[column].astype(float), b[column].astype(float), rtol=1e-9, atol=1e-12):
+            problems.append(f"{column}: числа расходятся")
+
+    # значимость не сверяется строго: до перехода на столбцовую историю из linregress
+    # бралось rvalue вместо pvalue, поэтому с такой версией расхождения ожидаемы
+    for metric, series in current['significance'].items():
+        diff = (series.sort_index() != baseline['significance'][metric].astype(bool).sort_index()).sum()
+        if diff:
+            print(f"значимость {metric}: отличается у {diff} кластеров")
+
+    key = ['date', 'keyword']
+    fa = current['filter'].sort_values(key).reset_index(drop=True)
+    fb = baseline['filter'].sort_values(key).reset_index(drop=True)
+    if len(fa) != len(fb) or not np.allclose(fa['spend'], fb['spend'], rtol=1e-9):
+        problems.append(f"filter_dataframe: {len(fa)} строк против {len(fb)} или расходится spend")
+    return problems
+
+
+@contextmanager
+def outside_tree():
+    """ako.py при импорте открывает keyword_optimizer.log в текущем каталоге — импортируем из временного."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        os.chdir(tmp)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+
+
+def main(args) -> None:
+    logging.disable(logging.WARNING)
+    with outside_tree():
+        import ako
+
+    df, mapping = synthetic_campaign(args.keywords, args.clusters, args.days, args.seed)
+    metrics = ['ctr', 'cpm', 'cpc']
+    print(f"Кампания: {args.keywords} фраз, {args.clusters} кластеров, {args.days} дней, {len(df)} строк")
+
+    current = run(ako, df, mapping, metrics, vectorized=True)
+    decisions = current['optimize']['decision'].value_counts().to_dict()
+    print(f"Решения: {decisions}")
+    print(f"{'этап':<18} {'текущая':>10}", end="")
+
+    baseline = None
+    if args.baseline:
+        spec = importlib.util.spec_from_file_location("ako_baseline", os.path.abspath(args.baseline))
+        module = importlib.util.module_from_spec(spec)
+        with outside_tree():
+            spec.loader.exec_module(module)
+        baseline = run(module, df, mapping, metrics, vectorized=hasattr(module.AdvancedKeywordOptimizer,
+                                                                          'check_statistical_significance'))
+        print(f" {'baseline':>10} {'ускорение':>10}", end="")
+    print()
+
+    for stage, seconds in current['times'].items():
+        line = f"{stage:<18} {seconds:>9.3f}s"
+        if baseline:
+            base = baseline['times'][stage]
+            line += f" {base:>9.3f}s {base / seconds:>9.1f}x"
+        print(line)
+
+    if baseline:
+        problems = compare(current, baseline)
+        print("Результаты совпадают с baseline" if not problems else "Расхождения:\n  " + "\n  ".join(problems))
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=10_000)
+    parser.add_argument("--clusters", type=int, default=2_000)
+    parser.add_argument("--days", type=int, default=21)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", help="путь к другой версии ako.py для сравнения")
+    main(parser.parse_args())
@@ -0,0 +1,189 @@
+"""
+Сверка воспроизведения UCB-бандита по снимку (bandit_snapshot) с живым режимом
+(UCBBandit.recommend_action) на поддельном API WB.
+
+FakeWildberriesAPI — настоящий WildberriesAPI, у которого make_request отвечает
+детерминированными данными вместо HTTP, а паузы между запросами только
+считаются (секунды, которые живой режим проспал бы). Кампании --campaigns
+разных видов:
+  • keywords    — статистика по ключевым фразам за окно;
+  • keywords-30 — фразы только за окно в 30 дней (запасной запрос);
+  • fullstats   — фраз нет, статистика из /v2/fullstats;
+  • empty       — статистики нет (рычаг исключается после трёх попыток);
+  • no-cpm      — нет autoParams.cpm (в живом режиме — ветка «Ошибка данных»);
+  • nan-ctr     — фразы с пустым ctr (ошибка только для метрики ctr).
+Неактивных кампаний и кампаний без информации среди рычагов нет: их
+отбрасывает compute_bandit в app.py до создания бандита.
+
+Для каждой метрики (ctr, clicks, sum, cpm, ctr/cpm) с бюджетом и без
+--iterations итераций живого режима сравниваются с replay_bandit по снимку:
+рекомендации — точно, состояние бандита (counts, rewards, cpms, initial_cpms,
+failed_attempts, arms, total_pulls) — точно. Печатается число запросов к API,
+проспанные секунды и время воспроизведения. Кэш снимка общий для всех
+прогонов: в первом статистика запрашивается, дальше непустые окна прошедших
+дат читаются из parquet.
+
+Запуск (из streamlit-main):
+    python benchmarks/check_bandit_snapshot.py --campaigns 40 --iterations 300
+"""
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import wb_api  # noqa: E402
+from bandit import UCBBandit  # noqa: E402
+from bandit_snapshot import build_snapshot, replay_bandit  # noqa: E402
+
+KINDS = ["keywords", "keywords-30", "fullstats", "empty", "no-cpm", "nan-ctr"]
+METRICS = ["ctr", "clicks", "sum", "cpm", "ctr/cpm"]
+
+
+class FakeWildberriesAPI(wb_api.WildberriesAPI):
+    """WildberriesAPI с ответами из памяти: одинаковый запрос — одинаковый ответ."""
+
+    def __init__(self, campaigns: dict, kinds: dict):
+        super().__init__("fake-token")
+        self.campaigns = campaigns
+        self.kinds = kinds
+        self.calls = Counter()
+
+    def make_request(self, endpoint, method="GET", params=None, data=None, retries=3, backoff_factor=1):
+        self.calls[endpoint] += 1
+        if endpoint == "/v1/promotion/adverts":
+            return [self.campaigns[i] for i in data if i in self.campaigns]
+        if endpoint == "/v0/stats/keywords":
+            return self._keywords(params["advert_id"], params["from"], params["to"])
+        if endpoint == "/v2/fullstats":
+            request = data[0]
+            advert_id, interval = request["advertId"], request["interval"]
+            if self.kinds.get(advert_id) != "fullstats":
+                return []
+            rnd = random.Random(f"{advert_id}:{interval['begin']}:{interval['end']}")
+            return [{"advertId": advert_id, "stat": [_stat_row(rnd) for _ in range(rnd.randint(1, 5))]}]
+        raise AssertionError(f"неожиданный запрос {endpoint}")
+
+    def _keywords(self, advert_id: int, date_from: str, date_to: str):
+        kind = self.kinds.get(advert_id)
+        span = (date.fromisoformat(date_to) - date.fromisoformat(date_from)).days + 1
+        if kind not in ("keywords", "keywords-30", "nan-ctr") or (kind == "keywords-30" and span <= 7):
+            return {"keywords": []}
+        rnd = random.Random(f"{advert_id}:{date_from}:{date_to}")
+        blocks = []
+        for day in range(span):
+            stats = []
+            for k in range(rnd.randint(0, 4)):
+                row = {"keyword": f"фраза {k}", **_stat_row(rnd)}
+                if kind == "nan-ctr" and k == 0:
+                    row["ctr"] = None
+                stats.append(row)
+            blocks.append({"date": (date.fromisoformat(date_from) + timedelta(days=day)).isoformat(), "stats": stats})
+        return {"keywords": blocks}
+
+
+def _stat_row(rnd: random.Random) -> dict:
+    views = rnd.choice([0, rnd.randint(1, 3000)])
+    clicks = rnd.randint(0, max(views // 20, 0))
+    return {"views": views, "clicks": clicks, "sum": round(rnd.uniform(0, 900), 2),
+            "ctr": round(clicks / views * 100, 2) if views else 0.0}
+
+
+def fake_campaigns(count: int):
+    rnd = random.Random(count)
+    campaigns, kinds = {}, {}
+    for i in range(count):
+        advert_id = 100000 + i
+        kinds[advert_id] = KINDS[i % len(KINDS)]
+        campaign = {"advertId": advert_id, "status": 9, "type": 8}
+        if kinds[advert_id] != "no-cpm":
+            campaign["autoParams"] = {"cpm": rnd.randint(100, 900)}
+        campaigns[advert_id] = campaign
+    return campaigns, kinds
+
+
+def bandit_state(bandit: UCBBandit) -> dict:
+    return {
+        "counts": dict(bandit.counts), "rewards": dict(bandit.rewards), "cpms": dict(bandit.cpms),
+        "initial_cpms": dict(bandit.initial_cpms), "failed_attempts": dict(getattr(bandit, "failed_attempts", {})),
+        "arms": list(bandit.arms), "total_pulls": bandit.total_pulls,
+    }
+
+
+def compare(live, replay, live_state, replay_state) -> list:
+    problems = []
+    if len(live) != len(replay):
+        problems.append(f"рекомендаций {len(live)} против {len(replay)}")
+    for i, (a, b) in enumerate(zip(live, replay)):
+        if a != b:
+            problems.append(f"итерация {i + 1}: {a} != {b}")
+            break
+    for key, value in live_state.items():
+        if replay_state[key] != value:
+            problems.append(f"состояние {key} расходится")
+    return problems
+
+
+def main(args) -> None:
+    logging.disable(logging.CRITICAL)
+    slept = Counter()
+    wb_api.time = SimpleNamespace(sleep=lambda seconds: slept.update(seconds=seconds))
+
+    campaigns, kinds = fake_campaigns(args.campaigns)
+    info = {str(advert_id): c for advert_id, c in campaigns.items()}
+    arms = [str(a) for a in kinds]
+    end = date.today() - timedelta(days=1)
+    start_date, end_date = (end - timedelta(days=6)).isoformat(), end.isoformat()
+    print(f"Кампаний {len(arms)} ({dict(Counter(kinds.values()))}), "
+          f"итераций {args.iterations}, окно {start_date}…{end_date}")
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for metric in METRICS:
+            for budget in (None, args.budget):
+                live_api = FakeWildberriesAPI(campaigns, kinds)
+                live_bandit = UCBBandit(arms=list(arms), reward_metric=metric, daily_budget=budget)
+                slept.clear()
+                t0 = time.perf_counter()
+                live = [live_bandit.recommend_action(live_api, start_date, end_date, max_days=30,
+                                                     campaign_info_dict=info) for _ in range(args.iterations)]
+                t_live = time.perf_counter() - t0
+                live_sleep = slept["seconds"]
+
+                snapshot_api = FakeWildberriesAPI(campaigns, kinds)
+                snapshot = build_snapshot(snapshot_api, list(arms), start_date, end_date, campaign_info_dict=info,
+                                          max_days=30, cache_dir=Path(cache_dir))
+                replay_bandit_ = UCBBandit(arms=list(arms), reward_metric=metric, daily_budget=budget)
+                t0 = time.perf_counter()
+                replay = replay_bandit(replay_bandit_, snapshot, args.iterations)
+                t_replay = time.perf_counter() - t0
+
+                problems = compare(live, replay, bandit_state(live_bandit), bandit_state(replay_bandit_))
+                failures += bool(problems)
+                print(f"{metric:>8} бюджет={str(budget):>5}: живой — {sum(live_api.calls.values()):>5} запросов, "
+                      f"пауз {live_sleep:>5.0f} с, {t_live * 1000:>6.0f} мс; снимок — "
+                      f"{sum(snapshot_api.calls.values()):>3} запросов, воспроизведение {t_replay * 1000:>5.1f} мс"
+                      f" — {'совпадает' if not problems else 'РАСХОДИТСЯ'}")
+                for problem in problems:
+                    print(f"    {problem}")
+
+    print("OK: воспроизведение по снимку совпадает с живым режимом" if not failures
+          else f"Расхождения в {failures} прогонах")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--campaigns", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--budget", type=float, default=500.0, help="дневной бюджет для прогонов с бюджетом")
+    main(parser.parse_args())
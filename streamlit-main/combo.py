@@ -94,7 +94,7 @@ class WildberriesOptimizer:
 
         df['ctr'] = df['clicks'] / df['shows'].replace(0, 1)
 
-        df['advertId'] = df['keyword'].apply(self.optimizer._map_keyword_to_cluster)
+        df['advertId'] = self.optimizer.map_keywords_to_clusters(df['keyword'])
         optimization_result = self.optimizer.optimize(df)
 
         if optimization_result is None or optimization_result.empty:
@@ -105,9 +105,11 @@ class WildberriesOptimizer:
         print(f"\nРекомендации по оптимизации кампании {campaign_id}:")
         print(f"{'Кластер':<25} {'Решение':<12} {'Причина':<20} {'CTR':>6} {'Ставка':>8} {'Эффективность':>12}")
         print("-" * 85)
-        for _, row in optimization_result.iterrows():
-            print(f"{row['advertId'][:25]:<25} {row['decision']:<12} {row['reason'][:20]:<20} "
-                  f"{row['ctr']:>6.2%} {row.get('bid_modifier', 1.0):>8.2f} {row['efficiency_score']:>12.2f}")
+        print("\n".join(
+            f"{row['advertId'][:25]:<25} {row['decision']:<12} {row['reason'][:20]:<20} "
+            f"{row['ctr']:>6.2%} {row.get('bid_modifier', 1.0):>8.2f} {row['efficiency_score']:>12.2f}"
+            for row in optimization_result.to_dict('records')
+        ))
 
         return optimization_result
 
@@ -162,7 +164,7 @@ class WildberriesOptimizer:
             df.loc[df['clicks'] > df['shows'], 'clicks'] = df['shows']
         df['ctr'] = df['clicks'] / df['shows'].replace(0, 1)
 
-        df['advertId'] = df['keyword'].apply(self.optimizer._map_keyword_to_cluster)
+        df['advertId'] = self.optimizer.map_keywords_to_clusters(df['keyword'])
         filtered_df = self.optimizer.filter_dataframe(df)
 
         if filtered_df is None or filtered_df.empty:
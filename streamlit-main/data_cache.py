@@ -0,0 +1,309 @@
+"""
+Общий для всех сессий кэш запросов к данным кампаний и фоновая предзагрузка.
+
+@st.cache_data на методах приложения кэшировал результаты в памяти процесса
+по (кампания, даты) — без токена, без срока жизни, а сбросить можно было
+только всё сразу. Здесь:
+
+  • QueryCache — SQLite-файл рядом с приложением (CACHE_PATH): значения
+    хранятся с TTL, ключ — хэш токена, вид запроса, кампании, окно дат и
+    параметры. Аналитики с одним токеном делят результаты между сессиями и
+    процессами; сам токен в кэш не попадает. Файл может быть общим
+    (WB_QUERY_CACHE), поэтому значения не pickle, а JSON + parquet для
+    DataFrame (encode_value / decode_value): чтение чужой записи не исполняет
+    код. Файл создаётся с правами 0600;
+  • invalidate_campaign — сброс только записей, в которых участвует кампания
+    (в т.ч. результатов бандита по нескольким кампаниям), invalidate_token —
+    всех записей одного токена;
+  • Prefetcher — пул фоновых потоков, заранее считающий запросы, которые
+    пользователь, вероятно, откроет следующими; одновременный запрос того же
+    ключа из сессии дождётся фонового расчёта, а не повторит его;
+  • page_count / page_slice — постраничная выдача больших таблиц.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = Path(os.getenv("WB_QUERY_CACHE", Path(__file__).resolve().parent / ".query_cache.sqlite"))
+DEFAULT_TTL = 30 * 60
+PREFETCH_WORKERS = 1
+DEFAULT_PAGE_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    token_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_campaigns (
+    id TEXT NOT NULL,
+    token_hash TEXT NOT NULL,
+    campaign TEXT NOT NULL,
+    PRIMARY KEY (id, campaign)
+);
+CREATE INDEX IF NOT EXISTS entry_campaigns_lookup ON entry_campaigns (token_hash, campaign);
+CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at);
+"""
+
+_MISS = object()
+
+# формат значения: VALUE_MAGIC, длина JSON (8 байт), JSON, затем parquet DataFrame'ов подряд
+VALUE_MAGIC = b"WBQC1"
+
+
+# ───────────────────────────── сериализация значений ─────────────────────────────
+
+def _to_json(value: Any, frames: List[bytes]) -> Any:
+    if isinstance(value, pd.DataFrame):
+        buffer = io.BytesIO()
+        value.to_parquet(buffer)
+        frames.append(buffer.getvalue())
+        return {"__frame__": len(frames) - 1}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_json(v, frames) for v in value]}
+    if isinstance(value, list):
+        return [_to_json(v, frames) for v in value]
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in value):
+            return {k: _to_json(v, frames) for k, v in value.items()}
+        return {"__items__": [[_to_json(k, frames), _to_json(v, frames)] for k, v in value.items()]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"значение типа {type(value).__name__} не сохраняется в кэше")
+
+
+def _from_json(value: Any, frames: List[pd.DataFrame]) -> Any:
+    if isinstance(value, list):
+        return [_from_json(v, frames) for v in value]
+    if isinstance(value, dict):
+        if "__frame__" in value:
+            return frames[value["__frame__"]]
+        if "__tuple__" in value:
+            return tuple(_from_json(v, frames) for v in value["__tuple__"])
+        if "__items__" in value:
+            return {_from_json(k, frames): _from_json(v, frames) for k, v in value["__items__"]}
+        return {k: _from_json(v, frames) for k, v in value.items()}
+    return value
+
+
+def encode_value(value: Any) -> bytes:
+    """Значение (DataFrame, списки, словари, кортежи, скаляры) → байты для кэша. TypeError — не сохраняется."""
+    frames: List[bytes] = []
+    payload = json.dumps({"value": _to_json(value, frames), "frames": [len(f) for f in frames]},
+                         ensure_ascii=False).encode("utf-8")
+    return b"".join([VALUE_MAGIC, len(payload).to_bytes(8, "big"), payload, *frames])
+
+
+def decode_value(blob: bytes) -> Any:
+    """Обратное к encode_value; ValueError — чужой или повреждённый формат (в т.ч. прежний pickle)."""
+    blob = bytes(blob)
+    if not blob.startswith(VALUE_MAGIC):
+        raise ValueError("неизвестный формат записи")
+    start = len(VALUE_MAGIC) + 8
+    end = start + int.from_bytes(blob[len(VALUE_MAGIC):start], "big")
+    payload = json.loads(blob[start:end].decode("utf-8"))
+    frames = []
+    for size in payload["frames"]:
+        frames.append(pd.read_parquet(io.BytesIO(blob[end:end + size])))
+        end += size
+    return _from_json(payload["value"], frames)
+
+
+def token_hash(token: str) -> str:
+    """Короткий необратимый отпечаток API-токена для ключей кэша."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    token_hash: str
+    kind: str  # 'optimization', 'bandit', ...
+    campaigns: Tuple[str, ...]
+    start_date: str
+    end_date: str
+    params: Tuple = ()
+
+    @classmethod
+    def build(cls, token: str, kind: str, campaigns: Iterable, start_date: str, end_date: str, **params):
+        return cls(token_hash(token), kind, tuple(str(c) for c in campaigns), start_date, end_date,
+                   tuple(sorted(params.items())))
+
+    @property
+    def id(self) -> str:
+        return hashlib.sha256(repr(self).encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """TTL-кэш в SQLite, общий для потоков и процессов; каждое обращение — своё подключение."""
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = DEFAULT_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            # кэш содержит данные кампаний: файл (и WAL рядом с ним) — только владельцу
+            self.path.touch(mode=0o600)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self.purge_expired()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _key_lock(self, key: CacheKey) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key.id, threading.Lock())
+
+    # ─── чтение и запись ───
+    def _load(self, key: CacheKey):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM entries WHERE id = ? AND expires_at > ?",
+                               (key.id, time.time())).fetchone()
+        if row is None:
+            return _MISS
+        try:
+            return decode_value(row[0])
+        except Exception as e:
+            logger.warning(f"Повреждённая запись кэша {key.kind} {key.campaigns}: {e}")
+            return _MISS
+
+    def get(self, key: CacheKey, default: Any = None) -> Any:
+        value = self._load(key)
+        return default if value is _MISS else value
+
+    def contains(self, key: CacheKey) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM entries WHERE id = ? AND expires_at > ?",
+                                (key.id, time.time())).fetchone() is not None
+
+    def set(self, key: CacheKey, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            blob = encode_value(value)
+        except Exception as e:
+            logger.warning(f"Значение {key.kind} {key.campaigns} не сохранено в кэше: {e}")
+            return
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (id, token_hash, kind, start_date, end_date, created_at, expires_at, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key.id, key.token_hash, key.kind, key.start_date, key.end_date, now,
+                 now + (self.ttl if ttl is None else ttl), blob),
+            )
+            conn.execute("DELETE FROM entry_campaigns WHERE id = ?", (key.id,))
+            conn.executemany("INSERT OR IGNORE INTO entry_campaigns (id, token_hash, campaign) VALUES (?, ?, ?)",
+                             [(key.id, key.token_hash, campaign) for campaign in key.campaigns])
+
+    def get_or_compute(self, key: CacheKey, compute: Callable[[], Any], ttl: Optional[float] = None,
+                       refresh: bool = False, cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Значение из кэша или compute(). Пока ключ считается в одном потоке, другие
+        ждут и берут готовый результат. cache_if(value)=False — результат не
+        сохраняется (ошибки и пустые ответы); refresh=True — пересчитать.
+        """
+        if not refresh:
+            value = self._load(key)
+            if value is not _MISS:
+                return value
+        with self._key_lock(key):
+            if not refresh:
+                value = self._load(key)
+                if value is not _MISS:
+                    return value
+            value = compute()
+            if cache_if is None or cache_if(value):
+                self.set(key, value, ttl)
+            return value
+
+    # ─── инвалидация ───
+    def invalidate_campaign(self, token: str, campaign) -> int:
+        """Удаляет записи токена, в которых участвует кампания; возвращает их число."""
+        with closing(self._connect()) as conn, conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM entry_campaigns WHERE token_hash = ? AND campaign = ?",
+                (token_hash(token), str(campaign)))]
+            conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in ids])
+            conn.executemany("DELETE FROM entry_campaigns WHERE id = ?", [(i,) for i in ids])
+        return len(ids)
+
+    def invalidate_token(self, token: str) -> int:
+        """Удаляет все записи токена."""
+        hashed = token_hash(token)
+        with closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM entries WHERE token_hash = ?", (hashed,)).rowcount
+            conn.execute("DELETE FROM entry_campaigns WHERE token_hash = ?", (hashed,))
+        return removed
+
+    def purge_expired(self) -> int:
+        with closing(self._connect()) as conn, conn:
+            removed = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.execute("DELETE FROM entry_campaigns WHERE id NOT IN (SELECT id FROM entries)")
+        return removed
+
+
+class Prefetcher:
+    """Фоновый расчёт ключей QueryCache; повторная постановка того же ключа игнорируется."""
+
+    def __init__(self, cache: QueryCache, max_workers: int = PREFETCH_WORKERS):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def prefetch(self, key: CacheKey, compute: Callable[[], Any],
+                 cache_if: Optional[Callable[[Any], bool]] = None) -> bool:
+        """Ставит ключ в очередь, если его нет в кэше и он ещё не считается; True — поставлен."""
+        with self._lock:
+            if key.id in self._inflight or self.cache.contains(key):
+                return False
+            self._inflight.add(key.id)
+
+        def run():
+            try:
+                self.cache.get_or_compute(key, compute, cache_if=cache_if)
+                logger.info(f"Предзагружено: {key.kind} {', '.join(key.campaigns)} {key.start_date} - {key.end_date}")
+            except Exception as e:
+                logger.warning(f"Ошибка предзагрузки {key.kind} {key.campaigns}: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.discard(key.id)
+
+        self._executor.submit(run)
+        return True
+
+
+# ───────────────────────────── постраничная выдача ─────────────────────────────
+
+def page_count(rows: int, page_size: int = DEFAULT_PAGE_SIZE) -> int:
+    return max((rows + page_size - 1) // page_size, 1)
+
+
+def page_slice(df: pd.DataFrame, page: int, page_size: int = DEFAULT_PAGE_SIZE) -> pd.DataFrame:
+    """Строки страницы page (с 1); номер вне диапазона прижимается к краю."""
+    page = min(max(int(page), 1), page_count(len(df), page_size))
+    return df.iloc[(page - 1) * page_size: page * page_size]